@@ -0,0 +1,409 @@
+"""
+이벤트용 대량 사전 변환 CLI
+
+디렉터리(또는 매니페스트)의 사진을 정규화 -> ComfyUI 업로드 -> 큐 제출 흐름으로 흘려보낸다.
+- 백엔드마다 --depth 개의 prompt만 동시에 넣어 큐를 비우지 않으면서도 넘치게 하지 않음
+  (한 건이 실행되는 동안 다음 건이 ComfyUI 큐에서 대기)
+- 다음 사진의 정규화(EXIF 회전, 긴 변 축소, JPEG 재인코딩)는 GPU 작업과 겹쳐서 미리 수행
+  (정규화 본문은 메모리 예산에서 빌린 만큼만 메모리에 두고, 예산이 없으면 저장한 원본 파일에서 다시 읽어 업로드)
+- 결과/메타데이터는 API와 같은 저장소 계층(app.services.storage)으로 기록 -> 갤러리/이미지 API로 바로 조회 가능
+- 진행 기록(JSON Lines 저널)을 건마다 남겨 중단 후 다시 실행하면 끝난 사진은 건너뜀
+- 실행 중 연결이 끊긴 백엔드는 사진을 다른 백엔드에 돌려주고 빠졌다가 BACKEND_PROBE_SECONDS 마다 다시 확인
+  (실패로 기록하는 것은 실행 오류뿐, 모든 백엔드가 --outage-wait 넘게 끊기면 남은 사진을 실패로 기록하고 끝냄)
+- 끝나면 이번 실행이 ComfyUI에 남긴 입력/출력/히스토리를 정리 (app.services.remote_gc)
+
+    python -m app.batch event_photos/ --style character --depth 2
+    python -m app.batch manifest.csv --journal manifest.journal.jsonl --json summary.json
+
+매니페스트: 한 줄에 `경로[,스타일]` (CSV/텍스트) 또는 `{"path": ..., "style": ...}` (.jsonl).
+상대 경로는 매니페스트 파일 기준.
+"""
+
+import argparse
+import asyncio
+import io
+import json
+import logging
+import os
+import sys
+import time
+from collections import deque
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Iterator, Optional, Union
+
+from app.config import settings
+from app.services.gallery_feed import gallery_feed
+from app.services.job_store import job_store
+from app.services.memory_budget import memory_budget
+from app.services.remote_gc import remote_gc
+from app.services.storage import storage
+from app.services.zimage import CHARACTER_STYLES, is_connection_error, zimage_service
+
+logger = logging.getLogger("app.batch")
+
+IMAGE_SUFFIXES = {".jpg", ".jpeg", ".png", ".webp", ".gif", ".bmp", ".heic"}
+
+# 연결이 끊겨 빠진 백엔드를 다시 확인하는 주기
+BACKEND_PROBE_SECONDS = 10.0
+
+
+@dataclass
+class BatchItem:
+    path: str
+    style: str
+
+    @property
+    def key(self) -> str:
+        return f"{self.path}|{self.style}"
+
+
+@dataclass
+class PreparedItem:
+    item: BatchItem
+    original_id: str
+    # 정규화 본문 (메모리 예산을 빌리지 못했으면 디스크에 저장한 원본 경로)
+    data: Union[bytes, Path]
+
+
+def iter_inputs(source: str, default_style: str) -> Iterator[BatchItem]:
+    """디렉터리(이름순) 또는 매니페스트의 입력 목록"""
+    path = Path(source)
+    if path.is_dir():
+        for child in sorted(path.iterdir()):
+            if child.is_file() and child.suffix.lower() in IMAGE_SUFFIXES:
+                yield BatchItem(str(child.resolve()), default_style)
+        return
+
+    base_dir = path.resolve().parent
+    with path.open("r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            if path.suffix == ".jsonl":
+                entry = json.loads(line)
+                image_path, style = entry["path"], entry.get("style") or default_style
+            else:
+                image_path, _, style = line.partition(",")
+                style = style.strip() or default_style
+            yield BatchItem(str((base_dir / image_path.strip()).resolve()), style)
+
+
+def load_journal(path: str) -> dict:
+    """저널 -> {key: 마지막 기록} (중단 중 잘린 마지막 줄은 무시)"""
+    records = {}
+    if not os.path.exists(path):
+        return records
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            records[record["key"]] = record
+    return records
+
+
+def _append_journal(path: str, record: dict) -> None:
+    with open(path, "a", encoding="utf-8") as f:
+        f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def normalize_image(path: str, max_side: int) -> bytes:
+    """EXIF 회전 적용, 긴 변 max_side로 축소, RGB JPEG로 재인코딩 (업로드 크기/디코딩 비용 절감)"""
+    from PIL import Image, ImageOps
+
+    with Image.open(path) as img:
+        img = ImageOps.exif_transpose(img)
+        img.thumbnail((max_side, max_side))
+        buf = io.BytesIO()
+        img.convert("RGB").save(buf, "JPEG", quality=92)
+        return buf.getvalue()
+
+
+class BatchRunner:
+    def __init__(
+        self,
+        items: list,
+        journal_path: str,
+        backends: list,
+        depth: int,
+        max_side: int,
+        prefetch: int,
+        outage_wait: float = 120.0,
+    ):
+        self.items = items
+        self.journal_path = journal_path
+        self.backends = backends
+        self.depth = depth
+        self.max_side = max_side
+        self.prefetch = prefetch
+        self.outage_wait = outage_wait
+        self.succeeded = 0
+        self.failed = 0
+        self.per_backend: dict = {url: 0 for url in backends}
+        self.started = 0.0
+        self.down: dict = {}  # 연결이 끊겨 빠진 백엔드 -> 빠진 시각 (monotonic)
+        self._returned: deque = deque()  # 끊긴 백엔드가 돌려준 사진 (다른 백엔드가 먼저 가져감)
+        self._remaining = len(items)
+        self._done: Optional[asyncio.Event] = None
+
+    async def _journal(self, record: dict) -> None:
+        await storage.run("journal", _append_journal, self.journal_path, {**record, "at": time.time()})
+
+    async def _prepare(self, pending: asyncio.Queue, ready: asyncio.Queue) -> None:
+        """정규화 + 원본 저장 (GPU 작업과 겹쳐서 미리 수행)"""
+        while True:
+            item = await pending.get()
+            if item is None:
+                return
+            try:
+                data = await storage.run("normalize", normalize_image, item.path, self.max_side)
+                original_id, _ = await storage.save_original(data, ".jpg", "image/jpeg", {"source": item.path})
+            except Exception as e:
+                await self._fail(item, None, f"normalize: {e!r}")
+                continue
+            if not await memory_budget.acquire(len(data), "normalized", timeout=memory_budget.wait_seconds):
+                data = Path(settings.UPLOAD_DIR, f"{original_id}.jpg")
+            await ready.put(PreparedItem(item, original_id, data))
+
+    async def _take(self, ready: asyncio.Queue) -> PreparedItem:
+        while True:
+            if self._returned:
+                return self._returned.popleft()
+            prepared = await ready.get()
+            if prepared is not None:  # None = 돌려받은 사진이 있다는 알림
+                return prepared
+
+    def _give_back(self, prepared: PreparedItem, ready: asyncio.Queue) -> None:
+        self._returned.append(prepared)
+        try:
+            ready.put_nowait(None)  # ready.get()에서 기다리는 워커 깨우기 (가득 차 있으면 기다리는 워커가 없음)
+        except asyncio.QueueFull:
+            pass
+
+    def _outage(self) -> bool:
+        """모든 백엔드가 outage_wait 넘게 끊겨 있음"""
+        return len(self.down) == len(self.backends) and time.monotonic() - max(self.down.values()) >= self.outage_wait
+
+    async def _recover(self, base_url: str) -> bool:
+        """빠진 백엔드를 주기적으로 다시 확인: 돌아오면 True, 모든 백엔드가 outage_wait 넘게 끊기면 False"""
+        while not self._outage():
+            await asyncio.sleep(min(BACKEND_PROBE_SECONDS, self.outage_wait))
+            if base_url not in self.down:  # 같은 백엔드의 다른 워커가 이미 확인함
+                return True
+            result = await zimage_service.check_connection(base_url, timeout=5.0)
+            if result.get("status") == "connected":
+                self.down.pop(base_url, None)
+                logger.warning(f"{base_url} is reachable again, resuming")
+                return True
+        return False
+
+    async def _backend_worker(self, base_url: str, ready: asyncio.Queue) -> None:
+        """한 백엔드에 prompt 하나씩 (depth개 워커 = 백엔드 파이프라인 깊이)"""
+        while True:
+            if base_url in self.down and not await self._recover(base_url):
+                # 모든 백엔드가 끊김: 남은 사진은 실패로 기록 (백엔드가 돌아오면 --retry-failed 로 다시)
+                prepared = await self._take(ready)
+                self._release_data(prepared)
+                await self._fail(prepared.item, base_url, "no ComfyUI backend reachable")
+                continue
+            prepared = await self._take(ready)
+            item = prepared.item
+            # 결과는 ComfyUI에서 받는 대로 바로 파일로 (메모리에 전체를 모으지 않음)
+            writer = storage.generated_writer(item.style, prepared.original_id, {"source": item.path, "batch": True})
+            try:
+                await zimage_service.transform_to_character(
+                    prepared.data, style=item.style, base_url=base_url, sink=writer
+                )
+            except Exception as e:
+                await writer.discard()
+                if is_connection_error(e):
+                    # 백엔드가 끊김: 사진은 다른 백엔드로, 이 백엔드의 워커는 다시 연결될 때까지 쉼
+                    if base_url not in self.down:
+                        self.down[base_url] = time.monotonic()
+                        logger.warning(f"{base_url} unreachable, taking it out of rotation: {e!r}")
+                    self._give_back(prepared, ready)
+                    continue
+                self._release_data(prepared)
+                await self._fail(item, base_url, repr(e))
+                continue
+            self._release_data(prepared)
+            result_id = writer.result_id
+            # 앱과 같은 STATE_DB_PATH를 쓰면 갤러리 스트림을 보는 화면에도 바로 표시
+            await gallery_feed.publish("created", result_id, item.style)
+            self.succeeded += 1
+            self.per_backend[base_url] += 1
+            await self._journal({
+                "key": item.key, "path": item.path, "style": item.style, "status": "succeeded",
+                "original_id": prepared.original_id, "result_id": result_id, "backend": base_url,
+            })
+            self._finish_one()
+
+    @staticmethod
+    def _release_data(prepared: PreparedItem) -> None:
+        if isinstance(prepared.data, bytes):
+            memory_budget.release(len(prepared.data), "normalized")
+
+    async def _fail(self, item: BatchItem, base_url: Optional[str], error: str) -> None:
+        self.failed += 1
+        logger.warning(f"{item.path} ({item.style}) failed: {error}")
+        await self._journal({
+            "key": item.key, "path": item.path, "style": item.style, "status": "failed",
+            "backend": base_url, "error": error,
+        })
+        self._finish_one()
+
+    def _finish_one(self) -> None:
+        self._progress()
+        self._remaining -= 1
+        if self._remaining == 0:
+            self._done.set()
+
+    def images_per_minute(self) -> float:
+        elapsed = time.monotonic() - self.started
+        return self.succeeded / elapsed * 60 if elapsed > 0 else 0.0
+
+    def _progress(self) -> None:
+        done = self.succeeded + self.failed
+        print(
+            f"[{done}/{len(self.items)}] ok={self.succeeded} failed={self.failed} "
+            f"{self.images_per_minute():.1f} images/min",
+            flush=True,
+        )
+
+    async def run(self) -> dict:
+        self.started = time.monotonic()
+        pending: asyncio.Queue = asyncio.Queue()
+        for item in self.items:
+            pending.put_nowait(item)
+        pending.put_nowait(None)
+        # 준비된 사진은 모든 백엔드 파이프라인을 채울 만큼만 (메모리 상한)
+        ready: asyncio.Queue = asyncio.Queue(maxsize=self.prefetch)
+
+        # 워커는 사진이 모두 기록(성공/실패)될 때까지 돌고, 끊긴 백엔드의 워커는 다시 연결되기를 기다리므로
+        # 큐 종료 표시 대신 남은 건수로 끝냄
+        self._done = asyncio.Event()
+        if self._remaining == 0:
+            self._done.set()
+        finished = asyncio.create_task(self._done.wait())
+        tasks = [asyncio.create_task(self._prepare(pending, ready))]
+        for base_url in self.backends:
+            tasks += [asyncio.create_task(self._backend_worker(base_url, ready)) for _ in range(self.depth)]
+        waiting = {finished, *tasks}
+        try:
+            while not finished.done():
+                done, waiting = await asyncio.wait(waiting, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task is not finished and task.exception() is not None:
+                        raise task.exception()
+        finally:
+            for task in (finished, *tasks):
+                task.cancel()
+        return self.summary()
+
+    def summary(self) -> dict:
+        elapsed = time.monotonic() - self.started
+        return {
+            "total": len(self.items),
+            "succeeded": self.succeeded,
+            "failed": self.failed,
+            "elapsed_seconds": round(elapsed, 1),
+            "images_per_minute": round(self.images_per_minute(), 2),
+            "per_backend": self.per_backend,
+            "backends_down": sorted(self.down),
+        }
+
+
+async def connected_backends() -> list:
+    results = await asyncio.gather(*(zimage_service.check_connection(url, timeout=5.0) for url in zimage_service.backends))
+    return [url for url, result in zip(zimage_service.backends, results) if result.get("status") == "connected"]
+
+
+async def run(args) -> int:
+    settings.ensure_dirs()
+    journal_path = args.journal or f"{args.source.rstrip('/')}.journal.jsonl"
+    done = load_journal(journal_path)
+    items, skipped = [], 0
+    for item in iter_inputs(args.source, args.style):
+        if item.style not in CHARACTER_STYLES:
+            print(f"unknown style {item.style!r} for {item.path}", file=sys.stderr)
+            return 2
+        record = done.get(item.key)
+        if record and (record["status"] == "succeeded" or (record["status"] == "failed" and not args.retry_failed)):
+            skipped += 1
+            continue
+        items.append(item)
+    # 같은 스타일끼리 연달아 제출 (ComfyUI가 스타일 공통 노드를 캐시에서 재사용, 스타일 안에서는 입력 순서 유지)
+    items.sort(key=lambda item: item.style)
+    print(f"{len(items)} images to convert ({skipped} already in {journal_path})")
+    if not items:
+        return 0
+
+    try:
+        backends = await connected_backends()
+        if not backends:
+            print("no ComfyUI backend is reachable", file=sys.stderr)
+            return 1
+        runner = BatchRunner(
+            items,
+            journal_path,
+            backends,
+            depth=args.depth,
+            max_side=args.max_side,
+            prefetch=args.prefetch or len(backends) * args.depth,
+            outage_wait=args.outage_wait,
+        )
+        summary = await runner.run()
+        if remote_gc.enabled:
+            # 다운로드가 끝난 사진의 ComfyUI 입력/출력/히스토리 정리 (앱이 떠 있지 않아도 남지 않게)
+            await remote_gc.collect_due()
+    finally:
+        await zimage_service.aclose()
+        job_store.close()
+        storage.shutdown()
+
+    print(
+        f"done: {summary['succeeded']} ok, {summary['failed']} failed in {summary['elapsed_seconds']}s "
+        f"({summary['images_per_minute']} images/min)"
+    )
+    for url, count in summary["per_backend"].items():
+        print(f"  {url}: {count}")
+    if args.json_path:
+        Path(args.json_path).write_text(json.dumps(summary, indent=2))
+    return 0 if summary["failed"] == 0 else 1
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Convert a directory or manifest of photos ahead of an event")
+    parser.add_argument("source", help="image directory or manifest (.csv/.txt: path[,style], .jsonl: {path, style})")
+    parser.add_argument("--style", default="real_bubblehead", choices=sorted(CHARACTER_STYLES), help="default style")
+    parser.add_argument("--depth", type=int, default=2, help="prompts in flight per backend (1 running + N-1 queued)")
+    parser.add_argument("--prefetch", type=int, default=0, help="normalized photos kept ready (default: backends x depth)")
+    parser.add_argument("--max-side", type=int, default=2048, help="downscale the long side before upload")
+    parser.add_argument("--journal", help="progress journal (default: <source>.journal.jsonl)")
+    parser.add_argument("--retry-failed", action="store_true", help="retry photos that failed in a previous run")
+    parser.add_argument(
+        "--outage-wait", type=float, default=120.0,
+        help="seconds to wait for a backend to come back once all are unreachable, before failing the rest",
+    )
+    parser.add_argument("--json", dest="json_path", help="write the summary as JSON")
+    return parser
+
+
+def main() -> None:
+    logging.basicConfig(level=logging.WARNING, format="%(levelname)s %(name)s: %(message)s")
+    args = build_parser().parse_args()
+    try:
+        sys.exit(asyncio.run(run(args)))
+    except KeyboardInterrupt:
+        # 끝난 사진은 저널에 남아 있으므로 같은 명령으로 이어서 실행
+        print("interrupted; rerun the same command to resume", file=sys.stderr)
+        sys.exit(130)
+
+
+if __name__ == "__main__":
+    main()
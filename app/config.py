@@ -2,9 +2,6 @@ import os
 from typing import Optional
 from pydantic import Field
 from pydantic_settings import BaseSettings
-from dotenv import load_dotenv
-
-load_dotenv()
 
 
 class Settings(BaseSettings):
@@ -14,6 +11,8 @@ class Settings(BaseSettings):
     
     HOST: str = "0.0.0.0"
     PORT: int = 5000
+    # 프로덕션에서는 /demo, 로컬에서는 빈 문자열
+    APP_ROOT_PATH: str = ""
     
     # Z-Image API Configuration
     ZIMAGE_BASE_URL: str = Field(
@@ -24,11 +23,256 @@ class Settings(BaseSettings):
         default=1.0,
         description="Output image megapixels for Z-Image"
     )
+    ZIMAGE_BACKEND_URLS: str = Field(
+        default="",
+        description="Comma-separated ComfyUI backend URLs (defaults to ZIMAGE_BASE_URL)"
+    )
+    COMFYUI_MAX_CONNECTIONS: int = Field(
+        default=16,
+        description="Pooled HTTP connections to ComfyUI per worker process"
+    )
+    COMFYUI_DOWNLOAD_CHUNK_KB: int = Field(
+        default=64,
+        description="Chunk size for streaming results from ComfyUI /view to disk and clients"
+    )
+    # 여러 백엔드일 때 같은 스타일을 마지막으로 실행한 백엔드 우선 (ComfyUI 노드 출력 캐시 재사용)
+    STYLE_AFFINITY_ENABLED: bool = True
+    STYLE_AFFINITY_MAX_EXTRA_LOAD: int = Field(
+        default=1,
+        description="Extra prompts tolerated on the backend that last ran the style, versus the least-loaded backend"
+    )
+    
+    # ComfyUI 쪽 요청별 파일/히스토리 정리 (업로드한 입력, SaveImage 출력, /history 항목)
+    REMOTE_GC_ENABLED: bool = True
+    COMFYUI_DEPLOYMENT_ID: str = Field(
+        default="",
+        pattern=r"^[A-Za-z0-9-]*$",
+        description="Stable name of this deployment, added to the upload/output filenames it creates on ComfyUI (letters, digits, '-')"
+    )
+    REMOTE_GC_RECONCILE: bool = Field(
+        default=False,
+        description="On backend (re)connect, also remove untracked history/files of this deployment older than the TTL (needs COMFYUI_DEPLOYMENT_ID)"
+    )
+    REMOTE_GC_TTL_SECONDS: float = Field(
+        default=3600.0,
+        description="Remote artifacts of jobs that never finished downloading are removed after this long"
+    )
+    REMOTE_GC_INTERVAL_SECONDS: float = Field(
+        default=10.0,
+        description="How often one worker removes remote artifacts that are due"
+    )
+    COMFYUI_DELETE_ENDPOINT: str = Field(
+        default="",
+        description="Backend path that deletes input/output files (POST {'files': [...]}); empty = only history is cleaned"
+    )
+    
+    # 변환 스케줄러 (우선순위/키오스크별 공정 큐)
+    SCHEDULER_MAX_IN_FLIGHT: int = Field(
+        default=2,
+        description="Transforms submitted to ComfyUI at once per worker; the rest wait in the app queue"
+    )
+    SCHEDULER_CANCEL_POLL_INTERVAL: float = 1.0
+    
+    # 같은 스타일 동시 요청을 한 ComfyUI prompt로 묶기 (0 = 끔)
+    BATCH_WINDOW_MS: int = Field(
+        default=0,
+        description="How long the first job of a style waits for others to join its batch (0 disables batching)"
+    )
+    BATCH_MAX_SIZE: int = 4
+    
+    # 완료 예상 시각 / 작업별 타임아웃 / 행 감지 (큐 깊이 + 스타일별 실행 시간 기반)
+    ETA_DEFAULT_EXECUTION_SECONDS: float = Field(
+        default=20.0,
+        description="Assumed GPU execution time per photo until real executions have been observed"
+    )
+    ETA_TIMEOUT_FACTOR: float = 2.0
+    ETA_TIMEOUT_SLACK_SECONDS: float = 30.0
+    ETA_MAX_TIMEOUT_SECONDS: float = 1800.0
+    ETA_HANG_FACTOR: float = Field(
+        default=3.0,
+        description="A running prompt is treated as hung after this many times its expected execution time"
+    )
+    ETA_HANG_MIN_SECONDS: float = 20.0
+    ETA_QUEUE_POLL_SECONDS: float = 3.0
+    
+    # 백엔드 워밍업 / 모델 상주 유지
+    WARMUP_ENABLED: bool = Field(
+        default=True,
+        description="Warm up each backend on app startup and after it restarts"
+    )
+    WARMUP_TIMEOUT: float = 300.0
+    KEEPALIVE_HOURS: str = Field(
+        default="",
+        description="Business hours for keep-alive prompts, e.g. '09:00-21:00' (empty disables)"
+    )
+    KEEPALIVE_INTERVAL: float = 600.0
+    
+    # 백엔드 헬스 모니터 (백그라운드 주기 점검)
+    HEALTH_CHECK_INTERVAL: float = 5.0
+    HEALTH_CHECK_TIMEOUT: float = 3.0
+    HEALTH_HISTORY_SIZE: int = 60
+    
+    # GPU 장애/포화 시 CPU 대체 변환 (저하 모드)
+    FALLBACK_ENABLED: bool = Field(
+        default=True,
+        description="Serve transforms with the local CPU stylizer when ComfyUI is down or saturated"
+    )
+    FALLBACK_WORKERS: int = Field(
+        default=2,
+        description="Processes in the CPU fallback pool (per app worker)"
+    )
+    FALLBACK_TIMEOUT_SECONDS: float = Field(
+        default=8.0,
+        description="Latency budget for one fallback render, including the wait for a pool process"
+    )
+    FALLBACK_MAX_SIDE: int = 768
+    FALLBACK_QUEUE_DEPTH: int = Field(
+        default=0,
+        description="Send preview transforms to the fallback when this many jobs are ahead (0 disables)"
+    )
+    BREAKER_FAILURE_THRESHOLD: int = Field(
+        default=3,
+        description="Consecutive ComfyUI connection failures that open the circuit breaker"
+    )
+    BREAKER_RESET_SECONDS: float = Field(
+        default=30.0,
+        description="How long the breaker stays open before letting one trial transform through"
+    )
     
     UPLOAD_DIR: str = "uploads"
     GENERATED_IMAGES_DIR: str = "generated_images"
     MAX_FILE_SIZE_MB: int = 10
     
+    # 파일 저장소 전용 스레드 풀 / 이벤트 루프 블로킹 감지
+    STORAGE_IO_THREADS: int = Field(
+        default=8,
+        description="Threads in the storage pool that runs all file-system calls"
+    )
+    LOOP_DEBUG: bool = Field(
+        default=False,
+        description="asyncio debug mode: log and count callbacks blocking the event loop"
+    )
+    LOOP_SLOW_CALLBACK_MS: float = 100.0
+    
+    # 재촬영 유사 사진 찾기 (지각 해시)
+    NEAR_DUP_ENABLED: bool = Field(
+        default=True,
+        description="Hash every upload and look up earlier near-identical photos"
+    )
+    NEAR_DUP_MAX_DISTANCE: int = Field(
+        default=10,
+        description="Largest pHash Hamming distance (of 64 bits) counted as the same shot"
+    )
+    NEAR_DUP_REUSE_TAGS: bool = Field(
+        default=False,
+        description="Reuse a near-duplicate's WD14 tags and skip the tagger node"
+    )
+    
+    # 갤러리 실시간 스트림 (SSE)
+    GALLERY_FEED_POLL_SECONDS: float = Field(
+        default=0.25,
+        description="How often each worker reads new gallery events written by other workers/processes"
+    )
+    GALLERY_FEED_BUFFER: int = 1000
+    GALLERY_STREAM_HEARTBEAT_SECONDS: float = 15.0
+    GALLERY_STREAM_MAX_SECONDS: float = Field(
+        default=300.0,
+        description="Close each stream after this long; clients reconnect and resume with Last-Event-ID"
+    )
+    
+    # 최근 이미지 인메모리 캐시
+    HOT_CACHE_MAX_MB: int = Field(
+        default=256,
+        description="In-memory hot image cache size (MB)"
+    )
+    HOT_CACHE_MAX_OBJECT_MB: int = Field(
+        default=16,
+        description="Largest single image kept in the hot cache (MB)"
+    )
+    
+    # 이미지 버퍼 메모리 예산 (업로드 사본 / 정규화 이미지 / 결과 스트림 버퍼, 프로세스 전체)
+    MEMORY_BUDGET_MB: int = Field(
+        default=128,
+        description="Bytes of image buffers held in memory at once per process (MB, 0 = unlimited, usage still reported)"
+    )
+    MEMORY_BUDGET_WAIT_SECONDS: float = Field(
+        default=2.0,
+        description="How long a buffer that can spill to disk waits for budget before using the file instead"
+    )
+    
+    # 트레이싱 (""=끔, "file"=OTLP/JSON Lines 파일, "otlp"=OTLP/HTTP 컬렉터)
+    TRACE_EXPORT: str = Field(
+        default="",
+        description="Span exporter: '', 'file' or 'otlp'"
+    )
+    TRACE_FILE: str = "traces.jsonl"
+    TRACE_OTLP_ENDPOINT: str = "http://localhost:4318/v1/traces"
+    TRACE_FLUSH_INTERVAL: float = 2.0
+    
+    # 운영 진단 (관리자 프로파일러 / 느린 요청 캡처)
+    ADMIN_TOKEN: str = Field(
+        default="",
+        description="Token for /api/admin (X-Admin-Token header); empty disables the admin endpoints"
+    )
+    PROFILER_MAX_SECONDS: float = 60.0
+    PROFILER_DEFAULT_HZ: int = 100
+    SLOW_REQUEST_THRESHOLD_MS: float = Field(
+        default=2000.0,
+        description="Keep stack samples and stage timings of requests slower than this (0 = off)"
+    )
+    SLOW_REQUEST_SAMPLE_HZ: int = Field(
+        default=20,
+        description="How often each in-flight request's stack is sampled"
+    )
+    SLOW_REQUEST_BUFFER: int = 50
+    
+    # 워커 간 공유 상태 (작업 기록, 중복 요청 병합, 레이트 리밋)
+    STATE_DB_PATH: str = Field(
+        default="state.db",
+        description="SQLite file shared by all uvicorn workers"
+    )
+    JOB_HEARTBEAT_SECONDS: float = Field(
+        default=30.0,
+        description="How often each worker refreshes updated_at of the jobs it owns (queued or running)"
+    )
+    JOB_STALE_SECONDS: int = Field(
+        default=120,
+        description="A queued/running job whose owner has not refreshed it for this long is treated as dead"
+    )
+    JOB_RETENTION_HOURS: int = 24
+    JOB_PRUNE_INTERVAL_SECONDS: float = Field(
+        default=600.0,
+        description="How often one worker deletes jobs, orders and gallery events past JOB_RETENTION_HOURS"
+    )
+    RATE_LIMIT_TRANSFORMS_PER_MINUTE: int = Field(
+        default=0,
+        description="Transform requests per kiosk per minute (0 = unlimited)"
+    )
+    METRICS_PUBLISH_SECONDS: float = Field(
+        default=5.0,
+        description="How often each worker writes its metrics to the shared DB so /metrics on any worker shows all of them"
+    )
+    
+    @property
+    def zimage_backends(self) -> list:
+        urls = [u.strip().rstrip("/") for u in self.ZIMAGE_BACKEND_URLS.split(",") if u.strip()]
+        return urls or [self.ZIMAGE_BASE_URL.rstrip("/")]
+    
+    @property
+    def comfyui_output_prefix(self) -> str:
+        """SaveImage filename_prefix (배포 이름이 있으면 포함: remote_gc reconcile이 이 배포의 파일만 찾음)"""
+        return f"zimage_{self.COMFYUI_DEPLOYMENT_ID}_" if self.COMFYUI_DEPLOYMENT_ID else "zimage_"
+    
+    @property
+    def comfyui_upload_prefix(self) -> str:
+        """사용자 사진 업로드 파일명 접두사 (배포 이름 포함 규칙은 comfyui_output_prefix와 같음)"""
+        return f"upload_{self.COMFYUI_DEPLOYMENT_ID}_" if self.COMFYUI_DEPLOYMENT_ID else "upload_"
+    
+    def ensure_dirs(self) -> None:
+        """저장 디렉터리 생성 (import 시점이 아니라 앱 lifespan / CLI 시작 시 호출)"""
+        os.makedirs(self.UPLOAD_DIR, exist_ok=True)
+        os.makedirs(self.GENERATED_IMAGES_DIR, exist_ok=True)
+    
     model_config = {
         "env_file": ".env",
         "env_file_encoding": "utf-8",
@@ -38,6 +282,3 @@ class Settings(BaseSettings):
 
 
 settings = Settings()
-
-os.makedirs(settings.UPLOAD_DIR, exist_ok=True)
-os.makedirs(settings.GENERATED_IMAGES_DIR, exist_ok=True)
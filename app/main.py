@@ -1,22 +1,72 @@
-import os
+from contextlib import asynccontextmanager
 from pathlib import Path
 
-from fastapi import FastAPI
-from fastapi.staticfiles import StaticFiles
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse
+from fastapi.responses import PlainTextResponse
 
 from app.config import settings
-from app.routers import transform
+from app.routers import admin, orders, transform
+from app.services.fallback import fallback_engine
+from app.services.gallery_feed import gallery_feed
+from app.services.health import health_monitor
+from app.services.hot_cache import hot_cache
+from app.services.job_store import job_store
+from app.services.http_cache import PrecompressedStaticFiles, static_assets
+from app.services.memory_budget import memory_budget
+from app.services.profiler import SlowRequestMiddleware, slow_requests
+from app.services.remote_gc import remote_gc
+from app.services.scheduler import scheduler
+from app.services.storage import enable_loop_debug, storage
+from app.services.tracing import RequestIdMiddleware, tracer
+from app.services.warmup import warmup_keeper
+from app.services.worker_metrics import worker_metrics
+from app.services.zimage import zimage_service
 
 # 프로젝트 루트 디렉토리
 BASE_DIR = Path(__file__).parent.parent
 STATIC_DIR = BASE_DIR / "static"
 
 # root_path는 환경변수로 설정 가능 (프로덕션에서는 /demo, 로컬에서는 빈 문자열)
-ROOT_PATH = os.getenv("APP_ROOT_PATH", "")
+ROOT_PATH = settings.APP_ROOT_PATH
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if settings.LOOP_DEBUG:
+        enable_loop_debug(settings.LOOP_SLOW_CALLBACK_MS)
+    await storage.run("makedirs", settings.ensure_dirs)
+    # HTML/CSS gzip/brotli 사전 압축 (요청마다 압축하지 않음)
+    static_assets.build(STATIC_DIR)
+    tracer.start()
+    slow_requests.start()
+    await job_store.prune()
+    job_store.start()
+    warmup_keeper.start()
+    fallback_engine.start()
+    remote_gc.start()
+    health_monitor.start()
+    scheduler.start()
+    gallery_feed.start()
+    worker_metrics.start()
+    yield
+    await worker_metrics.stop()
+    await gallery_feed.stop()
+    await scheduler.stop()
+    await health_monitor.stop()
+    await remote_gc.stop()
+    await warmup_keeper.stop()
+    await job_store.stop()
+    fallback_engine.shutdown()
+    await zimage_service.aclose()
+    slow_requests.stop()
+    await tracer.stop()
+    job_store.close()
+    storage.shutdown()
+
 
 app = FastAPI(
+    lifespan=lifespan,
     root_path=ROOT_PATH,  # 환경변수로 제어 : 제발 더 나은 방법을 찾을것.
     title=settings.APP_NAME,
     description="AI 기반 인물 사진 캐릭터화 서비스 - Z-Image 연동",
@@ -29,55 +79,61 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Request-ID", "X-Job-ID", "X-Image-ID", "X-Original-ID", "X-Degraded"],
 )
+# 느린 요청 캡처는 요청 id가 정해진 뒤에 등록되도록 RequestIdMiddleware 안쪽에 둔다
+app.add_middleware(SlowRequestMiddleware)
+app.add_middleware(RequestIdMiddleware)
 
 app.include_router(transform.router)
+app.include_router(orders.router)
+app.include_router(admin.router)
 
 # Static 파일은 라우트보다 나중에 마운트 (라우트 우선순위)
 
 
 @app.get("/favicon.ico", include_in_schema=False)
-async def favicon():
-    return FileResponse(str(STATIC_DIR / "favicon.svg"), media_type="image/svg+xml")
+async def favicon(request: Request):
+    return static_assets.response(request, "favicon.svg")
 
 
 @app.get("/")
-async def root():
-    return FileResponse(str(STATIC_DIR / "index.html"))
+async def root(request: Request):
+    return static_assets.response(request, "index.html")
 
 
 @app.get("/style")
-async def style_page():
-    return FileResponse(str(STATIC_DIR / "style.html"))
+async def style_page(request: Request):
+    return static_assets.response(request, "style.html")
 
 
 @app.get("/camera")
-async def camera_page():
-    return FileResponse(str(STATIC_DIR / "camera.html"))
+async def camera_page(request: Request):
+    return static_assets.response(request, "camera.html")
 
 
 @app.get("/preview")
-async def preview_page():
-    return FileResponse(str(STATIC_DIR / "preview.html"))
+async def preview_page(request: Request):
+    return static_assets.response(request, "preview.html")
 
 
 @app.get("/shipping")
-async def shipping_page():
-    return FileResponse(str(STATIC_DIR / "shipping.html"))
+async def shipping_page(request: Request):
+    return static_assets.response(request, "shipping.html")
 
 
 @app.get("/payment")
-async def payment_page():
-    return FileResponse(str(STATIC_DIR / "payment.html"))
+async def payment_page(request: Request):
+    return static_assets.response(request, "payment.html")
 
 
 @app.get("/printing")
-async def printing_page():
-    return FileResponse(str(STATIC_DIR / "printing.html"))
+async def printing_page(request: Request):
+    return static_assets.response(request, "printing.html")
 
 
 # Static 파일 마운트 (라우트보다 나중에 마운트해야 라우트가 우선)
-app.mount("/static", StaticFiles(directory=str(STATIC_DIR)), name="static")
+app.mount("/static", PrecompressedStaticFiles(directory=str(STATIC_DIR), assets=static_assets), name="static")
 
 
 @app.get("/health")
@@ -85,10 +141,25 @@ async def health_check():
     return {
         "status": "healthy",
         "service": settings.APP_NAME,
-        "version": settings.APP_VERSION
+        "version": settings.APP_VERSION,
+        "hot_cache": hot_cache.stats(),
+        "scheduler": scheduler.stats(),
+        "warmup": warmup_keeper.stats(),
+        "gallery_feed": gallery_feed.stats(),
+        "fallback": fallback_engine.stats(),
+        "routing": zimage_service.routing_stats(),
+        "memory_budget": memory_budget.stats(),
+        "remote_gc": remote_gc.stats(),
+        "slow_requests": slow_requests.stats()
     }
 
 
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    # 워커가 여럿이면 모든 워커의 메트릭을 worker 라벨로 구분해 합침
+    return PlainTextResponse(await worker_metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
 @app.get("/api/info")
 async def api_info():
     return {
@@ -100,11 +171,22 @@ async def api_info():
             "get_image": "GET /api/transform/image/{image_id}",
             "get_original": "GET /api/transform/original/{image_id}",
             "check_sd_health": "GET /api/transform/health",
-            "gallery": "GET /api/transform/gallery"
+            "gallery": "GET /api/transform/gallery",
+            "gallery_stream": "GET /api/transform/gallery/stream (SSE, Last-Event-ID)",
+            "job_status": "GET /api/transform/jobs/{job_id}",
+            "active_jobs": "GET /api/transform/jobs/active",
+            "eta": "GET /api/transform/eta?style=...",
+            "image_derivative": "GET /api/transform/image/{image_id}/{thumb|preview}",
+            "create_order": "POST /api/orders",
+            "get_order": "GET /api/orders/{order_id}",
+            "update_order": "PATCH /api/orders/{order_id}",
+            "metrics": "GET /metrics",
+            "admin_profile": "POST /api/admin/profile?seconds=N (X-Admin-Token)",
+            "admin_slow_requests": "GET /api/admin/slow-requests (X-Admin-Token)"
         },
         "description": "인물 사진을 업로드하여 다양한 스타일의 캐릭터 이미지로 변환하는 서비스입니다.",
         "zimage": {
             "base_url": settings.ZIMAGE_BASE_URL,
-            "note": "Z-Image 서버가 실행 중이어야 합니다."
+            "note": "Z-Image 서버가 실행 중이어야 합니다. 연결되지 않으면 CPU 대체 변환(degraded=true)으로 응답합니다."
         }
     }
@@ -36,3 +36,24 @@ class GalleryImage(BaseModel):
     id: str
     url: str
     style: str
+
+
+class ShippingInfo(BaseModel):
+    name: str
+    phone: str
+    postcode: str
+    address: str
+    addressDetail: str = ""
+    memo: str = ""
+
+
+class OrderCreate(BaseModel):
+    original_id: str
+    style: Optional[str] = None
+
+
+class OrderUpdate(BaseModel):
+    style: Optional[str] = None
+    result_id: Optional[str] = None
+    shipping: Optional[ShippingInfo] = None
+    status: Optional[str] = None
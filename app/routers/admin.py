@@ -0,0 +1,82 @@
+import hmac
+import os
+import time
+from collections import Counter
+
+from fastapi import APIRouter, Depends, Header, HTTPException
+from fastapi.responses import PlainTextResponse
+
+from app.config import settings
+from app.services.profiler import profiler, render_folded, slow_requests
+
+
+def require_admin(x_admin_token: str = Header(default="")) -> None:
+    """ADMIN_TOKEN 이 없으면 관리자 API 자체가 없는 것처럼 404"""
+    if not settings.ADMIN_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not hmac.compare_digest(x_admin_token.encode(), settings.ADMIN_TOKEN.encode()):
+        raise HTTPException(status_code=401, detail="관리자 토큰이 올바르지 않습니다")
+
+
+router = APIRouter(prefix="/api/admin", tags=["admin"], dependencies=[Depends(require_admin)])
+
+
+def _worker_headers() -> dict:
+    # uvicorn 워커가 여럿이면 요청을 받은 워커만 프로파일링됨
+    return {"X-Worker-PID": str(os.getpid())}
+
+
+@router.post("/profile")
+async def profile_worker(seconds: float = 10.0, hz: int = settings.PROFILER_DEFAULT_HZ):
+    """
+    이 워커의 모든 스레드를 seconds 동안 샘플링해 folded stacks로 다운로드
+
+    flamegraph.pl, speedscope, inferno-flamegraph 에 그대로 넣을 수 있다.
+    """
+    if not 0 < seconds <= settings.PROFILER_MAX_SECONDS:
+        raise HTTPException(status_code=400, detail=f"seconds는 0 초과 {settings.PROFILER_MAX_SECONDS} 이하여야 합니다")
+    if not 1 <= hz <= 1000:
+        raise HTTPException(status_code=400, detail="hz는 1~1000 사이여야 합니다")
+    if profiler.running:
+        raise HTTPException(status_code=409, detail="이 워커에서 이미 프로파일링 중입니다")
+
+    result = await profiler.profile(seconds, hz)
+    filename = f"profile-{os.getpid()}-{int(time.time())}.folded"
+    return PlainTextResponse(result.folded(), headers={
+        **_worker_headers(),
+        "Content-Disposition": f'attachment; filename="{filename}"',
+        "X-Profile-Samples": str(result.samples),
+        "X-Profile-Seconds": f"{result.seconds:.2f}",
+    })
+
+
+@router.get("/slow-requests")
+async def list_slow_requests():
+    """SLOW_REQUEST_THRESHOLD_MS 보다 오래 걸린 최근 요청 (이 워커, 최신 순, 단계별 span 시간 포함)"""
+    return {
+        **slow_requests.stats(),
+        "worker_pid": os.getpid(),
+        "profiler": {"running": profiler.running, "sessions": profiler.sessions, "last": profiler.last},
+        "requests": slow_requests.recent(),
+    }
+
+
+@router.get("/slow-requests/{request_id}")
+async def get_slow_request(request_id: str):
+    record = slow_requests.get(request_id)
+    if record is None:
+        raise HTTPException(status_code=404, detail="이 워커의 느린 요청 기록에 없습니다")
+    return record
+
+
+@router.get("/slow-requests/{request_id}/folded")
+async def get_slow_request_folded(request_id: str):
+    """느린 요청 하나의 스택 샘플을 folded stacks로 ([cpu] = 루프에서 실행 중, [wait] = 기다리는 중)"""
+    record = slow_requests.get(request_id)
+    if record is None:
+        raise HTTPException(status_code=404, detail="이 워커의 느린 요청 기록에 없습니다")
+    counts = {entry["stack"]: entry["count"] for entry in record["stacks"]}
+    return PlainTextResponse(render_folded(Counter(counts)), headers={
+        **_worker_headers(),
+        "Content-Disposition": f'attachment; filename="slow-{request_id}.folded"',
+    })
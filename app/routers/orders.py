@@ -0,0 +1,76 @@
+import os
+
+from fastapi import APIRouter, HTTPException, Request
+
+from app.config import settings
+from app.models.schemas import OrderCreate, OrderUpdate
+from app.routers.transform import _kiosk_key, _original_path
+from app.services.job_store import ORDER_STATUSES, job_store
+from app.services.storage import storage
+from app.services.zimage import CHARACTER_STYLES
+
+router = APIRouter(prefix="/api/orders", tags=["orders"])
+
+
+def _order_view(order: dict) -> dict:
+    """주문 + 페이지별 크기의 이미지 URL (페이지는 주문 id만 주고받고 이미지는 필요할 때 받아 감)"""
+    original_url = f"api/transform/original/{order['original_id']}"
+    urls = {
+        "original": original_url,
+        "original_preview": f"{original_url}/preview",
+        "original_thumb": f"{original_url}/thumb",
+    }
+    if order["result_id"]:
+        result_url = f"api/transform/image/{order['result_id']}"
+        urls.update({
+            "result": result_url,
+            "result_preview": f"{result_url}/preview",
+            "result_thumb": f"{result_url}/thumb",
+        })
+    view = {key: value for key, value in order.items() if key != "kiosk"}
+    view["urls"] = urls
+    return view
+
+
+def _check_style(style: str) -> None:
+    if style not in CHARACTER_STYLES:
+        raise HTTPException(status_code=400, detail=f"알 수 없는 스타일입니다: {style}")
+
+
+@router.post("", status_code=201)
+async def create_order(body: OrderCreate, request: Request):
+    """업로드한 원본으로 주문(키오스크 세션) 시작"""
+    await _original_path(body.original_id)
+    if body.style is not None:
+        _check_style(body.style)
+    order = await job_store.create_order(body.original_id, style=body.style, kiosk=_kiosk_key(request))
+    return _order_view(order)
+
+
+@router.get("/{order_id}")
+async def get_order(order_id: str):
+    order = await job_store.get_order(order_id)
+    if order is None:
+        raise HTTPException(status_code=404, detail="주문을 찾을 수 없습니다")
+    return _order_view(order)
+
+
+@router.patch("/{order_id}")
+async def update_order(order_id: str, body: OrderUpdate):
+    fields = body.model_dump(exclude_unset=True)
+    if fields.get("style") is not None:
+        _check_style(fields["style"])
+    if fields.get("status") is not None and fields["status"] not in ORDER_STATUSES:
+        raise HTTPException(status_code=400, detail=f"status는 {', '.join(ORDER_STATUSES)} 중 하나여야 합니다")
+    if fields.get("result_id") is not None:
+        if not await storage.exists(os.path.join(settings.GENERATED_IMAGES_DIR, f"{fields['result_id']}.png")):
+            raise HTTPException(status_code=400, detail="생성 이미지를 찾을 수 없습니다")
+    if fields.get("style") is not None and "result_id" not in fields:
+        # 스타일을 바꾸면 이전 스타일의 결과는 더 이상 이 주문의 결과가 아님
+        current = await job_store.get_order(order_id)
+        if current is not None and current["style"] != fields["style"]:
+            fields["result_id"] = None
+    order = await job_store.update_order(order_id, **fields)
+    if order is None:
+        raise HTTPException(status_code=404, detail="주문을 찾을 수 없습니다")
+    return _order_view(order)
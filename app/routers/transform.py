@@ -1,15 +1,46 @@
+import asyncio
+import logging
 import os
-import uuid
-import json
-import aiofiles
-from fastapi import APIRouter, UploadFile, File, Form, HTTPException
-from fastapi.responses import FileResponse
+import time
+from pathlib import Path
+from typing import Optional
+
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import FileResponse, Response, StreamingResponse
 
 from app.config import settings
-from app.services.zimage import zimage_service, CHARACTER_STYLES
+from app.services.http_cache import (
+    IMMUTABLE_CACHE_CONTROL,
+    etag_matches,
+    file_etag,
+    image_etags,
+    not_modified,
+)
+from app.services.eta import eta_view, latency_model
+from app.services.derivatives import DERIVATIVE_MEDIA_TYPE, DERIVATIVE_SIZES, derivative_etag, derivative_store
+from app.services.fallback import GPUUnavailable, fallback_engine
+from app.services.gallery_feed import gallery_entry, gallery_feed
+from app.services.health import health_monitor
+from app.services.hot_cache import hot_cache
+from app.services.job_store import job_store
+from app.services.metrics import NEAR_DUP_LOOKUPS, TRANSFORM_SECONDS, TRANSFORMS_IN_FLIGHT
+from app.services.perceptual_hash import near_duplicate_view, near_duplicates
+from app.services.result_stream import ResultStream
+from app.services.scheduler import DEFAULT_PRIORITY, PRIORITY_CLASSES, JobCancelled, scheduler
+from app.services.storage import storage
+from app.services.tracing import tracer
+from app.services.uploads import UPLOAD_REQUEST_BODY, StoredUpload, receive_image_upload, upload_request_body
+from app.services.zimage import zimage_service, CHARACTER_STYLES, is_connection_error
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/api/transform", tags=["transform"])
 
+TRANSFORM_REQUEST_BODY = upload_request_body(
+    priority={"type": "string", "enum": list(PRIORITY_CLASSES), "default": DEFAULT_PRIORITY},
+    order_id={"type": "string", "description": "결과를 연결할 주문 id (POST /api/orders)"},
+)
+
 MIME_TO_EXT = {
     "image/jpeg": ".jpg",
     "image/jpg": ".jpg",
@@ -35,6 +66,188 @@ def get_mime_from_extension(ext: str) -> str:
     return EXT_TO_MIME.get(ext.lower(), "image/png")
 
 
+async def _image_response(kind: str, image_id: str, image_path: str, media_type: str, etag: str):
+    """디스크에서 읽은 이미지를 핫 캐시에 올리고 응답 (캐시에 안 들어가는 크기면 FileResponse)"""
+    headers = {"ETag": etag, "Cache-Control": IMMUTABLE_CACHE_CONTROL}
+    if hot_cache.accepts(await storage.getsize(image_path)):
+        data = await storage.read_bytes(image_path)
+        hot_cache.put(kind, image_id, data, media_type, etag)
+        return Response(content=memoryview(data), media_type=media_type, headers=headers)
+    return FileResponse(image_path, media_type=media_type, headers=headers)
+
+
+async def _resolve_etag(kind: str, image_id: str, image_path: str, meta_path: str) -> str:
+    """ETag 인덱스에 없으면 저장소 스레드에서 메타데이터/파일 해시로 결정"""
+    etag = image_etags.lookup(kind, image_id)
+    if etag is None:
+        etag = await storage.run("etag", file_etag, image_path, meta_path)
+        image_etags.remember(kind, image_id, etag)
+    return etag
+
+
+async def _find_near_duplicates(endpoint: str, upload, image_id: str) -> list:
+    """업로드를 지각 해시 색인에 추가하고 이전의 거의 같은 사진 목록 반환 (실패해도 업로드는 계속)"""
+    if not settings.NEAR_DUP_ENABLED:
+        return []
+    try:
+        found = await near_duplicates.check(
+            upload.etag, image_id, upload.data if upload.data is not None else Path(upload.path)
+        )
+    except Exception as e:
+        NEAR_DUP_LOOKUPS.inc(endpoint, "error")
+        logger.warning(f"Perceptual hash lookup failed for {image_id}: {e!r}")
+        return []
+    NEAR_DUP_LOOKUPS.inc(endpoint, "found" if found else "none")
+    return found
+
+
+def _jobs_ahead(priority: str) -> int:
+    """지금 들어온 작업보다 먼저 실행될 작업 수 (앱 스케줄러 대기 + ComfyUI 큐)"""
+    return scheduler.jobs_ahead(priority) + zimage_service.expected_queue_depth()
+
+
+def _predict_seconds(style: str, priority: str) -> float:
+    """지금 들어온 작업의 완료까지 예상 초 (앱 스케줄러 대기 + ComfyUI 큐 + 실행)"""
+    return latency_model.predict(style, _jobs_ahead(priority))
+
+
+async def _join_timeout(job_id: str, style: str, priority: str) -> float:
+    """같은 작업에 합류한 요청의 최대 대기: 그 작업의 완료 예상 시각과 지금 들어온 작업의 예측 중 늦은 쪽 기준 결과 대기 타임아웃"""
+    job = await job_store.get_job(job_id)
+    remaining = _predict_seconds(style, priority)
+    if job is not None and job["eta_at"]:
+        remaining = max(remaining, job["eta_at"] - time.time())
+    return latency_model.timeout(remaining)
+
+
+def _job_view(job: dict) -> dict:
+    result = {
+        "job_id": job["job_id"],
+        "status": job["status"],
+        "style": job["style"],
+        "original_id": job["original_id"],
+        "prompt_id": job["prompt_id"],
+        "error": job["error"],
+        "created_at": job["created_at"],
+        "updated_at": job["updated_at"],
+    }
+    if job["status"] in ("queued", "running"):
+        result.update(eta_view(job))
+    if job["image_id"]:
+        result["image_id"] = job["image_id"]
+        result["image_url"] = f"api/transform/image/{job['image_id']}"
+    return result
+
+
+def _kiosk_key(request: Request) -> str:
+    """레이트 리밋 / 공정 스케줄링 단위 (X-Kiosk-ID 헤더, 없으면 클라이언트 IP)"""
+    kiosk_id = request.headers.get("x-kiosk-id")
+    if kiosk_id:
+        return f"kiosk:{kiosk_id[:64]}"
+    return f"ip:{request.client.host if request.client else 'unknown'}"
+
+
+def _wants_image(request: Request) -> bool:
+    """동기 호출자: Accept: image/png 이면 JSON 대신 결과 PNG를 같은 응답으로"""
+    return "image/png" in request.headers.get("accept", "")
+
+
+def _result_headers(job_id: str, image_id: str, original_id: str, meta: Optional[dict] = None) -> dict:
+    headers = {
+        "X-Job-ID": job_id,
+        "X-Image-ID": image_id,
+        "X-Original-ID": original_id,
+        "Content-Location": f"api/transform/image/{image_id}",
+    }
+    if meta and meta.get("degraded"):
+        headers["X-Degraded"] = meta.get("degraded_reason") or "true"
+    return headers
+
+
+def _retry_after(seconds: float) -> dict:
+    return {"Retry-After": str(max(1, int(seconds + 0.999)))}
+
+
+# 응답을 먼저 돌려준 뒤에도 끝까지 실행되는 변환 (이벤트 루프가 약한 참조만 가지므로 보관)
+_background_tasks: set = set()
+
+
+async def _stream_result(completion, result_stream: ResultStream, job_id: str, original_id: str):
+    """ComfyUI 다운로드가 시작되면 바로 PNG 응답을 열고, 청크를 디스크와 함께 흘려보냄"""
+    task = asyncio.create_task(completion)
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+    
+    def close_stream(done: asyncio.Task) -> None:
+        # 정상 종료는 finish()에서 닫힘. 응답을 보내던 중 실패하면 본문을 끊어 잘린 이미지가 완성본처럼 보이지 않게 함
+        if done.cancelled():
+            result_stream.close(RuntimeError("transform cancelled"))
+        elif done.exception() is not None:
+            result_stream.close(done.exception())
+        else:
+            result_stream.close()
+    
+    task.add_done_callback(close_stream)
+    started = asyncio.create_task(result_stream.started.wait())
+    try:
+        await asyncio.wait({task, started}, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        started.cancel()
+    if not result_stream.started.is_set():
+        # 다운로드 전에 끝남 (실패/취소 -> HTTPException)
+        return task.result()
+    
+    headers = _result_headers(job_id, result_stream.writer.result_id, original_id, result_stream.writer.meta)
+    if result_stream.content_length is not None:
+        headers["Content-Length"] = str(result_stream.content_length)
+    return StreamingResponse(result_stream.body(), media_type="image/png", headers=headers)
+
+
+def _transform_result(job: dict, original_id: str, meta: Optional[dict] = None) -> dict:
+    meta = meta or {}
+    result = {
+        "success": True,
+        "job_id": job["job_id"],
+        "original_id": original_id,
+        "image_id": job["image_id"],
+        "image_url": f"api/transform/image/{job['image_id']}",
+        "preview_url": f"api/transform/image/{job['image_id']}/preview",
+        "original_url": f"api/transform/original/{original_id}",
+        "style": job["style"],
+        # GPU 대신 CPU 대체 변환으로 만든 결과면 degraded=true (키오스크가 다시 시도를 권할 수 있음)
+        "engine": meta.get("engine", "comfyui"),
+        "degraded": bool(meta.get("degraded")),
+    }
+    if meta.get("degraded"):
+        result["degraded_reason"] = meta.get("degraded_reason")
+    return result
+
+
+CANCEL_MESSAGES = {
+    "superseded": "같은 키오스크의 새 요청으로 대체되어 취소되었습니다",
+    "cancelled": "취소된 요청입니다",
+    "disconnected": "클라이언트 연결이 끊겨 취소되었습니다",
+}
+
+
+async def _cancel_on_disconnect(request: Request, job_id: str, interval: float = 0.5) -> None:
+    """변환 대기 중 클라이언트가 떠나면 (뒤로 가기, 탭 닫기) 작업 취소"""
+    while True:
+        await asyncio.sleep(interval)
+        if await request.is_disconnected():
+            scheduler.cancel(job_id, "disconnected")
+            return
+
+
+def _cached_image_response(kind: str, image_id: str, if_none_match: str):
+    entry = hot_cache.get(kind, image_id)
+    if entry is None:
+        return None
+    if etag_matches(if_none_match, entry.etag):
+        return not_modified(entry.etag, IMMUTABLE_CACHE_CONTROL)
+    return entry.response(headers={"ETag": entry.etag, "Cache-Control": IMMUTABLE_CACHE_CONTROL})
+
+
 @router.get("/styles")
 async def list_styles():
     return {
@@ -43,186 +256,503 @@ async def list_styles():
 
 
 @router.get("/health")
-async def check_sd_connection():
-    return await zimage_service.check_connection()
+async def check_sd_connection(history: bool = False):
+    """백그라운드 모니터의 최근 점검 결과 (ComfyUI로 실시간 요청하지 않음)"""
+    await health_monitor.wait_ready()
+    return health_monitor.snapshot(include_history=history)
 
 
 
-@router.post("/upload-temp")
-async def upload_temp_image(
-    image: UploadFile = File(...)
-):
+@router.post("/upload-temp", openapi_extra=UPLOAD_REQUEST_BODY)
+async def upload_temp_image(request: Request):
     """임시 이미지 업로드 (sessionStorage 용량 초과 방지)"""
-    if not image.content_type or not image.content_type.startswith("image/"):
-        raise HTTPException(status_code=400, detail="파일은 이미지여야 합니다")
-
-    image_bytes = await image.read()
-
-    max_size = settings.MAX_FILE_SIZE_MB * 1024 * 1024
-    if len(image_bytes) > max_size:
-        raise HTTPException(
-            status_code=400,
-            detail=f"이미지 크기는 {settings.MAX_FILE_SIZE_MB}MB 이하여야 합니다"
-        )
+    upload = await receive_image_upload(
+        request,
+        settings.UPLOAD_DIR,
+        max_bytes=settings.MAX_FILE_SIZE_MB * 1024 * 1024,
+        keep_bytes=hot_cache.max_object_bytes,
+    )
+    image_id = upload.image_id
 
-    ext = get_extension_from_mime(image.content_type)
-    image_id = str(uuid.uuid4())
-    filename = f"{image_id}{ext}"
-    filepath = os.path.join(settings.UPLOAD_DIR, filename)
-
-    async with aiofiles.open(filepath, "wb") as f:
-        await f.write(image_bytes)
-
-    meta_path = os.path.join(settings.UPLOAD_DIR, f"{image_id}.json")
-    async with aiofiles.open(meta_path, "w") as f:
-        await f.write(json.dumps({"ext": ext, "mime": image.content_type}))
+    try:
+        meta_path = os.path.join(settings.UPLOAD_DIR, f"{image_id}.json")
+        await storage.write_json(meta_path, {"ext": upload.ext, "mime": upload.mime, "etag": upload.etag})
+        image_etags.remember("original", image_id, upload.etag)
+        if upload.data is not None:
+            hot_cache.put("original", image_id, upload.data, upload.mime, upload.etag)
+        near_duplicates_found = await _find_near_duplicates("upload_temp", upload, image_id)
+    finally:
+        upload.release_data()
 
-    return {
+    result = {
         "success": True,
         "image_id": image_id,
         "image_url": f"api/transform/original/{image_id}"
     }
+    # 거의 같은 사진을 이전에 변환했다면 그 결과를 제안할 수 있도록 함께 반환
+    near_duplicate = near_duplicate_view(near_duplicates_found)
+    if near_duplicate is not None:
+        result["near_duplicate"] = near_duplicate
+    return result
 
 
 @router.get("/gallery")
 async def get_gallery():
     images = []
     generated_dir = settings.GENERATED_IMAGES_DIR
+    # 스캔 전에 읽은 커서로 스트림을 열면 목록과 스트림 사이에 빠지는 이미지가 없음
+    _, cursor = await job_store.gallery_event_bounds()
     
-    if os.path.exists(generated_dir):
-        files = []
-        for filename in os.listdir(generated_dir):
-            if filename.endswith('.png'):
-                filepath = os.path.join(generated_dir, filename)
-                files.append((filename, os.path.getmtime(filepath)))
-        
-        files.sort(key=lambda x: x[1], reverse=True)
-        
-        for filename, _ in files[:20]:
-            image_id = filename.replace('.png', '')
-            meta_path = os.path.join(generated_dir, f"{image_id}.json")
-            style = "unknown"
-            
-            if os.path.exists(meta_path):
-                try:
-                    with open(meta_path, 'r') as f:
-                        meta = json.load(f)
-                        style_key = meta.get("style", "unknown")
-                        if style_key in CHARACTER_STYLES:
-                            style = CHARACTER_STYLES[style_key]["name"]
-                except Exception:
-                    pass
-            
-            images.append({
-                "id": image_id,
-                "url": f"api/transform/image/{image_id}",
-                "style": style
-            })
-    
-    return {"images": images}
-
-
-@router.post("/character")
-async def transform_character(
-    image: UploadFile = File(...),
-    style: str = Form(default="real_bubblehead")
-):
-    if not image.content_type or not image.content_type.startswith("image/"):
-        raise HTTPException(status_code=400, detail="파일은 이미지여야 합니다")
-    
-    image_bytes = await image.read()
-    
-    max_size = settings.MAX_FILE_SIZE_MB * 1024 * 1024
-    if len(image_bytes) > max_size:
+    files = await storage.scan(generated_dir, ".png")
+    files.sort(key=lambda x: x[1], reverse=True)
+    image_ids = [filename.replace('.png', '') for filename, _ in files[:20]]
+    
+    async def read_meta(image_id: str):
+        try:
+            return await storage.read_json(os.path.join(generated_dir, f"{image_id}.json"))
+        except Exception:
+            return None
+    
+    metas = await asyncio.gather(*(read_meta(image_id) for image_id in image_ids))
+    for image_id, meta in zip(image_ids, metas):
+        images.append(gallery_entry(image_id, (meta or {}).get("style")))
+    
+    return {"images": images, "cursor": cursor}
+
+
+@router.get("/gallery/stream")
+async def stream_gallery(request: Request, cursor: Optional[int] = None):
+    """생성/삭제 이벤트 푸시 (text/event-stream)
+
+    이어받을 위치: 재연결 시 브라우저가 보내는 Last-Event-ID, 처음 연결이면 ?cursor= (/gallery 응답의 cursor).
+    둘 다 없으면 지금 이후 이벤트만 보낸다.
+    """
+    last_event_id = request.headers.get("last-event-id")
+    if last_event_id:
+        try:
+            cursor = int(last_event_id)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Last-Event-ID가 올바르지 않습니다")
+    return StreamingResponse(
+        gallery_feed.stream(cursor),
+        media_type="text/event-stream",
+        # 프록시(nginx) 버퍼링/캐시 없이 바로 전달
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@router.post("/character", openapi_extra=TRANSFORM_REQUEST_BODY)
+async def transform_character(request: Request):
+    retry_after = await job_store.hit_rate_limit(
+        _kiosk_key(request), settings.RATE_LIMIT_TRANSFORMS_PER_MINUTE
+    )
+    if retry_after is not None:
         raise HTTPException(
-            status_code=400, 
-            detail=f"이미지 크기는 {settings.MAX_FILE_SIZE_MB}MB 이하여야 합니다"
+            status_code=429,
+            detail="요청이 너무 많습니다. 잠시 후 다시 시도해주세요",
+            headers=_retry_after(retry_after),
         )
+    with tracer.span("transform_character") as span:
+        return await _transform_character(request, span)
+
+
+async def _transform_character(request: Request, span):
+    upload = await receive_image_upload(
+        request,
+        settings.UPLOAD_DIR,
+        max_bytes=settings.MAX_FILE_SIZE_MB * 1024 * 1024,
+        keep_bytes=hot_cache.max_object_bytes,
+    )
+    # 본문 사본은 핫 캐시/유사 사진 조회까지만: ComfyUI를 기다리는 동안에는 디스크 파일만 사용
+    try:
+        return await _transform_upload(request, span, upload)
+    finally:
+        upload.release_data()
+
+
+async def _transform_upload(request: Request, span, upload: StoredUpload):
+    style = upload.fields.get("style") or "real_bubblehead"
+    priority = upload.fields.get("priority") or DEFAULT_PRIORITY
+    if priority not in PRIORITY_CLASSES:
+        raise HTTPException(status_code=400, detail=f"priority는 {', '.join(PRIORITY_CLASSES)} 중 하나여야 합니다")
+    kiosk = _kiosk_key(request)
+    original_id = upload.image_id
+    # 주문에 결과를 연결하면 이후 페이지(배송/결제/출력)는 주문 id만으로 결과를 찾는다
+    order_id = upload.fields.get("order_id")
+    span.set_attribute("style", style)
+    span.set_attribute("priority", priority)
+    span.set_attribute("original_id", original_id)
+    span.set_attribute("upload_bytes", upload.size)
+    
+    meta_path = os.path.join(settings.UPLOAD_DIR, f"{original_id}.json")
+    await storage.write_json(meta_path, {"ext": upload.ext, "mime": upload.mime, "etag": upload.etag})
+    image_etags.remember("original", original_id, upload.etag)
+    if upload.data is not None:
+        hot_cache.put("original", original_id, upload.data, upload.mime, upload.etag)
     
-    original_ext = get_extension_from_mime(image.content_type)
-    original_id = str(uuid.uuid4())
-    original_filename = f"{original_id}{original_ext}"
-    original_path = os.path.join(settings.UPLOAD_DIR, original_filename)
+    near_duplicates_found = await _find_near_duplicates("transform", upload, original_id)
+    upload.release_data()
+    if near_duplicates_found:
+        span.set_attribute("near_duplicate_distance", near_duplicates_found[0].distance)
     
-    async with aiofiles.open(original_path, "wb") as f:
-        await f.write(image_bytes)
+    metric_style = style if style in CHARACTER_STYLES else "real_bubblehead"
     
-    meta_path = os.path.join(settings.UPLOAD_DIR, f"{original_id}.json")
-    async with aiofiles.open(meta_path, "w") as f:
-        await f.write(json.dumps({"ext": original_ext, "mime": image.content_type}))
+    # 같은 사진 + 같은 스타일이 이미 처리 중이면 (다른 워커여도) 그 결과를 함께 사용
+    job_id, is_new = await job_store.create_job(
+        style,
+        dedup_key=f"{metric_style}:{upload.etag}",
+        original_id=original_id,
+        kiosk=kiosk,
+        priority=priority,
+    )
+    span.set_attribute("job_id", job_id)
+    if not is_new:
+        span.set_attribute("deduplicated", True)
+        job = await job_store.wait_for_job(job_id, timeout=await _join_timeout(job_id, metric_style, priority))
+        if job is not None and job["status"] == "cancelled":
+            raise HTTPException(status_code=409, detail=CANCEL_MESSAGES.get(job["error"], "취소된 요청입니다"))
+        if job is not None and job["status"] in ("queued", "running"):
+            if job_store.is_stale(job):
+                # 처리하던 워커가 죽음: 다시 보내면 새 작업으로 시작됨
+                raise HTTPException(
+                    status_code=503,
+                    detail="변환을 처리하던 서버가 응답하지 않습니다. 다시 시도해주세요",
+                    headers={"Retry-After": "1"},
+                )
+            raise HTTPException(
+                status_code=504,
+                detail=f"변환이 아직 끝나지 않았습니다. GET /api/transform/jobs/{job_id} 로 확인해주세요",
+            )
+        if job is None or job["status"] != "succeeded":
+            error = (job.get("error") if job else None) or "job record missing"
+            raise HTTPException(status_code=500, detail=f"캐릭터 변환 실패: {error}")
+        result_meta = await storage.read_json(os.path.join(settings.GENERATED_IMAGES_DIR, f"{job['image_id']}.json"))
+        if priority == "final" and (result_meta or {}).get("degraded"):
+            # 중복 키는 우선순위를 구분하지 않음: 미리보기 요청이 받은 CPU 대체 결과를 final에 넘기지 않음
+            # (그 작업은 끝났으므로 다시 보내면 새 작업으로 GPU에서 변환)
+            raise HTTPException(
+                status_code=503,
+                detail="GPU 변환 결과가 아직 없습니다. 잠시 후 다시 시도해주세요",
+                headers=_retry_after(fallback_engine.breaker.retry_after()),
+            )
+        if order_id:
+            await job_store.update_order(order_id, style=style, job_id=job_id, result_id=job["image_id"])
+        if _wants_image(request):
+            return FileResponse(
+                os.path.join(settings.GENERATED_IMAGES_DIR, f"{job['image_id']}.png"),
+                media_type="image/png",
+                headers=_result_headers(job_id, job["image_id"], original_id, result_meta),
+            )
+        return _transform_result(job, original_id, result_meta)
+    
+    # 같은 키오스크가 새로 요청하면 이전 미리보기는 더 이상 필요 없음 (X-Kiosk-ID를 보낸 경우만)
+    if priority != "background" and request.headers.get("x-kiosk-id"):
+        await scheduler.supersede(kiosk, job_id)
+    
+    async def record_prompt_id(prompt_id: str) -> None:
+        await job_store.update_job(job_id, prompt_id=prompt_id)
+    
+    # 완료 예상 시각 (진행률 막대용): 접수 시 앱 큐 기준으로, ComfyUI 제출 후에는 큐 위치/실행 상태로 갱신
+    async def record_eta(remaining: float) -> None:
+        await job_store.update_job(job_id, eta_at=time.time() + remaining)
+    
+    await record_eta(_predict_seconds(metric_style, priority))
+    
+    # 거의 같은 사진의 WD14 태그가 있으면 재사용 (태거 노드 생략), 없으면 이번 태그를 저장해 다음 재촬영에 사용
+    reused_tags = None
+    if settings.NEAR_DUP_REUSE_TAGS:
+        reused_tags = next((match.tags for match in near_duplicates_found if match.tags), None)
+    span.set_attribute("tags_reused", reused_tags is not None)
+    
+    async def record_tags(tags: str) -> None:
+        await near_duplicates.remember_tags(upload.etag, tags)
+    
+    # 결과는 다운로드하면서 바로 디스크에 (동기 호출자면 응답 본문에도) 흘려보냄
+    writer = storage.generated_writer(style, original_id)
+    result_stream = ResultStream(writer) if _wants_image(request) else None
+    
+    async def run_transform():
+        await job_store.update_job(job_id, status="running")
+        with TRANSFORMS_IN_FLIGHT.track():
+            return await zimage_service.transform_to_character(
+                Path(upload.path), 
+                style=style,
+                on_queued=record_prompt_id,
+                tags=reused_tags,
+                on_tagged=record_tags if settings.NEAR_DUP_ENABLED else None,
+                on_eta=record_eta,
+                sink=result_stream or writer,
+            )
+    
+    async def run_fallback(reason: str):
+        span.set_attribute("degraded", reason)
+        await job_store.update_job(job_id, status="running")
+        await fallback_engine.render(upload.path, metric_style, result_stream or writer, reason)
     
+    async def execute():
+        # GPU가 끊겼거나(브레이커 열림) 미리보기 대기열이 너무 길면 CPU 대체 변환 (final은 GPUUnavailable -> 503)
+        degrade_reason = fallback_engine.degrade_reason(priority, _jobs_ahead(priority))
+        if degrade_reason is not None:
+            return await run_fallback(degrade_reason)
+        try:
+            await scheduler.run(job_id, kiosk, priority, run_transform, style=style)
+        except JobCancelled:
+            raise
+        except Exception as e:
+            if not is_connection_error(e):
+                raise
+            fallback_engine.breaker.record_failure()
+            # 이미 GPU 결과로 응답을 열었으면 대체 결과로 바꿔 보낼 수 없음 (본문을 끊어 실패를 알림)
+            if not fallback_engine.enabled or (result_stream is not None and result_stream.committed):
+                raise
+            if priority == "final":
+                raise GPUUnavailable("comfyui_error", fallback_engine.breaker.retry_after()) from e
+            logger.warning(f"ComfyUI unreachable for job {job_id}, using CPU fallback: {e!r}")
+            return await run_fallback("comfyui_error")
+        fallback_engine.breaker.record_success()
+    
+    completion = _complete_transform(
+        request, span, job_id, style, metric_style, original_id, order_id, writer, execute
+    )
+    if result_stream is None:
+        return await completion
+    return await _stream_result(completion, result_stream, job_id, original_id)
+
+
+async def _complete_transform(
+    request: Request,
+    span,
+    job_id: str,
+    style: str,
+    metric_style: str,
+    original_id: str,
+    order_id,
+    writer,
+    execute,
+) -> dict:
+    """변환 실행(GPU 또는 CPU 대체) -> 작업/주문/갤러리 기록 (결과 파일은 다운로드하면서 writer가 이미 저장)"""
+    started = time.perf_counter()
+    watcher = asyncio.create_task(_cancel_on_disconnect(request, job_id))
     try:
-        result_bytes = await zimage_service.transform_to_character(
-            image_bytes, 
-            style=style,
-        )
-        
-        result_id = str(uuid.uuid4())
-        result_filename = f"{result_id}.png"
-        result_path = os.path.join(settings.GENERATED_IMAGES_DIR, result_filename)
-        
-        async with aiofiles.open(result_path, "wb") as f:
-            await f.write(result_bytes)
+        try:
+            await execute()
+        except BaseException:
+            await asyncio.shield(writer.discard())
+            raise
+        finally:
+            watcher.cancel()
         
-        result_meta_path = os.path.join(settings.GENERATED_IMAGES_DIR, f"{result_id}.json")
-        async with aiofiles.open(result_meta_path, "w") as f:
-            await f.write(json.dumps({
-                "style": style,
-                "original_id": original_id
-            }))
+        result_id = writer.result_id
+        span.set_attribute("result_bytes", writer.size)
+        image_etags.remember("generated", result_id, writer.etag)
+        span.set_attribute("image_id", result_id)
+        await gallery_feed.publish("created", result_id, style)
+        TRANSFORM_SECONDS.observe(time.perf_counter() - started, metric_style, "success")
         
-        return {
-            "success": True,
-            "original_id": original_id,
-            "image_id": result_id,
-            "image_url": f"api/transform/image/{result_id}",
-            "original_url": f"api/transform/original/{original_id}",
-            "style": style
-        }
+        await job_store.update_job(job_id, status="succeeded", image_id=result_id)
+        if order_id:
+            await job_store.update_order(order_id, style=style, job_id=job_id, result_id=result_id)
+        return _transform_result({"job_id": job_id, "image_id": result_id, "style": style}, original_id, writer.meta)
+    except JobCancelled as e:
+        TRANSFORM_SECONDS.observe(time.perf_counter() - started, metric_style, "cancelled")
+        await job_store.update_job(job_id, status="cancelled", error=e.reason)
+        raise HTTPException(
+            status_code=409,
+            detail=CANCEL_MESSAGES.get(e.reason, "취소된 요청입니다")
+        )
+    except GPUUnavailable as e:
+        TRANSFORM_SECONDS.observe(time.perf_counter() - started, metric_style, "error")
+        await job_store.update_job(job_id, status="failed", error=str(e))
+        raise HTTPException(
+            status_code=503,
+            detail="GPU 변환 서버에 연결할 수 없습니다. 잠시 후 다시 시도해주세요",
+            headers=_retry_after(e.retry_after),
+        )
     except Exception as e:
+        TRANSFORM_SECONDS.observe(time.perf_counter() - started, metric_style, "error")
+        await job_store.update_job(job_id, status="failed", error=str(e)[:500])
         raise HTTPException(
             status_code=500, 
             detail=f"캐릭터 변환 실패: {str(e)}"
         )
+    except BaseException:
+        # 요청 취소 등: 대기 중인 다른 요청이 stale 시간까지 기다리지 않도록 실패로 기록
+        await asyncio.shield(job_store.update_job(job_id, status="failed", error="cancelled"))
+        raise
+
+
+@router.post("/jobs/{job_id}/cancel")
+async def cancel_job(job_id: str):
+    """진행 중 작업 취소 (앱 큐에서 제거하거나 ComfyUI 큐 삭제 / 중단)"""
+    job = await scheduler.cancel_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="작업을 찾을 수 없습니다")
+    if job["status"] not in ("queued", "running"):
+        raise HTTPException(status_code=409, detail=f"이미 끝난 작업입니다 ({job['status']})")
+    return {"job_id": job_id, "status": "cancelling"}
+
+
+@router.get("/eta")
+async def predict_eta(style: str = "real_bubblehead", priority: str = DEFAULT_PRIORITY):
+    """지금 변환을 요청하면 완료까지 예상 초 (큐 깊이 + 스타일별 실행 시간 기반)"""
+    if priority not in PRIORITY_CLASSES:
+        raise HTTPException(status_code=400, detail=f"priority는 {', '.join(PRIORITY_CLASSES)} 중 하나여야 합니다")
+    metric_style = style if style in CHARACTER_STYLES else "real_bubblehead"
+    return {
+        "style": metric_style,
+        "priority": priority,
+        "eta_seconds": round(_predict_seconds(metric_style, priority), 1),
+        "queue": {
+            "scheduler": scheduler.stats(),
+            "comfyui_depth": zimage_service.expected_queue_depth(),
+        },
+        "model": latency_model.snapshot(),
+    }
+
+
+@router.get("/jobs/active")
+async def get_active_jobs(request: Request):
+    """이 키오스크의 진행 중 작업과 완료 예상 시각 (변환을 기다리는 동안 진행률 표시용)"""
+    jobs = await job_store.active_jobs(_kiosk_key(request))
+    return {"jobs": [_job_view(job) for job in jobs]}
+
+
+@router.get("/jobs/{job_id}")
+async def get_job_status(job_id: str):
+    """작업 상태 조회 (어느 워커가 처리했든 같은 결과)"""
+    job = await job_store.get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="작업을 찾을 수 없습니다")
+    return _job_view(job)
 
 
 @router.get("/image/{image_id}")
-async def get_generated_image(image_id: str):
+async def get_generated_image(image_id: str, request: Request):
+    # 생성 이미지는 UUID로 한 번 쓰이면 바뀌지 않음 -> 알려진 ETag면 파일을 보지 않고 304
+    if_none_match = request.headers.get("if-none-match")
+    known_etag = image_etags.lookup("generated", image_id)
+    if known_etag and etag_matches(if_none_match, known_etag):
+        return not_modified(known_etag, IMMUTABLE_CACHE_CONTROL)
+
+    cached = _cached_image_response("generated", image_id, if_none_match)
+    if cached is not None:
+        return cached
+
     image_path = os.path.join(settings.GENERATED_IMAGES_DIR, f"{image_id}.png")
-    if not os.path.exists(image_path):
+    if not await storage.exists(image_path):
         raise HTTPException(status_code=404, detail="이미지를 찾을 수 없습니다")
-    return FileResponse(image_path, media_type="image/png")
 
+    meta_path = os.path.join(settings.GENERATED_IMAGES_DIR, f"{image_id}.json")
+    etag = await _resolve_etag("generated", image_id, image_path, meta_path)
+    if etag_matches(if_none_match, etag):
+        return not_modified(etag, IMMUTABLE_CACHE_CONTROL)
+    return await _image_response("generated", image_id, image_path, "image/png", etag)
 
-@router.get("/original/{image_id}")
-async def get_original_image(image_id: str):
+
+async def _original_path(image_id: str) -> tuple:
+    """업로드 원본의 (경로, MIME, 메타데이터 경로)"""
     meta_path = os.path.join(settings.UPLOAD_DIR, f"{image_id}.json")
     
     ext = ".png"
     mime_type = "image/png"
     
-    if os.path.exists(meta_path):
-        try:
-            async with aiofiles.open(meta_path, "r") as f:
-                meta = json.loads(await f.read())
-                ext = meta.get("ext", ".png")
-                mime_type = meta.get("mime", "image/png")
-        except Exception:
-            pass
+    try:
+        meta = await storage.read_json(meta_path)
+    except Exception:
+        meta = None
+    if meta:
+        ext = meta.get("ext", ".png")
+        mime_type = meta.get("mime", "image/png")
     
     image_path = os.path.join(settings.UPLOAD_DIR, f"{image_id}{ext}")
     
-    if not os.path.exists(image_path):
-        for possible_ext in [".jpg", ".jpeg", ".png", ".gif", ".webp"]:
-            possible_path = os.path.join(settings.UPLOAD_DIR, f"{image_id}{possible_ext}")
-            if os.path.exists(possible_path):
-                image_path = possible_path
-                mime_type = get_mime_from_extension(possible_ext)
-                break
-        else:
+    if not await storage.exists(image_path):
+        # 메타데이터가 없는 구버전 파일: 확장자를 바꿔 가며 한 번의 스레드 왕복으로 확인
+        candidates = [
+            os.path.join(settings.UPLOAD_DIR, f"{image_id}{possible_ext}")
+            for possible_ext in [".jpg", ".jpeg", ".png", ".gif", ".webp"]
+        ]
+        found = await storage.first_existing(candidates)
+        if found is None:
             raise HTTPException(status_code=404, detail="원본 이미지를 찾을 수 없습니다")
-    
-    return FileResponse(image_path, media_type=mime_type)
+        image_path = found
+        mime_type = get_mime_from_extension(os.path.splitext(found)[1])
+    return image_path, mime_type, meta_path
+
+
+@router.get("/original/{image_id}")
+async def get_original_image(image_id: str, request: Request):
+    if_none_match = request.headers.get("if-none-match")
+    known_etag = image_etags.lookup("original", image_id)
+    if known_etag and etag_matches(if_none_match, known_etag):
+        return not_modified(known_etag, IMMUTABLE_CACHE_CONTROL)
+
+    cached = _cached_image_response("original", image_id, if_none_match)
+    if cached is not None:
+        return cached
+
+    image_path, mime_type, meta_path = await _original_path(image_id)
+    etag = await _resolve_etag("original", image_id, image_path, meta_path)
+    if etag_matches(if_none_match, etag):
+        return not_modified(etag, IMMUTABLE_CACHE_CONTROL)
+    return await _image_response("original", image_id, image_path, mime_type, etag)
+
+
+async def _derivative_response(kind: str, image_id: str, size: str, request: Request):
+    """썸네일/미리보기 크기 WebP (원본과 같은 캐싱 규칙: 불변 ETag + 핫 캐시)"""
+    if size not in DERIVATIVE_SIZES:
+        raise HTTPException(status_code=404, detail=f"size는 {', '.join(DERIVATIVE_SIZES)} 중 하나여야 합니다")
+    cache_kind = f"{kind}:{size}"
+    if_none_match = request.headers.get("if-none-match")
+    known_etag = image_etags.lookup(cache_kind, image_id)
+    if known_etag and etag_matches(if_none_match, known_etag):
+        return not_modified(known_etag, IMMUTABLE_CACHE_CONTROL)
+
+    cached = _cached_image_response(cache_kind, image_id, if_none_match)
+    if cached is not None:
+        return cached
+
+    if kind == "generated":
+        base_dir = settings.GENERATED_IMAGES_DIR
+        source_path = os.path.join(base_dir, f"{image_id}.png")
+        meta_path = os.path.join(base_dir, f"{image_id}.json")
+        if not await storage.exists(source_path):
+            raise HTTPException(status_code=404, detail="이미지를 찾을 수 없습니다")
+    else:
+        base_dir = settings.UPLOAD_DIR
+        source_path, _, meta_path = await _original_path(image_id)
+
+    etag = derivative_etag(await _resolve_etag(kind, image_id, source_path, meta_path), size)
+    image_etags.remember(cache_kind, image_id, etag)
+    if etag_matches(if_none_match, etag):
+        return not_modified(etag, IMMUTABLE_CACHE_CONTROL)
+    path = await derivative_store.ensure(source_path, base_dir, image_id, size)
+    return await _image_response(cache_kind, image_id, path, DERIVATIVE_MEDIA_TYPE, etag)
+
+
+@router.get("/image/{image_id}/{size}")
+async def get_generated_image_derivative(image_id: str, size: str, request: Request):
+    return await _derivative_response("generated", image_id, size, request)
+
+
+@router.get("/original/{image_id}/{size}")
+async def get_original_image_derivative(image_id: str, size: str, request: Request):
+    return await _derivative_response("original", image_id, size, request)
+
+
+def _forget_generated(image_id: str) -> None:
+    """이 워커의 인메모리 캐시(ETag 인덱스, 핫 캐시)에서 생성 이미지와 파생 이미지를 지움"""
+    for kind in ["generated"] + [f"generated:{size}" for size in DERIVATIVE_SIZES]:
+        image_etags.forget(kind, image_id)
+        hot_cache.evict(kind, image_id)
+
+
+def _on_gallery_event(event) -> None:
+    if event.type == "deleted":
+        _forget_generated(event.image_id)
+
+
+gallery_feed.add_listener(_on_gallery_event)
 
 
 @router.delete("/image/{image_id}")
@@ -230,13 +760,16 @@ async def delete_generated_image(image_id: str):
     image_path = os.path.join(settings.GENERATED_IMAGES_DIR, f"{image_id}.png")
     meta_path = os.path.join(settings.GENERATED_IMAGES_DIR, f"{image_id}.json")
     
-    if not os.path.exists(image_path):
+    if not await storage.exists(image_path):
         raise HTTPException(status_code=404, detail="이미지를 찾을 수 없습니다")
     
     try:
-        os.remove(image_path)
-        if os.path.exists(meta_path):
-            os.remove(meta_path)
+        await storage.remove(image_path)
+        await storage.remove(meta_path)
+        _forget_generated(image_id)
+        await derivative_store.remove(settings.GENERATED_IMAGES_DIR, image_id)
+        # 다른 워커는 이 이벤트를 폴링하면서 자기 캐시에서 지운다
+        await gallery_feed.publish("deleted", image_id)
         return {"success": True, "message": "이미지가 삭제되었습니다"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"삭제 실패: {str(e)}")
@@ -0,0 +1,130 @@
+"""
+같은 스타일 동시 요청 마이크로 배칭
+
+첫 요청이 들어오면 window 동안(또는 max_size가 찰 때까지) 같은 키(스타일)의 요청을 모아
+run_batch 콜백 한 번으로 실행하고, 결과를 입력 순서대로 각 요청자에게 돌려준다.
+run_batch는 요청자별 결과 또는 예외 목록을 돌려주므로 한 장의 실패(다운로드/저장)는 그 요청자만 실패시키고,
+run_batch 자체가 실패하면 모든 요청자가 실패하되 요청자마다 별도 예외 객체를 받는다.
+묶음 안의 일부 요청자가 취소되어도 나머지는 계속 진행하며, 모두 취소되면 묶음 실행도 취소한다.
+"""
+
+import asyncio
+import copy
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Optional
+
+
+@dataclass(eq=False)
+class BatchItem:
+    image: object
+    on_queued: Optional[Callable[[str], Awaitable[None]]]
+    tags: Optional[str] = None
+    on_tagged: Optional[Callable[[str], Awaitable[None]]] = None
+    on_eta: Optional[Callable[[float], Awaitable[None]]] = None
+    sink: object = None
+    future: asyncio.Future = field(default_factory=lambda: asyncio.get_running_loop().create_future())
+    cancelled: bool = False
+    batch: Optional[list] = None
+    task: Optional[asyncio.Task] = None
+
+
+def _consume(future: asyncio.Future) -> None:
+    """아무도 기다리지 않는 future의 예외 경고 방지"""
+    if not future.cancelled():
+        future.exception()
+
+
+def _own_exception(error: BaseException) -> BaseException:
+    """요청자마다 별도 예외 객체 (한 객체를 여러 태스크에서 raise하면 __traceback__이 섞임, 원본은 __cause__로)"""
+    try:
+        clone = copy.copy(error)
+    except Exception:
+        return error
+    clone.__cause__ = error
+    return clone
+
+
+class MicroBatcher:
+    def __init__(self, window: float, max_size: int, run_batch: Callable[[str, list], Awaitable[list]]):
+        self.window = window
+        self.max_size = max_size
+        self.run_batch = run_batch
+        self._pending: dict = {}
+        self._timers: dict = {}
+
+    async def submit(
+        self,
+        key: str,
+        image,
+        on_queued: Optional[Callable[[str], Awaitable[None]]] = None,
+        tags: Optional[str] = None,
+        on_tagged: Optional[Callable[[str], Awaitable[None]]] = None,
+        on_eta: Optional[Callable[[float], Awaitable[None]]] = None,
+        sink=None,
+    ):
+        item = BatchItem(image, on_queued, tags, on_tagged, on_eta, sink)
+        pending = self._pending.setdefault(key, [])
+        pending.append(item)
+        if len(pending) >= self.max_size:
+            self._flush(key)
+        elif key not in self._timers:
+            self._timers[key] = asyncio.create_task(self._flush_later(key))
+
+        try:
+            return await asyncio.shield(item.future)
+        except asyncio.CancelledError:
+            self._cancel(key, item)
+            raise
+
+    def _cancel(self, key: str, item: BatchItem) -> None:
+        item.cancelled = True
+        item.future.add_done_callback(_consume)
+        pending = self._pending.get(key)
+        if pending is not None and item in pending:
+            pending.remove(item)
+            if not pending:
+                del self._pending[key]
+                timer = self._timers.pop(key, None)
+                if timer is not None:
+                    timer.cancel()
+        elif item.batch is not None and all(other.cancelled for other in item.batch):
+            # 묶음 전체가 취소됨 -> 실행 태스크 취소 (ComfyUI 큐에서도 제거됨)
+            item.task.cancel()
+
+    async def _flush_later(self, key: str) -> None:
+        await asyncio.sleep(self.window)
+        self._timers.pop(key, None)
+        self._flush(key)
+
+    def _flush(self, key: str) -> None:
+        items = self._pending.pop(key, [])
+        timer = self._timers.pop(key, None)
+        if timer is not None:
+            timer.cancel()
+        if not items:
+            return
+        task = asyncio.create_task(self._run(key, items))
+        for item in items:
+            item.batch = items
+            item.task = task
+
+    async def _run(self, key: str, items: list) -> None:
+        try:
+            results = await self.run_batch(key, items)
+        except asyncio.CancelledError:
+            for item in items:
+                if not item.future.done():
+                    item.future.cancel()
+            raise
+        except Exception as e:
+            for item in items:
+                if not item.future.done():
+                    item.future.set_exception(_own_exception(e))
+            return
+        for item, result in zip(items, results):
+            if item.future.done():
+                continue
+            if isinstance(result, BaseException):
+                item.future.set_exception(result)
+            else:
+                item.future.set_result(result)
@@ -0,0 +1,71 @@
+"""
+화면 크기별 이미지 파생본 (썸네일 / 미리보기)
+
+키오스크 페이지는 원본 PNG(수 MB)가 아니라 화면에 맞는 크기만 필요하다.
+첫 요청 때 Pillow로 WebP 파생본을 만들어 원본 옆 derivatives/ 디렉터리에 저장하고,
+이후에는 파일(또는 핫 캐시)에서 바로 돌려준다. 원본은 id로 주소가 정해지고 바뀌지 않으므로
+파생본 ETag는 원본 ETag + 크기에서 결정된다.
+"""
+
+import asyncio
+import hashlib
+import os
+
+from app.services.storage import storage
+
+# 크기 이름 -> 긴 변 최대 픽셀
+DERIVATIVE_SIZES = {
+    "thumb": 256,
+    "preview": 1024,
+}
+DERIVATIVE_MEDIA_TYPE = "image/webp"
+
+
+def derivative_etag(source_etag: str, size: str) -> str:
+    return '"' + hashlib.sha256(f"{source_etag}:{size}".encode()).hexdigest()[:32] + '"'
+
+
+def _render(source_path: str, target_path: str, max_side: int) -> None:
+    from PIL import Image, ImageOps  # Pillow는 파생본을 처음 만들 때 로드
+
+    with Image.open(source_path) as img:
+        img = ImageOps.exif_transpose(img)
+        img.thumbnail((max_side, max_side))
+        if img.mode not in ("RGB", "RGBA"):
+            img = img.convert("RGBA" if "A" in img.getbands() else "RGB")
+        tmp_path = f"{target_path}.{os.getpid()}.tmp"
+        img.save(tmp_path, "WEBP", quality=85, method=4)
+    os.replace(tmp_path, target_path)
+
+
+class DerivativeStore:
+    def __init__(self):
+        self._locks: dict = {}
+
+    def path(self, base_dir: str, image_id: str, size: str) -> str:
+        return os.path.join(base_dir, "derivatives", f"{image_id}_{size}.webp")
+
+    async def ensure(self, source_path: str, base_dir: str, image_id: str, size: str) -> str:
+        """파생본 경로 반환 (없으면 스레드에서 생성; 같은 파생본 동시 요청은 한 번만 생성)"""
+        target_path = self.path(base_dir, image_id, size)
+        if await storage.exists(target_path):
+            return target_path
+        key = (base_dir, image_id, size)
+        lock = self._locks.setdefault(key, asyncio.Lock())
+        try:
+            async with lock:
+                if not await storage.exists(target_path):
+                    await storage.makedirs(os.path.dirname(target_path))
+                    await storage.run("render", _render, source_path, target_path, DERIVATIVE_SIZES[size])
+        finally:
+            if not lock.locked():
+                self._locks.pop(key, None)
+        return target_path
+
+    async def remove(self, base_dir: str, image_id: str) -> None:
+        for size in DERIVATIVE_SIZES:
+            await storage.remove(self.path(base_dir, image_id, size))
+
+
+# 파생본 저장소 인스턴스
+derivative_store = DerivativeStore()
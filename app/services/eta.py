@@ -0,0 +1,146 @@
+"""
+변환 완료 시각 예측 / 작업별 타임아웃 / 행(hang) 감지
+
+ComfyUI 큐 앞에 몇 개의 prompt가 있는지(라이브 /queue)와 스타일별 과거 GPU 실행 시간(지수이동평균)으로
+각 작업의 완료 예상 시각을 계산한다. 클라이언트는 이 값으로 실제 진행률 막대를 그리고,
+결과 대기의 타임아웃과 행 감지도 고정값(180초) 대신 이 예측에서 정한다.
+
+- 큐가 길면 그만큼 타임아웃이 늘어나 긴 대기열 뒤의 작업이 가짜로 실패하지 않고
+- 실행이 시작된 prompt가 예상 실행 시간보다 훨씬 오래 끝나지 않으면 3분을 기다리지 않고 행으로 판단한다.
+
+실행 시간은 사진 한 장 기준으로 학습한다 (마이크로 배치 prompt는 실행 시간 / 장 수로 반영). 여러 장을 묶은
+prompt의 예측/행 판단은 장 수에 비례해 늘린다 (묶음 비용을 선형으로 보는 보수적인 가정).
+"""
+
+import time
+from dataclasses import dataclass
+from typing import Optional
+
+from app.config import settings
+
+
+@dataclass
+class _Ewma:
+    mean: float
+    deviation: float
+    samples: int = 1
+
+    def update(self, value: float, alpha: float) -> None:
+        self.deviation = (1 - alpha) * self.deviation + alpha * abs(value - self.mean)
+        self.mean = (1 - alpha) * self.mean + alpha * value
+        self.samples += 1
+
+
+class LatencyModel:
+    def __init__(
+        self,
+        default_execution: float,
+        alpha: float,
+        timeout_factor: float,
+        timeout_slack: float,
+        max_timeout: float,
+        hang_factor: float,
+        hang_min_seconds: float,
+    ):
+        self.default_execution = default_execution
+        self.alpha = alpha
+        self.timeout_factor = timeout_factor
+        self.timeout_slack = timeout_slack
+        self.max_timeout = max_timeout
+        self.hang_factor = hang_factor
+        self.hang_min_seconds = hang_min_seconds
+        self._styles: dict = {}
+        self._overall: Optional[_Ewma] = None
+
+    def observe(self, style: str, execution: float) -> None:
+        """사진 한 장의 GPU 실행 시간 반영 (스타일별 + 전체)"""
+        for key in (style, None):
+            stats = self._styles.get(key) if key is not None else self._overall
+            if stats is None:
+                stats = _Ewma(mean=execution, deviation=execution / 4)
+                if key is None:
+                    self._overall = stats
+                else:
+                    self._styles[key] = stats
+            else:
+                stats.update(execution, self.alpha)
+
+    @property
+    def observed(self) -> bool:
+        return self._overall is not None
+
+    def execution(self, style: Optional[str] = None) -> float:
+        """예상 GPU 실행 시간 (스타일 기록이 없으면 전체 평균, 그것도 없으면 기본값)"""
+        stats = self._styles.get(style) or self._overall
+        return stats.mean if stats is not None else self.default_execution
+
+    def deviation(self, style: Optional[str] = None) -> float:
+        stats = self._styles.get(style) or self._overall
+        return stats.deviation if stats is not None else self.default_execution / 4
+
+    def predict(self, style: str, prompts_ahead: float, running_elapsed: Optional[float] = None, items: int = 1) -> float:
+        """지금부터 완료까지 예상 초
+
+        prompts_ahead: ComfyUI(또는 앱 큐)에서 이 작업보다 먼저 실행될 prompt 수 (스타일을 모르므로 전체 평균으로 계산)
+        running_elapsed: 이미 실행 중이면 실행 시작 후 경과 시간
+        items: 이 prompt에 묶인 사진 수
+        """
+        own = self.execution(style) * items
+        if running_elapsed is not None:
+            # 예상보다 오래 걸리는 중이면 남은 시간을 편차만큼으로 둠 (0초 진행률 정지 방지)
+            return max(own - running_elapsed, self.deviation(style) * items)
+        return prompts_ahead * self.execution() + own
+
+    def timeout(self, predicted: float) -> float:
+        """결과 대기 타임아웃: 예측 x 배수 + 여유 (최대 max_timeout)"""
+        return min(self.max_timeout, predicted * self.timeout_factor + self.timeout_slack)
+
+    def hang_after(self, style: str, items: int = 1) -> float:
+        """실행 시작 후 이 시간이 지나도 끝나지 않으면 행으로 판단 (items: prompt에 묶인 사진 수)"""
+        return max(
+            self.hang_min_seconds,
+            (self.execution(style) * self.hang_factor + 4 * self.deviation(style)) * items,
+        )
+
+    def snapshot(self) -> dict:
+        return {
+            "default_execution_seconds": self.default_execution,
+            "overall": self._stats_view(self._overall),
+            "styles": {style: self._stats_view(stats) for style, stats in self._styles.items()},
+        }
+
+    @staticmethod
+    def _stats_view(stats: Optional[_Ewma]) -> Optional[dict]:
+        if stats is None:
+            return None
+        return {
+            "execution_seconds": round(stats.mean, 2),
+            "deviation_seconds": round(stats.deviation, 2),
+            "samples": stats.samples,
+        }
+
+
+def eta_view(job: dict, now: Optional[float] = None) -> dict:
+    """작업 기록 -> 진행률 표시용 필드 (eta_at: 완료 예상 epoch 초)"""
+    if job.get("eta_at") is None:
+        return {}
+    now = now or time.time()
+    remaining = max(0.0, job["eta_at"] - now)
+    elapsed = max(0.0, now - job["created_at"])
+    return {
+        "eta_at": round(job["eta_at"], 3),
+        "eta_seconds": round(remaining, 1),
+        "progress": round(elapsed / (elapsed + remaining), 3) if elapsed + remaining > 0 else 1.0,
+    }
+
+
+# 지연 모델 인스턴스 (워커 프로세스별로 자신이 본 실행 시간으로 학습)
+latency_model = LatencyModel(
+    default_execution=settings.ETA_DEFAULT_EXECUTION_SECONDS,
+    alpha=0.2,
+    timeout_factor=settings.ETA_TIMEOUT_FACTOR,
+    timeout_slack=settings.ETA_TIMEOUT_SLACK_SECONDS,
+    max_timeout=settings.ETA_MAX_TIMEOUT_SECONDS,
+    hang_factor=settings.ETA_HANG_FACTOR,
+    hang_min_seconds=settings.ETA_HANG_MIN_SECONDS,
+)
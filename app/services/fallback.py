@@ -0,0 +1,362 @@
+"""
+GPU 장애/포화 시 CPU 대체 변환 (저하 모드)
+
+ComfyUI에 연결되지 않으면 재시도 후 500이 나 키오스크 흐름이 막힌다. 대신 NumPy/Pillow만으로
+스타일별 간단한 변환(경계 보존 스무딩 -> 색 양자화 -> 머리 확대 왜곡 -> 윤곽선)을 프로세스 풀에서 실행해
+결과를 돌려주고, 응답과 메타데이터에 저하 모드(engine=cpu_fallback)임을 표시한다.
+
+전환 조건
+- 서킷 브레이커가 열림: 연속 연결 실패 BREAKER_FAILURE_THRESHOLD 회, 또는 헬스 모니터에서 모든 백엔드가 끊김.
+  BREAKER_RESET_SECONDS 뒤 시험 요청 하나만 GPU로 보내 성공하면 닫힘
+- 미리보기(preview) 요청 앞에 작업이 FALLBACK_QUEUE_DEPTH 개 이상 밀려 있음 (final은 GPU 결과를 기다림)
+- 이번 요청의 GPU 변환이 연결 오류로 실패함
+
+final(결제/출력용) 요청은 저하 결과를 받지 않는다: 위 조건이면 GPUUnavailable로 실패해 503 + Retry-After로 응답한다.
+렌더 한 건은 FALLBACK_TIMEOUT_SECONDS 안에 끝나야 하고 (풀 대기 포함), 넘으면 실패로 처리한다.
+"""
+
+import asyncio
+import io
+import logging
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Optional
+
+from app.config import settings
+from app.services.health import health_monitor
+from app.services.memory_budget import memory_budget
+from app.services.metrics import COMFYUI_BREAKER_OPEN, FALLBACK_SECONDS, FALLBACK_TRANSFORMS
+
+logger = logging.getLogger(__name__)
+
+ENGINE = "cpu_fallback"
+
+# 스타일별 대체 변환 설정
+# smooth: 경계 보존 스무딩 반경, colors: 양자화 색 수 (None=안 함), head_scale: 머리 확대 강도 (0=안 함),
+# saturation: 채도 배수, outline: 윤곽선 농도 (0~1)
+FALLBACK_RECIPES = {
+    "real_bubblehead": {"smooth": 2, "colors": None, "head_scale": 0.55, "saturation": 1.05, "outline": 0.0},
+    "semi_realistic": {"smooth": 3, "colors": 32, "head_scale": 0.3, "saturation": 1.25, "outline": 0.2},
+    "character": {"smooth": 4, "colors": 12, "head_scale": 0.6, "saturation": 1.3, "outline": 0.5},
+}
+
+
+class FallbackUnavailable(Exception):
+    """대체 변환을 쓸 수 없음 (꺼짐 / 시간 예산 초과 / 풀 오류)"""
+
+
+class GPUUnavailable(Exception):
+    """final 요청인데 GPU를 쓸 수 없음 (대체 변환으로 대신하지 않음, retry_after초 뒤 다시 시도)"""
+
+    def __init__(self, reason: str, retry_after: float):
+        super().__init__(f"ComfyUI unavailable for final transform: {reason}")
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+# -- 프로세스 풀 워커에서 실행 ------------------------------------------------
+
+def _warm() -> bool:
+    # NumPy/Pillow를 미리 로드해 첫 렌더가 import 시간을 쓰지 않게 함
+    import numpy  # noqa: F401
+    from PIL import Image  # noqa: F401
+    return True
+
+
+def _edge_mask(img, np):
+    """0~1 윤곽 강도 (흑백 FIND_EDGES를 살짝 흐려 정규화)"""
+    from PIL import ImageFilter
+
+    edges = img.convert("L").filter(ImageFilter.FIND_EDGES).filter(ImageFilter.GaussianBlur(1))
+    mask = np.asarray(edges, dtype=np.float32)
+    return np.clip(mask / max(float(np.percentile(mask, 98)), 1.0), 0.0, 1.0)
+
+
+def _smooth(img, radius: int, np):
+    """경계 보존 스무딩: 흐린 이미지와 원본을 윤곽 강도로 섞음 (윤곽은 원본, 평면은 흐린 쪽)"""
+    from PIL import Image, ImageFilter
+
+    if radius <= 0:
+        return img
+    blurred = img.filter(ImageFilter.MedianFilter(3)).filter(ImageFilter.GaussianBlur(radius))
+    mask = _edge_mask(img, np)[..., None]
+    out = np.asarray(img, dtype=np.float32) * mask + np.asarray(blurred, dtype=np.float32) * (1 - mask)
+    return Image.fromarray(out.astype(np.uint8), "RGB")
+
+
+def _head_center(img, np) -> tuple:
+    """머리 중심 추정: 위쪽 60%의 피부색(YCbCr) 화소 중심, 없으면 인물 사진 기본 위치"""
+    ycbcr = np.asarray(img.convert("YCbCr"), dtype=np.int16)
+    height, width = ycbcr.shape[:2]
+    top = ycbcr[: int(height * 0.6)]
+    cb, cr = top[..., 1], top[..., 2]
+    ys, xs = np.nonzero((cb >= 77) & (cb <= 127) & (cr >= 133) & (cr <= 173))
+    if len(xs) < width * height * 0.002:
+        return width * 0.5, height * 0.3
+    return float(np.median(xs)), float(np.median(ys))
+
+
+def _bulge(img, strength: float, np):
+    """머리 중심 주변을 부풀려 큰 머리 비율로 (반경 안에서 중심 쪽을 확대, 경계는 그대로)"""
+    from PIL import Image
+
+    if strength <= 0:
+        return img
+    src = np.asarray(img, dtype=np.float32)
+    height, width = src.shape[:2]
+    cx, cy = _head_center(img, np)
+    radius = 0.32 * min(width, height)
+    ys, xs = np.mgrid[0:height, 0:width].astype(np.float32)
+    dx, dy = xs - cx, ys - cy
+    dist = np.sqrt(dx * dx + dy * dy) / radius
+    # 반경 안: 원본 좌표를 중심 쪽으로 당김 (dist^strength), 반경 밖: 그대로
+    scale = np.where(dist < 1.0, np.power(np.maximum(dist, 1e-6), strength), 1.0)
+    sx = np.clip(cx + dx * scale, 0, width - 1)
+    sy = np.clip(cy + dy * scale, 0, height - 1)
+    # 쌍선형 보간
+    x0, y0 = np.floor(sx).astype(np.int32), np.floor(sy).astype(np.int32)
+    x1, y1 = np.minimum(x0 + 1, width - 1), np.minimum(y0 + 1, height - 1)
+    fx, fy = (sx - x0)[..., None], (sy - y0)[..., None]
+    top = src[y0, x0] * (1 - fx) + src[y0, x1] * fx
+    bottom = src[y1, x0] * (1 - fx) + src[y1, x1] * fx
+    out = top * (1 - fy) + bottom * fy
+    return Image.fromarray(out.astype(np.uint8), "RGB")
+
+
+def stylize(source_path: str, style: str, max_side: int) -> bytes:
+    """원본 사진 -> 스타일 대체 변환 PNG 바이트"""
+    import numpy as np
+    from PIL import Image, ImageEnhance, ImageOps
+
+    recipe = FALLBACK_RECIPES.get(style, FALLBACK_RECIPES["real_bubblehead"])
+    with Image.open(source_path) as img:
+        img = ImageOps.exif_transpose(img).convert("RGB")
+        img.thumbnail((max_side, max_side))
+
+    img = _smooth(img, recipe["smooth"], np)
+    if recipe["colors"]:
+        img = img.quantize(recipe["colors"], method=Image.Quantize.MEDIANCUT, dither=Image.Dither.NONE).convert("RGB")
+    img = _bulge(img, recipe["head_scale"], np)
+    img = ImageEnhance.Color(img).enhance(recipe["saturation"])
+    if recipe["outline"]:
+        mask = _edge_mask(img, np)[..., None]
+        out = np.asarray(img, dtype=np.float32) * (1 - recipe["outline"] * mask)
+        img = Image.fromarray(out.astype(np.uint8), "RGB")
+
+    buffer = io.BytesIO()
+    # 시간 예산 안에 끝나도록 압축은 가볍게
+    img.save(buffer, "PNG", compress_level=1)
+    return buffer.getvalue()
+
+
+# -- 앱 프로세스 ---------------------------------------------------------------
+
+class CircuitBreaker:
+    """ComfyUI 서킷 브레이커 (워커 프로세스별)
+
+    closed -> (연속 실패 threshold 회 / 모든 백엔드 끊김) -> open
+    open -> (reset_seconds 경과) -> half_open: 시험 요청 하나만 통과, 결과가 오기 전 reset_seconds가 또 지나면 하나 더
+    시험 요청 성공 -> closed, 실패 -> open
+    """
+
+    def __init__(self, failure_threshold: int, reset_seconds: float):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self.reason: Optional[str] = None
+
+    def allow(self) -> bool:
+        """GPU로 보내도 되는지 (half_open이면 이번 호출이 시험 요청)"""
+        if self.state == "closed":
+            return True
+        if time.monotonic() - self.opened_at < self.reset_seconds:
+            return False
+        self.state = "half_open"
+        self.opened_at = time.monotonic()
+        return True
+
+    def record_success(self) -> None:
+        if self.state != "closed":
+            logger.info("ComfyUI circuit breaker closed")
+        self.state = "closed"
+        self.failures = 0
+        self.reason = None
+        COMFYUI_BREAKER_OPEN.set(value=0)
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        if self.state == "half_open" or self.failures >= self.failure_threshold:
+            self.trip(f"{self.failures} consecutive connection failures")
+
+    def trip(self, reason: str) -> None:
+        if self.state != "open":
+            logger.warning(f"ComfyUI circuit breaker opened: {reason}")
+        self.state = "open"
+        self.opened_at = time.monotonic()
+        self.reason = reason
+        COMFYUI_BREAKER_OPEN.set(value=1)
+
+    def retry_after(self) -> float:
+        """다음 시험 요청을 GPU로 보낼 수 있을 때까지 남은 초 (닫혀 있으면 0)"""
+        if self.state == "closed":
+            return 0.0
+        return max(0.0, self.reset_seconds - (time.monotonic() - self.opened_at))
+
+    def probe_now(self) -> None:
+        """백엔드가 다시 연결됨: 대기 시간 없이 다음 요청을 시험 요청으로"""
+        if self.state != "closed":
+            self.opened_at = float("-inf")
+
+    def snapshot(self) -> dict:
+        return {
+            "state": self.state,
+            "failures": self.failures,
+            "reason": self.reason,
+            "open_seconds": round(time.monotonic() - self.opened_at, 1)
+            if self.state != "closed" and self.opened_at != float("-inf") else None,
+        }
+
+
+class FallbackEngine:
+    def __init__(self, enabled: bool, workers: int, timeout: float, max_side: int, queue_depth: int, breaker: CircuitBreaker):
+        self.enabled = enabled
+        self.workers = workers
+        self.timeout = timeout
+        self.max_side = max_side
+        self.queue_depth = queue_depth
+        self.breaker = breaker
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self.in_flight = 0
+
+    @property
+    def executor(self) -> ProcessPoolExecutor:
+        # 처음 필요할 때 생성 (spawn: 스레드가 도는 앱 프로세스를 fork하지 않음)
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers, mp_context=multiprocessing.get_context("spawn")
+            )
+        return self._executor
+
+    def prewarm(self) -> None:
+        """풀 프로세스를 미리 띄워 첫 대체 변환이 기동/import 시간을 예산에서 쓰지 않게 함"""
+        if self.enabled and self._executor is None:
+            for _ in range(self.workers):
+                self.executor.submit(_warm)
+
+    def _on_health_change(self, base_url: str, previous: str, current: str) -> None:
+        if current == "connected":
+            self.breaker.probe_now()
+        elif current == "disconnected" and not any(
+            backend.status == "connected" for backend in health_monitor.backends.values()
+        ):
+            self.breaker.trip("all ComfyUI backends disconnected")
+            self.prewarm()
+
+    def start(self) -> None:
+        if self.enabled:
+            health_monitor.add_listener(self._on_health_change)
+            if self.queue_depth:
+                # 대기열 기준 전환은 GPU가 정상일 때도 일어나므로 풀을 미리 띄워 둠
+                self.prewarm()
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
+
+    def degrade_reason(self, priority: str, jobs_ahead: int) -> Optional[str]:
+        """GPU 대신 대체 변환으로 보낼 이유 (None이면 GPU, final은 GPU를 못 쓰면 GPUUnavailable)"""
+        if not self.enabled:
+            return None
+        # 큐 깊이를 먼저 봐야 half_open 시험 요청 자리를 대체 변환에 쓰지 않음
+        if priority == "preview" and self.queue_depth and jobs_ahead >= self.queue_depth:
+            return "queue_depth"
+        if not self.breaker.allow():
+            if priority == "final":
+                raise GPUUnavailable("breaker_open", self.breaker.retry_after())
+            return "breaker_open"
+        return None
+
+    async def _render(self, source_path: str, style: str) -> bytes:
+        loop = asyncio.get_running_loop()
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.workers)
+        await self._slots.acquire()
+        try:
+            future = self.executor.submit(stylize, source_path, style, self.max_side)
+        except BaseException:
+            self._slots.release()
+            raise
+        # 시간 예산을 넘겨 포기해도 프로세스가 실제로 끝날 때까지 자리를 돌려주지 않음 (풀 과부하 방지)
+        future.add_done_callback(lambda _: loop.call_soon_threadsafe(self._slots.release))
+        try:
+            return await asyncio.wrap_future(future)
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+
+    async def render(self, source_path: str, style: str, sink, reason: str) -> None:
+        """대체 변환 결과를 sink(GeneratedWriter / ResultStream)에 기록"""
+        if not self.enabled:
+            raise FallbackUnavailable("CPU fallback is disabled")
+        # 결과 PNG는 풀에서 통째로 돌아오므로 최악 크기(긴 변 max_side, RGB 무압축)를 예산에서 미리 빌림
+        async with memory_budget.reserve(self.max_side * self.max_side * 3, "result"):
+            data = await self._render_timed(source_path, style, reason)
+        # 예약을 돌려준 뒤에 씀: ResultStream.write는 같은 "result" 예산에서 청크만큼 다시 빌리므로,
+        # 예약을 잡은 채 쓰면 동시 렌더끼리 서로의 반납을 기다리며 멈춤
+        sink_writer = getattr(sink, "writer", sink)
+        sink_writer.meta.update({"engine": ENGINE, "degraded": True, "degraded_reason": reason})
+        await sink.start(len(data))
+        await sink.write(data)
+        await sink.finish()
+
+    async def _render_timed(self, source_path: str, style: str, reason: str) -> bytes:
+        started = time.perf_counter()
+        self.in_flight += 1
+        try:
+            data = await asyncio.wait_for(self._render(source_path, style), timeout=self.timeout)
+        except asyncio.TimeoutError:
+            FALLBACK_TRANSFORMS.inc(style, reason, "timeout")
+            raise FallbackUnavailable(f"CPU fallback exceeded its {self.timeout:g}s budget")
+        except BrokenProcessPool as e:
+            FALLBACK_TRANSFORMS.inc(style, reason, "error")
+            self._executor = None  # 다음 요청에서 새 풀
+            raise FallbackUnavailable(f"CPU fallback pool failed: {e!r}")
+        except Exception:
+            FALLBACK_TRANSFORMS.inc(style, reason, "error")
+            raise
+        finally:
+            self.in_flight -= 1
+        FALLBACK_SECONDS.observe(time.perf_counter() - started, style)
+        FALLBACK_TRANSFORMS.inc(style, reason, "success")
+        return data
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "workers": self.workers,
+            "in_flight": self.in_flight,
+            "budget_seconds": self.timeout,
+            "queue_depth": self.queue_depth or None,
+            "breaker": self.breaker.snapshot(),
+        }
+
+
+# ComfyUI 서킷 브레이커 / 대체 변환 인스턴스
+comfy_breaker = CircuitBreaker(
+    failure_threshold=settings.BREAKER_FAILURE_THRESHOLD,
+    reset_seconds=settings.BREAKER_RESET_SECONDS,
+)
+fallback_engine = FallbackEngine(
+    enabled=settings.FALLBACK_ENABLED,
+    workers=settings.FALLBACK_WORKERS,
+    timeout=settings.FALLBACK_TIMEOUT_SECONDS,
+    max_side=settings.FALLBACK_MAX_SIDE,
+    queue_depth=settings.FALLBACK_QUEUE_DEPTH,
+    breaker=comfy_breaker,
+)
@@ -0,0 +1,200 @@
+"""
+갤러리 실시간 푸시 (Server-Sent Events)
+
+쇼룸 화면이 GET /api/transform/gallery 를 주기적으로 다시 받으면 요청마다 출력 디렉터리 전체를 스캔한다.
+대신 생성/삭제된 이미지를 공유 DB(job_store)의 gallery_events 에 순번(id)과 함께 기록하고,
+워커마다 폴러 하나가 그 테이블의 끝만 읽어 메모리 버퍼에 담은 뒤 구독자 전원을 한 번에 깨운다.
+
+- 화면이 몇 대든 DB 조회는 워커당 GALLERY_FEED_POLL_SECONDS 마다 id 범위 조회 한 번 (구독자가 없으면 조회하지 않음)
+- 같은 워커에서 생긴 이벤트는 폴링 주기를 기다리지 않고 바로 전달
+- 이벤트 id가 곧 SSE 커서: 재연결하면 Last-Event-ID 이후만 이어서 받는다
+  (버퍼보다 오래된 커서는 DB에서 읽고, 보관 기간이 지나 지워진 구간이면 reset 이벤트로 목록을 다시 받게 함)
+- 배치 CLI처럼 같은 STATE_DB_PATH 를 쓰는 다른 프로세스가 기록한 이벤트도 전달된다
+- 리스너(add_listener)가 있으면 구독자가 없어도 폴링한다: 다른 워커에서 삭제된 이미지를 이 워커의
+  인메모리 캐시(핫 캐시, ETag 인덱스)에서 지우는 데 쓴다
+"""
+
+import asyncio
+import json
+import logging
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import AsyncIterator, Optional
+
+from app.config import settings
+from app.services.job_store import job_store
+from app.services.metrics import GALLERY_EVENTS_SENT, GALLERY_STREAM_SUBSCRIBERS
+from app.services.zimage import CHARACTER_STYLES
+
+logger = logging.getLogger(__name__)
+
+# EventSource 재연결 대기 (ms)
+RETRY_MS = 2000
+FETCH_LIMIT = 500
+
+
+@dataclass
+class GalleryEvent:
+    id: int
+    type: str  # created | deleted
+    image_id: str
+    style: Optional[str]
+    created_at: float
+
+
+def gallery_entry(image_id: str, style_key: Optional[str]) -> dict:
+    """갤러리 목록/이벤트 공통 항목"""
+    style = "unknown"
+    if style_key in CHARACTER_STYLES:
+        style = CHARACTER_STYLES[style_key]["name"]
+    return {"id": image_id, "url": f"api/transform/image/{image_id}", "style": style}
+
+
+def _sse(event: str, event_id: int, data: dict) -> str:
+    return f"id: {event_id}\nevent: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+class GalleryFeed:
+    def __init__(self, poll_interval: float, buffer_size: int, heartbeat: float, max_stream_seconds: float):
+        self.poll_interval = poll_interval
+        self.heartbeat = heartbeat
+        self.max_stream_seconds = max_stream_seconds
+        self._buffer: deque = deque(maxlen=buffer_size)
+        self._last_id: Optional[int] = None  # 폴러가 읽은 마지막 이벤트 id
+        self._changed = asyncio.Event()
+        self._wake = asyncio.Event()
+        self._subscribers = 0
+        self._listeners: list = []
+        self._task: Optional[asyncio.Task] = None
+
+    def add_listener(self, callback) -> None:
+        """폴러가 읽은 이벤트마다 callback(event) 호출 (이 워커가 기록한 이벤트 포함)"""
+        self._listeners.append(callback)
+
+    async def publish(self, event_type: str, image_id: str, style: Optional[str] = None) -> None:
+        """이벤트 기록 (실패해도 생성/삭제 요청은 성공으로 둠)"""
+        try:
+            await job_store.add_gallery_event(event_type, image_id, style)
+        except Exception as e:
+            logger.warning(f"Gallery event {event_type} {image_id} not recorded: {e!r}")
+            return
+        self._wake.set()
+
+    async def _poll(self) -> None:
+        if self._last_id is None:
+            # 폴러 시작 시점 이후만 버퍼에 담음 (그 이전 커서는 구독자가 DB에서 직접 읽음)
+            _, self._last_id = await job_store.gallery_event_bounds()
+            return
+        while True:
+            rows = await job_store.gallery_events_after(self._last_id, FETCH_LIMIT)
+            if not rows:
+                return
+            events = [GalleryEvent(*row) for row in rows]
+            self._buffer.extend(events)
+            for event in events:
+                for callback in self._listeners:
+                    try:
+                        callback(event)
+                    except Exception as e:
+                        logger.warning(f"Gallery event listener failed for {event.type} {event.image_id}: {e!r}")
+            self._last_id = rows[-1][0]
+            # 기다리던 구독자 전원을 깨우고 다음 대기용 이벤트로 교체
+            self._changed.set()
+            self._changed = asyncio.Event()
+            if len(rows) < FETCH_LIMIT:
+                return
+
+    async def _loop(self) -> None:
+        while True:
+            if self._subscribers or self._listeners:
+                try:
+                    await self._poll()
+                except Exception as e:
+                    logger.warning(f"Gallery feed poll failed: {e!r}")
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+
+    def start(self) -> None:
+        if self._task is None:
+            self._changed = asyncio.Event()
+            self._wake = asyncio.Event()
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def _buffered_after(self, cursor: int) -> Optional[list]:
+        """버퍼로 답할 수 있으면 cursor 이후 이벤트, 버퍼 범위 밖이면 None"""
+        if self._last_id is None or cursor > self._last_id:
+            return None
+        if self._buffer and cursor >= self._buffer[0].id - 1:
+            return [event for event in self._buffer if event.id > cursor]
+        return [] if cursor == self._last_id else None
+
+    async def _events_after(self, cursor: int) -> list:
+        events = self._buffered_after(cursor)
+        if events is None:
+            events = [GalleryEvent(*row) for row in await job_store.gallery_events_after(cursor, FETCH_LIMIT)]
+        return events
+
+    async def stream(self, cursor: Optional[int]) -> AsyncIterator[str]:
+        """SSE 본문: cursor(마지막으로 받은 이벤트 id) 이후 이벤트, 없으면 지금부터"""
+        self._subscribers += 1
+        GALLERY_STREAM_SUBSCRIBERS.inc()
+        self._wake.set()
+        try:
+            yield f"retry: {RETRY_MS}\n\n"
+            first, last = await job_store.gallery_event_bounds()
+            if cursor is None:
+                cursor = last
+            elif cursor > last or cursor < first - 1:
+                # 이벤트가 보관 기간이 지나 지워졌거나 DB가 바뀜 -> 목록을 다시 받도록
+                GALLERY_EVENTS_SENT.inc("reset")
+                yield _sse("reset", last, {})
+                cursor = last
+
+            deadline = time.monotonic() + self.max_stream_seconds
+            while True:
+                # 조회 전에 잡아 둬야 조회(await) 중 폴러가 알린 이벤트를 놓치지 않음
+                changed = self._changed
+                events = await self._events_after(cursor)
+                for event in events:
+                    data = gallery_entry(event.image_id, event.style) if event.type == "created" else {"id": event.image_id}
+                    GALLERY_EVENTS_SENT.inc(event.type)
+                    yield _sse(event.type, event.id, data)
+                if events:
+                    cursor = events[-1].id
+                    continue
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    # 연결을 주기적으로 끊어 종료/배포 시 스트림이 남지 않게 함 (클라이언트는 Last-Event-ID로 이어받음)
+                    return
+                try:
+                    await asyncio.wait_for(changed.wait(), timeout=min(self.heartbeat, remaining))
+                except asyncio.TimeoutError:
+                    yield ": ping\n\n"
+        finally:
+            self._subscribers -= 1
+            GALLERY_STREAM_SUBSCRIBERS.dec()
+
+    def stats(self) -> dict:
+        return {
+            "subscribers": self._subscribers,
+            "last_event_id": self._last_id,
+            "buffered": len(self._buffer),
+        }
+
+
+# 갤러리 피드 인스턴스 (워커 프로세스마다 폴러 하나)
+gallery_feed = GalleryFeed(
+    poll_interval=settings.GALLERY_FEED_POLL_SECONDS,
+    buffer_size=settings.GALLERY_FEED_BUFFER,
+    heartbeat=settings.GALLERY_STREAM_HEARTBEAT_SECONDS,
+    max_stream_seconds=settings.GALLERY_STREAM_MAX_SECONDS,
+)
@@ -0,0 +1,182 @@
+"""
+ComfyUI 백엔드 헬스 모니터
+
+키오스크 페이지마다 /api/transform/health 를 호출하므로 요청 시점에 ComfyUI로 실시간 점검을 보내지 않는다.
+백그라운드 태스크가 백엔드별로 주기적으로 /system_stats, /queue 를 조회해 최근 VRAM/큐 통계를 보관하고,
+헬스 엔드포인트는 그 스냅샷을 즉시 돌려준다 (경과 시간/stale 여부 포함).
+"""
+
+import asyncio
+import logging
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Callable, Optional
+
+from app.config import settings
+from app.services.metrics import COMFYUI_QUEUE_DEPTH, COMFYUI_UP, COMFYUI_VRAM_FREE
+from app.services.zimage import zimage_service
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class BackendHealth:
+    base_url: str
+    history_size: int
+    status: str = "unknown"
+    server_info: Optional[dict] = None
+    message: Optional[str] = None
+    checked_at: Optional[float] = None
+    latency: Optional[float] = None
+    history: deque = field(init=False)
+
+    def __post_init__(self):
+        self.history = deque(maxlen=self.history_size)
+
+    def update(self, result: dict, latency: float) -> None:
+        previous = self.status
+        self.status = result["status"]
+        self.message = result.get("message")
+        self.server_info = result.get("server_info") or self.server_info
+        self.checked_at = time.time()
+        self.latency = latency
+
+        sample = {"time": self.checked_at, "status": self.status, "latency_ms": round(latency * 1000, 1)}
+        if self.status == "connected":
+            device = (result["server_info"].get("devices") or [{}])[0]
+            sample["vram_total"] = device.get("vram_total")
+            sample["vram_free"] = device.get("vram_free")
+            sample["queue_running"] = result.get("queue_running")
+            sample["queue_pending"] = result.get("queue_pending")
+        self.history.append(sample)
+
+        COMFYUI_UP.set(self.base_url, value=1 if self.status == "connected" else 0)
+        if sample.get("vram_free") is not None:
+            COMFYUI_VRAM_FREE.set(self.base_url, value=sample["vram_free"])
+        if sample.get("queue_running") is not None:
+            COMFYUI_QUEUE_DEPTH.set(self.base_url, value=sample["queue_running"] + (sample["queue_pending"] or 0))
+        if previous != self.status:
+            logger.info(f"ComfyUI backend {self.base_url}: {previous} -> {self.status}")
+
+    def snapshot(self, now: float, stale_after: float, include_history: bool = False) -> dict:
+        age = now - self.checked_at if self.checked_at else None
+        latest = self.history[-1] if self.history else {}
+        snapshot = {
+            "base_url": self.base_url,
+            "status": self.status,
+            "message": self.message,
+            "age_seconds": round(age, 2) if age is not None else None,
+            "stale": age is None or age > stale_after,
+            "latency_ms": latest.get("latency_ms"),
+            "vram_total": latest.get("vram_total"),
+            "vram_free": latest.get("vram_free"),
+            "queue_running": latest.get("queue_running"),
+            "queue_pending": latest.get("queue_pending"),
+        }
+        if include_history:
+            snapshot["history"] = list(self.history)
+        return snapshot
+
+
+class HealthMonitor:
+    def __init__(self, backends: list, interval: float, timeout: float, history_size: int):
+        self.interval = interval
+        self.timeout = timeout
+        self.backends = {url: BackendHealth(url, history_size) for url in backends}
+        self._task: Optional[asyncio.Task] = None
+        self._ready = asyncio.Event()
+        self._listeners: list = []
+
+    @property
+    def stale_after(self) -> float:
+        # 두 번 연속 점검을 놓치면 stale
+        return self.interval * 2 + self.timeout
+
+    def add_listener(self, listener: Callable[[str, str, str], None]) -> None:
+        """상태 변화 콜백 등록: listener(base_url, previous, current)"""
+        self._listeners.append(listener)
+
+    async def _probe(self, backend: BackendHealth) -> None:
+        started = time.perf_counter()
+        result = await zimage_service.check_connection(backend.base_url, timeout=self.timeout)
+        previous = backend.status
+        backend.update(result, time.perf_counter() - started)
+        zimage_service.set_available(backend.base_url, backend.status != "disconnected")
+        if previous != backend.status:
+            for listener in self._listeners:
+                try:
+                    listener(backend.base_url, previous, backend.status)
+                except Exception as e:
+                    logger.warning(f"Health listener failed: {e!r}")
+
+    async def probe_all(self) -> None:
+        await asyncio.gather(*(self._probe(backend) for backend in self.backends.values()))
+        self._ready.set()
+
+    async def _loop(self) -> None:
+        while True:
+            try:
+                await self.probe_all()
+            except Exception as e:
+                logger.warning(f"Health probe failed: {e!r}")
+            await asyncio.sleep(self.interval)
+
+    def start(self) -> None:
+        if self._task is None:
+            self._ready = asyncio.Event()
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def wait_ready(self) -> None:
+        """기동 직후 첫 점검이 끝나기 전이면 그 결과만 잠깐 기다림 (최대 timeout)"""
+        if self._ready.is_set() or self._task is None:
+            return
+        try:
+            await asyncio.wait_for(self._ready.wait(), timeout=self.timeout)
+        except asyncio.TimeoutError:
+            pass
+
+    def backend(self, base_url: str) -> Optional[BackendHealth]:
+        return self.backends.get(base_url)
+
+    def is_available(self, base_url: str) -> bool:
+        backend = self.backends.get(base_url)
+        return backend is None or backend.status != "disconnected"
+
+    def snapshot(self, include_history: bool = False) -> dict:
+        """기존 응답 키(status/server_info/base_url)를 유지한 집계 스냅샷"""
+        now = time.time()
+        backends = [b.snapshot(now, self.stale_after, include_history) for b in self.backends.values()]
+        connected = [b for b in self.backends.values() if b.status == "connected"]
+        primary = connected[0] if connected else next(iter(self.backends.values()))
+        checked = [b.checked_at for b in self.backends.values() if b.checked_at]
+        age = now - max(checked) if checked else None
+
+        snapshot = {
+            "status": "connected" if connected else primary.status,
+            "server_info": primary.server_info,
+            "base_url": primary.base_url,
+            "connected_backends": len(connected),
+            "age_seconds": round(age, 2) if age is not None else None,
+            "stale": age is None or age > self.stale_after,
+            "checked_at": max(checked) if checked else None,
+            "interval_seconds": self.interval,
+            "backends": backends,
+        }
+        if not connected and primary.message:
+            snapshot["message"] = primary.message
+        return snapshot
+
+
+# 모니터 인스턴스
+health_monitor = HealthMonitor(
+    settings.zimage_backends,
+    interval=settings.HEALTH_CHECK_INTERVAL,
+    timeout=settings.HEALTH_CHECK_TIMEOUT,
+    history_size=settings.HEALTH_HISTORY_SIZE,
+)
@@ -0,0 +1,110 @@
+"""
+최근 생성/업로드 이미지용 인메모리 LRU 캐시
+
+생성 직후 같은 이미지를 미리보기, 결제/출력 페이지, 갤러리가 연달아 요청하므로
+쓰기 시점에 캐시에 넣어 두고 첫 읽기부터 디스크를 거치지 않는다.
+응답 본문은 memoryview로 넘겨 복사 없이 전송한다.
+"""
+
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Optional
+
+from fastapi.responses import Response
+
+from app.config import settings
+from app.services.metrics import (
+    HOT_CACHE_BYTES,
+    HOT_CACHE_HIT_RATIO,
+    HOT_CACHE_HITS,
+    HOT_CACHE_MISSES,
+    registry,
+)
+
+
+@dataclass(frozen=True)
+class CachedObject:
+    data: bytes
+    media_type: str
+    etag: str
+
+    def response(self, headers: Optional[dict] = None) -> Response:
+        """zero-copy 응답 (Starlette는 memoryview 본문을 그대로 전송)"""
+        return Response(content=memoryview(self.data), media_type=self.media_type, headers=headers)
+
+
+class HotObjectCache:
+    """(kind, id) 키의 바이트 크기 기준 LRU 캐시"""
+
+    def __init__(self, max_bytes: int, max_object_bytes: int):
+        self.max_bytes = max_bytes
+        self.max_object_bytes = min(max_object_bytes, max_bytes)
+        self._entries: "OrderedDict[tuple[str, str], CachedObject]" = OrderedDict()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def accepts(self, size: int) -> bool:
+        return 0 < size <= self.max_object_bytes
+
+    def put(self, kind: str, object_id: str, data: bytes, media_type: str, etag: str) -> bool:
+        if not self.accepts(len(data)):
+            return False
+        key = (kind, object_id)
+        previous = self._entries.pop(key, None)
+        if previous is not None:
+            self._bytes -= len(previous.data)
+
+        self._entries[key] = CachedObject(bytes(data), media_type, etag)
+        self._bytes += len(data)
+        while self._bytes > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self._bytes -= len(evicted.data)
+            self.evictions += 1
+        return True
+
+    def get(self, kind: str, object_id: str) -> Optional[CachedObject]:
+        key = (kind, object_id)
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            HOT_CACHE_MISSES.inc()
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        HOT_CACHE_HITS.inc()
+        return entry
+
+    def evict(self, kind: str, object_id: str) -> None:
+        entry = self._entries.pop((kind, object_id), None)
+        if entry is not None:
+            self._bytes -= len(entry.data)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+# 캐시 인스턴스
+hot_cache = HotObjectCache(
+    max_bytes=settings.HOT_CACHE_MAX_MB * 1024 * 1024,
+    max_object_bytes=settings.HOT_CACHE_MAX_OBJECT_MB * 1024 * 1024,
+)
+
+
+def _collect_metrics() -> None:
+    stats = hot_cache.stats()
+    HOT_CACHE_HIT_RATIO.set(value=stats["hit_ratio"])
+    HOT_CACHE_BYTES.set(value=stats["bytes"])
+
+
+registry.add_collector(_collect_metrics)
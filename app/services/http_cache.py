@@ -0,0 +1,210 @@
+"""
+HTTP 캐싱 유틸리티
+- UUID로 저장되는 이미지(생성 결과/원본)용 content-hash 강한 ETag
+- 키오스크 페이지(HTML/CSS) gzip/brotli 사전 압축 및 Accept-Encoding 협상
+"""
+
+import gzip
+import hashlib
+import json
+import logging
+import os
+from collections import OrderedDict
+from pathlib import Path
+from typing import Optional
+
+from fastapi import Request
+from fastapi.responses import Response
+from fastapi.staticfiles import StaticFiles
+
+try:
+    import brotli
+except ImportError:  # brotli는 선택 의존성 (없으면 gzip만 제공)
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+# id로 주소가 정해지는 이미지는 한 번 쓰이면 바뀌지 않음
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+# 페이지/스타일시트는 배포 시 바뀔 수 있으므로 매번 재검증 (변경 없으면 304)
+REVALIDATE_CACHE_CONTROL = "no-cache"
+
+PRECOMPRESS_SUFFIXES = {".html", ".css", ".svg", ".js"}
+PRECOMPRESS_MEDIA_TYPES = {
+    ".html": "text/html; charset=utf-8",
+    ".css": "text/css; charset=utf-8",
+    ".svg": "image/svg+xml",
+    ".js": "text/javascript; charset=utf-8",
+}
+
+
+def make_etag(data: bytes) -> str:
+    """콘텐츠 해시 기반 강한 ETag"""
+    return '"' + hashlib.sha256(data).hexdigest()[:32] + '"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """If-None-Match 헤더 비교 (RFC 9110 약한 비교)"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    target = etag.removeprefix("W/")
+    for candidate in if_none_match.split(","):
+        if candidate.strip().removeprefix("W/") == target:
+            return True
+    return False
+
+
+def not_modified(etag: str, cache_control: str, vary: Optional[str] = None) -> Response:
+    headers = {"ETag": etag, "Cache-Control": cache_control}
+    if vary:
+        headers["Vary"] = vary
+    return Response(status_code=304, headers=headers)
+
+
+class ImageETagIndex:
+    """
+    이미지 id -> ETag 인메모리 인덱스
+
+    저장 시점에 계산한 해시를 기억해 두었다가 조건부 요청에 파일 접근 없이 304를 돌려준다.
+    인덱스에 없으면 호출자가 저장소 스레드에서 file_etag()로 구해 remember() 한다 (이벤트 루프에서 파일을 읽지 않음).
+    """
+
+    def __init__(self, max_entries: int = 100_000):
+        self.max_entries = max_entries
+        self._etags: "OrderedDict[tuple[str, str], str]" = OrderedDict()
+
+    def remember(self, kind: str, image_id: str, etag: str) -> None:
+        key = (kind, image_id)
+        self._etags[key] = etag
+        self._etags.move_to_end(key)
+        while len(self._etags) > self.max_entries:
+            self._etags.popitem(last=False)
+
+    def forget(self, kind: str, image_id: str) -> None:
+        self._etags.pop((kind, image_id), None)
+
+    def lookup(self, kind: str, image_id: str) -> Optional[str]:
+        etag = self._etags.get((kind, image_id))
+        if etag is not None:
+            self._etags.move_to_end((kind, image_id))
+        return etag
+
+
+def file_etag(image_path: str, meta_path: Optional[str] = None) -> str:
+    """메타데이터 JSON의 etag, 없으면 (구버전 파일) 파일 해시 (블로킹 -> 저장소 스레드에서 호출)"""
+    etag = None
+    if meta_path and os.path.exists(meta_path):
+        try:
+            with open(meta_path, "r") as f:
+                etag = json.load(f).get("etag")
+        except Exception:
+            etag = None
+
+    if not etag:
+        hasher = hashlib.sha256()
+        with open(image_path, "rb") as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                hasher.update(chunk)
+        etag = '"' + hasher.hexdigest()[:32] + '"'
+    return etag
+
+
+class _PrecompressedAsset:
+    __slots__ = ("media_type", "variants")
+
+    def __init__(self, media_type: str, variants: dict):
+        self.media_type = media_type
+        # encoding("identity" | "gzip" | "br") -> (body, etag)
+        self.variants = variants
+
+
+class StaticAssetCache:
+    """static/ 의 텍스트 자산을 시작 시 사전 압축해 두고 Accept-Encoding으로 협상해 제공"""
+
+    def __init__(self):
+        self._assets: dict[str, _PrecompressedAsset] = {}
+
+    def build(self, static_dir: Path) -> None:
+        assets = {}
+        for path in sorted(static_dir.rglob("*")):
+            if not path.is_file() or path.suffix.lower() not in PRECOMPRESS_SUFFIXES:
+                continue
+            raw = path.read_bytes()
+            etag = make_etag(raw)
+            variants = {"identity": (raw, etag)}
+
+            gz = gzip.compress(raw, compresslevel=9, mtime=0)
+            if len(gz) < len(raw):
+                variants["gzip"] = (gz, etag[:-1] + '-gz"')
+            if brotli is not None:
+                br = brotli.compress(raw, quality=11)
+                if len(br) < len(raw):
+                    variants["br"] = (br, etag[:-1] + '-br"')
+
+            name = path.relative_to(static_dir).as_posix()
+            assets[name] = _PrecompressedAsset(PRECOMPRESS_MEDIA_TYPES[path.suffix.lower()], variants)
+
+        self._assets = assets
+        logger.info(f"Precompressed {len(assets)} static assets (brotli={'on' if brotli else 'off'})")
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._assets
+
+    @staticmethod
+    def _accepted_encodings(accept_encoding: str) -> set:
+        accepted = set()
+        for item in accept_encoding.split(","):
+            coding, _, params = item.strip().partition(";")
+            q = 1.0
+            params = params.strip()
+            if params.startswith("q="):
+                try:
+                    q = float(params[2:])
+                except ValueError:
+                    q = 0.0
+            if q > 0 and coding:
+                accepted.add(coding.strip().lower())
+        return accepted
+
+    def response(self, request: Request, name: str) -> Response:
+        """협상된 변형으로 응답 (If-None-Match 일치 시 304)"""
+        asset = self._assets[name]
+        accepted = self._accepted_encodings(request.headers.get("accept-encoding", ""))
+
+        encoding = "identity"
+        for candidate in ("br", "gzip"):
+            if candidate in asset.variants and (candidate in accepted or "*" in accepted):
+                encoding = candidate
+                break
+
+        body, etag = asset.variants[encoding]
+        vary = "Accept-Encoding" if len(asset.variants) > 1 else None
+        if etag_matches(request.headers.get("if-none-match"), etag):
+            return not_modified(etag, REVALIDATE_CACHE_CONTROL, vary)
+
+        headers = {"ETag": etag, "Cache-Control": REVALIDATE_CACHE_CONTROL}
+        if vary:
+            headers["Vary"] = vary
+        if encoding != "identity":
+            headers["Content-Encoding"] = encoding
+        return Response(content=body, media_type=asset.media_type, headers=headers)
+
+
+class PrecompressedStaticFiles(StaticFiles):
+    """/static 마운트: 사전 압축된 자산은 캐시에서, 나머지(이미지 등)는 기본 StaticFiles로 제공"""
+
+    def __init__(self, *args, assets: StaticAssetCache, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.assets = assets
+
+    async def get_response(self, path: str, scope) -> Response:
+        if scope["method"] in ("GET", "HEAD") and path in self.assets:
+            return self.assets.response(Request(scope), path)
+        return await super().get_response(path, scope)
+
+
+# 인스턴스
+image_etags = ImageETagIndex()
+static_assets = StaticAssetCache()
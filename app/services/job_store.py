@@ -0,0 +1,623 @@
+"""
+워커 간 공유 상태 (SQLite)
+
+uvicorn --workers N 으로 띄우면 모듈 전역 상태는 워커마다 따로 존재한다.
+작업 기록, 진행 중 요청 병합(같은 사진 + 같은 스타일), 레이트 리밋, 주문(키오스크 세션), 유사 사진 색인, 갤러리 이벤트,
+ComfyUI에 남긴 요청별 파일 목록은
+모든 워커가 같은 값을 봐야 하므로 WAL 모드 SQLite 파일 하나에 둔다 (별도 서버 없이 같은 호스트의 프로세스끼리 공유).
+블로킹 호출은 asyncio.to_thread 로 이벤트 루프 밖에서 실행한다.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Optional
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+FINISHED = ("succeeded", "failed", "cancelled")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    job_id      TEXT PRIMARY KEY,
+    dedup_key   TEXT,
+    style       TEXT NOT NULL,
+    status      TEXT NOT NULL,
+    original_id TEXT,
+    image_id    TEXT,
+    prompt_id   TEXT,
+    error       TEXT,
+    worker      TEXT,
+    kiosk       TEXT,
+    priority    TEXT,
+    cancel_requested INTEGER NOT NULL DEFAULT 0,
+    cancel_reason TEXT,
+    eta_at      REAL,
+    created_at  REAL NOT NULL,
+    updated_at  REAL NOT NULL
+);
+CREATE UNIQUE INDEX IF NOT EXISTS jobs_in_flight ON jobs(dedup_key) WHERE status IN ('queued', 'running');
+CREATE INDEX IF NOT EXISTS jobs_updated_at ON jobs(updated_at);
+CREATE INDEX IF NOT EXISTS jobs_kiosk ON jobs(kiosk, status);
+CREATE INDEX IF NOT EXISTS jobs_dedup_key ON jobs(dedup_key, status);
+CREATE TABLE IF NOT EXISTS leases (
+    name       TEXT PRIMARY KEY,
+    owner      TEXT NOT NULL,
+    expires_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS orders (
+    order_id    TEXT PRIMARY KEY,
+    kiosk       TEXT,
+    status      TEXT NOT NULL,
+    original_id TEXT NOT NULL,
+    style       TEXT,
+    job_id      TEXT,
+    result_id   TEXT,
+    shipping    TEXT,
+    created_at  REAL NOT NULL,
+    updated_at  REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS orders_updated_at ON orders(updated_at);
+CREATE TABLE IF NOT EXISTS image_hashes (
+    etag        TEXT PRIMARY KEY,
+    original_id TEXT NOT NULL,
+    phash       INTEGER NOT NULL,
+    dhash       INTEGER NOT NULL,
+    band0       INTEGER NOT NULL,
+    band1       INTEGER NOT NULL,
+    band2       INTEGER NOT NULL,
+    band3       INTEGER NOT NULL,
+    tags        TEXT,
+    created_at  REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS image_hashes_band0 ON image_hashes(band0, phash, dhash);
+CREATE INDEX IF NOT EXISTS image_hashes_band1 ON image_hashes(band1, phash, dhash);
+CREATE INDEX IF NOT EXISTS image_hashes_band2 ON image_hashes(band2, phash, dhash);
+CREATE INDEX IF NOT EXISTS image_hashes_band3 ON image_hashes(band3, phash, dhash);
+CREATE TABLE IF NOT EXISTS gallery_events (
+    id         INTEGER PRIMARY KEY AUTOINCREMENT,
+    type       TEXT NOT NULL,
+    image_id   TEXT NOT NULL,
+    style      TEXT,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS gallery_events_created_at ON gallery_events(created_at);
+CREATE TABLE IF NOT EXISTS rate_limits (
+    key    TEXT NOT NULL,
+    bucket INTEGER NOT NULL,
+    count  INTEGER NOT NULL,
+    PRIMARY KEY (key, bucket)
+);
+CREATE TABLE IF NOT EXISTS remote_artifacts (
+    id         INTEGER PRIMARY KEY AUTOINCREMENT,
+    group_id   TEXT NOT NULL,
+    backend    TEXT NOT NULL,
+    kind       TEXT NOT NULL,
+    name       TEXT NOT NULL,
+    subfolder  TEXT NOT NULL DEFAULT '',
+    created_at REAL NOT NULL,
+    due_at     REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS remote_artifacts_due_at ON remote_artifacts(due_at);
+CREATE INDEX IF NOT EXISTS remote_artifacts_group ON remote_artifacts(group_id);
+CREATE TABLE IF NOT EXISTS worker_metrics (
+    worker     TEXT PRIMARY KEY,
+    families   TEXT NOT NULL,
+    updated_at REAL NOT NULL
+);
+"""
+
+JOB_COLUMNS = (
+    "job_id", "dedup_key", "style", "status", "original_id", "image_id",
+    "prompt_id", "error", "worker", "kiosk", "priority", "cancel_requested",
+    "cancel_reason", "eta_at", "created_at", "updated_at",
+)
+
+ORDER_COLUMNS = (
+    "order_id", "kiosk", "status", "original_id", "style", "job_id", "result_id", "shipping",
+    "created_at", "updated_at",
+)
+ORDER_STATUSES = ("draft", "paid", "printed")
+
+# 이전 버전 DB 파일에 없는 컬럼
+MIGRATIONS = {
+    "kiosk": "ALTER TABLE jobs ADD COLUMN kiosk TEXT",
+    "priority": "ALTER TABLE jobs ADD COLUMN priority TEXT",
+    "cancel_requested": "ALTER TABLE jobs ADD COLUMN cancel_requested INTEGER NOT NULL DEFAULT 0",
+    "cancel_reason": "ALTER TABLE jobs ADD COLUMN cancel_reason TEXT",
+    "eta_at": "ALTER TABLE jobs ADD COLUMN eta_at REAL",
+}
+
+
+class JobStore:
+    def __init__(self, path: str, stale_after: float, retention_seconds: float, prune_interval: float = 0.0):
+        self.path = path
+        self.stale_after = stale_after
+        self.retention_seconds = retention_seconds
+        self.prune_interval = prune_interval
+        self._prune_task: Optional[asyncio.Task] = None
+        self.worker = f"{socket.gethostname()}:{os.getpid()}"
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            existing = {row[1] for row in conn.execute("PRAGMA table_info(jobs)")}
+            if existing:
+                for column, statement in MIGRATIONS.items():
+                    if column not in existing:
+                        conn.execute(statement)
+            conn.executescript(SCHEMA)
+            self._conn = conn
+        return self._conn
+
+    def _run(self, fn, *args):
+        with self._lock:
+            return fn(self._connection(), *args)
+
+    async def _call(self, fn, *args):
+        return await asyncio.to_thread(self._run, fn, *args)
+
+    # -- 작업 기록 ---------------------------------------------------------
+
+    def _create(
+        self,
+        conn: sqlite3.Connection,
+        dedup_key: Optional[str],
+        style: str,
+        original_id: Optional[str],
+        kiosk: Optional[str],
+        priority: Optional[str],
+    ) -> tuple:
+        now = time.time()
+        job_id = uuid.uuid4().hex
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if dedup_key is not None:
+                row = conn.execute(
+                    "SELECT job_id, updated_at FROM jobs WHERE dedup_key = ? AND status IN ('queued', 'running')",
+                    (dedup_key,),
+                ).fetchone()
+                if row is not None:
+                    if now - row[1] <= self.stale_after:
+                        conn.execute("COMMIT")
+                        return row[0], False
+                    # 소유 워커의 heartbeat가 끊긴 작업(워커가 죽음)은 실패 처리하고 새로 시작
+                    conn.execute(
+                        "UPDATE jobs SET status = 'failed', error = 'stale', updated_at = ? WHERE job_id = ?",
+                        (now, row[0]),
+                    )
+            conn.execute(
+                "INSERT INTO jobs (job_id, dedup_key, style, status, original_id, worker, kiosk, priority, created_at, updated_at) "
+                "VALUES (?, ?, ?, 'queued', ?, ?, ?, ?, ?, ?)",
+                (job_id, dedup_key, style, original_id, self.worker, kiosk, priority, now, now),
+            )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return job_id, True
+
+    async def create_job(
+        self,
+        style: str,
+        dedup_key: Optional[str] = None,
+        original_id: Optional[str] = None,
+        kiosk: Optional[str] = None,
+        priority: Optional[str] = None,
+    ) -> tuple:
+        """작업 등록. 같은 dedup_key 작업이 진행 중이면 (그 job_id, False)를 반환"""
+        return await self._call(self._create, dedup_key, style, original_id, kiosk, priority)
+
+    def _update(self, conn: sqlite3.Connection, job_id: str, fields: dict) -> None:
+        fields["updated_at"] = time.time()
+        assignments = ", ".join(f"{name} = ?" for name in fields)
+        conn.execute(f"UPDATE jobs SET {assignments} WHERE job_id = ?", (*fields.values(), job_id))
+
+    async def update_job(self, job_id: str, **fields) -> None:
+        unknown = set(fields) - set(JOB_COLUMNS)
+        if unknown:
+            raise ValueError(f"Unknown job fields: {sorted(unknown)}")
+        await self._call(self._update, job_id, fields)
+
+    def _get(self, conn: sqlite3.Connection, job_id: str) -> Optional[dict]:
+        row = conn.execute(f"SELECT {', '.join(JOB_COLUMNS)} FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        return dict(zip(JOB_COLUMNS, row)) if row else None
+
+    async def get_job(self, job_id: str) -> Optional[dict]:
+        return await self._call(self._get, job_id)
+
+    def is_stale(self, job: dict) -> bool:
+        """진행 중인데 소유 워커가 stale_after 넘게 heartbeat(updated_at 갱신)를 하지 않음 = 워커가 죽음"""
+        return job["status"] not in FINISHED and time.time() - job["updated_at"] > self.stale_after
+
+    async def wait_for_job(self, job_id: str, timeout: float, poll_interval: float = 0.5) -> Optional[dict]:
+        """다른 워커가 처리 중인 작업이 끝날 때까지 대기 (timeout이 지나거나 소유 워커가 죽으면 마지막 상태 반환)"""
+        deadline = time.monotonic() + timeout
+        while True:
+            job = await self.get_job(job_id)
+            if job is None or job["status"] in FINISHED or self.is_stale(job) or time.monotonic() >= deadline:
+                return job
+            await asyncio.sleep(poll_interval)
+
+    def _touch_jobs(self, conn: sqlite3.Connection, worker: str) -> int:
+        return conn.execute(
+            "UPDATE jobs SET updated_at = ? WHERE worker = ? AND status IN ('queued', 'running')",
+            (time.time(), worker),
+        ).rowcount
+
+    async def touch_jobs(self, worker: Optional[str] = None) -> int:
+        """이 워커가 맡은 진행 중 작업의 heartbeat (앱 큐에서 오래 기다려도 stale로 보이지 않게)"""
+        return await self._call(self._touch_jobs, worker or self.worker)
+
+    def _active_jobs(self, conn: sqlite3.Connection, kiosk: str) -> list:
+        rows = conn.execute(
+            f"SELECT {', '.join(JOB_COLUMNS)} FROM jobs WHERE kiosk = ? AND status IN ('queued', 'running') "
+            f"ORDER BY created_at",
+            (kiosk,),
+        ).fetchall()
+        return [dict(zip(JOB_COLUMNS, row)) for row in rows]
+
+    async def active_jobs(self, kiosk: str) -> list:
+        """키오스크의 진행 중 작업 (오래된 순)"""
+        return await self._call(self._active_jobs, kiosk)
+
+    def _supersede(self, conn: sqlite3.Connection, kiosk: str, keep_job_id: str, priorities: tuple) -> list:
+        placeholders = ", ".join("?" for _ in priorities)
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            rows = conn.execute(
+                f"SELECT job_id, worker FROM jobs WHERE kiosk = ? AND job_id != ? "
+                f"AND status IN ('queued', 'running') AND priority IN ({placeholders})",
+                (kiosk, keep_job_id, *priorities),
+            ).fetchall()
+            conn.executemany(
+                "UPDATE jobs SET cancel_requested = 1, cancel_reason = 'superseded', updated_at = ? WHERE job_id = ?",
+                [(time.time(), job_id) for job_id, _ in rows],
+            )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return rows
+
+    async def supersede(self, kiosk: str, keep_job_id: str, priorities: tuple) -> list:
+        """같은 키오스크의 이전 진행 중 작업에 취소 요청 표시. [(job_id, worker)] 반환"""
+        return await self._call(self._supersede, kiosk, keep_job_id, priorities)
+
+    def _request_cancel(self, conn: sqlite3.Connection, job_id: str, reason: str) -> Optional[dict]:
+        conn.execute(
+            "UPDATE jobs SET cancel_requested = 1, cancel_reason = ?, updated_at = ? "
+            "WHERE job_id = ? AND status IN ('queued', 'running') AND cancel_requested = 0",
+            (reason, time.time(), job_id),
+        )
+        return self._get(conn, job_id)
+
+    async def request_cancel(self, job_id: str, reason: str) -> Optional[dict]:
+        """진행 중 작업에 취소 요청 표시 (소유 워커가 처리). 갱신된 작업 기록 반환"""
+        return await self._call(self._request_cancel, job_id, reason)
+
+    def _cancel_requests(self, conn: sqlite3.Connection, worker: str) -> list:
+        return conn.execute(
+            "SELECT job_id, cancel_reason FROM jobs "
+            "WHERE worker = ? AND cancel_requested = 1 AND status IN ('queued', 'running')",
+            (worker,),
+        ).fetchall()
+
+    async def cancel_requests(self, worker: Optional[str] = None) -> list:
+        """이 워커가 처리 중인 작업 중 (다른 워커가) 취소를 요청한 [(job_id, reason)]"""
+        return await self._call(self._cancel_requests, worker or self.worker)
+
+    def _prune(self, conn: sqlite3.Connection) -> int:
+        now = time.time()
+        cursor = conn.execute(
+            f"DELETE FROM jobs WHERE status IN ({', '.join('?' for _ in FINISHED)}) AND updated_at < ?",
+            (*FINISHED, now - self.retention_seconds),
+        )
+        # 주문에는 배송 정보(개인정보)가 있으므로 같은 보관 기간이 지나면 삭제
+        conn.execute("DELETE FROM orders WHERE updated_at < ?", (now - self.retention_seconds,))
+        conn.execute("DELETE FROM rate_limits WHERE bucket < ?", (int(now // 60) - 1,))
+        conn.execute("DELETE FROM gallery_events WHERE created_at < ?", (now - self.retention_seconds,))
+        return cursor.rowcount
+
+    async def prune(self) -> int:
+        """보관 기간이 지난 작업 기록/주문/갤러리 이벤트와 지난 레이트 리밋 구간 삭제"""
+        return await self._call(self._prune)
+
+    async def _prune_loop(self) -> None:
+        # 오래 떠 있는 워커에서도 보관 기간이 지켜지도록 주기적으로 (여러 워커 중 한 곳만)
+        while True:
+            await asyncio.sleep(self.prune_interval)
+            try:
+                if await self.acquire_lease("job_store:prune", self.prune_interval * 0.9):
+                    await self.prune()
+            except Exception as e:
+                logger.warning(f"Pruning shared state failed: {e!r}")
+
+    def start(self) -> None:
+        if self.prune_interval > 0 and self._prune_task is None:
+            self._prune_task = asyncio.create_task(self._prune_loop())
+
+    async def stop(self) -> None:
+        if self._prune_task is not None:
+            self._prune_task.cancel()
+            self._prune_task = None
+
+    # -- 레이트 리밋 -------------------------------------------------------
+
+    def _hit(self, conn: sqlite3.Connection, key: str, window_seconds: int) -> tuple:
+        now = time.time()
+        window = int(now // window_seconds)
+        count = conn.execute(
+            "INSERT INTO rate_limits (key, bucket, count) VALUES (?, ?, 1) "
+            "ON CONFLICT (key, bucket) DO UPDATE SET count = count + 1 RETURNING count",
+            (key, window),
+        ).fetchone()[0]
+        retry_after = (window + 1) * window_seconds - now
+        return count, retry_after
+
+    async def hit_rate_limit(self, key: str, limit: int, window_seconds: int = 60) -> Optional[float]:
+        """고정 윈도 카운터. 한도를 넘으면 재시도까지 남은 초, 아니면 None"""
+        if limit <= 0:
+            return None
+        count, retry_after = await self._call(self._hit, key, window_seconds)
+        return retry_after if count > limit else None
+
+    # -- 주문 (키오스크 세션: 원본 -> 스타일 -> 결과 -> 배송 -> 결제) --------
+
+    def _create_order(self, conn: sqlite3.Connection, original_id: str, style: Optional[str], kiosk: Optional[str]) -> dict:
+        now = time.time()
+        order_id = uuid.uuid4().hex
+        conn.execute(
+            "INSERT INTO orders (order_id, kiosk, status, original_id, style, created_at, updated_at) "
+            "VALUES (?, ?, 'draft', ?, ?, ?, ?)",
+            (order_id, kiosk, original_id, style, now, now),
+        )
+        return self._get_order(conn, order_id)
+
+    async def create_order(self, original_id: str, style: Optional[str] = None, kiosk: Optional[str] = None) -> dict:
+        return await self._call(self._create_order, original_id, style, kiosk)
+
+    def _get_order(self, conn: sqlite3.Connection, order_id: str) -> Optional[dict]:
+        row = conn.execute(f"SELECT {', '.join(ORDER_COLUMNS)} FROM orders WHERE order_id = ?", (order_id,)).fetchone()
+        if row is None:
+            return None
+        order = dict(zip(ORDER_COLUMNS, row))
+        order["shipping"] = json.loads(order["shipping"]) if order["shipping"] else None
+        return order
+
+    async def get_order(self, order_id: str) -> Optional[dict]:
+        return await self._call(self._get_order, order_id)
+
+    def _update_order(self, conn: sqlite3.Connection, order_id: str, fields: dict) -> Optional[dict]:
+        if "shipping" in fields and fields["shipping"] is not None:
+            fields["shipping"] = json.dumps(fields["shipping"], ensure_ascii=False)
+        fields["updated_at"] = time.time()
+        assignments = ", ".join(f"{name} = ?" for name in fields)
+        conn.execute(f"UPDATE orders SET {assignments} WHERE order_id = ?", (*fields.values(), order_id))
+        return self._get_order(conn, order_id)
+
+    async def update_order(self, order_id: str, **fields) -> Optional[dict]:
+        """주문 갱신. 갱신된 주문 (없는 주문이면 None) 반환"""
+        unknown = set(fields) - set(ORDER_COLUMNS)
+        if unknown:
+            raise ValueError(f"Unknown order fields: {sorted(unknown)}")
+        return await self._call(self._update_order, order_id, fields)
+
+    # -- 지각 해시 색인 (유사 사진 찾기, app.services.perceptual_hash) ----------
+
+    def _add_image_hash(
+        self, conn: sqlite3.Connection, etag: str, original_id: str, phash: int, dhash: int, band_values: list
+    ) -> None:
+        conn.execute(
+            "INSERT OR IGNORE INTO image_hashes "
+            "(etag, original_id, phash, dhash, band0, band1, band2, band3, created_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (etag, original_id, phash, dhash, *band_values, time.time()),
+        )
+
+    async def add_image_hash(self, etag: str, original_id: str, phash: int, dhash: int, band_values: list) -> None:
+        await self._call(self._add_image_hash, etag, original_id, phash, dhash, band_values)
+
+    def _image_hash_candidates(self, conn: sqlite3.Connection, band_values: list) -> list:
+        # 밴드마다 (band, phash, dhash) 커버링 인덱스만 읽음 (OR 하나로 쓰면 인덱스를 못 탈 수 있어 UNION)
+        queries, params = [], []
+        for index, values in enumerate(band_values):
+            if not values:
+                continue
+            queries.append(
+                f"SELECT rowid, phash, dhash FROM image_hashes WHERE band{index} IN ({', '.join('?' for _ in values)})"
+            )
+            params.extend(values)
+        return conn.execute(" UNION ".join(queries), params).fetchall()
+
+    async def image_hash_candidates(self, band_values: list) -> list:
+        """밴드별 허용 값 목록 중 하나라도 맞는 [(rowid, phash, dhash)]"""
+        return await self._call(self._image_hash_candidates, band_values)
+
+    def _image_hash_rows(self, conn: sqlite3.Connection, rowids: list) -> dict:
+        rows = conn.execute(
+            f"SELECT rowid, etag, original_id, tags FROM image_hashes WHERE rowid IN ({', '.join('?' for _ in rowids)})",
+            rowids,
+        ).fetchall()
+        return {row[0]: row[1:] for row in rows}
+
+    async def image_hash_rows(self, rowids: list) -> dict:
+        """{rowid: (etag, original_id, tags)}"""
+        if not rowids:
+            return {}
+        return await self._call(self._image_hash_rows, rowids)
+
+    def _set_image_tags(self, conn: sqlite3.Connection, etag: str, tags: str) -> None:
+        conn.execute("UPDATE image_hashes SET tags = ? WHERE etag = ?", (tags, etag))
+
+    async def set_image_tags(self, etag: str, tags: str) -> None:
+        await self._call(self._set_image_tags, etag, tags)
+
+    def _results_for_etags(self, conn: sqlite3.Connection, etags: list, styles: tuple) -> dict:
+        keys = {f"{style}:{etag}": (style, etag) for etag in etags for style in styles}
+        if not keys:
+            return {}
+        rows = conn.execute(
+            f"SELECT dedup_key, image_id FROM jobs WHERE status = 'succeeded' AND image_id IS NOT NULL "
+            f"AND dedup_key IN ({', '.join('?' for _ in keys)}) ORDER BY updated_at DESC",
+            list(keys),
+        ).fetchall()
+        results, seen = {}, set()
+        for dedup_key, image_id in rows:
+            if dedup_key in seen:
+                continue  # 스타일별 최신 결과 하나
+            seen.add(dedup_key)
+            style, etag = keys[dedup_key]
+            results.setdefault(etag, []).append((style, image_id))
+        return results
+
+    async def results_for_etags(self, etags: list, styles: tuple) -> dict:
+        """같은 내용(ETag) 사진의 성공한 변환 결과 {etag: [(style, image_id)]}"""
+        return await self._call(self._results_for_etags, etags, styles)
+
+    # -- 갤러리 이벤트 (실시간 스트림, app.services.gallery_feed) -------------
+
+    def _add_gallery_event(self, conn: sqlite3.Connection, event_type: str, image_id: str, style: Optional[str]) -> int:
+        return conn.execute(
+            "INSERT INTO gallery_events (type, image_id, style, created_at) VALUES (?, ?, ?, ?)",
+            (event_type, image_id, style, time.time()),
+        ).lastrowid
+
+    async def add_gallery_event(self, event_type: str, image_id: str, style: Optional[str] = None) -> int:
+        """갤러리 이벤트 기록 -> 이벤트 id (스트림 커서)"""
+        return await self._call(self._add_gallery_event, event_type, image_id, style)
+
+    def _gallery_events_after(self, conn: sqlite3.Connection, cursor: int, limit: int) -> list:
+        return conn.execute(
+            "SELECT id, type, image_id, style, created_at FROM gallery_events WHERE id > ? ORDER BY id LIMIT ?",
+            (cursor, limit),
+        ).fetchall()
+
+    async def gallery_events_after(self, cursor: int, limit: int = 500) -> list:
+        """cursor 이후의 [(id, type, image_id, style, created_at)] (오래된 순)"""
+        return await self._call(self._gallery_events_after, cursor, limit)
+
+    def _gallery_event_bounds(self, conn: sqlite3.Connection) -> tuple:
+        first = conn.execute("SELECT MIN(id) FROM gallery_events").fetchone()[0]
+        # AUTOINCREMENT 순번: 보관 기간이 지나 모두 지워져도 마지막으로 발급한 id
+        row = conn.execute("SELECT seq FROM sqlite_sequence WHERE name = 'gallery_events'").fetchone()
+        last = row[0] if row else 0
+        return (first if first is not None else last + 1), last
+
+    async def gallery_event_bounds(self) -> tuple:
+        """(남아 있는 가장 오래된 이벤트 id, 마지막 이벤트 id). 비어 있으면 (마지막 id + 1, 마지막 id)"""
+        return await self._call(self._gallery_event_bounds)
+
+    # -- ComfyUI에 남긴 파일/히스토리 (app.services.remote_gc) ----------------
+
+    def _add_remote_artifacts(self, conn: sqlite3.Connection, group_id: str, backend: str, artifacts: list, due_at: float) -> None:
+        now = time.time()
+        conn.executemany(
+            "INSERT INTO remote_artifacts (group_id, backend, kind, name, subfolder, created_at, due_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            [(group_id, backend, kind, name, subfolder or "", now, due_at) for kind, name, subfolder in artifacts],
+        )
+
+    async def add_remote_artifacts(self, group_id: str, backend: str, artifacts: list, due_at: float) -> None:
+        """[(kind, name, subfolder)] 기록. kind: input/output/temp = 파일, history = prompt_id"""
+        await self._call(self._add_remote_artifacts, group_id, backend, artifacts, due_at)
+
+    def _release_remote_artifacts(self, conn: sqlite3.Connection, group_id: str) -> None:
+        conn.execute("UPDATE remote_artifacts SET due_at = ? WHERE group_id = ?", (time.time(), group_id))
+
+    async def release_remote_artifacts(self, group_id: str) -> None:
+        """더 필요 없음 (다음 정리 때 바로 삭제)"""
+        await self._call(self._release_remote_artifacts, group_id)
+
+    def _due_remote_artifacts(self, conn: sqlite3.Connection, limit: int) -> list:
+        return conn.execute(
+            "SELECT id, backend, kind, name, subfolder FROM remote_artifacts WHERE due_at <= ? ORDER BY due_at LIMIT ?",
+            (time.time(), limit),
+        ).fetchall()
+
+    async def due_remote_artifacts(self, limit: int = 500) -> list:
+        """삭제할 때가 된 [(id, backend, kind, name, subfolder)]"""
+        return await self._call(self._due_remote_artifacts, limit)
+
+    def _tracked_remote_names(self, conn: sqlite3.Connection, backend: str) -> set:
+        rows = conn.execute("SELECT name FROM remote_artifacts WHERE backend = ?", (backend,)).fetchall()
+        return {row[0] for row in rows}
+
+    async def tracked_remote_names(self, backend: str) -> set:
+        """백엔드에 기록해 둔 파일명/prompt_id (아직 삭제 전인 것 전부)"""
+        return await self._call(self._tracked_remote_names, backend)
+
+    def _delete_remote_artifacts(self, conn: sqlite3.Connection, ids: list) -> None:
+        conn.executemany("DELETE FROM remote_artifacts WHERE id = ?", [(row_id,) for row_id in ids])
+
+    async def delete_remote_artifacts(self, ids: list) -> None:
+        await self._call(self._delete_remote_artifacts, ids)
+
+    # -- 워커별 메트릭 스냅샷 (app.services.worker_metrics) --------------------
+
+    def _put_worker_metrics(self, conn: sqlite3.Connection, families: str, max_age: float) -> None:
+        now = time.time()
+        conn.execute(
+            "INSERT INTO worker_metrics (worker, families, updated_at) VALUES (?, ?, ?) "
+            "ON CONFLICT (worker) DO UPDATE SET families = excluded.families, updated_at = excluded.updated_at",
+            (self.worker, families, now),
+        )
+        # 종료/재시작한 워커의 스냅샷
+        conn.execute("DELETE FROM worker_metrics WHERE updated_at < ?", (now - max_age,))
+
+    async def put_worker_metrics(self, families: str, max_age: float) -> None:
+        """이 워커의 메트릭 스냅샷(JSON) 저장, max_age보다 오래된 다른 워커 스냅샷은 삭제"""
+        await self._call(self._put_worker_metrics, families, max_age)
+
+    def _worker_metrics(self, conn: sqlite3.Connection, max_age: float) -> list:
+        return conn.execute(
+            "SELECT worker, families FROM worker_metrics WHERE updated_at >= ? ORDER BY worker",
+            (time.time() - max_age,),
+        ).fetchall()
+
+    async def worker_metrics(self, max_age: float) -> list:
+        """max_age 안에 갱신된 [(worker, families JSON)]"""
+        return await self._call(self._worker_metrics, max_age)
+
+    # -- 리스 (여러 워커 중 한 곳만 실행할 작업) -----------------------------
+
+    def _acquire_lease(self, conn: sqlite3.Connection, name: str, ttl: float) -> bool:
+        now = time.time()
+        cursor = conn.execute(
+            "INSERT INTO leases (name, owner, expires_at) VALUES (?, ?, ?) "
+            "ON CONFLICT (name) DO UPDATE SET owner = excluded.owner, expires_at = excluded.expires_at "
+            "WHERE leases.expires_at < ? OR leases.owner = excluded.owner",
+            (name, self.worker, now + ttl, now),
+        )
+        return cursor.rowcount == 1
+
+    async def acquire_lease(self, name: str, ttl: float) -> bool:
+        """ttl 동안 이 워커가 name 작업을 맡음 (다른 워커가 유효한 리스를 갖고 있으면 False)"""
+        return await self._call(self._acquire_lease, name, ttl)
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+# 저장소 인스턴스 (연결은 첫 사용 시 워커 프로세스 안에서 연다)
+job_store = JobStore(
+    settings.STATE_DB_PATH,
+    stale_after=settings.JOB_STALE_SECONDS,
+    retention_seconds=settings.JOB_RETENTION_HOURS * 3600,
+    prune_interval=settings.JOB_PRUNE_INTERVAL_SECONDS,
+)
@@ -0,0 +1,127 @@
+"""
+프로세스 전체 이미지 버퍼 메모리 예산
+
+변환 요청은 ComfyUI를 기다리는 수십 초~수 분 동안 살아 있으므로, 요청마다 잡은 버퍼가 그동안 남으면
+동시 요청 수만큼 힙이 커진다. 메모리에 두는 이미지 버퍼는 모두 이 예산에서 바이트 단위로 빌린다.
+- upload: 핫 캐시에 넣을 업로드 본문 사본 (예산이 없으면 사본 없이 디스크 파일만 사용)
+- normalized: 배치 CLI가 정규화해 ComfyUI 업로드까지 들고 있는 JPEG (오래 기다리면 저장한 파일로 대체)
+- result: 동기 호출자에게 흘려보내는 결과 스트림 버퍼 / CPU 대체 변환 결과 (예산이 날 때까지 다운로드가 기다림)
+
+디스크로 대신할 수 있는 버퍼는 MEMORY_BUDGET_WAIT_SECONDS 만 기다린 뒤 파일을 쓰고(spill),
+결과 버퍼는 클라이언트가 읽어 예산이 돌아올 때까지 기다린다. 대기는 요청 순서대로(FIFO) 풀린다.
+예산보다 큰 버퍼 하나는 다른 버퍼가 모두 반납됐을 때 혼자 들어간다 (영원히 기다리지 않음).
+"""
+
+import asyncio
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Optional
+
+from app.config import settings
+from app.services.metrics import MEMORY_BUDGET_BYTES, MEMORY_BUDGET_HIGH_WATER, MEMORY_BUDGET_WAITS
+
+BUFFER_KINDS = ("upload", "normalized", "result")
+
+
+class MemoryBudget:
+    """바이트 단위 비동기 세마포어 (limit=0 이면 제한 없이 사용량만 집계)"""
+
+    def __init__(self, limit: int, wait_seconds: float):
+        self.limit = limit
+        self.wait_seconds = wait_seconds
+        self.used = 0
+        self.high_water = 0
+        self._by_kind = {kind: 0 for kind in BUFFER_KINDS}
+        self._waiters: deque = deque()  # (nbytes, kind, future)
+        self.spilled = 0
+
+    def _fits(self, nbytes: int) -> bool:
+        return not self.limit or self.used == 0 or self.used + nbytes <= self.limit
+
+    def _take(self, nbytes: int, kind: str) -> None:
+        self.used += nbytes
+        self._by_kind[kind] += nbytes
+        MEMORY_BUDGET_BYTES.set(kind, value=self._by_kind[kind])
+        if self.used > self.high_water:
+            self.high_water = self.used
+            MEMORY_BUDGET_HIGH_WATER.set(value=self.high_water)
+
+    def try_acquire(self, nbytes: int, kind: str) -> bool:
+        """기다리지 않고 빌림 (먼저 기다리는 요청이 있으면 새치기하지 않음)"""
+        if self._waiters or not self._fits(nbytes):
+            return False
+        self._take(nbytes, kind)
+        return True
+
+    async def acquire(self, nbytes: int, kind: str, timeout: Optional[float] = None) -> bool:
+        """예산이 날 때까지 기다려 빌림. timeout 안에 못 빌리면 False (호출자가 디스크로 대신함)"""
+        if self.try_acquire(nbytes, kind):
+            return True
+        if timeout is not None and timeout <= 0:
+            self.spilled += 1
+            MEMORY_BUDGET_WAITS.inc(kind, "spilled")
+            return False
+        future = asyncio.get_running_loop().create_future()
+        waiter = (nbytes, kind, future)
+        self._waiters.append(waiter)
+        try:
+            await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            self.spilled += 1
+            MEMORY_BUDGET_WAITS.inc(kind, "spilled")
+            return False
+        except asyncio.CancelledError:
+            # 빌린 직후 취소되면 바로 반납
+            if future.done() and not future.cancelled():
+                self.release(nbytes, kind)
+            raise
+        finally:
+            if waiter in self._waiters:
+                self._waiters.remove(waiter)
+                self._wake()
+        MEMORY_BUDGET_WAITS.inc(kind, "granted")
+        return True
+
+    def release(self, nbytes: int, kind: str) -> None:
+        self.used -= nbytes
+        self._by_kind[kind] -= nbytes
+        MEMORY_BUDGET_BYTES.set(kind, value=self._by_kind[kind])
+        self._wake()
+
+    def _wake(self) -> None:
+        while self._waiters:
+            nbytes, kind, future = self._waiters[0]
+            if future.done():
+                self._waiters.popleft()
+                continue
+            if not self._fits(nbytes):
+                return
+            self._waiters.popleft()
+            self._take(nbytes, kind)
+            future.set_result(True)
+
+    @asynccontextmanager
+    async def reserve(self, nbytes: int, kind: str):
+        """블록 동안 nbytes를 빌림 (기다려서라도)"""
+        await self.acquire(nbytes, kind)
+        try:
+            yield
+        finally:
+            self.release(nbytes, kind)
+
+    def stats(self) -> dict:
+        return {
+            "limit_bytes": self.limit or None,
+            "used_bytes": self.used,
+            "high_water_bytes": self.high_water,
+            "by_kind": dict(self._by_kind),
+            "waiting": len(self._waiters),
+            "spilled": self.spilled,
+        }
+
+
+# 이미지 버퍼 메모리 예산 인스턴스 (워커 프로세스마다 하나)
+memory_budget = MemoryBudget(
+    limit=settings.MEMORY_BUDGET_MB * 1024 * 1024,
+    wait_seconds=settings.MEMORY_BUDGET_WAIT_SECONDS,
+)
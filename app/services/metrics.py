@@ -0,0 +1,418 @@
+"""
+Prometheus 텍스트 포맷 메트릭
+
+외부 의존성 없이 카운터/게이지/히스토그램만 구현한다.
+이벤트 루프 한 스레드에서 dict 조회 + bisect 한 번이면 끝나도록 유지 (핫 패스 오버헤드 최소화).
+"""
+
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Callable, Iterable, Optional
+
+# 초 단위 지연 히스토그램 기본 버킷 (업로드 수십 ms ~ GPU 실행 수 분)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0, 120.0, 180.0, 300.0)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: tuple, values: tuple, extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    metric_type = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+
+    def header(self) -> list:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.metric_type}"]
+
+    def render(self) -> list:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    metric_type = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: dict = {}
+
+    def inc(self, *labelvalues: str, amount: float = 1.0) -> None:
+        self._values[labelvalues] = self._values.get(labelvalues, 0.0) + amount
+
+    def value(self, *labelvalues: str) -> float:
+        return self._values.get(labelvalues, 0.0)
+
+    def render(self) -> list:
+        lines = self.header()
+        for labels, value in self._values.items():
+            lines.append(f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}")
+        return lines
+
+
+class Gauge(Counter):
+    metric_type = "gauge"
+
+    def set(self, *labelvalues: str, value: float) -> None:
+        self._values[labelvalues] = value
+
+    def dec(self, *labelvalues: str, amount: float = 1.0) -> None:
+        self.inc(*labelvalues, amount=-amount)
+
+    @contextmanager
+    def track(self, *labelvalues: str, amount: float = 1.0):
+        """블록 실행 동안 +amount"""
+        self.inc(*labelvalues, amount=amount)
+        try:
+            yield
+        finally:
+            self.dec(*labelvalues, amount=amount)
+
+
+class Histogram(_Metric):
+    metric_type = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Iterable[str] = (),
+        buckets: tuple = LATENCY_BUCKETS,
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # labels -> [버킷별 카운트..., +Inf 카운트, 합계]
+        self._series: dict = {}
+
+    def observe(self, value: float, *labelvalues: str) -> None:
+        series = self._series.get(labelvalues)
+        if series is None:
+            series = self._series[labelvalues] = [0] * (len(self.buckets) + 1) + [0.0]
+        series[bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    @contextmanager
+    def time(self, *labelvalues: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, *labelvalues)
+
+    def snapshot(self, *labelvalues: str) -> Optional[dict]:
+        series = self._series.get(labelvalues)
+        if series is None:
+            return None
+        count = sum(series[:-1])
+        return {"count": count, "sum": series[-1], "mean": series[-1] / count if count else 0.0}
+
+    def render(self) -> list:
+        lines = self.header()
+        for labels, series in self._series.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), series[:-1]):
+                cumulative += count
+                le = 'le="' + _format_value(bound) + '"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, labels, le)} {cumulative}")
+            label_str = _format_labels(self.labelnames, labels)
+            lines.append(f"{self.name}_sum{label_str} {_format_value(series[-1])}")
+            lines.append(f"{self.name}_count{label_str} {cumulative}")
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics: list = []
+        self._collectors: list = []
+
+    def counter(self, name: str, documentation: str, labelnames: Iterable[str] = ()) -> Counter:
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Iterable[str] = ()) -> Gauge:
+        return self._register(Gauge(name, documentation, labelnames))
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Iterable[str] = (),
+        buckets: tuple = LATENCY_BUCKETS,
+    ) -> Histogram:
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def add_collector(self, collector: Callable[[], None]) -> None:
+        """스크레이프 직전에 호출되어 외부 상태(캐시 통계 등)를 게이지에 반영"""
+        self._collectors.append(collector)
+
+    def _register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        for collector in self._collectors:
+            collector()
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+    def families(self) -> list:
+        """[[이름, HELP/TYPE 줄, 샘플 줄]] (워커 간 합치기용)"""
+        for collector in self._collectors:
+            collector()
+        families = []
+        for metric in self._metrics:
+            lines = metric.render()
+            families.append([metric.name, lines[:2], lines[2:]])
+        return families
+
+
+def _with_label(line: str, label: str) -> str:
+    name, brace, rest = line.partition("{")
+    if brace:
+        return f"{name}{{{label},{rest}"
+    name, _, value = line.partition(" ")
+    return f"{name}{{{label}}} {value}"
+
+
+def render_workers(snapshots: dict) -> str:
+    """워커별 families() 스냅샷 {worker: families}을 worker 라벨을 붙여 한 응답으로 (같은 메트릭 줄은 모아서)"""
+    headers: dict = {}
+    samples: dict = {}
+    for worker, families in snapshots.items():
+        label = f'worker="{_escape(worker)}"'
+        for name, header, lines in families:
+            headers.setdefault(name, header)
+            samples.setdefault(name, []).extend(_with_label(line, label) for line in lines)
+    out = []
+    for name, header in headers.items():
+        out.extend(header)
+        out.extend(samples[name])
+    return "\n".join(out) + "\n"
+
+
+registry = MetricsRegistry()
+
+# 변환 파이프라인
+TRANSFORM_STAGE_SECONDS = registry.histogram(
+    "figure_transform_stage_seconds",
+    "Per-stage latency of a character transform",
+    ("stage", "style"),
+)
+TRANSFORM_SECONDS = registry.histogram(
+    "figure_transform_seconds",
+    "End-to-end latency of POST /api/transform/character",
+    ("style", "status"),
+)
+TRANSFORMS_IN_FLIGHT = registry.gauge(
+    "figure_transforms_in_flight",
+    "Transform requests currently being processed",
+)
+JOBS_QUEUED = registry.gauge(
+    "figure_comfyui_jobs_queued",
+    "Prompts submitted to ComfyUI and not finished yet",
+    ("backend",),
+)
+
+# 스케줄러
+SCHEDULER_QUEUE_WAIT_SECONDS = registry.histogram(
+    "figure_scheduler_queue_wait_seconds",
+    "Time a transform waited in the app scheduler before being sent to ComfyUI",
+    ("priority",),
+)
+SCHEDULER_QUEUED = registry.gauge(
+    "figure_scheduler_queued",
+    "Transforms waiting in the app scheduler",
+    ("priority",),
+)
+JOBS_CANCELLED = registry.counter(
+    "figure_jobs_cancelled_total",
+    "Transform jobs cancelled before completion",
+    ("priority", "reason"),
+)
+
+# ComfyUI 백엔드
+COMFYUI_ERRORS = registry.counter(
+    "figure_comfyui_errors_total",
+    "Failed ComfyUI transform attempts",
+    ("backend", "kind"),
+)
+COMFYUI_RETRIES = registry.counter(
+    "figure_comfyui_retries_total",
+    "Transform attempts retried after a connection error",
+    ("backend",),
+)
+BATCH_SIZE = registry.histogram(
+    "figure_comfyui_batch_size",
+    "User images per ComfyUI prompt (1 unless micro-batching is enabled)",
+    ("style",),
+    buckets=(1, 2, 3, 4, 6, 8, 12, 16),
+)
+COMFYUI_ROUTED = registry.counter(
+    "figure_comfyui_routed_total",
+    "Prompts sent to each backend, by routing decision (affinity = backend last ran the same style)",
+    ("backend", "reason"),
+)
+COMFYUI_NODES_EXECUTED = registry.histogram(
+    "figure_comfyui_nodes_executed",
+    "Workflow nodes ComfyUI actually executed per prompt (the rest were reused from its node cache)",
+    ("style", "warm"),
+    buckets=(1, 2, 4, 6, 8, 10, 12, 14, 16, 20, 30, 50),
+)
+COMFYUI_NODES_CACHED = registry.counter(
+    "figure_comfyui_nodes_cached_total",
+    "Workflow nodes ComfyUI skipped because their inputs matched its cache (execution_cached)",
+    ("style", "warm"),
+)
+COMFYUI_GPU_SECONDS_AVOIDED = registry.counter(
+    "figure_comfyui_gpu_seconds_avoided_total",
+    "Estimated GPU execution seconds saved by cancelling jobs nobody will see",
+    ("backend", "stage"),
+)
+COMFYUI_BYTES_SENT = registry.counter(
+    "figure_comfyui_bytes_sent_total",
+    "Request body bytes sent to ComfyUI",
+    ("backend",),
+)
+COMFYUI_BYTES_RECEIVED = registry.counter(
+    "figure_comfyui_bytes_received_total",
+    "Response body bytes received from ComfyUI",
+    ("backend",),
+)
+
+# 워밍업 / keep-alive (사용자 변환과 별도 집계)
+WARMUP_SECONDS = registry.histogram(
+    "figure_comfyui_warmup_seconds",
+    "Warm-up / keep-alive prompt duration (not user traffic)",
+    ("backend", "reason", "stage"),
+    buckets=(0.5, 1, 2, 5, 10, 20, 30, 60, 120, 300),
+)
+WARMUP_RUNS = registry.counter(
+    "figure_comfyui_warmup_runs_total",
+    "Warm-up / keep-alive prompts by outcome",
+    ("backend", "reason", "status"),
+)
+
+# 핫 캐시
+HOT_CACHE_HITS = registry.counter("figure_hot_cache_hits_total", "Hot image cache hits")
+HOT_CACHE_MISSES = registry.counter("figure_hot_cache_misses_total", "Hot image cache misses")
+HOT_CACHE_HIT_RATIO = registry.gauge("figure_hot_cache_hit_ratio", "Hot image cache hit ratio")
+HOT_CACHE_BYTES = registry.gauge("figure_hot_cache_bytes", "Bytes held by the hot image cache")
+
+# 백엔드 헬스 (백그라운드 모니터가 갱신)
+COMFYUI_UP = registry.gauge("figure_comfyui_up", "1 if the last health probe succeeded", ("backend",))
+COMFYUI_VRAM_FREE = registry.gauge("figure_comfyui_vram_free_bytes", "Free VRAM reported by /system_stats", ("backend",))
+COMFYUI_QUEUE_DEPTH = registry.gauge("figure_comfyui_queue_depth", "Running + pending prompts reported by /queue", ("backend",))
+
+# 파일 저장소 스레드 풀 / 이벤트 루프
+STORAGE_SECONDS = registry.histogram(
+    "figure_storage_op_seconds",
+    "Storage operation time including the wait for a storage thread",
+    ("op",),
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5),
+)
+STORAGE_IN_FLIGHT = registry.gauge("figure_storage_in_flight", "Storage operations submitted or running on the storage pool")
+EVENT_LOOP_SLOW_CALLBACKS = registry.counter(
+    "figure_event_loop_slow_callbacks_total",
+    "Event loop callbacks that blocked longer than LOOP_SLOW_CALLBACK_MS (only counted in loop debug mode)",
+)
+
+# 재촬영 유사 사진 찾기
+NEAR_DUP_LOOKUPS = registry.counter(
+    "figure_near_duplicate_lookups_total",
+    "Uploads checked against the perceptual hash index, by outcome",
+    ("endpoint", "outcome"),
+)
+
+# 완료 예측 / 행 감지
+ETA_ERROR_SECONDS = registry.histogram(
+    "figure_eta_error_seconds",
+    "Absolute error of the completion time predicted when the prompt was queued",
+    ("style",),
+)
+COMFYUI_HANGS = registry.counter(
+    "figure_comfyui_hangs_total",
+    "Prompts interrupted because they ran far longer than their predicted execution time",
+    ("backend",),
+)
+
+# ComfyUI 쪽 요청별 파일/히스토리 정리
+COMFYUI_ARTIFACTS_REMOVED = registry.counter(
+    "figure_comfyui_artifacts_removed_total",
+    "Per-request artifacts removed from ComfyUI backends, by kind (history/input/output/temp) and source (tracked/reconciled)",
+    ("backend", "kind", "source"),
+)
+COMFYUI_GC_ERRORS = registry.counter(
+    "figure_comfyui_gc_errors_total",
+    "Failed ComfyUI cleanup calls (the artifacts are retried on the next pass)",
+    ("backend",),
+)
+
+# 갤러리 실시간 스트림
+GALLERY_STREAM_SUBSCRIBERS = registry.gauge(
+    "figure_gallery_stream_subscribers",
+    "Open gallery event streams (SSE) on this worker",
+)
+GALLERY_EVENTS_SENT = registry.counter(
+    "figure_gallery_events_sent_total",
+    "Gallery events written to stream subscribers, by type",
+    ("type",),
+)
+
+# CPU 대체 변환 (GPU 장애/포화 시 저하 모드)
+FALLBACK_TRANSFORMS = registry.counter(
+    "figure_fallback_transforms_total",
+    "Transforms served by the CPU fallback engine, by reason and outcome",
+    ("style", "reason", "outcome"),
+)
+FALLBACK_SECONDS = registry.histogram(
+    "figure_fallback_seconds",
+    "CPU fallback render time including the wait for a pool process",
+    ("style",),
+    buckets=(0.1, 0.25, 0.5, 1.0, 2.0, 4.0, 8.0, 15.0),
+)
+COMFYUI_BREAKER_OPEN = registry.gauge(
+    "figure_comfyui_breaker_open",
+    "1 while the ComfyUI circuit breaker is open and transforms go to the CPU fallback",
+)
+
+# 이미지 버퍼 메모리 예산
+MEMORY_BUDGET_BYTES = registry.gauge(
+    "figure_memory_budget_bytes",
+    "Image buffer bytes currently reserved from the memory budget, by buffer kind",
+    ("kind",),
+)
+MEMORY_BUDGET_HIGH_WATER = registry.gauge(
+    "figure_memory_budget_high_water_bytes",
+    "Most image buffer bytes reserved at once since start",
+)
+MEMORY_BUDGET_WAITS = registry.counter(
+    "figure_memory_budget_waits_total",
+    "Buffers that did not fit the memory budget right away, by kind and outcome (granted after waiting or spilled to disk)",
+    ("kind", "outcome"),
+)
+
+# 운영 진단 (느린 요청 캡처)
+SLOW_REQUESTS = registry.counter(
+    "figure_slow_requests_total",
+    "Requests slower than SLOW_REQUEST_THRESHOLD_MS, captured with stack samples and stage timings",
+    ("method", "route"),
+)
@@ -0,0 +1,190 @@
+"""
+지각 해시(perceptual hash) 기반 유사 사진 찾기
+
+키오스크에서는 거의 같은 사진을 다시 찍는 경우가 많은데, 바이트가 조금만 달라도 ETag(내용 해시) 기반 병합은 놓친다.
+업로드마다 64비트 pHash(32x32 DCT 저주파 8x8)와 dHash(9x8 인접 픽셀 밝기 차)를 NumPy로 계산해
+공유 DB(job_store)에 색인하고, 해밍 거리 NEAR_DUP_MAX_DISTANCE 이내의 이전 사진을 찾는다.
+
+색인은 multi-index hashing: pHash를 16비트 밴드 4개로 나눠 밴드별 인덱스 컬럼에 둔다.
+두 해시의 거리가 d 이하면 밴드별 반경 r_i (sum(r_i + 1) > d) 중 적어도 한 밴드는 그 반경 안에 있으므로(비둘기집 원리)
+각 밴드에서 반경 안의 값들만 (band, phash, dhash) 커버링 인덱스로 조회하고, 후보의 실제 거리는 NumPy로 한 번에 확인한다.
+밴드 값 하나에 평균 N / 65536 건만 걸리므로 수백만 건이어도 후보는 수천 건이고, 본 테이블은 확인된 몇 건만 읽는다.
+
+찾은 사진은 이전 변환 결과(같은 스타일이면 바로 제안 가능)와 WD14 태그(재사용 시 태거 노드 생략)를 함께 돌려준다.
+NumPy와 Pillow는 첫 해시 계산 때 로드한다.
+"""
+
+import io
+from dataclasses import dataclass, field
+from itertools import combinations
+from pathlib import Path
+from typing import Optional, Union
+
+from app.config import settings
+from app.services.job_store import job_store
+from app.services.storage import storage
+from app.services.zimage import CHARACTER_STYLES
+
+HASH_BITS = 64
+BANDS = 4
+BAND_BITS = HASH_BITS // BANDS
+BAND_MASK = (1 << BAND_BITS) - 1
+
+_dct_matrix = None
+
+
+def _dct(size: int = 32):
+    """DCT-II 변환 행렬 (한 번만 계산)"""
+    global _dct_matrix
+    if _dct_matrix is None:
+        import numpy as np
+
+        k = np.arange(size)[:, None]
+        n = np.arange(size)[None, :]
+        matrix = np.cos(np.pi * (2 * n + 1) * k / (2 * size)) * np.sqrt(2 / size)
+        matrix[0] /= np.sqrt(2)
+        _dct_matrix = matrix
+    return _dct_matrix
+
+
+def _pack(bits) -> int:
+    import numpy as np
+
+    return int.from_bytes(np.packbits(bits.ravel()).tobytes(), "big")
+
+
+def compute_hashes(image: Union[bytes, Path, str]) -> tuple:
+    """이미지 -> (pHash, dHash) 64비트 정수 (블로킹: 저장소 스레드에서 호출)"""
+    import numpy as np
+    from PIL import Image, ImageOps
+
+    source = io.BytesIO(image) if isinstance(image, bytes) else str(image)
+    with Image.open(source) as img:
+        # JPEG는 디코딩 단계에서 1/8까지 축소 (12MP 사진 전체를 디코딩하지 않음)
+        img.draft("L", (64, 64))
+        img = ImageOps.exif_transpose(img).convert("L")
+        small = np.asarray(img.resize((32, 32), Image.Resampling.BOX), dtype=np.float64)
+        tiny = np.asarray(img.resize((9, 8), Image.Resampling.BOX), dtype=np.float64)
+
+    dct = _dct()
+    low = (dct @ small @ dct.T)[:8, :8]
+    # DC 성분은 전체 밝기라 중앙값 계산에서 제외
+    phash = _pack(low > np.median(low.ravel()[1:]))
+    dhash = _pack(tiny[:, 1:] > tiny[:, :-1])
+    return phash, dhash
+
+
+def hamming(hashes, query: int):
+    """hashes(부호 있는/없는 64비트 정수 배열) 각각과 query의 해밍 거리 (NumPy 배열)"""
+    import numpy as np
+
+    return np.bitwise_count(np.asarray(hashes).view(np.uint64) ^ np.uint64(query))
+
+
+def bands(value: int) -> list:
+    return [(value >> (BAND_BITS * i)) & BAND_MASK for i in range(BANDS)]
+
+
+def band_neighbors(value: int, radius: int) -> list:
+    """16비트 밴드 값에서 해밍 거리 radius 이내의 모든 값"""
+    values = [value]
+    for distance in range(1, radius + 1):
+        for positions in combinations(range(BAND_BITS), distance):
+            flipped = value
+            for position in positions:
+                flipped ^= 1 << position
+            values.append(flipped)
+    return values
+
+
+def band_radii(max_distance: int) -> list:
+    """sum(r_i + 1) > max_distance 를 만족하는 가장 작은 밴드별 반경 (예: 10 -> [2, 2, 2, 1])"""
+    total = max(0, max_distance + 1 - BANDS)
+    return [total // BANDS + (1 if i < total % BANDS else 0) for i in range(BANDS)]
+
+
+def to_signed(value: int) -> int:
+    """SQLite INTEGER(부호 있는 64비트)에 넣을 수 있도록 변환"""
+    return value - (1 << HASH_BITS) if value >= 1 << (HASH_BITS - 1) else value
+
+
+@dataclass
+class NearDuplicate:
+    etag: str
+    original_id: str
+    distance: int
+    tags: Optional[str] = None
+    results: list = field(default_factory=list)
+
+
+class NearDuplicateIndex:
+    def __init__(self, max_distance: int):
+        self.max_distance = max_distance
+
+    async def hash(self, image: Union[bytes, Path, str]) -> tuple:
+        return await storage.run("phash", compute_hashes, image)
+
+    async def lookup(self, phash: int, dhash: int, limit: int = 5) -> list:
+        """거리 max_distance 이내의 이전 사진 [NearDuplicate] (가까운 순, 이전 변환 결과 포함)"""
+        import numpy as np
+
+        candidates = await job_store.image_hash_candidates([
+            band_neighbors(value, radius) for value, radius in zip(bands(phash), band_radii(self.max_distance))
+        ])
+        if not candidates:
+            return []
+        rows = np.array(candidates, dtype=np.int64)
+        phash_distance = hamming(rows[:, 1], phash)
+        # dHash는 작은 이동에도 더 민감하므로 두 배까지 허용 (pHash만 우연히 가까운 경우 걸러냄)
+        keep = (phash_distance <= self.max_distance) & (hamming(rows[:, 2], dhash) <= 2 * self.max_distance)
+        order = np.argsort(phash_distance[keep], kind="stable")[:limit]
+        matches = [(int(rowid), int(distance)) for rowid, distance in zip(rows[keep, 0][order], phash_distance[keep][order])]
+        details = await job_store.image_hash_rows([rowid for rowid, _ in matches])
+        found = [
+            NearDuplicate(etag=details[rowid][0], original_id=details[rowid][1], distance=distance, tags=details[rowid][2])
+            for rowid, distance in matches
+            if rowid in details
+        ]
+        results = await job_store.results_for_etags([match.etag for match in found], tuple(CHARACTER_STYLES))
+        for match in found:
+            match.results = results.get(match.etag, [])
+        return found
+
+    async def add(self, etag: str, original_id: str, phash: int, dhash: int) -> None:
+        """색인에 추가 (같은 내용(ETag)은 처음 업로드만 남김)"""
+        await job_store.add_image_hash(etag, original_id, to_signed(phash), to_signed(dhash), bands(phash))
+
+    async def remember_tags(self, etag: str, tags: str) -> None:
+        await job_store.set_image_tags(etag, tags)
+
+    async def check(self, etag: str, original_id: str, image: Union[bytes, Path, str]) -> list:
+        """해시 계산 -> 유사 사진 조회 -> 이 사진도 색인에 추가"""
+        phash, dhash = await self.hash(image)
+        found = await self.lookup(phash, dhash)
+        await self.add(etag, original_id, phash, dhash)
+        return found
+
+
+def near_duplicate_view(found: list) -> Optional[dict]:
+    """API 응답용: 이전 변환 결과가 있는 가장 가까운 사진 (없으면 None)"""
+    for match in found:
+        if match.results:
+            return {
+                "original_id": match.original_id,
+                "distance": match.distance,
+                "original_thumb_url": f"api/transform/original/{match.original_id}/thumb",
+                "results": [
+                    {
+                        "style": style,
+                        "image_id": image_id,
+                        "image_url": f"api/transform/image/{image_id}",
+                        "preview_url": f"api/transform/image/{image_id}/preview",
+                    }
+                    for style, image_id in match.results
+                ],
+            }
+    return None
+
+
+# 유사 사진 색인 인스턴스 (데이터는 워커 간 공유 DB에 있음)
+near_duplicates = NearDuplicateIndex(max_distance=settings.NEAR_DUP_MAX_DISTANCE)
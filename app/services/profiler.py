@@ -0,0 +1,391 @@
+"""
+운영 중 워커 프로파일링 / 느린 요청 캡처
+
+p99가 튈 때 시간이 이벤트 루프 정체, 갤러리 JSON 처리, Pillow 작업, ComfyUI 대기 중 어디에 쓰였는지 보기 위한 도구.
+- SamplingProfiler: 관리자 요청으로 N초 동안 별도 스레드가 모든 스레드의 파이썬 스택을 hz 주기로 샘플링해
+  folded stacks(flamegraph.pl / speedscope / inferno 입력 형식)로 돌려준다. 쉬고 있는 스레드는 "(idle)" 하나로 접는다.
+- SlowRequestRecorder: 진행 중인 요청마다 SLOW_REQUEST_SAMPLE_HZ 로 스택을 샘플링해 두었다가
+  SLOW_REQUEST_THRESHOLD_MS 보다 오래 걸린 요청만 단계별 span 시간과 함께 링 버퍼(SLOW_REQUEST_BUFFER)에 남긴다.
+  이벤트 루프가 그 요청을 실행 중이면 실제 실행 스택([cpu]), 아니면 요청이 만든 가장 안쪽 태스크까지의 await 체인([wait])을
+  기록하므로 루프를 잡고 있는 JSON/Pillow 작업과 ComfyUI 대기가 구분된다. 루프가 다른 일로 바빠 기다린 샘플도 따로 센다.
+샘플러는 이벤트 루프가 막혀 있어도 돌도록 스레드에서 실행한다 (샘플 한 번에 GIL을 잡는 시간은 수십 µs).
+"""
+
+import asyncio
+import logging
+import re
+import sys
+import threading
+import time
+from collections import Counter, deque
+from dataclasses import dataclass, field
+from typing import Optional
+
+from app.config import settings
+from app.services.metrics import SLOW_REQUESTS
+from app.services.tracing import Span, current_request_id, new_trace_id, tracer
+
+logger = logging.getLogger(__name__)
+
+# 이 프레임이 맨 안쪽이면 스레드가 쉬는 중 (이벤트 루프 select, 스레드 풀 대기 등)
+IDLE_LEAVES = frozenset({
+    "selectors:EpollSelector.select",
+    "selectors:PollSelector.select",
+    "selectors:SelectSelector.select",
+    "selectors:KqueueSelector.select",
+    "threading:Condition.wait",
+    "threading:Event.wait",
+    "threading:Thread._wait_for_tstate_lock",
+    "queue:Queue.get",
+    "concurrent.futures.thread:_worker",
+    "multiprocessing.connection:wait",
+})
+IDLE_FRAME = "(idle)"
+# 이벤트 루프 스레드 스택에서 이 프레임까지는 매번 같은 루프 바깥 부분이라 잘라 낸다
+LOOP_CALLBACK_FRAME = "asyncio.events:Handle._run"
+# 캡처하지 않는 요청 (오래 열려 있는 것이 정상인 스트림 / 프로파일링 요청 자체)
+IGNORED_PATH_MARKERS = ("/api/admin/", "/gallery/stream")
+MAX_STAGES = 200
+MAX_STACKS = 50
+
+
+def frame_label(frame) -> str:
+    code = frame.f_code
+    name = getattr(code, "co_qualname", code.co_name)
+    return f"{frame.f_globals.get('__name__', '?')}:{name}".replace(";", ",")
+
+
+def frame_stack(frame) -> list:
+    """바깥 -> 안쪽 순서의 프레임 라벨"""
+    labels = []
+    while frame is not None:
+        labels.append(frame_label(frame))
+        frame = frame.f_back
+    labels.reverse()
+    return labels
+
+
+def await_stack(coro) -> list:
+    """중단된 코루틴이 기다리는 await 체인 (바깥 -> 안쪽). 끝이 Future면 그 타입을 붙인다"""
+    labels = []
+    while coro is not None:
+        frame = getattr(coro, "cr_frame", None) or getattr(coro, "gi_frame", None) or getattr(coro, "ag_frame", None)
+        if frame is None:
+            labels.append(f"<{type(coro).__name__}>")
+            break
+        labels.append(frame_label(frame))
+        coro = getattr(coro, "cr_await", None) or getattr(coro, "gi_yieldfrom", None) or getattr(coro, "ag_await", None)
+    return labels
+
+
+def thread_root(name: str) -> str:
+    # 풀 스레드(storage_0, storage_1 ...)는 풀 하나로 합침
+    return re.sub(r"_\d+$", "", name)
+
+
+def render_folded(counts: Counter) -> str:
+    return "".join(f"{stack} {count}\n" for stack, count in counts.most_common())
+
+
+@dataclass
+class ProfileResult:
+    seconds: float
+    hz: int
+    samples: int
+    counts: Counter
+
+    def folded(self) -> str:
+        return render_folded(self.counts)
+
+
+class SamplingProfiler:
+    """요청받은 동안만 도는 전체 스레드 샘플링 프로파일러 (워커마다 한 번에 하나)"""
+
+    def __init__(self):
+        self.running = False
+        self.sessions = 0
+        self.last: Optional[dict] = None
+
+    @staticmethod
+    def _sample(interval: float, stop: threading.Event, counts: Counter, result: dict) -> None:
+        me = threading.get_ident()
+        next_at = time.perf_counter()
+        while not stop.is_set():
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                labels = frame_stack(frame)
+                root = thread_root(names.get(ident, f"thread-{ident}"))
+                if labels and labels[-1] in IDLE_LEAVES:
+                    labels = [IDLE_FRAME]
+                counts[";".join([root] + labels)] += 1
+            result["samples"] += 1
+            next_at += interval
+            delay = next_at - time.perf_counter()
+            if delay < 0:
+                # 밀린 주기는 건너뜀 (따라잡으려고 몰아서 샘플링하지 않음)
+                next_at = time.perf_counter()
+                delay = 0
+            stop.wait(delay)
+
+    async def profile(self, seconds: float, hz: int) -> ProfileResult:
+        """seconds 동안 hz로 샘플링한 결과 (이 코루틴이 기다리는 동안 워커는 평소대로 요청을 처리)"""
+        if self.running:
+            raise RuntimeError("profiler already running")
+        self.running = True
+        counts: Counter = Counter()
+        result = {"samples": 0}
+        stop = threading.Event()
+        thread = threading.Thread(
+            target=self._sample, args=(1.0 / hz, stop, counts, result), name="profiler", daemon=True
+        )
+        started = time.perf_counter()
+        thread.start()
+        try:
+            await asyncio.sleep(seconds)
+        finally:
+            stop.set()
+            thread.join()
+            self.running = False
+        elapsed = time.perf_counter() - started
+        self.sessions += 1
+        self.last = {"at": time.time(), "seconds": round(elapsed, 2), "hz": hz, "samples": result["samples"]}
+        logger.info(f"Profiled this worker for {elapsed:.1f}s: {result['samples']} samples, {len(counts)} distinct stacks")
+        return ProfileResult(elapsed, hz, result["samples"], counts)
+
+
+@dataclass
+class _ActiveRequest:
+    request_id: str
+    method: str
+    path: str
+    task: Optional[asyncio.Task]
+    started: float
+    started_at: float
+    started_ns: int
+    tasks: list = field(default_factory=list)  # 요청 안에서 만든 태스크 (스케줄러 작업 등)
+    stacks: Counter = field(default_factory=Counter)
+    stages: list = field(default_factory=list)
+    samples: int = 0
+    cpu_samples: int = 0
+    loop_busy_samples: int = 0
+
+
+class SlowRequestRecorder:
+    def __init__(self, threshold_ms: float, sample_hz: int, buffer_size: int):
+        self.enabled = threshold_ms > 0
+        self.threshold = threshold_ms / 1000
+        self.interval = 1.0 / max(1, sample_hz)
+        self.captured = 0
+        self._buffer: deque = deque(maxlen=buffer_size)
+        self._active: dict = {}
+        self._lock = threading.Lock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread: Optional[int] = None
+        self._previous_factory = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    # -- 요청 등록 (이벤트 루프 스레드) -------------------------------------------
+
+    def begin(self, method: str, path: str) -> _ActiveRequest:
+        task = asyncio.current_task()
+        active = _ActiveRequest(
+            request_id=current_request_id() or new_trace_id(),
+            method=method,
+            path=path,
+            task=task,
+            started=time.perf_counter(),
+            started_at=time.time(),
+            started_ns=time.time_ns(),
+            tasks=[task] if task is not None else [],
+        )
+        with self._lock:
+            self._active[active.request_id] = active
+        return active
+
+    def finish(self, active: _ActiveRequest, route: str, status: int) -> None:
+        duration = time.perf_counter() - active.started
+        with self._lock:
+            if self._active.get(active.request_id) is active:
+                del self._active[active.request_id]
+        if duration < self.threshold:
+            return
+        self.captured += 1
+        SLOW_REQUESTS.inc(active.method, route)
+        self._buffer.append({
+            "request_id": active.request_id,
+            "method": active.method,
+            "path": active.path,
+            "route": route,
+            "status": status,
+            "started_at": active.started_at,
+            "duration_ms": round(duration * 1000, 1),
+            "samples": active.samples,
+            "cpu_samples": active.cpu_samples,
+            "loop_busy_samples": active.loop_busy_samples,
+            "stages": sorted(active.stages, key=lambda stage: stage["offset_ms"]),
+            "stacks": [{"stack": stack, "count": count} for stack, count in active.stacks.most_common(MAX_STACKS)],
+        })
+        logger.info(
+            f"Slow request {active.method} {active.path} took {duration * 1000:.0f} ms "
+            f"(request id {active.request_id}, {active.samples} stack samples)"
+        )
+
+    def _on_span(self, span: Span) -> None:
+        active = self._active.get(span.trace_id)
+        if active is None or len(active.stages) >= MAX_STAGES:
+            return
+        active.stages.append({
+            "name": span.name,
+            "offset_ms": round((span.start_ns - active.started_ns) / 1e6, 1),
+            "duration_ms": round(span.duration * 1000, 1),
+            "error": span.error,
+            "attributes": dict(span.attributes),
+        })
+
+    def _task_factory(self, loop, coro, **kwargs):
+        if self._previous_factory is not None:
+            task = self._previous_factory(loop, coro, **kwargs)
+        else:
+            task = asyncio.Task(coro, loop=loop, **kwargs)
+        request_id = current_request_id()
+        if request_id is not None:
+            active = self._active.get(request_id)
+            if active is not None:
+                # 끝난 태스크는 여기서 정리 (샘플러 스레드는 목록을 복사해서 읽기만 함)
+                active.tasks = [t for t in active.tasks if not t.done()] + [task]
+        return task
+
+    # -- 샘플링 (샘플러 스레드) -----------------------------------------------------
+
+    def _request_stack(self, active: _ActiveRequest) -> Optional[list]:
+        tasks = [t for t in list(active.tasks) if not t.done()]
+        if not tasks:
+            return None
+        main, leaf = tasks[0], tasks[-1]
+        labels = await_stack(main.get_coro())
+        if leaf is not main:
+            labels += ["<task>"] + await_stack(leaf.get_coro())
+        return labels
+
+    def _sample_once(self) -> None:
+        loop_frame = sys._current_frames().get(self._loop_thread)
+        loop_stack = frame_stack(loop_frame) if loop_frame is not None else []
+        loop_idle = not loop_stack or loop_stack[-1] in IDLE_LEAVES
+        running = asyncio.current_task(self._loop) if not loop_idle else None
+        if LOOP_CALLBACK_FRAME in loop_stack:
+            loop_stack = loop_stack[len(loop_stack) - loop_stack[::-1].index(LOOP_CALLBACK_FRAME):]
+        with self._lock:
+            for active in self._active.values():
+                if running is not None and running in active.tasks:
+                    active.cpu_samples += 1
+                    labels = ["[cpu]"] + loop_stack
+                else:
+                    stack = self._request_stack(active)
+                    if stack is None:
+                        continue
+                    if not loop_idle:
+                        active.loop_busy_samples += 1
+                    labels = ["[wait]"] + stack
+                active.samples += 1
+                active.stacks[";".join(labels)] += 1
+
+    def _sample_loop(self) -> None:
+        while not self._stop.wait(self.interval):
+            if not self._active:
+                continue
+            try:
+                self._sample_once()
+            except Exception as e:
+                # 다른 스레드의 코루틴을 읽는 중 상태가 바뀌는 경우 등: 이번 샘플만 버림
+                logger.debug(f"Slow request sample skipped: {e!r}")
+
+    def start(self) -> None:
+        if not self.enabled or self._thread is not None:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread = threading.get_ident()
+        self._previous_factory = self._loop.get_task_factory()
+        self._loop.set_task_factory(self._task_factory)
+        tracer.add_listener(self._on_span)
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._sample_loop, name="slow-request-sampler", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+        if self._loop is not None and self._loop.get_task_factory() == self._task_factory:
+            self._loop.set_task_factory(self._previous_factory)
+
+    # -- 조회 -----------------------------------------------------------------------
+
+    def recent(self) -> list:
+        """최근 캡처 (최신 순, 스택 제외)"""
+        return [
+            {key: value for key, value in record.items() if key != "stacks"}
+            for record in reversed(self._buffer)
+        ]
+
+    def get(self, request_id: str) -> Optional[dict]:
+        for record in reversed(self._buffer):
+            if record["request_id"] == request_id:
+                return record
+        return None
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "threshold_ms": self.threshold * 1000,
+            "in_flight": len(self._active),
+            "captured": self.captured,
+            "buffered": len(self._buffer),
+        }
+
+
+class SlowRequestMiddleware:
+    """요청 시간을 재고 진행 중인 요청을 샘플러에 등록하는 ASGI 미들웨어 (RequestIdMiddleware 안쪽에 둔다)"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if (
+            scope["type"] != "http"
+            or not slow_requests.enabled
+            or any(marker in scope["path"] for marker in IGNORED_PATH_MARKERS)
+        ):
+            await self.app(scope, receive, send)
+            return
+
+        active = slow_requests.begin(scope["method"], scope["path"])
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            # 라우팅 후 scope에 남는 경로 템플릿 (메트릭 라벨 수를 묶음)
+            route = getattr(scope.get("route"), "path", None) or "unmatched"
+            slow_requests.finish(active, route, status)
+
+
+# 관리자 요청용 샘플링 프로파일러 인스턴스 (워커 프로세스별)
+profiler = SamplingProfiler()
+
+# 느린 요청 캡처 인스턴스 (워커 프로세스별 링 버퍼)
+slow_requests = SlowRequestRecorder(
+    threshold_ms=settings.SLOW_REQUEST_THRESHOLD_MS,
+    sample_hz=settings.SLOW_REQUEST_SAMPLE_HZ,
+    buffer_size=settings.SLOW_REQUEST_BUFFER,
+)
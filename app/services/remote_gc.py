@@ -0,0 +1,217 @@
+"""
+ComfyUI 백엔드에 남는 요청별 파일/히스토리 정리
+
+변환 한 건마다 ComfyUI에는 업로드한 사용자 사진(input/upload_[<배포>_]<uuid>.png), SaveImage 결과(output/zimage_[<배포>_]*.png),
+/history 항목이 남는다. 지우지 않으면 GPU 서버 디스크가 차고 /history 응답도 점점 느려진다.
+- zimage가 prompt마다 남긴 것을 공유 DB(remote_artifacts)에 묶음으로 기록하고, 다운로드가 끝나거나 취소되면 바로 정리 대상으로 표시
+- 다운로드까지 가지 못한 묶음(실행 오류, 프로세스 종료)은 REMOTE_GC_TTL_SECONDS 뒤 정리 (그동안은 원인 확인용으로 남김)
+- REMOTE_GC_INTERVAL_SECONDS 마다 한 워커만(공유 DB 리스) 정리: 히스토리는 POST /history {"delete": [...]},
+  파일은 COMFYUI_DELETE_ENDPOINT 가 설정된 경우에만 (ComfyUI 기본 API에는 파일 삭제가 없음)
+- REMOTE_GC_RECONCILE 이면 백엔드가 처음 연결되거나 재시작될 때 /history를 훑어 기록에 없는 오래된 이 배포의 prompt도
+  정리 (reconcile: 기록 전에 죽은 프로세스, 이 기능 이전에 쌓인 항목). 같은 ComfyUI를 다른 배포도 쓸 수 있고 state.db를
+  잃으면 모든 항목이 "기록에 없음"이 되므로, COMFYUI_DEPLOYMENT_ID가 들어간 파일명(zimage_<배포>_, upload_<배포>_)만
+  건드리고 배포 이름이 없으면 하지 않는다. 기본은 꺼짐.
+"""
+
+import asyncio
+import logging
+import time
+from typing import Optional
+
+from app.config import settings
+from app.services.health import health_monitor
+from app.services.job_store import job_store
+from app.services.metrics import COMFYUI_ARTIFACTS_REMOVED, COMFYUI_GC_ERRORS
+from app.services.zimage import execution_timestamps, zimage_service
+
+logger = logging.getLogger(__name__)
+
+FETCH_LIMIT = 500
+
+
+def prompt_files(prompt_history: dict) -> list:
+    """history 항목에서 이 배포가 만든 파일 [{"filename", "subfolder", "type"}] (파일명 접두사는 settings.comfyui_*_prefix)"""
+    output_prefix, upload_prefix = settings.comfyui_output_prefix, settings.comfyui_upload_prefix
+    files = []
+    for node_output in prompt_history.get("outputs", {}).values():
+        for image in node_output.get("images") or []:
+            if str(image.get("filename", "")).startswith(output_prefix):
+                files.append({
+                    "filename": image["filename"],
+                    "subfolder": image.get("subfolder", ""),
+                    "type": image.get("type", "output"),
+                })
+    prompt = prompt_history.get("prompt") or []
+    graph = prompt[2] if len(prompt) > 2 and isinstance(prompt[2], dict) else {}
+    for node in graph.values():
+        name = node.get("inputs", {}).get("image") if node.get("class_type") == "LoadImage" else None
+        if isinstance(name, str) and name.startswith(upload_prefix):
+            files.append({"filename": name, "subfolder": "", "type": "input"})
+    return files
+
+
+class RemoteArtifactCollector:
+    def __init__(self, enabled: bool, ttl: float, interval: float, reconcile: bool, deployment_id: str):
+        self.enabled = enabled
+        # 배포 이름이 없으면 다른 배포의 파일과 구분할 수 없으므로 reconcile 안 함
+        self.reconcile_enabled = reconcile and bool(deployment_id)
+        self.deployment_id = deployment_id
+        self.ttl = ttl
+        self.interval = interval
+        self.removed: dict = {}
+        self.files_kept = 0  # 삭제 엔드포인트가 없어 기록만 지운 파일 수
+        self.errors = 0
+        self.last_pass_at: Optional[float] = None
+        self.reconciled: dict = {}
+        self._task: Optional[asyncio.Task] = None
+        self._reconciling: dict = {}
+
+    def _count(self, base_url: str, kind: str, source: str, amount: int) -> None:
+        if amount:
+            COMFYUI_ARTIFACTS_REMOVED.inc(base_url, kind, source, amount=amount)
+            self.removed[kind] = self.removed.get(kind, 0) + amount
+
+    async def _remove(self, base_url: str, prompt_ids: list, files: list, source: str) -> None:
+        """히스토리 항목 + 파일 삭제 (실패하면 예외: 호출자가 다음 번에 다시 시도)"""
+        if prompt_ids:
+            await zimage_service.delete_history(prompt_ids, base_url)
+            self._count(base_url, "history", source, len(prompt_ids))
+        if files:
+            if await zimage_service.delete_files(files, base_url):
+                for kind in {f["type"] for f in files}:
+                    self._count(base_url, kind, source, sum(1 for f in files if f["type"] == kind))
+            else:
+                self.files_kept += len(files)
+
+    async def collect_due(self) -> int:
+        """정리 대상이 된 기록을 백엔드에서 지우고 기록도 삭제 -> 처리한 기록 수"""
+        handled = 0
+        while True:
+            rows = await job_store.due_remote_artifacts(FETCH_LIMIT)
+            by_backend: dict = {}
+            for row in rows:
+                by_backend.setdefault(row[1], []).append(row)
+            done = []
+            for base_url, items in by_backend.items():
+                if base_url not in zimage_service.backends:
+                    # 설정에서 빠진 백엔드: 지울 방법이 없으므로 기록만 정리
+                    done += items
+                    continue
+                try:
+                    await self._remove(
+                        base_url,
+                        [name for _, _, kind, name, _ in items if kind == "history"],
+                        [
+                            {"filename": name, "subfolder": subfolder, "type": kind}
+                            for _, _, kind, name, subfolder in items if kind != "history"
+                        ],
+                        "tracked",
+                    )
+                except Exception as e:
+                    COMFYUI_GC_ERRORS.inc(base_url)
+                    self.errors += 1
+                    logger.warning(f"ComfyUI cleanup on {base_url} failed, retrying next pass: {e!r}")
+                    continue
+                done += items
+            if done:
+                await job_store.delete_remote_artifacts([row[0] for row in done])
+            handled += len(done)
+            # 실패한 백엔드 기록이 남아 있으면 같은 행을 다시 읽게 되므로 이번 패스는 여기까지
+            if len(rows) < FETCH_LIMIT or len(done) < len(rows):
+                return handled
+
+    async def reconcile(self, base_url: str) -> dict:
+        """/history에서 기록에 없고 TTL이 지난 이 배포의 prompt를 찾아 정리"""
+        history = await zimage_service.list_history(base_url)
+        tracked = await job_store.tracked_remote_names(base_url)
+        cutoff = time.time() - self.ttl
+        prompt_ids, files = [], []
+        for prompt_id, entry in history.items():
+            if prompt_id in tracked:
+                continue
+            started, finished = execution_timestamps(entry)
+            finished_at = finished or started
+            # 언제 끝났는지 모르거나 아직 TTL 전이면 (다른 워커가 다운로드 중일 수 있음) 두기
+            if finished_at is None or finished_at > cutoff:
+                continue
+            entry_files = prompt_files(entry)
+            if not entry_files:
+                continue
+            prompt_ids.append(prompt_id)
+            files += [f for f in entry_files if f["filename"] not in tracked]
+        await self._remove(base_url, prompt_ids, files, "reconciled")
+        result = {"at": time.time(), "history_entries": len(history), "prompts_removed": len(prompt_ids), "files": len(files)}
+        self.reconciled[base_url] = result
+        if prompt_ids:
+            logger.info(f"Reconciled {base_url}: removed {len(prompt_ids)} orphaned prompts, {len(files)} files")
+        return result
+
+    async def _reconcile_once(self, base_url: str) -> None:
+        if not await job_store.acquire_lease(f"remote_gc:reconcile:{base_url}", max(60.0, self.interval)):
+            return
+        try:
+            await self.reconcile(base_url)
+        except Exception as e:
+            COMFYUI_GC_ERRORS.inc(base_url)
+            self.errors += 1
+            logger.warning(f"ComfyUI reconciliation of {base_url} failed: {e!r}")
+
+    def _on_health_change(self, base_url: str, previous: str, current: str) -> None:
+        # 앱 기동 후 처음 연결 / 재시작 후 다시 연결: 그동안 쌓였을 수 있는 항목 정리
+        if current != "connected":
+            return
+        task = self._reconciling.get(base_url)
+        if task is None or task.done():
+            self._reconciling[base_url] = asyncio.create_task(self._reconcile_once(base_url))
+
+    async def _loop(self) -> None:
+        while True:
+            try:
+                if await job_store.acquire_lease("remote_gc:collect", self.interval * 0.9):
+                    await self.collect_due()
+                    self.last_pass_at = time.time()
+            except Exception as e:
+                self.errors += 1
+                logger.warning(f"ComfyUI cleanup pass failed: {e!r}")
+            await asyncio.sleep(self.interval)
+
+    def start(self) -> None:
+        if not self.enabled or self._task is not None:
+            return
+        if self.reconcile_enabled:
+            health_monitor.add_listener(self._on_health_change)
+        elif settings.REMOTE_GC_RECONCILE:
+            logger.warning("REMOTE_GC_RECONCILE needs COMFYUI_DEPLOYMENT_ID to tell this deployment's files apart; not reconciling")
+        self._task = asyncio.create_task(self._loop())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        for task in self._reconciling.values():
+            task.cancel()
+        self._reconciling.clear()
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "ttl_seconds": self.ttl,
+            "reconcile": self.reconcile_enabled,
+            "deployment_id": self.deployment_id or None,
+            "delete_endpoint": settings.COMFYUI_DELETE_ENDPOINT or None,
+            "removed": self.removed,
+            "files_kept": self.files_kept,
+            "errors": self.errors,
+            "last_pass_at": self.last_pass_at,
+            "reconciled": self.reconciled,
+        }
+
+
+# ComfyUI 파일/히스토리 정리 인스턴스
+remote_gc = RemoteArtifactCollector(
+    enabled=settings.REMOTE_GC_ENABLED,
+    ttl=settings.REMOTE_GC_TTL_SECONDS,
+    interval=settings.REMOTE_GC_INTERVAL_SECONDS,
+    reconcile=settings.REMOTE_GC_RECONCILE,
+    deployment_id=settings.COMFYUI_DEPLOYMENT_ID,
+)
@@ -0,0 +1,116 @@
+"""
+변환 결과를 디스크와 HTTP 응답으로 동시에 스트리밍 (동기 호출자용)
+
+POST /api/transform/character 를 Accept: image/png 로 호출하면 JSON 대신 결과 PNG 자체를 같은 응답으로 돌려준다.
+ComfyUI /view 청크는 GeneratedWriter(디스크)에 쓴 뒤 이 객체의 버퍼를 거쳐 곧바로 클라이언트로 나간다.
+- 버퍼는 MAX_BUFFER_BYTES까지만: 클라이언트가 느리면 다운로드도 그만큼 기다림 (이미지 전체를 메모리에 쌓지 않음)
+- 버퍼에 든 청크는 프로세스 메모리 예산("result")에서 빌림: 동시 스트림이 많으면 예산이 날 때까지 다운로드가 기다림
+- 클라이언트가 떠나면(detach) 버퍼를 비우고 디스크 쓰기만 계속
+- 응답을 연 뒤에는(헤더의 Content-Length/X-Image-ID가 그 다운로드 기준) 처음부터 다시 받을 수 없으므로
+  재시도(start 재호출)를 거부: zimage 재시도와 라우터의 CPU 대체 변환도 committed를 보고 건너뜀
+"""
+
+import asyncio
+from collections import deque
+from typing import AsyncIterator, Optional
+
+from app.services.memory_budget import memory_budget
+from app.services.storage import GeneratedWriter
+
+MAX_BUFFER_BYTES = 1024 * 1024
+
+
+class ResultStreamRestarted(Exception):
+    """이미 응답을 연 스트림을 다시 시작하려 함 (재시도 대상이 아님)"""
+
+
+class ResultStream:
+    def __init__(self, writer: GeneratedWriter, max_buffer_bytes: int = MAX_BUFFER_BYTES):
+        self.writer = writer
+        self.max_buffer_bytes = max_buffer_bytes
+        self.content_length: Optional[int] = None
+        self.started = asyncio.Event()
+        self.attached = True
+        self._chunks: deque = deque()
+        self._buffered = 0
+        self._readable = asyncio.Event()
+        self._writable = asyncio.Event()
+        self._closed = False
+        self._error: Optional[BaseException] = None
+
+    @property
+    def committed(self) -> bool:
+        """응답 헤더를 이미 내보냄 (이후 실패는 본문을 끊는 것 말고는 되돌릴 수 없음)"""
+        return self.started.is_set()
+
+    # -- GeneratedWriter와 같은 sink 인터페이스 (zimage._download_image가 호출) --
+
+    async def start(self, content_length: Optional[int] = None) -> None:
+        if self.committed:
+            raise ResultStreamRestarted("Result response was already started")
+        await self.writer.start(content_length)
+        self.content_length = content_length
+        self.started.set()
+
+    async def write(self, chunk: bytes) -> None:
+        await self.writer.write(chunk)
+        while self.attached and self._buffered >= self.max_buffer_bytes:
+            self._writable.clear()
+            await self._writable.wait()
+        if not self.attached:
+            return
+        await memory_budget.acquire(len(chunk), "result")
+        if not self.attached:
+            memory_budget.release(len(chunk), "result")
+            return
+        self._chunks.append(chunk)
+        self._buffered += len(chunk)
+        self._readable.set()
+
+    async def finish(self) -> None:
+        await self.writer.finish()
+        self.close()
+
+    async def abort(self) -> None:
+        await self.writer.abort()
+
+    async def discard(self) -> None:
+        await self.writer.discard()
+
+    # -- HTTP 응답 쪽 --------------------------------------------------------
+
+    def close(self, error: Optional[BaseException] = None) -> None:
+        """더 보낼 청크 없음 (error가 있으면 응답 본문을 중간에 끊음)"""
+        if self._closed:
+            return
+        self._closed = True
+        self._error = error
+        self._readable.set()
+
+    def detach(self) -> None:
+        """클라이언트가 떠남: 버퍼를 비우고 이후 청크는 디스크에만 씀"""
+        self.attached = False
+        self._chunks.clear()
+        if self._buffered:
+            memory_budget.release(self._buffered, "result")
+        self._buffered = 0
+        self._writable.set()
+
+    async def body(self) -> AsyncIterator[bytes]:
+        try:
+            while True:
+                if self._chunks:
+                    chunk = self._chunks.popleft()
+                    self._buffered -= len(chunk)
+                    memory_budget.release(len(chunk), "result")
+                    self._writable.set()
+                    yield chunk
+                    continue
+                if self._closed:
+                    if self._error is not None:
+                        raise self._error
+                    return
+                self._readable.clear()
+                await self._readable.wait()
+        finally:
+            self.detach()
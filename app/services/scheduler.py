@@ -0,0 +1,222 @@
+"""
+변환 작업 스케줄러
+
+ComfyUI 큐는 도착 순서(FIFO)라 한 키오스크가 스타일을 연달아 바꾸면 다른 키오스크가 밀리고,
+결제 후 최종 렌더가 버려질 미리보기 뒤에서 기다리게 된다.
+그래서 ComfyUI에 동시에 넣는 작업 수를 제한하고, 남는 작업은 여기서 줄 세운다.
+
+- 우선순위 클래스: final(결제 후 최종) > preview(대화형 미리보기) > background(추측/백그라운드)
+- 같은 클래스 안에서는 키오스크별 라운드 로빈 (한 키오스크가 여러 건을 넣어도 번갈아 처리)
+- 같은 키오스크의 새 미리보기가 들어오면 이전 미리보기/백그라운드 작업은 취소
+  (대기 중이면 이 큐에서 제거, 이미 제출됐으면 ComfyUI 큐 삭제 또는 /interrupt)
+- 클라이언트 연결이 끊기거나 취소 API가 호출된 작업도 같은 경로로 취소
+"""
+
+import asyncio
+import logging
+import time
+from collections import OrderedDict, deque
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Optional
+
+from app.config import settings
+from app.services.job_store import job_store
+from app.services.metrics import JOBS_CANCELLED, SCHEDULER_QUEUE_WAIT_SECONDS, SCHEDULER_QUEUED
+from app.services.zimage import zimage_service
+
+logger = logging.getLogger(__name__)
+
+PRIORITY_CLASSES = ("final", "preview", "background")
+DEFAULT_PRIORITY = "preview"
+# 새 작업이 들어오면 같은 키오스크의 이 클래스 작업들을 대체
+SUPERSEDABLE = ("preview", "background")
+
+
+class JobCancelled(Exception):
+    """대기/실행 중 작업이 취소됨 (reason: superseded, cancelled 등)"""
+
+    def __init__(self, reason: str):
+        super().__init__(reason)
+        self.reason = reason
+
+
+@dataclass
+class Ticket:
+    job_id: str
+    kiosk: str
+    priority: str
+    style: Optional[str] = None
+    enqueued_at: float = field(default_factory=time.monotonic)
+    granted: asyncio.Future = field(default_factory=lambda: asyncio.get_running_loop().create_future())
+    task: Optional[asyncio.Task] = None
+    cancel_reason: Optional[str] = None
+
+
+class TransformScheduler:
+    def __init__(self, max_in_flight: int, cancel_poll_interval: float, heartbeat_interval: float):
+        self.max_in_flight = max_in_flight
+        self.cancel_poll_interval = cancel_poll_interval
+        self.heartbeat_interval = heartbeat_interval
+        # 클래스별 {kiosk: deque[Ticket]} (OrderedDict 순서 = 라운드 로빈 순서)
+        self._queues = {priority: OrderedDict() for priority in PRIORITY_CLASSES}
+        self._tickets: dict = {}
+        self._running = 0
+        self._poll_task: Optional[asyncio.Task] = None
+
+    def queued(self, priority: Optional[str] = None) -> int:
+        classes = (priority,) if priority else PRIORITY_CLASSES
+        return sum(len(q) for p in classes for q in self._queues[p].values())
+
+    def jobs_ahead(self, priority: str) -> int:
+        """새 priority 작업보다 먼저 ComfyUI로 갈 작업 수 (실행 중 + 같거나 높은 클래스 대기)"""
+        higher = PRIORITY_CLASSES[:PRIORITY_CLASSES.index(priority) + 1]
+        return self._running + sum(self.queued(p) for p in higher)
+
+    def _next_ticket(self) -> Optional[Ticket]:
+        for priority in PRIORITY_CLASSES:
+            queues = self._queues[priority]
+            if not queues:
+                continue
+            kiosk, tickets = next(iter(queues.items()))
+            ticket = tickets.popleft()
+            if tickets:
+                queues.move_to_end(kiosk)
+            else:
+                del queues[kiosk]
+            return ticket
+        return None
+
+    def _dispatch(self) -> None:
+        while self._running < self.max_in_flight:
+            ticket = self._next_ticket()
+            if ticket is None:
+                break
+            SCHEDULER_QUEUED.dec(ticket.priority)
+            if ticket.granted.done():
+                continue
+            self._running += 1
+            ticket.granted.set_result(None)
+
+    def _remove_queued(self, ticket: Ticket) -> bool:
+        tickets = self._queues[ticket.priority].get(ticket.kiosk)
+        if tickets is None or ticket not in tickets:
+            return False
+        tickets.remove(ticket)
+        if not tickets:
+            del self._queues[ticket.priority][ticket.kiosk]
+        SCHEDULER_QUEUED.dec(ticket.priority)
+        return True
+
+    async def run(self, job_id: str, kiosk: str, priority: str, fn: Callable[[], Awaitable], style: Optional[str] = None):
+        """슬롯이 날 때까지 기다렸다가 fn 실행. 취소되면 JobCancelled (style은 아낀 GPU 시간 추정용)"""
+        ticket = Ticket(job_id, kiosk, priority, style)
+        self._tickets[job_id] = ticket
+        self._queues[priority].setdefault(kiosk, deque()).append(ticket)
+        SCHEDULER_QUEUED.inc(priority)
+        self._dispatch()
+        try:
+            try:
+                await ticket.granted
+            except asyncio.CancelledError:
+                if not self._remove_queued(ticket) and ticket.granted.done() and not ticket.granted.cancelled():
+                    # 슬롯을 받은 직후 취소된 경우 슬롯 반환
+                    self._release()
+                raise
+            SCHEDULER_QUEUE_WAIT_SECONDS.observe(time.monotonic() - ticket.enqueued_at, priority)
+
+            try:
+                if ticket.cancel_reason is not None:
+                    raise JobCancelled(ticket.cancel_reason)
+                ticket.task = asyncio.create_task(fn())
+                try:
+                    return await ticket.task
+                except asyncio.CancelledError:
+                    current = asyncio.current_task()
+                    if ticket.cancel_reason is not None and not (current and current.cancelling()):
+                        raise JobCancelled(ticket.cancel_reason)
+                    ticket.task.cancel()
+                    raise
+            finally:
+                self._release()
+        finally:
+            self._tickets.pop(job_id, None)
+
+    def _release(self) -> None:
+        self._running -= 1
+        self._dispatch()
+
+    def cancel(self, job_id: str, reason: str = "cancelled") -> bool:
+        """이 워커의 작업 취소 (대기 중이면 큐에서 제거, 실행 중이면 태스크 취소)"""
+        ticket = self._tickets.get(job_id)
+        if ticket is None or ticket.cancel_reason is not None:
+            return False
+        ticket.cancel_reason = reason
+        JOBS_CANCELLED.inc(ticket.priority, reason)
+        if self._remove_queued(ticket):
+            ticket.granted.set_exception(JobCancelled(reason))
+            # ComfyUI에 보내기 전에 취소 -> 실행 시간 전체를 아낌
+            zimage_service.count_gpu_seconds_avoided("queued", ticket.style)
+        elif ticket.task is not None:
+            ticket.task.cancel()
+        logger.info(f"Job {job_id} cancelled ({reason}, priority={ticket.priority})")
+        return True
+
+    async def cancel_job(self, job_id: str, reason: str = "cancelled") -> Optional[dict]:
+        """어느 워커의 작업이든 취소 (이 워커 소유면 즉시, 아니면 취소 요청을 기록해 소유 워커가 처리)"""
+        job = await job_store.request_cancel(job_id, reason)
+        if job is not None and job["worker"] == job_store.worker:
+            self.cancel(job_id, reason)
+        return job
+
+    async def supersede(self, kiosk: str, job_id: str) -> int:
+        """같은 키오스크의 이전 미리보기/백그라운드 작업 취소 (다른 워커 소유면 취소 요청만 기록)"""
+        superseded = await job_store.supersede(kiosk, job_id, SUPERSEDABLE)
+        cancelled = 0
+        for old_job_id, worker in superseded:
+            if worker == job_store.worker and self.cancel(old_job_id, "superseded"):
+                cancelled += 1
+        return cancelled
+
+    async def _poll_cancel_requests(self) -> None:
+        """다른 워커가 요청한 취소 반영 + 이 워커가 맡은 작업의 heartbeat"""
+        last_heartbeat = time.monotonic()
+        while True:
+            await asyncio.sleep(self.cancel_poll_interval)
+            if time.monotonic() - last_heartbeat >= self.heartbeat_interval:
+                last_heartbeat = time.monotonic()
+                try:
+                    await job_store.touch_jobs()
+                except Exception as e:
+                    logger.warning(f"Job heartbeat failed: {e!r}")
+            if not self._tickets:
+                continue
+            try:
+                for job_id, reason in await job_store.cancel_requests():
+                    self.cancel(job_id, reason or "cancelled")
+            except Exception as e:
+                logger.warning(f"Cancel request poll failed: {e!r}")
+
+    def start(self) -> None:
+        if self._poll_task is None:
+            self._poll_task = asyncio.create_task(self._poll_cancel_requests())
+
+    async def stop(self) -> None:
+        if self._poll_task is not None:
+            self._poll_task.cancel()
+            self._poll_task = None
+
+    def stats(self) -> dict:
+        return {
+            "max_in_flight": self.max_in_flight,
+            "running": self._running,
+            "queued": {priority: self.queued(priority) for priority in PRIORITY_CLASSES},
+        }
+
+
+# 스케줄러 인스턴스 (워커 프로세스별)
+# 배칭을 켜면 한 prompt에 최대 BATCH_MAX_SIZE건이 들어가므로 슬롯도 그만큼 늘린다
+scheduler = TransformScheduler(
+    max_in_flight=settings.SCHEDULER_MAX_IN_FLIGHT * (settings.BATCH_MAX_SIZE if settings.BATCH_WINDOW_MS > 0 else 1),
+    cancel_poll_interval=settings.SCHEDULER_CANCEL_POLL_INTERVAL,
+    heartbeat_interval=settings.JOB_HEARTBEAT_SECONDS,
+)
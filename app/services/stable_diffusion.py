@@ -10,7 +10,6 @@ import random
 import uuid
 from typing import Optional
 import httpx
-from PIL import Image
 from tenacity import retry, stop_after_attempt, wait_exponential, retry_if_exception
 
 from app.config import settings
@@ -0,0 +1,273 @@
+"""
+파일 저장소 접근 (전용 스레드 풀)
+
+업로드/생성 이미지와 메타데이터 JSON의 읽기/쓰기/삭제/목록 조회는 모두 이 모듈을 거친다
+(API 라우터와 배치 CLI가 같은 파일 배치와 메타데이터 형식을 쓴다).
+블로킹 파일 시스템 호출은 크기가 정해진 전용 ThreadPoolExecutor에서 실행되므로
+디스크가 느려져도 이벤트 루프(다른 요청)를 멈추지 않고, 기본 executor(asyncio.to_thread)와도 경쟁하지 않는다.
+
+LOOP_DEBUG를 켜면 asyncio 디버그 모드로 이벤트 루프에서 LOOP_SLOW_CALLBACK_MS보다 오래 걸린 콜백을
+경고 로그로 남기고 figure_event_loop_slow_callbacks_total 로 집계한다 (이 모듈을 거치지 않은 블로킹 호출 찾기용).
+"""
+
+import asyncio
+import functools
+import hashlib
+import json
+import logging
+import os
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Optional
+
+from app.config import settings
+from app.services.http_cache import make_etag
+from app.services.metrics import EVENT_LOOP_SLOW_CALLBACKS, STORAGE_IN_FLIGHT, STORAGE_SECONDS
+
+logger = logging.getLogger(__name__)
+
+
+def _read_json(path: str) -> Optional[Any]:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def _write_json(path: str, value: Any) -> None:
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(value, f, ensure_ascii=False)
+
+
+def _read_file(path: str) -> bytes:
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def _write_bytes(path: str, data: bytes) -> None:
+    with open(path, "wb") as f:
+        f.write(data)
+
+
+def _write_hashed(f, hasher, data: bytes) -> None:
+    hasher.update(data)
+    f.write(data)
+
+
+def _remove(path: str) -> bool:
+    try:
+        os.remove(path)
+        return True
+    except FileNotFoundError:
+        return False
+
+
+def _scan(directory: str, suffix: str) -> list:
+    """directory 안의 suffix 파일 [(이름, mtime)] (디렉터리가 없으면 빈 목록)"""
+    try:
+        with os.scandir(directory) as entries:
+            return [
+                (entry.name, entry.stat().st_mtime)
+                for entry in entries
+                if entry.name.endswith(suffix) and entry.is_file()
+            ]
+    except FileNotFoundError:
+        return []
+
+
+def _first_existing(paths: list) -> Optional[str]:
+    for path in paths:
+        if os.path.exists(path):
+            return path
+    return None
+
+
+class AsyncFile:
+    """스레드 풀에서 쓰는 파일 핸들 (청크 단위 스트리밍 쓰기용)"""
+
+    def __init__(self, storage: "Storage", f):
+        self._storage = storage
+        self._file = f
+
+    async def write(self, data: bytes) -> int:
+        return await self._storage.run("write", self._file.write, data)
+
+    async def read(self, size: int = -1) -> bytes:
+        return await self._storage.run("read", self._file.read, size)
+
+    async def close(self) -> None:
+        await self._storage.run("close", self._file.close)
+
+    async def __aenter__(self) -> "AsyncFile":
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        await self.close()
+
+
+class GeneratedWriter:
+    """생성 이미지 스트리밍 저장
+
+    ComfyUI /view 응답 청크를 <id>.png.part 에 쓰면서 SHA-256(ETag)을 같은 스레드 왕복에서 계산하고,
+    finish()에서 최종 이름으로 바꾼 뒤 메타데이터를 기록한다 (이미지 전체를 메모리에 올리지 않음).
+    - start(): 다운로드 (재)시작. 이전 시도에서 쓴 내용은 버림
+    - abort(): 이번 시도 실패 -> .part 삭제 (재시도하면 start()부터 다시)
+    - discard(): 소유자(요청)가 결과를 원하지 않음 -> 쓰는 중이면 끝날 때, 아니면 바로 삭제
+    """
+
+    def __init__(self, storage: "Storage", style: str, original_id: str, extra: Optional[dict] = None):
+        self._storage = storage
+        self.result_id = str(uuid.uuid4())
+        self.path = os.path.join(settings.GENERATED_IMAGES_DIR, f"{self.result_id}.png")
+        self.meta_path = os.path.join(settings.GENERATED_IMAGES_DIR, f"{self.result_id}.json")
+        self._part_path = f"{self.path}.part"
+        self.meta = {"style": style, "original_id": original_id, **(extra or {})}
+        self.size = 0
+        self.etag: Optional[str] = None
+        self._hasher = None
+        self._file = None
+        self._discarded = False
+
+    async def start(self, content_length: Optional[int] = None) -> None:
+        await self._close()
+        self._file = await self._storage.run("open", open, self._part_path, "wb")
+        self._hasher = hashlib.sha256()
+        self.size = 0
+
+    async def write(self, chunk: bytes) -> None:
+        self.size += len(chunk)
+        await self._storage.run("write", _write_hashed, self._file, self._hasher, chunk)
+
+    async def _close(self) -> None:
+        if self._file is not None:
+            await self._storage.run("close", self._file.close)
+            self._file = None
+
+    async def finish(self) -> None:
+        await self._close()
+        if self._discarded:
+            await self._storage.remove(self._part_path)
+            return
+        self.etag = '"' + self._hasher.hexdigest()[:32] + '"'
+        await self._storage.replace(self._part_path, self.path)
+        await self._storage.write_json(self.meta_path, {**self.meta, "etag": self.etag})
+
+    async def abort(self) -> None:
+        await self._close()
+        await self._storage.remove(self._part_path)
+
+    async def discard(self) -> None:
+        self._discarded = True
+        if self._file is None:
+            await self._storage.remove(self._part_path)
+            await self._storage.remove(self.path)
+            await self._storage.remove(self.meta_path)
+
+
+class Storage:
+    def __init__(self, max_workers: int):
+        self.max_workers = max_workers
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    @property
+    def executor(self) -> ThreadPoolExecutor:
+        # 첫 사용 시 생성 (import 시점에 스레드를 만들지 않음)
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="storage")
+        return self._executor
+
+    async def run(self, op: str, fn: Callable, *args, **kwargs):
+        """fn을 저장소 스레드 풀에서 실행 (op: 메트릭 라벨)"""
+        loop = asyncio.get_running_loop()
+        started = time.perf_counter()
+        with STORAGE_IN_FLIGHT.track():
+            try:
+                return await loop.run_in_executor(self.executor, functools.partial(fn, *args, **kwargs))
+            finally:
+                STORAGE_SECONDS.observe(time.perf_counter() - started, op)
+
+    async def exists(self, path: str) -> bool:
+        return await self.run("exists", os.path.exists, path)
+
+    async def first_existing(self, paths: list) -> Optional[str]:
+        """paths 중 처음 존재하는 경로 (한 번의 스레드 왕복으로 확인)"""
+        return await self.run("exists", _first_existing, paths)
+
+    async def getsize(self, path: str) -> int:
+        return await self.run("stat", os.path.getsize, path)
+
+    async def read_bytes(self, path: str) -> bytes:
+        return await self.run("read", _read_file, path)
+
+    async def write_bytes(self, path: str, data: bytes) -> None:
+        await self.run("write", _write_bytes, path, data)
+
+    async def read_json(self, path: str) -> Optional[Any]:
+        """JSON 파일 읽기 (없으면 None)"""
+        return await self.run("read_json", _read_json, path)
+
+    async def write_json(self, path: str, value: Any) -> None:
+        await self.run("write_json", _write_json, path, value)
+
+    async def remove(self, path: str) -> bool:
+        """파일 삭제 (없었으면 False)"""
+        return await self.run("remove", _remove, path)
+
+    async def replace(self, src: str, dst: str) -> None:
+        await self.run("replace", os.replace, src, dst)
+
+    async def makedirs(self, path: str) -> None:
+        await self.run("makedirs", os.makedirs, path, exist_ok=True)
+
+    async def scan(self, directory: str, suffix: str = "") -> list:
+        return await self.run("scan", _scan, directory, suffix)
+
+    async def open(self, path: str, mode: str = "rb") -> AsyncFile:
+        return AsyncFile(self, await self.run("open", open, path, mode))
+
+    # -- 이미지 저장 (API와 배치 CLI가 같은 배치/메타데이터 형식을 쓰도록) ------
+
+    async def save_original(self, data: bytes, ext: str, mime: str, extra: Optional[dict] = None) -> tuple:
+        """원본 이미지 + 메타데이터 저장 -> (image_id, etag)"""
+        image_id = str(uuid.uuid4())
+        etag = make_etag(data)
+        await self.write_bytes(os.path.join(settings.UPLOAD_DIR, f"{image_id}{ext}"), data)
+        await self.write_json(
+            os.path.join(settings.UPLOAD_DIR, f"{image_id}.json"),
+            {"ext": ext, "mime": mime, "etag": etag, **(extra or {})},
+        )
+        return image_id, etag
+
+    def generated_writer(self, style: str, original_id: str, extra: Optional[dict] = None) -> GeneratedWriter:
+        """생성 이미지(PNG) + 메타데이터를 스트리밍으로 저장할 writer (result_id는 미리 정해짐)"""
+        return GeneratedWriter(self, style, original_id, extra)
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+
+class _SlowCallbackCounter(logging.Handler):
+    """asyncio 디버그 모드의 'Executing <Handle ...> took N seconds' 경고 집계"""
+
+    def emit(self, record: logging.LogRecord) -> None:
+        if record.getMessage().startswith("Executing "):
+            EVENT_LOOP_SLOW_CALLBACKS.inc()
+
+
+def enable_loop_debug(slow_callback_ms: float) -> None:
+    """현재 이벤트 루프에서 slow_callback_ms보다 오래 막힌 콜백을 경고/집계"""
+    loop = asyncio.get_running_loop()
+    loop.set_debug(True)
+    loop.slow_callback_duration = slow_callback_ms / 1000
+    asyncio_logger = logging.getLogger("asyncio")
+    if not any(isinstance(handler, _SlowCallbackCounter) for handler in asyncio_logger.handlers):
+        asyncio_logger.addHandler(_SlowCallbackCounter())
+    logger.warning(f"Event loop debug mode on: flagging callbacks blocking longer than {slow_callback_ms} ms")
+
+
+# 저장소 인스턴스 (워커 프로세스별 스레드 풀)
+storage = Storage(max_workers=settings.STORAGE_IO_THREADS)
@@ -0,0 +1,239 @@
+"""
+경량 요청 트레이싱
+
+- 요청마다 request id(= trace id)를 부여하고 X-Request-ID 응답 헤더로 돌려준다
+- contextvars로 부모 span을 전파하므로 라우터 -> 서비스 -> ComfyUI HTTP 호출이 한 트리로 묶인다
+- 종료된 span은 버퍼에 모았다가 OTLP/JSON 형식으로 파일(JSON Lines) 또는 로컬 컬렉터(OTLP/HTTP)로 내보낸다
+"""
+
+import asyncio
+import contextvars
+import json
+import logging
+import os
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Optional
+
+import httpx
+
+from app.config import settings
+from app.services.storage import storage
+
+logger = logging.getLogger(__name__)
+
+REQUEST_ID_HEADER = "X-Request-ID"
+MAX_BUFFERED_SPANS = 10_000
+
+_current_span: contextvars.ContextVar = contextvars.ContextVar("current_span", default=None)
+_request_id: contextvars.ContextVar = contextvars.ContextVar("request_id", default=None)
+
+
+def new_trace_id() -> str:
+    return os.urandom(16).hex()
+
+
+def new_span_id() -> str:
+    return os.urandom(8).hex()
+
+
+def current_request_id() -> Optional[str]:
+    return _request_id.get()
+
+
+def current_span() -> Optional["Span"]:
+    return _current_span.get()
+
+
+@dataclass
+class Span:
+    name: str
+    trace_id: str
+    span_id: str
+    parent_id: Optional[str]
+    start_ns: int
+    end_ns: int = 0
+    attributes: dict = field(default_factory=dict)
+    error: Optional[str] = None
+
+    def set_attribute(self, key: str, value) -> None:
+        self.attributes[key] = value
+
+    @property
+    def duration(self) -> float:
+        return (self.end_ns - self.start_ns) / 1e9 if self.end_ns else 0.0
+
+    def to_otlp(self) -> dict:
+        span = {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": 1,  # SPAN_KIND_INTERNAL
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns),
+            "attributes": [_otlp_attribute(k, v) for k, v in self.attributes.items()],
+            "status": {"code": 2, "message": self.error} if self.error else {"code": 1},
+        }
+        if self.parent_id:
+            span["parentSpanId"] = self.parent_id
+        return span
+
+
+def _otlp_attribute(key: str, value) -> dict:
+    if isinstance(value, bool):
+        return {"key": key, "value": {"boolValue": value}}
+    if isinstance(value, int):
+        return {"key": key, "value": {"intValue": str(value)}}
+    if isinstance(value, float):
+        return {"key": key, "value": {"doubleValue": value}}
+    return {"key": key, "value": {"stringValue": str(value)}}
+
+
+class Tracer:
+    def __init__(self, service_name: str, exporter: str):
+        self.service_name = service_name
+        self.exporter = exporter
+        self.enabled = bool(exporter)
+        self._buffer: list = []
+        self._flush_task: Optional[asyncio.Task] = None
+        self._listeners: list = []
+
+    def add_listener(self, callback) -> None:
+        """종료된 span마다 callback(span) 호출 (내보내기를 꺼도 호출됨: 느린 요청 캡처 등)"""
+        self._listeners.append(callback)
+
+    @contextmanager
+    def span(self, name: str, **attributes):
+        """현재 span의 자식 span 생성 (부모가 없으면 request id를 trace id로 사용)"""
+        parent = _current_span.get()
+        if parent is not None:
+            trace_id, parent_id = parent.trace_id, parent.span_id
+        else:
+            trace_id, parent_id = _request_id.get() or new_trace_id(), None
+
+        span = Span(name, trace_id, new_span_id(), parent_id, time.time_ns(), attributes=attributes)
+        token = _current_span.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.error = repr(e)
+            raise
+        finally:
+            _current_span.reset(token)
+            span.end_ns = time.time_ns()
+            self._record(span)
+
+    def record_span(self, name: str, start_ns: int, end_ns: int, error: Optional[str] = None, **attributes) -> None:
+        """이미 끝난 구간을 현재 span의 자식으로 기록 (httpx 이벤트 훅 등)"""
+        parent = _current_span.get()
+        if parent is None:
+            return
+        span = Span(name, parent.trace_id, new_span_id(), parent.span_id, start_ns, end_ns, attributes, error)
+        self._record(span)
+
+    def _record(self, span: Span) -> None:
+        for callback in self._listeners:
+            callback(span)
+        if not self.enabled:
+            return
+        if len(self._buffer) >= MAX_BUFFERED_SPANS:
+            return
+        self._buffer.append(span)
+
+    def _otlp_payload(self, spans: list) -> dict:
+        return {
+            "resourceSpans": [{
+                "resource": {"attributes": [_otlp_attribute("service.name", self.service_name)]},
+                "scopeSpans": [{
+                    "scope": {"name": "app.services.tracing"},
+                    "spans": [span.to_otlp() for span in spans],
+                }],
+            }]
+        }
+
+    async def flush(self) -> None:
+        if not self._buffer:
+            return
+        spans, self._buffer = self._buffer, []
+        payload = self._otlp_payload(spans)
+        try:
+            if self.exporter == "otlp":
+                async with httpx.AsyncClient(timeout=5.0) as client:
+                    await client.post(settings.TRACE_OTLP_ENDPOINT, json=payload)
+            else:
+                line = json.dumps(payload, ensure_ascii=False) + "\n"
+                await storage.run("trace_append", _append_line, settings.TRACE_FILE, line)
+        except Exception as e:
+            logger.warning(f"Trace export failed ({len(spans)} spans dropped): {e!r}")
+
+    async def _flush_loop(self) -> None:
+        while True:
+            await asyncio.sleep(settings.TRACE_FLUSH_INTERVAL)
+            await self.flush()
+
+    def start(self) -> None:
+        if self.enabled and self._flush_task is None:
+            self._flush_task = asyncio.create_task(self._flush_loop())
+
+    async def stop(self) -> None:
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            self._flush_task = None
+        await self.flush()
+
+
+def _append_line(path: str, line: str) -> None:
+    with open(path, "a", encoding="utf-8") as f:
+        f.write(line)
+
+
+def _parse_traceparent(value: str) -> Optional[str]:
+    """W3C traceparent 헤더에서 trace id 추출"""
+    parts = value.split("-")
+    if len(parts) == 4 and len(parts[1]) == 32 and parts[1] != "0" * 32:
+        return parts[1]
+    return None
+
+
+class RequestIdMiddleware:
+    """요청 id를 contextvar에 설정하고 X-Request-ID 응답 헤더로 돌려주는 ASGI 미들웨어"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope.get("headers") or [])
+        request_id = None
+        traceparent = headers.get(b"traceparent")
+        if traceparent:
+            request_id = _parse_traceparent(traceparent.decode("latin-1"))
+        if request_id is None:
+            # trace id로 그대로 쓰므로 32자리 hex만 수용
+            incoming = headers.get(REQUEST_ID_HEADER.lower().encode(), b"").decode("latin-1").lower()
+            if len(incoming) == 32 and all(c in "0123456789abcdef" for c in incoming):
+                request_id = incoming
+        if request_id is None:
+            request_id = new_trace_id()
+
+        token = _request_id.set(request_id)
+
+        async def send_with_request_id(message):
+            if message["type"] == "http.response.start":
+                message.setdefault("headers", [])
+                message["headers"] = list(message["headers"]) + [
+                    (REQUEST_ID_HEADER.lower().encode(), request_id.encode("latin-1"))
+                ]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_request_id)
+        finally:
+            _request_id.reset(token)
+
+
+tracer = Tracer(settings.APP_NAME, settings.TRACE_EXPORT)
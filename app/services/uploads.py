@@ -0,0 +1,335 @@
+"""
+스트리밍 이미지 업로드 처리
+
+multipart 본문을 청크 단위로 읽어 바로 디스크에 기록한다.
+- Content-Length / 누적 크기로 MAX_FILE_SIZE_MB 초과를 즉시 거부 (전체를 메모리에 올리지 않음)
+- 클라이언트 Content-Type 대신 매직 바이트로 형식 판별
+- 앞부분(HEADER_CHECK_BYTES)이 모이는 즉시 Pillow로 헤더만 열어 검증하고 손상된 파일은 그 자리에서 거부 (픽셀 디코딩 없음)
+  헤더가 앞부분에 다 들어가지 않는 파일(큰 EXIF/ICC 등)과 그보다 작은 파일만 수신 완료 후 저장된 파일로 검증
+- 핫 캐시용 본문 사본은 메모리 예산(memory_budget)에서 빌린 만큼만 (못 빌리면 디스크 파일만 사용)
+"""
+
+import hashlib
+import io
+import os
+import uuid
+from dataclasses import dataclass, field
+from typing import Optional
+
+from fastapi import HTTPException, Request
+from python_multipart.exceptions import FormParserError
+from python_multipart.multipart import MultipartParser, parse_options_header
+
+from app.services.memory_budget import memory_budget
+from app.services.storage import storage
+
+# 매직 바이트 -> (mime, 확장자, Pillow 포맷명)
+IMAGE_SIGNATURES = (
+    (b"\xff\xd8\xff", "image/jpeg", ".jpg", "JPEG"),
+    (b"\x89PNG\r\n\x1a\n", "image/png", ".png", "PNG"),
+    (b"GIF87a", "image/gif", ".gif", "GIF"),
+    (b"GIF89a", "image/gif", ".gif", "GIF"),
+)
+SNIFF_BYTES = 12
+# 본문을 끝까지 받기 전에 헤더를 검증할 앞부분 크기
+HEADER_CHECK_BYTES = 64 * 1024
+# 폼 텍스트 필드(style 등)와 multipart 헤더/경계 여유분
+MAX_FIELD_BYTES = 64 * 1024
+MULTIPART_OVERHEAD_BYTES = 64 * 1024
+
+def upload_request_body(**fields) -> dict:
+    """스트리밍으로 직접 파싱하는 multipart 폼의 OpenAPI 스키마 (image + style + 엔드포인트별 필드)"""
+    return {
+        "requestBody": {
+            "required": True,
+            "content": {
+                "multipart/form-data": {
+                    "schema": {
+                        "type": "object",
+                        "required": ["image"],
+                        "properties": {
+                            "image": {"type": "string", "format": "binary"},
+                            "style": {"type": "string", "default": "real_bubblehead"},
+                            **fields,
+                        },
+                    }
+                }
+            },
+        }
+    }
+
+
+UPLOAD_REQUEST_BODY = upload_request_body()
+
+
+def sniff_image_type(head: bytes) -> Optional[tuple]:
+    """파일 앞부분으로 이미지 형식 판별 -> (mime, ext, pillow_format)"""
+    for signature, mime, ext, fmt in IMAGE_SIGNATURES:
+        if head.startswith(signature):
+            return mime, ext, fmt
+    if len(head) >= 12 and head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "image/webp", ".webp", "WEBP"
+    return None
+
+
+def _validate_image_header(source, expected_format: str) -> tuple:
+    """Pillow로 헤더만 읽어 형식/해상도 확인 (lazy open, 픽셀 디코딩 안 함, source는 경로 또는 파일 객체)"""
+    from PIL import Image
+
+    with Image.open(source, formats=(expected_format,)) as img:
+        if img.format != expected_format:
+            raise ValueError(f"format mismatch: {img.format} != {expected_format}")
+        width, height = img.size
+        if width <= 0 or height <= 0:
+            raise ValueError("invalid dimensions")
+        if Image.MAX_IMAGE_PIXELS and width * height > Image.MAX_IMAGE_PIXELS:
+            raise ValueError("image has too many pixels")
+        return width, height
+
+
+class _HeadBuffer(io.BytesIO):
+    """업로드 앞부분만 담은 버퍼: Pillow가 버퍼 끝을 넘어 읽으려 했는지 기록"""
+
+    exhausted = False
+
+    def read(self, size: Optional[int] = -1) -> bytes:
+        data = super().read(size)
+        if size is None or size < 0 or len(data) < size:
+            self.exhausted = True
+        return data
+
+
+def _validate_image_head(head: bytes, expected_format: str) -> Optional[tuple]:
+    """앞부분만으로 헤더 검증 -> (width, height), 헤더가 앞부분을 넘어가면 None (수신 완료 후 파일로 검증)"""
+    buffer = _HeadBuffer(head)
+    try:
+        return _validate_image_header(buffer, expected_format)
+    except Exception:
+        if buffer.exhausted:
+            return None
+        raise
+
+
+@dataclass
+class StoredUpload:
+    image_id: str
+    path: str
+    ext: str
+    mime: str
+    size: int
+    etag: str
+    width: int = 0
+    height: int = 0
+    fields: dict = field(default_factory=dict)
+    # keep_bytes 이하이고 메모리 예산이 있을 때만 채워지는 본문 (핫 캐시 적재용)
+    data: Optional[bytes] = None
+
+    def release_data(self) -> None:
+        """본문 사본을 놓고 메모리 예산 반납 (이후에는 path만 사용)"""
+        if self.data is not None:
+            memory_budget.release(len(self.data), "upload")
+            self.data = None
+
+
+class _UploadStream:
+    """MultipartParser 콜백 상태 (콜백은 동기이므로 이벤트를 모았다가 청크마다 비동기로 처리)"""
+
+    def __init__(self, file_field: str):
+        self.file_field = file_field
+        self.events: list = []
+        self._header_field = b""
+        self._header_value = b""
+        self._headers: dict = {}
+
+    def callbacks(self) -> dict:
+        return {
+            "on_part_begin": self.on_part_begin,
+            "on_part_data": self.on_part_data,
+            "on_part_end": self.on_part_end,
+            "on_header_field": self.on_header_field,
+            "on_header_value": self.on_header_value,
+            "on_header_end": self.on_header_end,
+            "on_headers_finished": self.on_headers_finished,
+        }
+
+    def on_part_begin(self) -> None:
+        self._headers = {}
+
+    def on_header_field(self, data: bytes, start: int, end: int) -> None:
+        self._header_field += data[start:end]
+
+    def on_header_value(self, data: bytes, start: int, end: int) -> None:
+        self._header_value += data[start:end]
+
+    def on_header_end(self) -> None:
+        self._headers[self._header_field.lower()] = self._header_value
+        self._header_field = b""
+        self._header_value = b""
+
+    def on_headers_finished(self) -> None:
+        _, options = parse_options_header(self._headers.get(b"content-disposition", b""))
+        name = options.get(b"name", b"").decode("latin-1")
+        is_file = b"filename" in options
+        self.events.append(("begin", name, is_file))
+
+    def on_part_data(self, data: bytes, start: int, end: int) -> None:
+        self.events.append(("data", data[start:end]))
+
+    def on_part_end(self) -> None:
+        self.events.append(("end",))
+
+
+def _reject(status_code: int, detail: str) -> HTTPException:
+    return HTTPException(status_code=status_code, detail=detail)
+
+
+async def receive_image_upload(
+    request: Request,
+    dest_dir: str,
+    max_bytes: int,
+    file_field: str = "image",
+    keep_bytes: int = 0,
+) -> StoredUpload:
+    """
+    multipart 요청에서 이미지 파일을 스트리밍으로 받아 dest_dir에 저장
+
+    keep_bytes > 0 이면 그 크기 이하의 파일은 본문 사본도 함께 돌려준다.
+    사본은 memory_budget에서 빌리므로 호출자는 다 쓴 뒤 release_data()를 불러야 한다.
+    """
+    size_detail = f"이미지 크기는 {max_bytes // (1024 * 1024)}MB 이하여야 합니다"
+
+    content_type = request.headers.get("content-type", "")
+    ctype, params = parse_options_header(content_type)
+    if ctype != b"multipart/form-data" or b"boundary" not in params:
+        raise _reject(400, "multipart/form-data 요청이어야 합니다")
+
+    content_length = request.headers.get("content-length")
+    if content_length and content_length.isdigit():
+        if int(content_length) > max_bytes + MULTIPART_OVERHEAD_BYTES:
+            raise _reject(413, size_detail)
+
+    stream = _UploadStream(file_field)
+    parser = MultipartParser(params[b"boundary"], stream.callbacks())
+
+    image_id = str(uuid.uuid4())
+    part_path = os.path.join(dest_dir, f"{image_id}.part")
+    hasher = hashlib.sha256()
+    fields: dict = {}
+    current: Optional[tuple] = None  # (name, is_file)
+    field_buffer = bytearray()
+    head = bytearray()
+    kept: Optional[bytearray] = bytearray() if keep_bytes > 0 else None
+    sniffed: Optional[tuple] = None
+    dimensions: Optional[tuple] = None  # 앞부분으로 검증을 마친 (width, height)
+    head_checked = False
+    size = 0
+    received_file = False
+    out = None
+
+    def drop_kept() -> None:
+        nonlocal kept
+        if kept:
+            memory_budget.release(len(kept), "upload")
+        kept = None
+
+    async def discard_partial() -> None:
+        drop_kept()
+        if out is not None:
+            await out.close()
+        await storage.remove(part_path)
+
+    try:
+        async for chunk in request.stream():
+            parser.write(chunk)
+            for event in stream.events:
+                kind = event[0]
+                if kind == "begin":
+                    current = (event[1], event[2])
+                    field_buffer.clear()
+                elif kind == "data" and current is not None:
+                    name, is_file = current
+                    data = event[1]
+                    if is_file and name == file_field and not received_file:
+                        size += len(data)
+                        if size > max_bytes:
+                            raise _reject(413, size_detail)
+                        hasher.update(data)
+                        if kept is not None:
+                            if size <= keep_bytes and await memory_budget.acquire(len(data), "upload", timeout=0):
+                                kept.extend(data)
+                            else:
+                                drop_kept()
+                        if not head_checked:
+                            head.extend(data[:HEADER_CHECK_BYTES - len(head)])
+                            if sniffed is None and len(head) >= SNIFF_BYTES:
+                                sniffed = sniff_image_type(bytes(head[:SNIFF_BYTES]))
+                                if sniffed is None:
+                                    raise _reject(400, "파일은 이미지여야 합니다")
+                            if len(head) >= HEADER_CHECK_BYTES:
+                                # 나머지를 받기 전에 헤더 검증 (손상된 파일은 여기서 끊음)
+                                head_checked = True
+                                try:
+                                    dimensions = await storage.run(
+                                        "validate", _validate_image_head, bytes(head), sniffed[2]
+                                    )
+                                except Exception:
+                                    raise _reject(400, "손상되었거나 지원하지 않는 이미지입니다")
+                                head.clear()
+                        if out is None:
+                            out = await storage.open(part_path, "wb")
+                        await out.write(data)
+                    elif not is_file:
+                        field_buffer.extend(data)
+                        if len(field_buffer) > MAX_FIELD_BYTES:
+                            raise _reject(413, "폼 필드가 너무 큽니다")
+                elif kind == "end" and current is not None:
+                    name, is_file = current
+                    if is_file and name == file_field:
+                        received_file = True
+                    elif not is_file:
+                        fields[name] = field_buffer.decode("utf-8", errors="replace")
+                    current = None
+            stream.events.clear()
+        parser.finalize()
+
+        if out is not None:
+            await out.close()
+            out = None
+
+        if not received_file or size == 0:
+            raise _reject(400, "이미지 파일이 필요합니다")
+        if sniffed is None:
+            sniffed = sniff_image_type(bytes(head))
+            if sniffed is None:
+                raise _reject(400, "파일은 이미지여야 합니다")
+
+        mime, ext, pillow_format = sniffed
+        if dimensions is None:
+            # 앞부분보다 작은 파일이거나 헤더가 앞부분을 넘어가는 파일
+            try:
+                dimensions = await storage.run("validate", _validate_image_header, part_path, pillow_format)
+            except Exception:
+                raise _reject(400, "손상되었거나 지원하지 않는 이미지입니다")
+        width, height = dimensions
+
+        final_path = os.path.join(dest_dir, f"{image_id}{ext}")
+        await storage.replace(part_path, final_path)
+    except FormParserError as exc:
+        await discard_partial()
+        raise _reject(400, "잘못된 multipart 요청입니다") from exc
+    except BaseException:
+        await discard_partial()
+        raise
+
+    return StoredUpload(
+        image_id=image_id,
+        path=final_path,
+        ext=ext,
+        mime=mime,
+        size=size,
+        etag='"' + hasher.hexdigest()[:32] + '"',
+        width=width,
+        height=height,
+        fields=fields,
+        data=bytes(kept) if kept is not None else None,
+    )
@@ -0,0 +1,137 @@
+"""
+ComfyUI 백엔드 워밍업 / 모델 상주 유지
+
+ComfyUI가 재시작되면 첫 변환이 UNET, CLIP, ControlNet 패치, WD14 모델 로딩 시간을 모두 떠안는다.
+- 헬스 모니터가 백엔드를 처음 연결됨으로 보거나(앱 기동) 끊김 -> 연결됨 전환(재시작)을 보면 워밍업 그래프 실행
+- KEEPALIVE_HOURS(영업 시간) 동안에는 한가한 백엔드에 주기적으로 저비용 prompt를 보내 모델이 내려가지 않게 유지
+- 여러 워커 중 한 곳만 실행하도록 공유 DB 리스를 사용
+- 소요 시간은 사용자 변환 메트릭과 별도(figure_comfyui_warmup_*)로 집계
+"""
+
+import asyncio
+import logging
+import time
+from datetime import datetime
+from typing import Optional
+
+from app.config import settings
+from app.services.health import health_monitor
+from app.services.job_store import job_store
+from app.services.metrics import WARMUP_RUNS, WARMUP_SECONDS
+from app.services.zimage import zimage_service
+
+logger = logging.getLogger(__name__)
+
+
+def parse_hours(spec: str) -> Optional[tuple]:
+    """'09:00-21:00' -> ((9, 0), (21, 0)). 비어 있으면 None"""
+    if not spec.strip():
+        return None
+    start, end = (part.strip() for part in spec.split("-", 1))
+    return tuple(tuple(int(x) for x in value.split(":", 1)) for value in (start, end))
+
+
+def in_hours(hours: Optional[tuple], now: Optional[datetime] = None) -> bool:
+    """영업 시간 안인지 (자정을 넘기는 구간 지원)"""
+    if hours is None:
+        return False
+    now = now or datetime.now()
+    current = (now.hour, now.minute)
+    start, end = hours
+    if start <= end:
+        return start <= current < end
+    return current >= start or current < end
+
+
+class WarmupKeeper:
+    def __init__(self, enabled: bool, timeout: float, keepalive_hours: str, keepalive_interval: float):
+        self.enabled = enabled
+        self.timeout = timeout
+        self.hours = parse_hours(keepalive_hours)
+        self.keepalive_interval = keepalive_interval
+        self.last: dict = {}
+        self._running: dict = {}
+        self._keepalive_task: Optional[asyncio.Task] = None
+
+    def _on_health_change(self, base_url: str, previous: str, current: str) -> None:
+        if current != "connected":
+            return
+        reason = "startup" if previous == "unknown" else "restart"
+        self.schedule(base_url, reason)
+
+    def schedule(self, base_url: str, reason: str) -> None:
+        task = self._running.get(base_url)
+        if task is not None and not task.done():
+            return
+        self._running[base_url] = asyncio.create_task(self.warm(base_url, reason))
+
+    async def warm(self, base_url: str, reason: str) -> Optional[dict]:
+        ttl = self.keepalive_interval * 0.9 if reason == "keepalive" else self.timeout
+        if not await job_store.acquire_lease(f"warmup:{reason}:{base_url}", ttl):
+            return None
+        logger.info(f"Warming up ComfyUI backend {base_url} ({reason})")
+        started = time.time()
+        try:
+            result = await zimage_service.warm_up(base_url, timeout=self.timeout)
+        except Exception as e:
+            WARMUP_RUNS.inc(base_url, reason, "error")
+            self.last[base_url] = {"reason": reason, "status": "error", "error": repr(e), "started_at": started}
+            logger.warning(f"Warm-up of {base_url} failed ({reason}): {e!r}")
+            return None
+        WARMUP_RUNS.inc(base_url, reason, "success")
+        WARMUP_SECONDS.observe(result["total_seconds"], base_url, reason, "total")
+        if result["execution_seconds"] is not None:
+            WARMUP_SECONDS.observe(result["execution_seconds"], base_url, reason, "execution")
+        self.last[base_url] = {"reason": reason, "status": "success", "started_at": started, **result}
+        logger.info(f"Warm-up of {base_url} done in {result['total_seconds']}s ({reason})")
+        return result
+
+    def _idle(self, base_url: str) -> bool:
+        backend = health_monitor.backend(base_url)
+        if backend is None or backend.status != "connected":
+            return False
+        latest = backend.history[-1] if backend.history else {}
+        if (latest.get("queue_running") or 0) + (latest.get("queue_pending") or 0) > 0:
+            return False
+        last_prompt = zimage_service.last_prompt_at.get(base_url)
+        return last_prompt is None or time.monotonic() - last_prompt >= self.keepalive_interval
+
+    async def _keepalive_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.keepalive_interval)
+            if not in_hours(self.hours):
+                continue
+            for base_url in health_monitor.backends:
+                if self._idle(base_url):
+                    self.schedule(base_url, "keepalive")
+
+    def start(self) -> None:
+        if self.enabled:
+            health_monitor.add_listener(self._on_health_change)
+        if self.hours is not None and self._keepalive_task is None:
+            self._keepalive_task = asyncio.create_task(self._keepalive_loop())
+
+    async def stop(self) -> None:
+        if self._keepalive_task is not None:
+            self._keepalive_task.cancel()
+            self._keepalive_task = None
+        for task in self._running.values():
+            task.cancel()
+        self._running.clear()
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "keepalive_hours": settings.KEEPALIVE_HOURS or None,
+            "in_keepalive_hours": in_hours(self.hours),
+            "backends": self.last,
+        }
+
+
+# 워밍업 인스턴스
+warmup_keeper = WarmupKeeper(
+    enabled=settings.WARMUP_ENABLED,
+    timeout=settings.WARMUP_TIMEOUT,
+    keepalive_hours=settings.KEEPALIVE_HOURS,
+    keepalive_interval=settings.KEEPALIVE_INTERVAL,
+)
@@ -0,0 +1,72 @@
+"""
+워커 간 메트릭 합치기
+
+uvicorn 워커가 여럿이면 /metrics 요청은 아무 워커에나 가므로, 그 워커의 메트릭만 돌려주면 스크레이프마다
+다른 일부만 보인다. 워커마다 METRICS_PUBLISH_SECONDS 마다 자기 메트릭을 공유 DB(worker_metrics)에 써 두고,
+/metrics 는 최근에 갱신된 모든 워커의 스냅샷을 worker 라벨을 붙여 한 응답으로 돌려준다
+(응답하는 워커 자신의 값은 요청 시점 값). 합계는 sum without (worker) (...) 로 구한다.
+"""
+
+import asyncio
+import json
+import logging
+from typing import Optional
+
+from app.config import settings
+from app.services.job_store import job_store
+from app.services.metrics import registry, render_workers
+
+logger = logging.getLogger(__name__)
+
+# 이만큼 갱신이 없으면 종료된 워커로 보고 제외
+STALE_INTERVALS = 3
+
+
+class WorkerMetricsExchange:
+    def __init__(self, interval: float):
+        self.interval = interval
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def max_age(self) -> float:
+        return self.interval * STALE_INTERVALS
+
+    async def publish(self) -> list:
+        families = registry.families()
+        await job_store.put_worker_metrics(json.dumps(families, ensure_ascii=False), self.max_age)
+        return families
+
+    async def render(self) -> str:
+        """모든 워커의 메트릭 (공유 DB를 못 쓰면 이 워커 것만)"""
+        try:
+            own = await self.publish()
+            rows = await job_store.worker_metrics(self.max_age)
+        except Exception as e:
+            logger.warning(f"Shared metrics unavailable, serving this worker only: {e!r}")
+            return registry.render()
+        snapshots = {job_store.worker: own}
+        for worker, families in rows:
+            if worker != job_store.worker:
+                snapshots[worker] = json.loads(families)
+        return render_workers(snapshots)
+
+    async def _loop(self) -> None:
+        while True:
+            try:
+                await self.publish()
+            except Exception as e:
+                logger.warning(f"Publishing worker metrics failed: {e!r}")
+            await asyncio.sleep(self.interval)
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+
+# 워커 간 메트릭 합치기 인스턴스
+worker_metrics = WorkerMetricsExchange(interval=settings.METRICS_PUBLISH_SECONDS)
@@ -3,18 +3,40 @@ Z-Image API Service for Character Transformation
 Using ComfyUI Workflow API (Controlnet Z-image Workflow with WD14 Tagger)
 """
 
+import copy
 import io
 import json
 import random
 import uuid
 import asyncio
 import logging
+import time
 from pathlib import Path
-from typing import Optional
+from typing import AsyncIterator, Awaitable, Callable, Optional, Union
 import httpx
-from tenacity import retry, stop_after_attempt, wait_exponential, retry_if_exception
+from tenacity import retry, stop_after_attempt, wait_exponential
 
 from app.config import settings
+from app.services.batching import MicroBatcher
+from app.services.eta import latency_model
+from app.services.job_store import job_store
+from app.services.metrics import (
+    BATCH_SIZE,
+    COMFYUI_BYTES_RECEIVED,
+    COMFYUI_BYTES_SENT,
+    COMFYUI_ERRORS,
+    COMFYUI_GPU_SECONDS_AVOIDED,
+    COMFYUI_HANGS,
+    COMFYUI_NODES_CACHED,
+    COMFYUI_NODES_EXECUTED,
+    COMFYUI_RETRIES,
+    COMFYUI_ROUTED,
+    ETA_ERROR_SECONDS,
+    JOBS_QUEUED,
+    TRANSFORM_STAGE_SECONDS,
+)
+from app.services.storage import storage
+from app.services.tracing import current_span, tracer
 
 logger = logging.getLogger(__name__)
 
@@ -23,15 +45,96 @@ BASE_DIR = Path(__file__).parent.parent.parent
 PRESET_DIR = BASE_DIR / "static" / "images" / "preset"
 
 
+class PromptDeadlineExceeded(Exception):
+    """ComfyUI가 prompt를 받았지만 예측 기반 타임아웃 안에 끝내지 못함 (행 감지 포함)
+
+    백엔드는 응답하고 있으므로 연결 오류가 아니다: 재시도/브레이커/CPU 대체 대상에서 빠진다.
+    """
+
+
 def is_connection_error(exception: BaseException) -> bool:
-    """연결 오류 감지"""
-    error_msg = str(exception).lower()
-    return (
-        "connection" in error_msg
-        or "timeout" in error_msg
-        or "refused" in error_msg
-        or isinstance(exception, (httpx.ConnectError, httpx.TimeoutException))
+    """연결 오류 감지 (전송 계층 오류만: 연결 실패, 요청 타임아웃, 연결 끊김)"""
+    return isinstance(exception, httpx.TransportError)
+
+
+# 디스크 파일을 ComfyUI로 올릴 때 한 번에 읽는 크기
+UPLOAD_CHUNK_BYTES = 256 * 1024
+
+
+async def multipart_file_body(path: Path, filename: str, fields: dict) -> tuple:
+    """파일을 청크 단위로 읽어 보내는 multipart 본문 -> (headers, 비동기 본문)
+
+    httpx files= 는 파일 전체를 bytes로 받거나 이벤트 루프에서 동기로 읽으므로,
+    경계/헤더만 직접 만들고 파일 내용은 저장소 스레드에서 UPLOAD_CHUNK_BYTES씩 읽어 흘려보낸다.
+    """
+    boundary = uuid.uuid4().hex
+    head = b"".join(
+        f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode()
+        for name, value in fields.items()
     )
+    head += (
+        f'--{boundary}\r\nContent-Disposition: form-data; name="image"; filename="{filename}"\r\n'
+        f"Content-Type: image/png\r\n\r\n"
+    ).encode()
+    tail = f"\r\n--{boundary}--\r\n".encode()
+    size = await storage.getsize(str(path))
+
+    async def body() -> AsyncIterator[bytes]:
+        yield head
+        async with await storage.open(str(path), "rb") as f:
+            while True:
+                chunk = await f.read(UPLOAD_CHUNK_BYTES)
+                if not chunk:
+                    break
+                yield chunk
+        yield tail
+
+    headers = {
+        "Content-Type": f"multipart/form-data; boundary={boundary}",
+        "Content-Length": str(len(head) + size + len(tail)),
+    }
+    return headers, body()
+
+
+def should_retry_transform(retry_state) -> bool:
+    """tenacity retry 조건: 연결 오류이고, 결과 응답을 아직 열지 않았을 때만 (연 뒤에는 처음부터 다시 받을 수 없음)"""
+    if not is_connection_error(retry_state.outcome.exception()):
+        return False
+    sink = retry_state.kwargs.get("sink")
+    return not getattr(sink, "committed", False)
+
+
+def count_retry(retry_state) -> None:
+    """tenacity before_sleep 훅: 백엔드별 재시도 집계"""
+    service = retry_state.args[0]
+    base_url = retry_state.kwargs.get("base_url") or "auto"
+    COMFYUI_RETRIES.inc(base_url)
+    logger.warning(f"Retrying transform on {base_url} (attempt {retry_state.attempt_number}): {retry_state.outcome.exception()!r}")
+
+
+def execution_timestamps(prompt_history: dict) -> tuple:
+    """history status.messages에서 (execution_start, execution_success) 타임스탬프(초) 추출"""
+    started = finished = None
+    for message in prompt_history.get("status", {}).get("messages", []):
+        if not isinstance(message, (list, tuple)) or len(message) != 2:
+            continue
+        event, data = message
+        if not isinstance(data, dict) or "timestamp" not in data:
+            continue
+        if event == "execution_start":
+            started = data["timestamp"] / 1000.0
+        elif event == "execution_success":
+            finished = data["timestamp"] / 1000.0
+    return started, finished
+
+
+def cached_node_count(prompt_history: dict) -> int:
+    """history status.messages의 execution_cached 노드 수 (입력이 이전 실행과 같아 ComfyUI가 다시 실행하지 않은 노드)"""
+    cached = 0
+    for message in prompt_history.get("status", {}).get("messages", []):
+        if isinstance(message, (list, tuple)) and len(message) == 2 and message[0] == "execution_cached":
+            cached += len((message[1] or {}).get("nodes") or [])
+    return cached
 
 
 # Z-Image base negative prompt
@@ -64,13 +167,144 @@ CHARACTER_STYLES = {
 }
 
 
+# 사용자 이미지마다 복제되는 노드 (LoadImage -> WD14 -> 프롬프트 -> KSampler -> VAEDecode -> SaveImage)
+PER_IMAGE_NODES = ("5", "7", "9", "10", "11", "12", "20", "22")
+
+
 class ZImageService:
     """Z-Image API 서비스 (via ComfyUI Workflow with WD14 Tagger)"""
 
     def __init__(self):
-        self.base_url = settings.ZIMAGE_BASE_URL.rstrip("/")
+        self.backends = settings.zimage_backends
+        self.base_url = self.backends[0]
         self.timeout = 180.0
         self.client_id = str(uuid.uuid4())
+        self._http: Optional[httpx.AsyncClient] = None
+        # 같은 스타일 동시 요청 묶음 실행 (BATCH_WINDOW_MS > 0 일 때만)
+        self.batcher: Optional[MicroBatcher] = None
+        if settings.BATCH_WINDOW_MS > 0 and settings.BATCH_MAX_SIZE > 1:
+            self.batcher = MicroBatcher(
+                window=settings.BATCH_WINDOW_MS / 1000.0,
+                max_size=settings.BATCH_MAX_SIZE,
+                run_batch=self._run_batch,
+            )
+        # 백엔드별 마지막 사용자 prompt 제출 시각 (keep-alive는 한가할 때만)
+        self.last_prompt_at: dict = {}
+        # 백엔드별 최근 /queue 조회 결과 (실행 중 + 대기 prompt 수, 완료 예상 시각 계산용)
+        self.queue_depth: dict = {}
+        # 스타일 친화 라우팅: 백엔드별 이 워커가 넣고 결과를 기다리는 prompt 수 / 마지막으로 넣은 스타일 / 헬스 모니터가 끊김으로 본 백엔드
+        self.in_flight: dict = {url: 0 for url in self.backends}
+        self.last_style: dict = {}
+        self.unavailable: set = set()
+        # prompt_id -> 실행 시작 시각(monotonic): 큐에서 실행 중으로 처음 본 시각, 아직 못 봤으면 마지막으로 대기 중이던 시각
+        # (취소로 중단한 prompt가 이미 쓴 GPU 시간 계산용)
+        self.run_started: dict = {}
+
+    @property
+    def http(self) -> httpx.AsyncClient:
+        """워커 프로세스당 하나의 커넥션 풀 (요청마다 새 클라이언트/TCP 연결을 만들지 않음)"""
+        if self._http is None or self._http.is_closed:
+            self._http = httpx.AsyncClient(
+                timeout=self.timeout,
+                limits=httpx.Limits(
+                    max_connections=settings.COMFYUI_MAX_CONNECTIONS,
+                    max_keepalive_connections=settings.COMFYUI_MAX_CONNECTIONS,
+                ),
+                event_hooks={"request": [self._on_request], "response": [self._on_response]},
+            )
+        return self._http
+
+    async def aclose(self) -> None:
+        if self._http is not None:
+            await self._http.aclose()
+            self._http = None
+
+    @staticmethod
+    def _backend_of(request: httpx.Request) -> str:
+        return str(request.url.copy_with(path="/", query=None, fragment=None)).rstrip("/")
+
+    async def _on_request(self, request: httpx.Request) -> None:
+        """ComfyUI 송신 바이트 집계"""
+        request.extensions["trace_start_ns"] = time.time_ns()
+        length = request.headers.get("content-length")
+        if length:
+            COMFYUI_BYTES_SENT.inc(self._backend_of(request), amount=int(length))
+
+    async def _on_response(self, response: httpx.Response) -> None:
+        """ComfyUI 수신 바이트 집계 + HTTP 호출 span 기록"""
+        request = response.request
+        backend = self._backend_of(request)
+        length = response.headers.get("content-length")
+        if length:
+            COMFYUI_BYTES_RECEIVED.inc(backend, amount=int(length))
+        path = request.url.path
+        if path.startswith("/history/"):
+            path = "/history/{prompt_id}"
+        tracer.record_span(
+            f"comfyui {request.method} {path}",
+            request.extensions.get("trace_start_ns", time.time_ns()),
+            time.time_ns(),
+            backend=backend,
+            **{"http.method": request.method, "http.status_code": response.status_code},
+        )
+
+    def set_available(self, base_url: str, available: bool) -> None:
+        """헬스 모니터 점검 결과 반영 (끊긴 백엔드로는 라우팅하지 않음)"""
+        if available:
+            self.unavailable.discard(base_url)
+        else:
+            self.unavailable.add(base_url)
+
+    def _load(self, base_url: str) -> int:
+        # 이 워커가 넣은 prompt 수와 /queue에서 본 전체 길이(다른 워커 포함) 중 큰 값
+        return max(self.in_flight.get(base_url, 0), self.queue_depth.get(base_url, 0))
+
+    def pick_backend(self, style: str) -> str:
+        """prompt를 보낼 백엔드
+
+        ComfyUI는 입력이 이전 실행과 같은 노드를 다시 실행하지 않는다. 모델 로더, negative 인코딩(8),
+        프리셋 프롬프트(21), 레퍼런스 이미지/ControlNet(15/16/19)은 스타일에만 의존하므로
+        같은 스타일을 마지막으로 실행한 백엔드로 보내면 그 노드들을 건너뛴다.
+        그 백엔드의 부하가 가장 한가한 백엔드보다 STYLE_AFFINITY_MAX_EXTRA_LOAD 넘게 많지 않을 때만 우선하고,
+        아니면 가장 한가한 백엔드 (같으면 가장 오래 쉰 백엔드: 다른 스타일의 캐시를 덜 덮어씀).
+        """
+        candidates = [url for url in self.backends if url not in self.unavailable] or self.backends
+        if len(candidates) == 1:
+            COMFYUI_ROUTED.inc(candidates[0], "only")
+            return candidates[0]
+        least = min(self._load(url) for url in candidates)
+        if settings.STYLE_AFFINITY_ENABLED:
+            warm = [
+                url for url in candidates
+                if self.last_style.get(url) == style and self._load(url) <= least + settings.STYLE_AFFINITY_MAX_EXTRA_LOAD
+            ]
+            if warm:
+                choice = min(warm, key=self._load)
+                COMFYUI_ROUTED.inc(choice, "affinity")
+                return choice
+        idle = [url for url in candidates if self._load(url) == least]
+        choice = min(idle, key=lambda url: self.last_prompt_at.get(url, float("-inf")))
+        COMFYUI_ROUTED.inc(choice, "least_loaded")
+        return choice
+
+    def routing_stats(self) -> dict:
+        return {
+            "style_affinity": settings.STYLE_AFFINITY_ENABLED,
+            "backends": {
+                url: {
+                    "available": url not in self.unavailable,
+                    "in_flight": self.in_flight.get(url, 0),
+                    "queue_depth": self.queue_depth.get(url),
+                    "last_style": self.last_style.get(url),
+                }
+                for url in self.backends
+            },
+        }
+
+    def expected_queue_depth(self) -> int:
+        """새 prompt 앞에 있을 ComfyUI 큐 길이 추정 (가장 한가한 백엔드 기준)"""
+        candidates = [url for url in self.backends if url not in self.unavailable] or self.backends
+        return min(self.queue_depth.get(url, 0) for url in candidates)
 
     def _get_workflow_template(
         self,
@@ -169,7 +403,7 @@ class ZImageService:
                 "class_type": "SaveImage",
                 "inputs": {
                     "images": ["7", 0],
-                    "filename_prefix": "zimage_"
+                    "filename_prefix": settings.comfyui_output_prefix
                 }
             },
             # KSampler (Node 10) - 하이퍼파라미터 변경 금지
@@ -271,91 +505,283 @@ class ZImageService:
             }
         }
 
-    async def check_connection(self) -> dict:
-        """ComfyUI 서버 연결 확인"""
+    def _get_batched_workflow(
+        self,
+        user_image_filenames: list,
+        reference_image_filename: str,
+        positive_prompt_preset: str,
+        seed: Optional[int] = None,
+        tags: Optional[list] = None,
+    ) -> tuple:
+        """
+        사용자 이미지 N장을 한 prompt로 묶은 워크플로우, SaveImage 노드 id 목록, WD14 태거 노드 id 목록 (입력 순서)
+
+        모델 로더, 네거티브 프롬프트, ControlNet(프리셋 레퍼런스), EmptyLatentImage는 한 번만 두고
+        사용자 이미지마다 LoadImage -> WD14 -> 프롬프트 -> KSampler -> VAEDecode -> SaveImage 분기를 복제한다.
+        WD14 태그로 만든 프롬프트가 사진마다 달라 KSampler 하나의 latent batch로는 합칠 수 없으므로
+        샘플링은 분기별로 실행되고, 묶음으로 얻는 것은 prompt 제출/폴링 한 번과 공유 노드 재사용이다.
+        첫 번째 분기는 원래 노드 id를 그대로 쓰므로 N=1이면 기존 워크플로우와 같다.
+        tags[i]가 있으면 i번째 분기는 태거(와 태거 입력용 축소) 노드 없이 그 태그를 프롬프트에 바로 넣는다 (태거 노드 id는 None).
+        """
+        template = self._get_workflow_template(
+            user_image_filename=user_image_filenames[0],
+            reference_image_filename=reference_image_filename,
+            positive_prompt_preset=positive_prompt_preset,
+            seed=seed,
+        )
+        workflow = dict(template)
+        save_nodes = ["9"]
+        for index, filename in enumerate(user_image_filenames[1:], start=1):
+            node_ids = {node_id: f"{node_id}_{index}" for node_id in PER_IMAGE_NODES}
+            for node_id in PER_IMAGE_NODES:
+                node = copy.deepcopy(template[node_id])
+                for name, value in node["inputs"].items():
+                    if isinstance(value, list) and value and value[0] in node_ids:
+                        node["inputs"][name] = [node_ids[value[0]], value[1]]
+                workflow[node_ids[node_id]] = node
+            workflow[node_ids["11"]]["inputs"]["image"] = filename
+            save_nodes.append(node_ids["9"])
+
+        tagger_nodes = []
+        for index, image_tags in enumerate(tags or [None] * len(user_image_filenames)):
+            suffix = f"_{index}" if index else ""
+            if image_tags is None:
+                tagger_nodes.append(f"20{suffix}")
+                continue
+            workflow[f"22{suffix}"] = copy.deepcopy(workflow[f"22{suffix}"])
+            workflow[f"22{suffix}"]["inputs"]["text_b"] = image_tags
+            del workflow[f"20{suffix}"], workflow[f"5{suffix}"]
+            tagger_nodes.append(None)
+        return workflow, save_nodes, tagger_nodes
+
+    async def check_connection(self, base_url: Optional[str] = None, timeout: float = 10.0) -> dict:
+        """ComfyUI 서버 연결 확인 (system_stats + 큐 길이)"""
+        base_url = base_url or self.base_url
         try:
-            async with httpx.AsyncClient(timeout=10.0) as client:
-                response = await client.get(f"{self.base_url}/system_stats")
-                if response.status_code == 200:
-                    stats = response.json()
-                    return {
-                        "status": "connected",
-                        "server_info": stats,
-                        "base_url": self.base_url
-                    }
-                else:
-                    return {
-                        "status": "error",
-                        "message": f"Server returned {response.status_code}"
-                    }
+            response, queue_response = await asyncio.gather(
+                self.http.get(f"{base_url}/system_stats", timeout=timeout),
+                self.http.get(f"{base_url}/queue", timeout=timeout),
+            )
+            if response.status_code == 200:
+                stats = response.json()
+                result = {
+                    "status": "connected",
+                    "server_info": stats,
+                    "base_url": base_url
+                }
+                if queue_response.status_code == 200:
+                    queue = queue_response.json()
+                    result["queue_running"] = len(queue.get("queue_running", []))
+                    result["queue_pending"] = len(queue.get("queue_pending", []))
+                    self.queue_depth[base_url] = result["queue_running"] + result["queue_pending"]
+                return result
+            else:
+                return {
+                    "status": "error",
+                    "message": f"Server returned {response.status_code}",
+                    "base_url": base_url
+                }
         except Exception as e:
             return {
                 "status": "disconnected",
                 "message": repr(e),
-                "base_url": self.base_url
+                "base_url": base_url
             }
 
-    async def upload_image(self, image_bytes: bytes, filename: str = "input.png") -> str:
-        """ComfyUI에 이미지 업로드"""
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            files = {
-                "image": (filename, image_bytes, "image/png"),
-            }
-            data = {
-                "overwrite": "true"
-            }
-            
+    async def upload_image(
+        self,
+        image: Union[bytes, Path],
+        filename: str = "input.png",
+        base_url: Optional[str] = None,
+    ) -> str:
+        """ComfyUI에 이미지 업로드 (Path면 파일을 청크 단위로 스트리밍)"""
+        base_url = base_url or self.base_url
+        client = self.http
+        data = {
+            "overwrite": "true"
+        }
+        
+        if isinstance(image, Path):
+            # 파일 전체를 메모리에 올리지 않고 디스크에서 청크 단위로 읽어 전송
+            headers, body = await multipart_file_body(image, filename, data)
             response = await client.post(
-                f"{self.base_url}/upload/image",
-                files=files,
-                data=data
+                f"{base_url}/upload/image",
+                content=body,
+                headers=headers,
+                timeout=30.0
             )
-            
-            if response.status_code != 200:
-                raise Exception(f"Image upload failed: {response.status_code} - {response.text}")
-            
-            result = response.json()
-            return result.get("name", filename)
+        else:
+            response = await client.post(
+                f"{base_url}/upload/image",
+                files={"image": (filename, image, "image/png")},
+                data=data,
+                timeout=30.0
+            )
+        
+        if response.status_code != 200:
+            raise Exception(f"Image upload failed: {response.status_code} - {response.text}")
+        
+        result = response.json()
+        return result.get("name", filename)
 
-    async def _upload_preset_image(self, preset_filename: str) -> str:
+    async def _upload_preset_image(self, preset_filename: str, base_url: Optional[str] = None) -> str:
         """프리셋 레퍼런스 이미지를 ComfyUI에 업로드"""
         preset_path = PRESET_DIR / preset_filename
-        if not preset_path.exists():
-            raise FileNotFoundError(f"Preset image not found: {preset_path}")
-        
-        image_bytes = preset_path.read_bytes()
-        return await self.upload_image(image_bytes, preset_filename)
+        try:
+            image_bytes = await storage.read_bytes(str(preset_path))
+        except FileNotFoundError:
+            raise FileNotFoundError(f"Preset image not found: {preset_path}") from None
+        return await self.upload_image(image_bytes, preset_filename, base_url=base_url)
 
     @retry(
         stop=stop_after_attempt(3),
         wait=wait_exponential(multiplier=1, min=2, max=30),
-        retry=retry_if_exception(is_connection_error),
+        retry=should_retry_transform,
+        before_sleep=count_retry,
         reraise=True,
     )
     async def transform_to_character(
         self,
-        image_bytes: bytes,
+        image: Union[bytes, Path],
         style: str = "real_bubblehead",
-    ) -> bytes:
-        """이미지를 캐릭터로 변환 (ComfyUI Z-Image with WD14 Tagger)"""
+        on_queued: Optional[Callable[[str], Awaitable[None]]] = None,
+        base_url: Optional[str] = None,
+        tags: Optional[str] = None,
+        on_tagged: Optional[Callable[[str], Awaitable[None]]] = None,
+        on_eta: Optional[Callable[[float], Awaitable[None]]] = None,
+        sink=None,
+    ):
+        """이미지를 캐릭터로 변환 (ComfyUI Z-Image with WD14 Tagger)
+
+        on_queued: ComfyUI가 prompt_id를 발급하면 호출 (작업 기록 갱신용)
+        base_url: 특정 백엔드에서 실행 (배치 CLI의 백엔드별 파이프라인용, 마이크로 배칭은 거치지 않음)
+        tags: WD14 태그를 이미 알면 (유사 사진에서 재사용) 태거 노드 없이 이 태그로 프롬프트 구성
+        on_tagged: WD14 태거를 실행했으면 결과 태그로 호출 (다음 유사 사진에서 재사용하도록 저장)
+        on_eta: 완료까지 남은 예상 초가 정해지거나 바뀌면 호출 (큐 위치/실행 상태에 따라 갱신)
+        sink: 결과를 받을 스트리밍 대상 (storage.GeneratedWriter 등, _download_image 참고). 주면 sink를, 없으면 bytes를 반환
+        """
+        # 백엔드는 prompt를 보낼 때 정함 (pick_backend, 스팬의 backend 속성도 그때 기록)
+        with tracer.span("zimage.transform_to_character", backend=base_url or "auto", style=style, tags_reused=tags is not None):
+            return await self._run_transform(image, style, on_queued, base_url, tags, on_tagged, on_eta, sink)
+
+    async def _run_transform(
+        self,
+        image: Union[bytes, Path],
+        style: str,
+        on_queued: Optional[Callable[[str], Awaitable[None]]] = None,
+        base_url: Optional[str] = None,
+        tags: Optional[str] = None,
+        on_tagged: Optional[Callable[[str], Awaitable[None]]] = None,
+        on_eta: Optional[Callable[[float], Awaitable[None]]] = None,
+        sink=None,
+    ):
+        # 알 수 없는 스타일은 기본 스타일로 처리 (메트릭 라벨도 동일하게)
+        if style not in CHARACTER_STYLES:
+            style = "real_bubblehead"
+        if self.batcher is not None and base_url is None:
+            return await self.batcher.submit(style, image, on_queued, tags, on_tagged, on_eta, sink)
+        results = await self._execute(style, [image], [on_queued], base_url, [tags], [on_tagged], [on_eta], [sink])
+        if isinstance(results[0], BaseException):
+            raise results[0]
+        return results[0]
+
+    async def _run_batch(self, style: str, items: list) -> list:
+        """MicroBatcher 콜백: 같은 스타일 작업 묶음을 한 prompt로 실행 (요청자별 결과 또는 예외)"""
+        return await self._execute(
+            style,
+            [item.image for item in items],
+            [item.on_queued for item in items],
+            tags=[item.tags for item in items],
+            on_tagged=[item.on_tagged for item in items],
+            on_eta=[item.on_eta for item in items],
+            sinks=[item.sink for item in items],
+        )
+
+    async def _execute(
+        self,
+        style: str,
+        images: list,
+        on_queued: list,
+        base_url: Optional[str] = None,
+        tags: Optional[list] = None,
+        on_tagged: Optional[list] = None,
+        on_eta: Optional[list] = None,
+        sinks: Optional[list] = None,
+    ) -> list:
+        """사용자 이미지 N장을 한 prompt로 실행하고 입력 순서대로 결과 이미지 반환 (N=1이면 기존 워크플로우 그대로)
+
+        base_url을 주지 않으면 스타일 친화 라우팅으로 백엔드를 고른다 (pick_backend).
+        prompt 전체가 실패하면 예외, 결과 다운로드만 실패한 장은 그 자리에 예외 객체가 들어간다.
+        """
+        if base_url is None:
+            base_url = self.pick_backend(style)
+        else:
+            COMFYUI_ROUTED.inc(base_url, "pinned")
+        # 직전 prompt와 같은 스타일이면 스타일 공통 노드가 ComfyUI 캐시에 남아 있음
+        warm = self.last_style.get(base_url) == style
+        self.last_style[base_url] = style
+        self.in_flight[base_url] = self.in_flight.get(base_url, 0) + 1
+        try:
+            results = await self._execute_on(
+                base_url, warm, style, images, on_queued, tags, on_tagged, on_eta, sinks
+            )
+        except Exception as e:
+            COMFYUI_ERRORS.inc(base_url, "connection" if is_connection_error(e) else "execution")
+            raise
+        finally:
+            self.in_flight[base_url] -= 1
+        for result in results:
+            if isinstance(result, Exception):
+                COMFYUI_ERRORS.inc(base_url, "connection" if is_connection_error(result) else "execution")
+        return results
 
-        style_config = CHARACTER_STYLES.get(style, CHARACTER_STYLES["real_bubblehead"])
+    async def _execute_on(
+        self,
+        base_url: str,
+        warm: bool,
+        style: str,
+        images: list,
+        on_queued: list,
+        tags: Optional[list] = None,
+        on_tagged: Optional[list] = None,
+        on_eta: Optional[list] = None,
+        sinks: Optional[list] = None,
+    ) -> list:
+        tags = tags or [None] * len(images)
+        on_tagged = on_tagged or [None] * len(images)
+        on_eta = on_eta or [None] * len(images)
+        sinks = sinks or [None] * len(images)
+        style_config = CHARACTER_STYLES[style]
+        batch_size = len(images)
+        span = current_span()
+        if span is not None:
+            span.set_attribute("backend", base_url)
+            span.set_attribute("style_warm", warm)
+            if batch_size > 1:
+                span.set_attribute("batch_size", batch_size)
 
         # 1. 사용자 이미지 업로드 (User Input - Node 11)
-        user_filename = f"upload_{uuid.uuid4().hex}.png"
-        uploaded_user_filename = await self.upload_image(image_bytes, user_filename)
-        logger.info(f"User image uploaded: {uploaded_user_filename}")
+        with TRANSFORM_STAGE_SECONDS.time("upload", style), tracer.span("zimage.upload_image", backend=base_url):
+            uploaded_user_filenames = await asyncio.gather(*(
+                self.upload_image(image, f"{settings.comfyui_upload_prefix}{uuid.uuid4().hex}.png", base_url=base_url) for image in images
+            ))
+        logger.info(f"User image uploaded: {', '.join(uploaded_user_filenames)}")
+        # 이번 prompt가 백엔드에 남기는 파일/히스토리는 한 묶음으로 기록했다가 다운로드가 끝나면 정리
+        artifact_group = uuid.uuid4().hex
+        await self._track(artifact_group, base_url, [("input", name, "") for name in uploaded_user_filenames])
         
         # 2. 프리셋 레퍼런스 이미지 업로드 (Reference Image - Node 19)
         preset_filename = style_config["reference_image"]
-        uploaded_ref_filename = await self._upload_preset_image(preset_filename)
+        with TRANSFORM_STAGE_SECONDS.time("preset_upload", style), tracer.span("zimage.upload_preset", backend=base_url):
+            uploaded_ref_filename = await self._upload_preset_image(preset_filename, base_url=base_url)
         logger.info(f"Reference image uploaded: {uploaded_ref_filename}")
         
         # 3. Workflow 생성 (Controlnet Z-image Workflow with WD14 Tagger)
-        workflow = self._get_workflow_template(
-            user_image_filename=uploaded_user_filename,
+        workflow, save_nodes, tagger_nodes = self._get_batched_workflow(
+            user_image_filenames=uploaded_user_filenames,
             reference_image_filename=uploaded_ref_filename,
             positive_prompt_preset=style_config["prompt"],
+            tags=tags,
         )
         
         # 4. Prompt 큐에 추가
@@ -364,37 +790,271 @@ class ZImageService:
             "client_id": self.client_id
         }
         
-        async with httpx.AsyncClient(timeout=self.timeout) as client:
-            logger.info(f"Submitting workflow to ComfyUI (style={style})")
+        client = self.http
+        logger.info(f"Submitting workflow to ComfyUI (style={style}, batch={batch_size})")
+        submitted_at = time.time()
+        with tracer.span("zimage.queue_prompt", backend=base_url):
             response = await client.post(
-                f"{self.base_url}/prompt",
+                f"{base_url}/prompt",
                 json=prompt_request
             )
-            
-            if response.status_code != 200:
-                raise Exception(f"Prompt queue failed: {response.status_code} - {response.text}")
-            
-            result = response.json()
-            prompt_id = result.get("prompt_id")
-            
-            if not prompt_id:
-                raise Exception("No prompt_id returned from ComfyUI")
-            
-            logger.info(f"Prompt queued: {prompt_id}")
-            
-            # 5. 결과 대기 및 가져오기
-            return await self._wait_for_result(prompt_id, client)
-            
-    async def _wait_for_result(self, prompt_id: str, client: httpx.AsyncClient) -> bytes:
-        """ComfyUI 작업 완료 대기 및 결과 이미지 가져오기"""
         
-        # 최대 180초 대기
-        max_attempts = 180
-        for attempt in range(max_attempts):
+        if response.status_code != 200:
+            raise Exception(f"Prompt queue failed: {response.status_code} - {response.text}")
+        
+        result = response.json()
+        prompt_id = result.get("prompt_id")
+        
+        if not prompt_id:
+            raise Exception("No prompt_id returned from ComfyUI")
+        
+        logger.info(f"Prompt queued: {prompt_id}")
+        await self._track(artifact_group, base_url, [("history", prompt_id, "")])
+        if span is not None:
+            span.set_attribute("prompt_id", prompt_id)
+        BATCH_SIZE.observe(batch_size, style)
+        self.last_prompt_at[base_url] = time.monotonic()
+        
+        # 5. 결과 대기 및 가져오기
+        try:
+            for callback in on_queued:
+                if callback is not None:
+                    await callback(prompt_id)
+            with JOBS_QUEUED.track(base_url, amount=batch_size), tracer.span(
+                "zimage.wait_for_result", backend=base_url, prompt_id=prompt_id
+            ):
+                images_info, prompt_history = await self._wait_for_outputs(
+                    prompt_id, client, save_nodes, style=style, submitted_at=submitted_at, base_url=base_url,
+                    on_eta=on_eta, items=batch_size,
+                )
+                outputs = prompt_history.get("outputs", {})
+                await self._track(artifact_group, base_url, [
+                    (info.get("type", "output"), info["filename"], info.get("subfolder", "")) for info in images_info
+                ])
+                self._observe_nodes(prompt_history, len(workflow), style, warm, span)
+                await self._report_tags(outputs, tagger_nodes, on_tagged)
+                with TRANSFORM_STAGE_SECONDS.time("download", style), tracer.span(
+                    "zimage.download_image", backend=base_url, prompt_id=prompt_id
+                ):
+                    # 한 장의 다운로드/저장 실패가 같은 prompt의 다른 요청자 결과까지 버리지 않도록 장별로 결과 또는 예외
+                    results = await asyncio.gather(*(
+                        self._download_image(
+                            info["filename"], info.get("subfolder", ""), info.get("type", "output"), client, base_url, sink
+                        )
+                        for info, sink in zip(images_info, sinks)
+                    ), return_exceptions=True)
+            # 하나라도 받았으면 정리 (모두 실패하면 원인 확인용으로 TTL까지 남김)
+            if not all(isinstance(result, BaseException) for result in results):
+                await self._release(artifact_group)
+            return results
+        except asyncio.CancelledError:
+            # 취소된 작업이 GPU를 계속 쓰지 않도록 ComfyUI 큐에서도 제거
+            action = await asyncio.shield(self.cancel_prompt(prompt_id, base_url))
+            if action in ("deleted", "interrupted"):
+                # 실행 중이었다면 실행 시작 후 이미 쓴 시간을 뺀다 (큐 대기는 GPU를 쓰지 않음)
+                ran = 0.0
+                if action == "interrupted":
+                    started = self.run_started.get(prompt_id)
+                    ran = time.monotonic() - started if started is not None else time.time() - submitted_at
+                self.count_gpu_seconds_avoided(action, style, ran, base_url, items=batch_size)
+            await asyncio.shield(self._release(artifact_group))
+            raise
+        finally:
+            self.run_started.pop(prompt_id, None)
+        
+    def _get_warmup_workflow(self, preset_filename: str, positive_prompt_preset: str) -> dict:
+        """
+        등록된 워크플로우 그대로 모든 모델(UNET, CLIP, ControlNet 패치, VAE, WD14)을 한 번씩 거치는 최소 그래프
+
+        프리셋 이미지를 사용자 입력 겸 레퍼런스로 쓰고, latent만 64x64로 줄인다 (샘플러 설정은 그대로).
+        결과는 PreviewImage(임시 폴더)로 보내 output 폴더에 남기지 않는다.
+        seed를 매번 바꿔 ComfyUI 캐시에 걸리지 않고 실제로 실행되게 한다.
+        """
+        workflow = self._get_workflow_template(
+            user_image_filename=preset_filename,
+            reference_image_filename=preset_filename,
+            positive_prompt_preset=positive_prompt_preset,
+            seed=random.randint(0, 2 ** 32 - 1),
+        )
+        workflow["23"]["inputs"].update(width=64, height=64)
+        workflow["9"] = {"class_type": "PreviewImage", "inputs": {"images": ["7", 0]}}
+        return workflow
+
+    async def warm_up(self, base_url: Optional[str] = None, timeout: float = 300.0) -> dict:
+        """프리셋 업로드 + 워밍업 그래프 실행. 단계별 소요 시간 반환 (사용자 변환 메트릭에는 기록하지 않음)"""
+        base_url = base_url or self.base_url
+        started = time.perf_counter()
+        uploaded = {}
+        for style, config in CHARACTER_STYLES.items():
+            if await storage.exists(str(PRESET_DIR / config["reference_image"])):
+                uploaded[style] = await self._upload_preset_image(config["reference_image"], base_url=base_url)
+        if not uploaded:
+            raise FileNotFoundError(f"No preset images in {PRESET_DIR}")
+        upload_seconds = time.perf_counter() - started
+
+        style, preset_filename = next(iter(uploaded.items()))
+        workflow = self._get_warmup_workflow(preset_filename, CHARACTER_STYLES[style]["prompt"])
+        response = await self.http.post(
+            f"{base_url}/prompt", json={"prompt": workflow, "client_id": self.client_id}
+        )
+        if response.status_code != 200:
+            raise Exception(f"Warm-up prompt failed: {response.status_code} - {response.text}")
+        prompt_id = response.json()["prompt_id"]
+        submitted_at = time.time()
+        # 워밍업 결과는 임시 폴더(PreviewImage)라 히스토리 항목만 정리
+        artifact_group = uuid.uuid4().hex
+        await self._track(artifact_group, base_url, [("history", prompt_id, "")])
+
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            await asyncio.sleep(0.5)
+            response = await self.http.get(f"{base_url}/history/{prompt_id}")
+            prompt_history = response.json().get(prompt_id) if response.status_code == 200 else None
+            if not prompt_history:
+                continue
+            status = prompt_history.get("status", {})
+            if status.get("status_str") == "error":
+                raise Exception(f"Warm-up execution error: {json.dumps(status.get('messages', []), ensure_ascii=False)}")
+            exec_started, exec_finished = execution_timestamps(prompt_history)
+            await self._release(artifact_group)
+            return {
+                "prompt_id": prompt_id,
+                "presets_uploaded": len(uploaded),
+                "upload_seconds": round(upload_seconds, 3),
+                "queue_wait_seconds": round(max(0.0, exec_started - submitted_at), 3) if exec_started else None,
+                "execution_seconds": round(exec_finished - exec_started, 3) if exec_started and exec_finished else None,
+                "total_seconds": round(time.perf_counter() - started, 3),
+            }
+        await self.cancel_prompt(prompt_id, base_url)
+        raise Exception(f"Warm-up timed out after {timeout}s")
+
+    async def cancel_prompt(self, prompt_id: str, base_url: Optional[str] = None) -> str:
+        """ComfyUI에서 작업 제거: 대기 중이면 /queue delete, 실행 중이면 /interrupt"""
+        base_url = base_url or self.base_url
+        try:
+            response = await self.http.get(f"{base_url}/queue", timeout=5.0)
+            queue = response.json() if response.status_code == 200 else {}
+            running = {item[1] for item in queue.get("queue_running", []) if len(item) > 1}
+            pending = {item[1] for item in queue.get("queue_pending", []) if len(item) > 1}
+            if prompt_id in pending:
+                await self.http.post(f"{base_url}/queue", json={"delete": [prompt_id]}, timeout=5.0)
+                action = "deleted"
+            elif prompt_id in running:
+                await self.http.post(f"{base_url}/interrupt", json={"prompt_id": prompt_id}, timeout=5.0)
+                action = "interrupted"
+            else:
+                action = "finished"
+        except Exception as e:
+            logger.warning(f"Failed to cancel ComfyUI prompt {prompt_id}: {e!r}")
+            return "error"
+        logger.info(f"ComfyUI prompt {prompt_id} {action}")
+        return action
+
+    async def _track(self, group_id: str, base_url: str, artifacts: list) -> None:
+        """백엔드에 남긴 파일/히스토리 기록 (REMOTE_GC_TTL_SECONDS 뒤 정리 대상, 기록 실패해도 변환은 계속)"""
+        if not settings.REMOTE_GC_ENABLED:
+            return
+        try:
+            await job_store.add_remote_artifacts(group_id, base_url, artifacts, time.time() + settings.REMOTE_GC_TTL_SECONDS)
+        except Exception as e:
+            logger.warning(f"Failed to track ComfyUI artifacts on {base_url}: {e!r}")
+
+    async def _release(self, group_id: str) -> None:
+        """다운로드가 끝났거나 취소된 prompt의 기록을 바로 정리 대상으로"""
+        if not settings.REMOTE_GC_ENABLED:
+            return
+        try:
+            await job_store.release_remote_artifacts(group_id)
+        except Exception as e:
+            logger.warning(f"Failed to release ComfyUI artifacts {group_id}: {e!r}")
+
+    async def list_history(self, base_url: str) -> dict:
+        """백엔드 /history 전체 {prompt_id: 항목}"""
+        response = await self.http.get(f"{base_url}/history", timeout=60.0)
+        if response.status_code != 200:
+            raise Exception(f"History listing failed: {response.status_code}")
+        return response.json()
+
+    async def delete_history(self, prompt_ids: list, base_url: str) -> None:
+        """/history 항목 삭제 (ComfyUI POST /history {"delete": [...]}; 없는 id는 무시됨)"""
+        response = await self.http.post(f"{base_url}/history", json={"delete": prompt_ids}, timeout=30.0)
+        if response.status_code != 200:
+            raise Exception(f"History delete failed: {response.status_code} - {response.text}")
+
+    async def delete_files(self, files: list, base_url: str) -> bool:
+        """입력/출력 파일 삭제 [{"filename", "subfolder", "type"}]
+
+        ComfyUI 기본 API에는 파일 삭제가 없으므로 COMFYUI_DELETE_ENDPOINT(커스텀 노드 라우트 등)가 있을 때만.
+        설정이 없으면 False.
+        """
+        if not settings.COMFYUI_DELETE_ENDPOINT:
+            return False
+        response = await self.http.post(
+            f"{base_url}{settings.COMFYUI_DELETE_ENDPOINT}", json={"files": files}, timeout=30.0
+        )
+        if response.status_code != 200:
+            raise Exception(f"File delete failed: {response.status_code} - {response.text}")
+        return True
+
+    async def _queue_position(self, prompt_id: str, base_url: str) -> tuple:
+        """ComfyUI /queue에서 prompt 상태: ("running", 0) / ("pending", 앞선 prompt 수) / ("absent", None) / ("unknown", None)"""
+        try:
+            response = await self.http.get(f"{base_url}/queue", timeout=5.0)
+            queue = response.json() if response.status_code == 200 else None
+        except Exception as e:
+            logger.debug(f"Queue poll failed on {base_url}: {e!r}")
+            queue = None
+        if queue is None:
+            return "unknown", None
+        running = queue.get("queue_running", [])
+        pending = queue.get("queue_pending", [])
+        self.queue_depth[base_url] = len(running) + len(pending)
+        if any(len(item) > 1 and item[1] == prompt_id for item in running):
+            return "running", 0
+        for item in pending:
+            if len(item) > 1 and item[1] == prompt_id:
+                ahead = sum(1 for other in pending if len(other) > 1 and other[0] < item[0])
+                return "pending", len(running) + ahead
+        return "absent", None
+
+    async def _wait_for_outputs(
+        self,
+        prompt_id: str,
+        client: httpx.AsyncClient,
+        save_nodes: list,
+        style: str = "real_bubblehead",
+        submitted_at: Optional[float] = None,
+        base_url: Optional[str] = None,
+        on_eta: Optional[list] = None,
+        items: int = 1,
+    ) -> tuple:
+        """ComfyUI 작업 완료 대기. (SaveImage 노드 순서대로 첫 번째 이미지 정보, history 항목) 반환
+
+        타임아웃은 고정값이 아니라 큐 위치와 스타일별 실행 시간으로 예측한 완료 시각에서 정하고,
+        큐를 다시 볼 때마다 예측(과 on_eta 콜백)을 갱신한다. 실행이 시작된 prompt가 예상보다
+        ETA_HANG_FACTOR배 넘게 끝나지 않거나 큐/히스토리 어디에도 없으면 기다리지 않고 실패 처리한다.
+        items(묶인 사진 수)만큼 예상 실행 시간을 늘려 보고, 끝나면 장당 실행 시간을 학습한다.
+        """
+        base_url = base_url or self.base_url
+        if submitted_at is None:
+            submitted_at = time.time()
+        on_eta = [callback for callback in (on_eta or []) if callback is not None]
+
+        state, ahead = await self._queue_position(prompt_id, base_url)
+        predicted = latency_model.predict(style, ahead or 0, items=items)
+        predicted_at_submit = time.time() + predicted
+        deadline = time.monotonic() + latency_model.timeout(predicted)
+        await self._report_eta(on_eta, predicted)
+        running_since = time.monotonic() if state == "running" else None
+        self.run_started[prompt_id] = time.monotonic()
+        next_queue_poll = time.monotonic() + settings.ETA_QUEUE_POLL_SECONDS
+        absent_polls = 0
+
+        while True:
             await asyncio.sleep(1)
             
             # History 확인
-            response = await client.get(f"{self.base_url}/history/{prompt_id}")
+            response = await client.get(f"{base_url}/history/{prompt_id}")
             
             if response.status_code == 200:
                 history = response.json()
@@ -409,55 +1069,155 @@ class ZImageService:
                         error_detail = json.dumps(messages, ensure_ascii=False) if messages else "Unknown error"
                         raise Exception(f"ComfyUI execution error: {error_detail}")
                     
-                    # 완료 확인
-                    if "outputs" in prompt_history:
-                        outputs = prompt_history["outputs"]
-                        
-                        # SaveImage 노드(id: 9)의 결과 찾기
-                        if "9" in outputs and "images" in outputs["9"]:
-                            images = outputs["9"]["images"]
-                            if images:
-                                image_info = images[0]
-                                filename = image_info["filename"]
-                                subfolder = image_info.get("subfolder", "")
-                                folder_type = image_info.get("type", "output")
-                                
-                                logger.info(f"Image generated: {filename}")
-                                
-                                # 이미지 다운로드
-                                return await self._download_image(
-                                    filename, subfolder, folder_type, client
-                                )
+                    # 완료 확인 (모든 SaveImage 노드에 결과가 있어야 함)
+                    outputs = prompt_history.get("outputs", {})
+                    images = [outputs.get(node_id, {}).get("images") for node_id in save_nodes]
+                    if all(images):
+                        self._observe_execution(prompt_history, style, submitted_at, items)
+                        ETA_ERROR_SECONDS.observe(abs(time.time() - predicted_at_submit), style)
+                        logger.info(f"Image generated: {', '.join(i[0]['filename'] for i in images)}")
+                        return [i[0] for i in images], prompt_history
             
-            if attempt % 10 == 0 and attempt > 0:
-                logger.info(f"Waiting for ComfyUI... ({attempt}s elapsed)")
-        
-        raise Exception("Timeout waiting for ComfyUI to complete")
+            now = time.monotonic()
+            if now >= next_queue_poll:
+                next_queue_poll = now + settings.ETA_QUEUE_POLL_SECONDS
+                state, ahead = await self._queue_position(prompt_id, base_url)
+                if state == "running":
+                    running_since = running_since or now
+                    self.run_started[prompt_id] = running_since
+                    running_for = now - running_since
+                    if running_for > latency_model.hang_after(style, items):
+                        COMFYUI_HANGS.inc(base_url)
+                        await self.cancel_prompt(prompt_id, base_url)
+                        raise PromptDeadlineExceeded(
+                            f"ComfyUI prompt {prompt_id} hung: running {running_for:.0f}s "
+                            f"(expected {latency_model.execution(style) * items:.0f}s)"
+                        )
+                    predicted = latency_model.predict(style, 0, running_for, items)
+                elif state == "pending":
+                    self.run_started[prompt_id] = now
+                    predicted = latency_model.predict(style, ahead, items=items)
+                elif state == "absent":
+                    # 히스토리 반영 직전일 수 있으므로 연속으로 없을 때만 (ComfyUI 재시작 등으로 prompt 유실)
+                    absent_polls += 1
+                    if absent_polls >= 3:
+                        raise Exception(f"ComfyUI prompt {prompt_id} is neither queued nor in history")
+                if state in ("running", "pending"):
+                    absent_polls = 0
+                    # 큐가 밀려 예측이 늦어지면 타임아웃도 함께 연장
+                    deadline = max(deadline, now + latency_model.timeout(predicted))
+                    await self._report_eta(on_eta, predicted)
+            
+            if now >= deadline:
+                await self.cancel_prompt(prompt_id, base_url)
+                raise PromptDeadlineExceeded(f"Timeout waiting for ComfyUI to complete (predicted {predicted:.0f}s)")
+
+    @staticmethod
+    async def _report_eta(callbacks: list, remaining: float) -> None:
+        for callback in callbacks:
+            try:
+                await callback(remaining)
+            except Exception as e:
+                logger.warning(f"Failed to record ETA: {e!r}")
+
+    @staticmethod
+    async def _report_tags(outputs: dict, tagger_nodes: list, on_tagged: list) -> None:
+        """WD14 태거 노드의 UI 출력(태그 문자열)을 이미지별 콜백으로 전달"""
+        for node_id, callback in zip(tagger_nodes, on_tagged):
+            if node_id is None or callback is None:
+                continue
+            node_tags = outputs.get(node_id, {}).get("tags")
+            if node_tags:
+                try:
+                    await callback(node_tags[0])
+                except Exception as e:
+                    logger.warning(f"Failed to record WD14 tags: {e!r}")
+
+    def _observe_execution(self, prompt_history: dict, style: str, submitted_at: float, items: int = 1) -> None:
+        """ComfyUI 타임스탬프로 큐 대기 / GPU 실행 시간 기록 (없으면 전체 대기를 실행 시간으로)
+
+        메트릭은 prompt 단위, 지연 모델에는 장당 시간(실행 시간 / items)을 반영한다.
+        """
+        started, finished = execution_timestamps(prompt_history)
+        if started is not None and finished is not None:
+            execution = max(0.0, finished - started)
+            TRANSFORM_STAGE_SECONDS.observe(max(0.0, started - submitted_at), "queue_wait", style)
+        else:
+            execution = max(0.0, time.time() - submitted_at)
+        TRANSFORM_STAGE_SECONDS.observe(execution, "execution", style)
+        latency_model.observe(style, execution / items)
+
+    @staticmethod
+    def _observe_nodes(prompt_history: dict, total: int, style: str, warm: bool, span=None) -> None:
+        """prompt 한 건에서 실제 실행된 노드 수 (전체 - execution_cached) 기록: 스타일 친화 라우팅 효과 확인용"""
+        cached = min(cached_node_count(prompt_history), total)
+        label = "warm" if warm else "cold"
+        COMFYUI_NODES_EXECUTED.observe(total - cached, style, label)
+        COMFYUI_NODES_CACHED.inc(style, label, amount=cached)
+        if span is not None:
+            span.set_attribute("nodes_executed", total - cached)
+            span.set_attribute("nodes_cached", cached)
+
+    def count_gpu_seconds_avoided(
+        self,
+        stage: str,
+        style: Optional[str] = None,
+        ran: float = 0.0,
+        base_url: Optional[str] = None,
+        items: int = 1,
+    ) -> None:
+        """취소로 아낀 GPU 시간 추정치 집계 (stage: queued=앱 큐, deleted=ComfyUI 큐, interrupted=실행 중)
+
+        스타일별 예상 실행 시간 x 묶인 사진 수에서 중단 전까지 실행된 시간(ran)을 뺀다.
+        """
+        if not latency_model.observed:
+            return
+        avoided = max(0.0, latency_model.execution(style) * items - ran)
+        if avoided:
+            COMFYUI_GPU_SECONDS_AVOIDED.inc(base_url or self.base_url, stage, amount=avoided)
     
     async def _download_image(
         self,
         filename: str,
         subfolder: str,
         folder_type: str,
-        client: httpx.AsyncClient
-    ) -> bytes:
-        """ComfyUI에서 생성된 이미지 다운로드"""
+        client: httpx.AsyncClient,
+        base_url: Optional[str] = None,
+        sink=None,
+    ):
+        """ComfyUI에서 생성된 이미지 다운로드
+
+        sink가 있으면 /view 응답을 COMFYUI_DOWNLOAD_CHUNK_KB 청크로 흘려보내고 sink를 반환한다
+        (sink.start(content_length) -> sink.write(chunk)... -> sink.finish(), 도중에 실패하면 sink.abort()).
+        없으면 전체를 bytes로 반환.
+        """
         params = {
             "filename": filename,
             "type": folder_type
         }
         if subfolder:
             params["subfolder"] = subfolder
+        url = f"{base_url or self.base_url}/view"
         
-        response = await client.get(
-            f"{self.base_url}/view",
-            params=params
-        )
-        
-        if response.status_code != 200:
-            raise Exception(f"Image download failed: {response.status_code}")
+        if sink is None:
+            response = await client.get(url, params=params)
+            if response.status_code != 200:
+                raise Exception(f"Image download failed: {response.status_code}")
+            return response.content
         
-        return response.content
+        async with client.stream("GET", url, params=params) as response:
+            if response.status_code != 200:
+                raise Exception(f"Image download failed: {response.status_code}")
+            length = response.headers.get("content-length")
+            await sink.start(int(length) if length else None)
+            try:
+                async for chunk in response.aiter_bytes(settings.COMFYUI_DOWNLOAD_CHUNK_KB * 1024):
+                    await sink.write(chunk)
+                await sink.finish()
+            except BaseException:
+                await asyncio.shield(sink.abort())
+                raise
+        return sink
 
     def get_available_styles(self) -> dict:
         """사용 가능한 스타일 목록"""
@@ -0,0 +1,62 @@
+"""
+마이크로 배칭 윈도 크기별 처리량 / 지연 비교
+
+BATCH_WINDOW_MS 값을 바꿔 가며 같은 부하(loadtest)를 돌리고 transform 단계의 처리량과 p50/p95를 표로 출력한다.
+가짜 ComfyUI의 --batch-item-cost 로 묶음 prompt에서 이미지 1장이 추가될 때의 GPU 비용을 정한다
+(1.0 = 이득 없음, 0.5 = 추가 이미지는 절반 비용).
+
+    python -m benchmarks.batch_window --windows 0 50 200 500 --concurrency 8 --flows 32
+    python -m benchmarks.batch_window --batch-item-cost 0.6 --json sweep.json
+"""
+
+import asyncio
+import json
+from pathlib import Path
+
+from benchmarks.loadtest import build_parser, comfy_config_from_args, run_benchmark
+
+
+def build_sweep_parser():
+    parser = build_parser()
+    parser.description = "Figure-Maker micro-batching window sweep"
+    parser.add_argument("--windows", type=int, nargs="+", default=[0, 50, 200, 500], help="BATCH_WINDOW_MS values")
+    parser.add_argument("--max-batch", type=int, default=4, help="BATCH_MAX_SIZE")
+    return parser
+
+
+async def sweep(args) -> list:
+    rows = []
+    for window in args.windows:
+        env = {"BATCH_WINDOW_MS": str(window), "BATCH_MAX_SIZE": str(args.max_batch)}
+        result = await run_benchmark(args, comfy_config_from_args(args), app_env=env)
+        transform = result["steps"].get("transform", {})
+        rows.append({
+            "window_ms": window,
+            "flows_ok": result["flows_ok"],
+            "flows_failed": result["flows_failed"],
+            "throughput_flows_per_s": result["throughput_flows_per_s"],
+            "transform_p50_ms": transform.get("p50_ms"),
+            "transform_p95_ms": transform.get("p95_ms"),
+        })
+    return rows
+
+
+def print_sweep(rows: list) -> None:
+    print(f"{'window ms':>10}{'ok':>6}{'failed':>8}{'flows/s':>10}{'p50 ms':>10}{'p95 ms':>10}")
+    for row in rows:
+        print(
+            f"{row['window_ms']:>10}{row['flows_ok']:>6}{row['flows_failed']:>8}"
+            f"{row['throughput_flows_per_s']:>10}{row['transform_p50_ms']:>10}{row['transform_p95_ms']:>10}"
+        )
+
+
+def main() -> None:
+    args = build_sweep_parser().parse_args()
+    rows = asyncio.run(sweep(args))
+    print_sweep(rows)
+    if args.json_path:
+        Path(args.json_path).write_text(json.dumps(rows, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,452 @@
+"""
+로컬 가짜 ComfyUI 서버 (벤치마크/부하 테스트용)
+
+실제 GPU 서버 없이 ZImageService가 사용하는 API를 흉내 낸다.
+- /upload/image, /prompt, /history, /view, /queue, /interrupt, /system_stats, /ws
+- 실행 시간(+지터), GPU 워커 수, 실패/행(hang) 주입, 큐 최대 길이 설정 가능
+- 노드 출력 캐시: 직전 prompt와 입력(상류 노드 포함)이 같은 노드는 실행하지 않고 execution_cached로 알림
+- POST /history {"delete": [...]} 와 파일 삭제 엔드포인트(기본 /figure/files/delete, COMFYUI_DELETE_ENDPOINT 규약) 지원
+  (--node-time 을 주면 실행된 노드마다 그만큼 실행 시간이 늘어남)
+
+단독 실행:
+    python -m benchmarks.fake_comfyui --port 8188 --exec-time 2.0
+"""
+
+import argparse
+import asyncio
+import hashlib
+import io
+import json
+import random
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from typing import Optional
+
+import uvicorn
+from fastapi import FastAPI, File, Form, HTTPException, Request, UploadFile, WebSocket, WebSocketDisconnect
+from fastapi.responses import Response
+
+
+@dataclass
+class FakeComfyConfig:
+    exec_time: float = 2.0          # 프롬프트 1건 GPU 실행 시간 (초)
+    exec_jitter: float = 0.1        # 실행 시간 ±비율
+    batch_item_cost: float = 1.0    # SaveImage 노드가 N개인 묶음 prompt의 실행 시간 = exec_time * (1 + cost * (N-1))
+    gpu_workers: int = 1            # 동시에 실행되는 프롬프트 수
+    failure_rate: float = 0.0       # 실행 오류(status_str=error) 비율
+    hang_rate: float = 0.0          # 완료되지 않는 프롬프트 비율
+    http_error_rate: float = 0.0    # /prompt 가 500을 돌려주는 비율
+    max_queue: int = 0              # 0이면 무제한, 초과 시 /prompt 503
+    node_time: float = 0.0          # 캐시되지 않고 실행된 노드마다 추가되는 시간 (초)
+    result_width: int = 712
+    result_height: int = 1072
+    file_delete_path: str = "/figure/files/delete"  # ""이면 파일 삭제 API 없음 (ComfyUI 기본 상태)
+    seed: Optional[int] = None
+
+
+@dataclass
+class FakePrompt:
+    prompt_id: str
+    number: int
+    prompt: dict
+    client_id: str
+    queued_at: float
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    status: str = "pending"  # pending | running | success | error | interrupted
+    hang: bool = False
+    fail: bool = False
+    cached: list = field(default_factory=list)
+
+
+@dataclass
+class FakeComfyState:
+    config: FakeComfyConfig
+    inputs: dict = field(default_factory=dict)
+    outputs: dict = field(default_factory=dict)
+    results: dict = field(default_factory=dict)
+    prompts: dict = field(default_factory=dict)
+    pending: deque = field(default_factory=deque)
+    running: dict = field(default_factory=dict)
+    counter: int = 0
+    executed: int = 0
+    interrupted: int = 0
+    tagged: int = 0
+    nodes_executed: int = 0
+    nodes_cached: int = 0
+    cache: set = field(default_factory=set)  # 직전 prompt의 노드 서명
+    sockets: set = field(default_factory=set)
+
+
+def _render_result_png(width: int, height: int) -> bytes:
+    """실제 결과와 비슷한 크기의 PNG (노이즈라 압축이 잘 안 됨)"""
+    from PIL import Image
+
+    buf = io.BytesIO()
+    Image.effect_noise((width, height), 64).convert("RGB").save(buf, "PNG", compress_level=1)
+    return buf.getvalue()
+
+
+# ComfyUI의 OUTPUT_NODE (출력 노드가 없는 prompt는 거부됨)
+OUTPUT_NODE_TYPES = ("SaveImage", "PreviewImage")
+TAGGER_NODE_TYPE = "WD14Tagger|pysssss"
+FAKE_TAGS = "1girl, solo, looking at viewer, smile, upper body"
+
+
+def _output_nodes(prompt: dict) -> list:
+    return [node_id for node_id, node in prompt.items() if node.get("class_type") in OUTPUT_NODE_TYPES]
+
+
+def _tagger_nodes(prompt: dict) -> list:
+    return [node_id for node_id, node in prompt.items() if node.get("class_type") == TAGGER_NODE_TYPE]
+
+
+def _node_signatures(prompt: dict) -> dict:
+    """노드 id -> 서명 (class_type + 입력, 링크는 상류 노드 서명으로 치환): ComfyUI 캐시 키와 같은 방식"""
+    signatures: dict = {}
+
+    def sign(node_id: str) -> str:
+        if node_id not in signatures:
+            node = prompt[node_id]
+            inputs = {}
+            for name, value in node.get("inputs", {}).items():
+                if isinstance(value, list) and len(value) == 2 and str(value[0]) in prompt:
+                    value = ["link", sign(str(value[0])), value[1]]
+                inputs[name] = value
+            payload = json.dumps([node.get("class_type"), inputs], sort_keys=True, default=str)
+            signatures[node_id] = hashlib.sha1(payload.encode()).hexdigest()
+        return signatures[node_id]
+
+    for node_id in prompt:
+        sign(node_id)
+    return signatures
+
+
+def create_app(config: Optional[FakeComfyConfig] = None) -> FastAPI:
+    config = config or FakeComfyConfig()
+    state = FakeComfyState(config=config)
+    rng = random.Random(config.seed)
+    result_png = _render_result_png(config.result_width, config.result_height)
+    wakeup = asyncio.Event()
+
+    @asynccontextmanager
+    async def lifespan(app: FastAPI):
+        task = asyncio.create_task(scheduler())
+        yield
+        task.cancel()
+
+    app = FastAPI(title="Fake ComfyUI", lifespan=lifespan)
+    app.state.fake = state
+
+    async def broadcast(message: dict) -> None:
+        for ws in list(state.sockets):
+            try:
+                await ws.send_json(message)
+            except Exception:
+                state.sockets.discard(ws)
+
+    def queue_status() -> dict:
+        return {"type": "status", "data": {"status": {"exec_info": {"queue_remaining": len(state.pending) + len(state.running)}}}}
+
+    async def execute(job: FakePrompt) -> None:
+        job.status = "running"
+        job.started_at = time.time()
+        await broadcast({"type": "execution_start", "data": {"prompt_id": job.prompt_id, "timestamp": int(job.started_at * 1000)}})
+        try:
+            if job.hang:
+                await asyncio.Event().wait()
+            # 직전 prompt와 서명이 같은 노드는 다시 실행하지 않음 (출력 노드는 항상 실행)
+            signatures = _node_signatures(job.prompt)
+            outputs = set(_output_nodes(job.prompt))
+            job.cached = [node_id for node_id, sig in signatures.items() if sig in state.cache and node_id not in outputs]
+            state.cache = set(signatures.values())
+            executed = len(signatures) - len(job.cached)
+            state.nodes_cached += len(job.cached)
+            state.nodes_executed += executed
+            await broadcast({"type": "execution_cached", "data": {"nodes": job.cached, "prompt_id": job.prompt_id}})
+            jitter = 1.0 + rng.uniform(-config.exec_jitter, config.exec_jitter)
+            items = max(1, len(_output_nodes(job.prompt)))
+            exec_time = config.exec_time * (1 + config.batch_item_cost * (items - 1)) + config.node_time * executed
+            await asyncio.sleep(max(0.0, exec_time * jitter))
+            job.finished_at = time.time()
+            if job.fail:
+                job.status = "error"
+                await broadcast({"type": "execution_error", "data": {"prompt_id": job.prompt_id}})
+                return
+            job.status = "success"
+            for node_id in _output_nodes(job.prompt):
+                prefix = job.prompt[node_id].get("inputs", {}).get("filename_prefix", "ComfyUI")
+                filename = f"{prefix}_{state.executed:05d}_{node_id}.png"
+                state.outputs[filename] = result_png
+                state.results.setdefault(job.prompt_id, []).append((node_id, filename))
+            state.tagged += len(_tagger_nodes(job.prompt))
+            state.executed += 1
+            await broadcast({"type": "executing", "data": {"node": None, "prompt_id": job.prompt_id}})
+        except asyncio.CancelledError:
+            job.status = "interrupted"
+            job.finished_at = time.time()
+            state.interrupted += 1
+        finally:
+            state.running.pop(job.prompt_id, None)
+            kick()
+            await broadcast(queue_status())
+
+    async def scheduler() -> None:
+        while True:
+            while state.pending and len(state.running) < config.gpu_workers:
+                job = state.pending.popleft()
+                state.running[job.prompt_id] = asyncio.create_task(execute(job))
+            wakeup.clear()
+            await wakeup.wait()
+
+    def kick() -> None:
+        wakeup.set()
+
+    @app.get("/system_stats")
+    async def system_stats():
+        return {
+            "system": {"os": "fake", "comfyui_version": "fake", "python_version": "3.11"},
+            "devices": [{
+                "name": "fake-gpu",
+                "type": "cuda",
+                "vram_total": 24 * 1024 ** 3,
+                "vram_free": 12 * 1024 ** 3,
+            }],
+        }
+
+    @app.post("/upload/image")
+    async def upload_image(image: UploadFile = File(...), overwrite: str = Form("false")):
+        state.inputs[image.filename] = await image.read()
+        return {"name": image.filename, "subfolder": "", "type": "input"}
+
+    @app.post("/prompt")
+    async def queue_prompt(request: Request):
+        if config.http_error_rate and rng.random() < config.http_error_rate:
+            raise HTTPException(status_code=500, detail="injected failure")
+        if config.max_queue and len(state.pending) >= config.max_queue:
+            raise HTTPException(status_code=503, detail="queue full")
+        body = await request.json()
+        prompt = body.get("prompt") or {}
+        if not _output_nodes(prompt):
+            return Response(status_code=400, content=b'{"error": "no output nodes"}', media_type="application/json")
+        state.counter += 1
+        job = FakePrompt(
+            prompt_id=str(uuid.uuid4()),
+            number=state.counter,
+            prompt=prompt,
+            client_id=body.get("client_id", ""),
+            queued_at=time.time(),
+            hang=bool(config.hang_rate and rng.random() < config.hang_rate),
+            fail=bool(config.failure_rate and rng.random() < config.failure_rate),
+        )
+        state.prompts[job.prompt_id] = job
+        state.pending.append(job)
+        kick()
+        return {"prompt_id": job.prompt_id, "number": job.number, "node_errors": {}}
+
+    def history_entry(job: FakePrompt) -> Optional[dict]:
+        if job.status not in ("success", "error", "interrupted"):
+            return None
+        messages = [["execution_start", {"prompt_id": job.prompt_id, "timestamp": int(job.started_at * 1000)}]]
+        messages.append(["execution_cached", {
+            "nodes": job.cached, "prompt_id": job.prompt_id, "timestamp": int(job.started_at * 1000),
+        }])
+        if job.status == "success":
+            messages.append(["execution_success", {"prompt_id": job.prompt_id, "timestamp": int(job.finished_at * 1000)}])
+        elif job.status == "error":
+            messages.append(["execution_error", {"prompt_id": job.prompt_id, "exception_message": "injected failure"}])
+        else:
+            messages.append(["execution_interrupted", {"prompt_id": job.prompt_id}])
+        outputs = {}
+        for node_id, filename in state.results.get(job.prompt_id, []):
+            outputs[node_id] = {"images": [{"filename": filename, "subfolder": "", "type": "output"}]}
+        if job.status == "success":
+            # WD14 태거는 UI 출력으로 태그 문자열을 남김
+            for node_id in _tagger_nodes(job.prompt):
+                outputs[node_id] = {"tags": [FAKE_TAGS]}
+        return {
+            "prompt": [job.number, job.prompt_id, job.prompt, {"client_id": job.client_id}, _output_nodes(job.prompt)],
+            "outputs": outputs,
+            "status": {
+                "status_str": "success" if job.status == "success" else "error",
+                "completed": job.status == "success",
+                "messages": messages,
+            },
+        }
+
+    @app.get("/history/{prompt_id}")
+    async def history_one(prompt_id: str):
+        job = state.prompts.get(prompt_id)
+        entry = history_entry(job) if job else None
+        return {prompt_id: entry} if entry else {}
+
+    @app.get("/history")
+    async def history_all(max_items: Optional[int] = None):
+        result = {}
+        for job in state.prompts.values():
+            entry = history_entry(job)
+            if entry:
+                result[job.prompt_id] = entry
+        if max_items:
+            result = dict(list(result.items())[-max_items:])
+        return result
+
+    @app.post("/history")
+    async def history_delete(request: Request):
+        body = await request.json()
+        if body.get("clear"):
+            for prompt_id in [p for p, j in state.prompts.items() if j.status not in ("pending", "running")]:
+                state.prompts.pop(prompt_id, None)
+                state.results.pop(prompt_id, None)
+        for prompt_id in body.get("delete", []):
+            job = state.prompts.get(prompt_id)
+            if job and job.status not in ("pending", "running"):
+                state.prompts.pop(prompt_id, None)
+                state.results.pop(prompt_id, None)
+        return {}
+
+    if config.file_delete_path:
+        @app.post(config.file_delete_path)
+        async def delete_files(request: Request):
+            body = await request.json()
+            deleted = 0
+            for item in body.get("files", []):
+                store = state.inputs if item.get("type") == "input" else state.outputs
+                if store.pop(item.get("filename"), None) is not None:
+                    deleted += 1
+            return {"deleted": deleted}
+
+    @app.get("/view")
+    async def view(filename: str, type: str = "output", subfolder: str = ""):
+        store = state.outputs if type == "output" else state.inputs
+        data = store.get(filename)
+        if data is None:
+            raise HTTPException(status_code=404)
+        return Response(content=data, media_type="image/png")
+
+    def queue_item(job: FakePrompt) -> list:
+        return [job.number, job.prompt_id, job.prompt, {"client_id": job.client_id}, _output_nodes(job.prompt)]
+
+    @app.get("/queue")
+    async def get_queue():
+        return {
+            "queue_running": [queue_item(state.prompts[p]) for p in state.running if p in state.prompts],
+            "queue_pending": [queue_item(job) for job in state.pending],
+        }
+
+    @app.post("/queue")
+    async def edit_queue(request: Request):
+        body = await request.json()
+        if body.get("clear"):
+            state.pending.clear()
+        delete = set(body.get("delete", []))
+        if delete:
+            state.pending = deque(job for job in state.pending if job.prompt_id not in delete)
+            for prompt_id in delete:
+                job = state.prompts.get(prompt_id)
+                if job and job.status == "pending":
+                    job.status = "interrupted"
+                    job.started_at = job.finished_at = time.time()
+        return {}
+
+    @app.post("/interrupt")
+    async def interrupt(request: Request):
+        try:
+            body = await request.json()
+        except Exception:
+            body = {}
+        target = body.get("prompt_id") if isinstance(body, dict) else None
+        for prompt_id, task in list(state.running.items()):
+            if target is None or target == prompt_id:
+                task.cancel()
+        return {}
+
+    @app.websocket("/ws")
+    async def websocket(ws: WebSocket, clientId: str = ""):
+        await ws.accept()
+        state.sockets.add(ws)
+        await ws.send_json(queue_status() | {"sid": clientId or str(uuid.uuid4())})
+        try:
+            while True:
+                await ws.receive_text()
+        except WebSocketDisconnect:
+            state.sockets.discard(ws)
+
+    return app
+
+
+class FakeComfyServer:
+    """별도 스레드에서 uvicorn으로 가짜 ComfyUI 실행"""
+
+    def __init__(self, config: Optional[FakeComfyConfig] = None, host: str = "127.0.0.1", port: int = 0):
+        self.app = create_app(config)
+        self.host = host
+        self.port = port
+        self._server: Optional[uvicorn.Server] = None
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    @property
+    def state(self) -> FakeComfyState:
+        return self.app.state.fake
+
+    def start(self) -> "FakeComfyServer":
+        config = uvicorn.Config(self.app, host=self.host, port=self.port, log_level="warning")
+        self._server = uvicorn.Server(config)
+        self._thread = threading.Thread(target=self._server.run, daemon=True)
+        self._thread.start()
+        while not self._server.started:
+            time.sleep(0.02)
+        if self.port == 0:
+            self.port = self._server.servers[0].sockets[0].getsockname()[1]
+        return self
+
+    def stop(self) -> None:
+        if self._server is not None:
+            self._server.should_exit = True
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+
+    def __enter__(self) -> "FakeComfyServer":
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Fake ComfyUI server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8188)
+    parser.add_argument("--exec-time", type=float, default=2.0)
+    parser.add_argument("--gpu-workers", type=int, default=1)
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    parser.add_argument("--hang-rate", type=float, default=0.0)
+    parser.add_argument("--http-error-rate", type=float, default=0.0)
+    parser.add_argument("--max-queue", type=int, default=0)
+    parser.add_argument("--batch-item-cost", type=float, default=1.0)
+    parser.add_argument("--node-time", type=float, default=0.0)
+    args = parser.parse_args()
+
+    config = FakeComfyConfig(
+        exec_time=args.exec_time,
+        gpu_workers=args.gpu_workers,
+        failure_rate=args.failure_rate,
+        hang_rate=args.hang_rate,
+        http_error_rate=args.http_error_rate,
+        max_queue=args.max_queue,
+        batch_item_cost=args.batch_item_cost,
+        node_time=args.node_time,
+    )
+    uvicorn.run(create_app(config), host=args.host, port=args.port, log_level="info")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,169 @@
+"""
+갤러리 실시간 스트림(SSE) 전달 지연 / 서버 비용 측정
+
+앱을 별도 uvicorn 프로세스(기본 워커 2개)로 띄우고 /api/transform/gallery/stream 구독자 N개를 연 뒤,
+같은 공유 DB(STATE_DB_PATH)에 다른 프로세스(배치 CLI와 같은 경로)로 생성 이벤트를 기록한다.
+구독자별 전달 지연 p50/p95/최대와 측정 동안 앱 프로세스가 쓴 CPU 시간을 출력한다.
+--compare-polling 이면 같은 수의 화면이 /gallery 를 1초마다 다시 받는 경우의 CPU 시간도 함께 잰다
+(출력 디렉터리에는 --gallery-size 개의 이미지를 미리 채워 둠).
+
+    python -m benchmarks.gallery_stream --subscribers 50 --events 40
+    python -m benchmarks.gallery_stream --subscribers 200 --workers 4 --compare-polling --json stream.json
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import time
+from pathlib import Path
+
+import httpx
+
+from benchmarks.fake_comfyui import FakeComfyServer
+from benchmarks.loadtest import AppProcess, percentile
+
+
+def read_cpu_seconds(app: AppProcess) -> float:
+    """앱 프로세스(+ 워커 자식 프로세스)의 user + system CPU 시간 (리눅스 전용)"""
+    pids = [app.proc.pid]
+    try:
+        pids += [int(pid) for pid in Path(f"/proc/{app.proc.pid}/task/{app.proc.pid}/children").read_text().split()]
+    except OSError:
+        pass
+    total = 0
+    for pid in pids:
+        try:
+            fields = Path(f"/proc/{pid}/stat").read_text().rsplit(")", 1)[1].split()
+        except OSError:
+            continue
+        total += int(fields[11]) + int(fields[12])
+    return total / os.sysconf("SC_CLK_TCK")
+
+
+async def subscribe(client: httpx.AsyncClient, published: dict, latencies: list, expected: int, connected: list) -> None:
+    received = 0
+    async with client.stream("GET", "/api/transform/gallery/stream") as response:
+        connected.append(1)
+        event = None
+        async for line in response.aiter_lines():
+            if line.startswith("event: "):
+                event = line[7:]
+            elif line.startswith("data: ") and event == "created":
+                image_id = json.loads(line[6:])["id"]
+                latencies.append(time.perf_counter() - published[image_id])
+                received += 1
+                if received >= expected:
+                    return
+
+
+def fill_gallery(directory: str, count: int) -> None:
+    """목록 스캔 비용을 재기 위한 더미 생성 이미지 (PNG 헤더만 + 메타데이터)"""
+    os.makedirs(directory, exist_ok=True)
+    for i in range(count):
+        Path(directory, f"seed-{i}.png").write_bytes(b"\x89PNG\r\n\x1a\n")
+        Path(directory, f"seed-{i}.json").write_text(json.dumps({"style": "character"}))
+
+
+async def poll_gallery(client: httpx.AsyncClient, stop: asyncio.Event) -> None:
+    while not stop.is_set():
+        await client.get("/api/transform/gallery")
+        try:
+            await asyncio.wait_for(stop.wait(), timeout=1.0)
+        except asyncio.TimeoutError:
+            pass
+
+
+async def measure_stream(app: AppProcess, args) -> dict:
+    from app.services.job_store import JobStore
+
+    store = JobStore(app.env["STATE_DB_PATH"], stale_after=600, retention_seconds=3600)
+    published, latencies, connected = {}, [], []
+    limits = httpx.Limits(max_connections=args.subscribers + 10)
+    async with httpx.AsyncClient(base_url=app.base_url, timeout=None, limits=limits) as client:
+        tasks = [
+            asyncio.create_task(subscribe(client, published, latencies, args.events, connected))
+            for _ in range(args.subscribers)
+        ]
+        while len(connected) < args.subscribers:
+            await asyncio.sleep(0.05)
+        await asyncio.sleep(0.5)
+
+        cpu_started, started = read_cpu_seconds(app), time.perf_counter()
+        for i in range(args.events):
+            image_id = f"bench-{i}"
+            published[image_id] = time.perf_counter()
+            await store.add_gallery_event("created", image_id, "character")
+            await asyncio.sleep(args.interval)
+        await asyncio.wait_for(asyncio.gather(*tasks), timeout=30)
+        elapsed = time.perf_counter() - started
+        cpu = read_cpu_seconds(app) - cpu_started
+    store.close()
+    return {
+        "subscribers": args.subscribers,
+        "events": args.events,
+        "deliveries": len(latencies),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 1),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 1),
+        "max_ms": round(max(latencies) * 1000, 1),
+        "elapsed_seconds": round(elapsed, 1),
+        "app_cpu_seconds": round(cpu, 2),
+    }
+
+
+async def measure_polling(app: AppProcess, args, seconds: float) -> dict:
+    limits = httpx.Limits(max_connections=args.subscribers + 10)
+    async with httpx.AsyncClient(base_url=app.base_url, timeout=30, limits=limits) as client:
+        stop = asyncio.Event()
+        cpu_started = read_cpu_seconds(app)
+        tasks = [asyncio.create_task(poll_gallery(client, stop)) for _ in range(args.subscribers)]
+        await asyncio.sleep(seconds)
+        stop.set()
+        await asyncio.gather(*tasks)
+        cpu = read_cpu_seconds(app) - cpu_started
+    return {"screens": args.subscribers, "seconds": round(seconds, 1), "app_cpu_seconds": round(cpu, 2)}
+
+
+async def run(args) -> dict:
+    with FakeComfyServer() as comfy:
+        app = AppProcess(comfy.base_url, env={"WARMUP_ENABLED": "false"}, workers=args.workers).start()
+        try:
+            fill_gallery(app.env["GENERATED_IMAGES_DIR"], args.gallery_size)
+            result = {"stream": await measure_stream(app, args)}
+            if args.compare_polling:
+                result["polling"] = await measure_polling(app, args, result["stream"]["elapsed_seconds"])
+        finally:
+            app.stop()
+    return result
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Figure-Maker gallery stream benchmark")
+    parser.add_argument("--subscribers", type=int, default=50, help="open gallery streams (showroom screens)")
+    parser.add_argument("--events", type=int, default=40, help="gallery events published")
+    parser.add_argument("--interval", type=float, default=0.1, help="seconds between events")
+    parser.add_argument("--workers", type=int, default=2, help="uvicorn workers")
+    parser.add_argument("--gallery-size", type=int, default=500, help="generated images already in the output directory")
+    parser.add_argument("--compare-polling", action="store_true", help="also measure screens polling /gallery every second")
+    parser.add_argument("--json", dest="json_path", help="write the results as JSON")
+    return parser
+
+
+def main() -> None:
+    args = build_parser().parse_args()
+    result = asyncio.run(run(args))
+    stream = result["stream"]
+    print(
+        f"stream: {stream['subscribers']} subscribers x {stream['events']} events -> {stream['deliveries']} deliveries  "
+        f"latency p50 {stream['p50_ms']} ms  p95 {stream['p95_ms']} ms  max {stream['max_ms']} ms  "
+        f"app cpu {stream['app_cpu_seconds']}s in {stream['elapsed_seconds']}s"
+    )
+    if "polling" in result:
+        polling = result["polling"]
+        print(f"polling: {polling['screens']} screens x 1/s for {polling['seconds']}s  app cpu {polling['app_cpu_seconds']}s")
+    if args.json_path:
+        Path(args.json_path).write_text(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
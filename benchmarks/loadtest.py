@@ -0,0 +1,321 @@
+"""
+키오스크 플로우 부하 테스트
+
+가짜 ComfyUI(benchmarks.fake_comfyui)를 띄우고, 앱을 별도 uvicorn 프로세스로 실행한 뒤
+upload-temp -> transform/character -> gallery -> image 조회 흐름을 지정한 동시성으로 반복한다.
+단계별 p50/p95/p99 지연, 처리량, 앱 프로세스 RSS(요청당 메모리 추정)를 출력한다.
+
+    python -m benchmarks.loadtest --concurrency 8 --flows 40 --exec-time 1.0
+    python -m benchmarks.loadtest --json result.json
+"""
+
+import argparse
+import asyncio
+import io
+import json
+import math
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from pathlib import Path
+from typing import Optional
+
+import httpx
+
+from benchmarks.fake_comfyui import FakeComfyConfig, FakeComfyServer
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+
+
+def available_styles() -> list:
+    """프리셋 이미지가 있는 스타일만 (없으면 앱이 500을 돌려주므로 측정에서 제외)"""
+    from app.services.zimage import CHARACTER_STYLES, PRESET_DIR
+
+    return [style for style, config in CHARACTER_STYLES.items() if (PRESET_DIR / config["reference_image"]).exists()]
+
+
+def percentile(values: list, pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = max(0, math.ceil(pct / 100.0 * len(ordered)) - 1)
+    return ordered[min(index, len(ordered) - 1)]
+
+
+def read_rss_bytes(pid: int) -> Optional[int]:
+    """/proc/<pid>/status 의 VmRSS (리눅스 전용)"""
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        return None
+    return None
+
+
+def sample_photo(width: int = 1200, height: int = 1600) -> bytes:
+    """업로드용 JPEG (카메라 촬영본 크기와 비슷하게)"""
+    from PIL import Image
+
+    buf = io.BytesIO()
+    Image.effect_noise((width, height), 32).convert("RGB").save(buf, "JPEG", quality=90)
+    return buf.getvalue()
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+class AppProcess:
+    """측정 대상 앱을 별도 uvicorn 프로세스로 실행"""
+
+    def __init__(self, comfy_url: str, env: Optional[dict] = None, workers: int = 1):
+        self.port = free_port()
+        self.workdir = tempfile.TemporaryDirectory(prefix="figure-bench-")
+        self.env = {
+            **os.environ,
+            "ZIMAGE_BASE_URL": comfy_url,
+            "UPLOAD_DIR": os.path.join(self.workdir.name, "uploads"),
+            "GENERATED_IMAGES_DIR": os.path.join(self.workdir.name, "generated_images"),
+            "STATE_DB_PATH": os.path.join(self.workdir.name, "state.db"),
+            "PYTHONPATH": str(REPO_ROOT),
+            **(env or {}),
+        }
+        self.workers = workers
+        self.proc: Optional[subprocess.Popen] = None
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.port}"
+
+    def start(self) -> "AppProcess":
+        cmd = [
+            sys.executable, "-m", "uvicorn", "app.main:app",
+            "--host", "127.0.0.1", "--port", str(self.port),
+            "--log-level", "warning", "--workers", str(self.workers),
+        ]
+        self.proc = subprocess.Popen(cmd, cwd=REPO_ROOT, env=self.env)
+        deadline = time.time() + 30
+        while time.time() < deadline:
+            try:
+                if httpx.get(f"{self.base_url}/health", timeout=1.0).status_code == 200:
+                    return self
+            except httpx.HTTPError:
+                time.sleep(0.1)
+        self.stop()
+        raise RuntimeError("app did not start within 30s")
+
+    def rss(self) -> Optional[int]:
+        if self.proc is None:
+            return None
+        total = read_rss_bytes(self.proc.pid) or 0
+        # --workers > 1 이면 자식 프로세스 RSS 합산
+        try:
+            children = Path(f"/proc/{self.proc.pid}/task/{self.proc.pid}/children").read_text().split()
+        except OSError:
+            children = []
+        for child in children:
+            total += read_rss_bytes(int(child)) or 0
+        return total or None
+
+    def stop(self) -> None:
+        if self.proc is not None:
+            self.proc.terminate()
+            try:
+                self.proc.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                self.proc.kill()
+            self.proc = None
+        self.workdir.cleanup()
+
+
+class FlowRecorder:
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.flows_ok = 0
+        self.flows_failed = 0
+
+    async def timed(self, step: str, coro):
+        started = time.perf_counter()
+        try:
+            response = await coro
+        except httpx.HTTPError:
+            self.errors[step] += 1
+            raise
+        self.latencies[step].append(time.perf_counter() - started)
+        if response.status_code >= 400:
+            self.errors[step] += 1
+            raise RuntimeError(f"{step} -> {response.status_code}")
+        return response
+
+
+async def run_flow(client: httpx.AsyncClient, photo: bytes, style: str, rec: FlowRecorder) -> None:
+    r = await rec.timed("upload_temp", client.post(
+        "/api/transform/upload-temp", files={"image": ("photo.jpg", photo, "image/jpeg")}
+    ))
+    original_url = r.json()["image_url"]
+
+    r = await rec.timed("original", client.get(f"/{original_url}"))
+
+    r = await rec.timed("transform", client.post(
+        "/api/transform/character",
+        files={"image": ("photo.jpg", r.content, "image/jpeg")},
+        data={"style": style},
+    ))
+    image_url = r.json()["image_url"]
+
+    await rec.timed("gallery", client.get("/api/transform/gallery"))
+    await rec.timed("image", client.get(f"/{image_url}"))
+
+
+async def drive(
+    base_url: str,
+    concurrency: int,
+    flows: int,
+    photo: bytes,
+    rec: FlowRecorder,
+    styles: list,
+) -> float:
+    queue: asyncio.Queue = asyncio.Queue()
+    for i in range(flows):
+        queue.put_nowait(i)
+
+    async def worker(client: httpx.AsyncClient) -> None:
+        while True:
+            try:
+                queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            try:
+                # JPEG EOI 뒤에 임의 바이트를 붙여 플로우마다 다른 사진으로 취급 (중복 요청 병합 방지)
+                await run_flow(client, photo + os.urandom(16), random.choice(styles), rec)
+                rec.flows_ok += 1
+            except Exception:
+                rec.flows_failed += 1
+
+    limits = httpx.Limits(max_connections=concurrency * 2)
+    async with httpx.AsyncClient(base_url=base_url, timeout=600.0, limits=limits) as client:
+        started = time.perf_counter()
+        await asyncio.gather(*(worker(client) for _ in range(concurrency)))
+        return time.perf_counter() - started
+
+
+async def sample_rss(app: AppProcess, samples: list, stop: asyncio.Event) -> None:
+    while not stop.is_set():
+        rss = app.rss()
+        if rss:
+            samples.append(rss)
+        try:
+            await asyncio.wait_for(stop.wait(), timeout=0.05)
+        except asyncio.TimeoutError:
+            pass
+
+
+async def run_benchmark(args, comfy_config: FakeComfyConfig, app_env: Optional[dict] = None) -> dict:
+    photo = sample_photo()
+    with FakeComfyServer(comfy_config) as comfy:
+        app = AppProcess(comfy.base_url, env=app_env, workers=args.workers).start()
+        try:
+            rec = FlowRecorder()
+            baseline_rss = app.rss() or 0
+            samples: list = []
+            stop = asyncio.Event()
+            sampler = asyncio.create_task(sample_rss(app, samples, stop))
+            elapsed = await drive(app.base_url, args.concurrency, args.flows, photo, rec, args.styles)
+            stop.set()
+            await sampler
+            peak_rss = max(samples) if samples else baseline_rss
+        finally:
+            app.stop()
+
+    steps = {}
+    for step, values in rec.latencies.items():
+        steps[step] = {
+            "count": len(values),
+            "errors": rec.errors.get(step, 0),
+            "p50_ms": round(percentile(values, 50) * 1000, 1),
+            "p95_ms": round(percentile(values, 95) * 1000, 1),
+            "p99_ms": round(percentile(values, 99) * 1000, 1),
+        }
+    return {
+        "concurrency": args.concurrency,
+        "flows_ok": rec.flows_ok,
+        "flows_failed": rec.flows_failed,
+        "elapsed_s": round(elapsed, 2),
+        "throughput_flows_per_s": round(rec.flows_ok / elapsed, 3) if elapsed else 0.0,
+        "rss_baseline_mb": round(baseline_rss / 2 ** 20, 1),
+        "rss_peak_mb": round(peak_rss / 2 ** 20, 1),
+        "rss_per_request_kb": round(max(0, peak_rss - baseline_rss) / max(1, args.concurrency) / 1024, 1),
+        "styles": list(args.styles),
+        "fake_comfyui": {"exec_time": comfy_config.exec_time, "gpu_workers": comfy_config.gpu_workers},
+        "steps": steps,
+    }
+
+
+def print_report(result: dict) -> None:
+    print(
+        f"concurrency={result['concurrency']} ok={result['flows_ok']} failed={result['flows_failed']} "
+        f"elapsed={result['elapsed_s']}s throughput={result['throughput_flows_per_s']} flows/s"
+    )
+    print(
+        f"rss baseline={result['rss_baseline_mb']}MB peak={result['rss_peak_mb']}MB "
+        f"~{result['rss_per_request_kb']}KB per in-flight request"
+    )
+    print(f"{'step':<14}{'count':>7}{'errors':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for step, s in result["steps"].items():
+        print(f"{step:<14}{s['count']:>7}{s['errors']:>8}{s['p50_ms']:>10}{s['p95_ms']:>10}{s['p99_ms']:>10}")
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Figure-Maker kiosk flow load test")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--flows", type=int, default=20, help="total kiosk flows to run")
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn workers for the app")
+    parser.add_argument("--exec-time", type=float, default=1.0, help="fake GPU execution time per prompt")
+    parser.add_argument("--gpu-workers", type=int, default=1)
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    parser.add_argument("--hang-rate", type=float, default=0.0)
+    parser.add_argument("--http-error-rate", type=float, default=0.0)
+    parser.add_argument("--max-queue", type=int, default=0)
+    parser.add_argument(
+        "--batch-item-cost", type=float, default=1.0,
+        help="fake GPU cost of each extra image in a batched prompt (1.0 = no batching gain)",
+    )
+    parser.add_argument("--node-time", type=float, default=0.0, help="fake GPU time per executed (uncached) workflow node")
+    parser.add_argument("--styles", nargs="+", default=available_styles(), help="styles to pick from at random")
+    parser.add_argument("--json", dest="json_path", help="write the result as JSON")
+    return parser
+
+
+def comfy_config_from_args(args) -> FakeComfyConfig:
+    return FakeComfyConfig(
+        exec_time=args.exec_time,
+        gpu_workers=args.gpu_workers,
+        failure_rate=args.failure_rate,
+        hang_rate=args.hang_rate,
+        http_error_rate=args.http_error_rate,
+        max_queue=args.max_queue,
+        batch_item_cost=args.batch_item_cost,
+        node_time=args.node_time,
+    )
+
+
+def main() -> None:
+    args = build_parser().parse_args()
+    result = asyncio.run(run_benchmark(args, comfy_config_from_args(args)))
+    print_report(result)
+    if args.json_path:
+        Path(args.json_path).write_text(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
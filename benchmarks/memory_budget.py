@@ -0,0 +1,203 @@
+"""
+이미지 버퍼 메모리 예산 스트레스 측정
+
+큰 사진(기본 약 8MB JPEG) 업로드를 한꺼번에 몰아넣고(절반은 Accept: image/png 로 결과를 천천히 읽는 클라이언트)
+앱 프로세스 RSS를 50ms마다 샘플링한다. 동시 요청 수를 늘려 가며 MEMORY_BUDGET_MB 를 준 경우와
+제한 없음(0)을 각각 돌려, 예산이 있으면 최대 RSS가 동시 요청 수와 함께 늘지 않는지 확인한다.
+/health 의 memory_budget(사용량 최고치, 디스크로 대신한 횟수)도 함께 출력한다.
+
+끝으로 ComfyUI가 죽어 브레이커가 열린 앱(아주 작은 예산)에 Accept: image/png 요청을 동시에 보내, CPU 대체 변환
+결과가 같은 "result" 예산을 쓰는 결과 스트림으로 나가면서 서로를 기다리며 멈추지 않는지 확인한다 (멈추면 종료 코드 1).
+
+    python -m benchmarks.memory_budget --levels 8 32 64 --budget-mb 32
+    python -m benchmarks.memory_budget --levels 16 64 --photo-mb 9 --json memory.json
+"""
+
+import argparse
+import asyncio
+import io
+import json
+import sys
+import time
+from pathlib import Path
+
+import httpx
+
+from benchmarks.fake_comfyui import FakeComfyConfig, FakeComfyServer
+from benchmarks.loadtest import AppProcess, free_port, sample_photo, sample_rss
+
+
+def large_photo(target_mb: float) -> bytes:
+    """업로드 한도 근처 크기의 JPEG (노이즈라 압축이 거의 안 됨)"""
+    from PIL import Image
+
+    side = int((target_mb * 1024 * 1024 / 0.95) ** 0.5)
+    buf = io.BytesIO()
+    Image.effect_noise((side, side), 64).convert("RGB").save(buf, "JPEG", quality=95)
+    return buf.getvalue()
+
+
+async def transform(client: httpx.AsyncClient, photo: bytes, index: int, slow_reader: bool, outcomes: dict) -> None:
+    # 요청마다 바이트를 달리해 같은 사진 중복 제거(dedup)에 걸리지 않게 함 (JPEG EOI 뒤 꼬리는 무시됨)
+    files = {"image": ("photo.jpg", photo + index.to_bytes(4, "big"), "image/jpeg")}
+    headers = {"Accept": "image/png"} if slow_reader else {}
+    try:
+        async with client.stream("POST", "/api/transform/character", files=files, data={"style": "character"}, headers=headers) as response:
+            async for _ in response.aiter_bytes(64 * 1024):
+                if slow_reader:
+                    await asyncio.sleep(0.05)
+        key = "ok" if response.status_code == 200 else str(response.status_code)
+    except httpx.HTTPError as e:
+        key = type(e).__name__
+    outcomes[key] = outcomes.get(key, 0) + 1
+
+
+async def burst(app: AppProcess, photo: bytes, concurrency: int) -> dict:
+    samples: list = []
+    stop = asyncio.Event()
+    baseline = app.rss() or 0
+    sampler = asyncio.create_task(sample_rss(app, samples, stop))
+    outcomes: dict = {}
+    limits = httpx.Limits(max_connections=concurrency + 4)
+    async with httpx.AsyncClient(base_url=app.base_url, timeout=600.0, limits=limits) as client:
+        started = time.perf_counter()
+        await asyncio.gather(*(transform(client, photo, i, i % 2 == 1, outcomes) for i in range(concurrency)))
+        elapsed = time.perf_counter() - started
+        budget = (await client.get("/health")).json()["memory_budget"]
+    stop.set()
+    await sampler
+    peak = max(samples) if samples else baseline
+    return {
+        "concurrency": concurrency,
+        "outcomes": outcomes,
+        "elapsed_s": round(elapsed, 1),
+        "rss_baseline_mb": round(baseline / 2 ** 20, 1),
+        "rss_peak_mb": round(peak / 2 ** 20, 1),
+        "rss_growth_mb": round(max(0, peak - baseline) / 2 ** 20, 1),
+        "budget_high_water_mb": round(budget["high_water_bytes"] / 2 ** 20, 1),
+        "budget_spilled": budget["spilled"],
+    }
+
+
+async def run_scenario(comfy_url: str, photo: bytes, levels: list, budget_mb: int) -> list:
+    env = {
+        "MEMORY_BUDGET_MB": str(budget_mb),
+        "RATE_LIMIT_TRANSFORMS_PER_MINUTE": "0",
+        "WARMUP_ENABLED": "false",
+        "FALLBACK_ENABLED": "false",
+    }
+    results = []
+    # 동시 요청 수마다 새 프로세스 (이전 단계에서 늘어난 힙이 다음 단계 기준선에 섞이지 않게)
+    for concurrency in levels:
+        app = AppProcess(comfy_url, env=env).start()
+        try:
+            results.append(await burst(app, photo, concurrency))
+        finally:
+            app.stop()
+    return results
+
+
+async def degraded_streams(streams: int, budget_mb: int, timeout: float) -> dict:
+    """GPU 없이(브레이커 열림) CPU 대체 변환 결과를 여러 스트림으로 동시에 받음"""
+    env = {
+        "MEMORY_BUDGET_MB": str(budget_mb),
+        "RATE_LIMIT_TRANSFORMS_PER_MINUTE": "0",
+        "WARMUP_ENABLED": "false",
+        "FALLBACK_TIMEOUT_SECONDS": str(timeout),
+    }
+    photo = sample_photo(1200, 1600)
+    outcomes: dict = {}
+
+    async def fetch(client: httpx.AsyncClient, index: int) -> None:
+        files = {"image": ("photo.jpg", photo + index.to_bytes(4, "big"), "image/jpeg")}
+        async with client.stream(
+            "POST", "/api/transform/character", files=files, data={"style": "character"}, headers={"Accept": "image/png"}
+        ) as response:
+            size = 0
+            async for chunk in response.aiter_bytes():
+                size += len(chunk)
+        key = response.headers.get("x-degraded", "gpu") if response.status_code == 200 and size else str(response.status_code)
+        outcomes[key] = outcomes.get(key, 0) + 1
+
+    # 아무도 듣지 않는 포트: 첫 헬스 체크에서 모든 백엔드가 끊김 -> 브레이커 열림
+    app = AppProcess(f"http://127.0.0.1:{free_port()}", env=env).start()
+    try:
+        async with httpx.AsyncClient(base_url=app.base_url, timeout=timeout * 2) as client:
+            started = time.perf_counter()
+            tasks = [asyncio.create_task(fetch(client, i)) for i in range(streams)]
+            done, pending = await asyncio.wait(tasks, timeout=timeout * 2)
+            for task in pending:
+                task.cancel()
+            elapsed = time.perf_counter() - started
+            budget = (await client.get("/health")).json()["memory_budget"]
+    finally:
+        app.stop()
+    return {
+        "streams": streams,
+        "budget_mb": budget_mb,
+        "outcomes": outcomes,
+        "stuck": len(pending),
+        "errors": sum(1 for task in done if task.exception() is not None),
+        "elapsed_s": round(elapsed, 1),
+        "budget_waiting_after": budget["waiting"],
+        "ok": not pending and outcomes.get("breaker_open", 0) == streams,
+    }
+
+
+async def run(args) -> dict:
+    photo = large_photo(args.photo_mb)
+    config = FakeComfyConfig(
+        exec_time=args.exec_time,
+        gpu_workers=args.gpu_workers,
+        result_width=args.result_side,
+        result_height=args.result_side,
+    )
+    with FakeComfyServer(config) as comfy:
+        return {
+            "photo_mb": round(len(photo) / 2 ** 20, 2),
+            "budgeted": {"budget_mb": args.budget_mb, "levels": await run_scenario(comfy.base_url, photo, args.levels, args.budget_mb)},
+            "unlimited": {"budget_mb": 0, "levels": await run_scenario(comfy.base_url, photo, args.levels, 0)},
+            "degraded_streams": await degraded_streams(args.fallback_streams, args.fallback_budget_mb, args.fallback_timeout),
+        }
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Figure-Maker image buffer memory budget stress test")
+    parser.add_argument("--levels", type=int, nargs="+", default=[8, 32, 64], help="concurrent uploads per burst")
+    parser.add_argument("--budget-mb", type=int, default=32, help="MEMORY_BUDGET_MB for the budgeted run")
+    parser.add_argument("--photo-mb", type=float, default=8.0, help="approximate upload size (MAX_FILE_SIZE_MB is 10 by default)")
+    parser.add_argument("--exec-time", type=float, default=1.0, help="fake ComfyUI seconds per prompt")
+    parser.add_argument("--gpu-workers", type=int, default=4, help="fake ComfyUI prompts running at once")
+    parser.add_argument("--result-side", type=int, default=1536, help="fake ComfyUI result width/height")
+    parser.add_argument("--fallback-streams", type=int, default=8, help="concurrent image/png requests served by the CPU fallback")
+    parser.add_argument("--fallback-budget-mb", type=int, default=4, help="MEMORY_BUDGET_MB for the fallback stream check")
+    parser.add_argument("--fallback-timeout", type=float, default=30.0, help="seconds before the fallback streams count as stuck")
+    parser.add_argument("--json", dest="json_path", help="write the results as JSON")
+    return parser
+
+
+def main() -> None:
+    args = build_parser().parse_args()
+    result = asyncio.run(run(args))
+    print(f"photo {result['photo_mb']} MB")
+    for name in ("budgeted", "unlimited"):
+        scenario = result[name]
+        print(f"{name} (MEMORY_BUDGET_MB={scenario['budget_mb']}):")
+        for level in scenario["levels"]:
+            print(
+                f"  {level['concurrency']:>4} uploads  rss peak {level['rss_peak_mb']} MB (+{level['rss_growth_mb']})  "
+                f"budget high water {level['budget_high_water_mb']} MB  spilled {level['budget_spilled']}  "
+                f"{level['outcomes']} in {level['elapsed_s']}s"
+            )
+    degraded = result["degraded_streams"]
+    print(
+        f"degraded streams (MEMORY_BUDGET_MB={degraded['budget_mb']}): {degraded['outcomes']}  stuck {degraded['stuck']}  "
+        f"errors {degraded['errors']}  budget waiters after {degraded['budget_waiting_after']}  in {degraded['elapsed_s']}s"
+    )
+    if args.json_path:
+        Path(args.json_path).write_text(json.dumps(result, indent=2))
+    sys.exit(0 if degraded["ok"] else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""
+지각 해시 색인(multi-index hashing) 조회 비용 / 재현율 측정
+
+임시 SQLite 파일에 무작위 pHash/dHash N건을 채운 뒤, 색인된 해시 일부를 k비트 뒤집은 질의로
+NearDuplicateIndex.lookup 을 호출해 p50/p95 지연과 재현율(원래 항목을 찾은 비율)을 출력한다.
+색인 크기를 늘려도 지연이 거의 그대로인지 확인하는 용도.
+
+    python -m benchmarks.near_duplicates --sizes 100000 1000000 --queries 200
+    python -m benchmarks.near_duplicates --sizes 3000000 --flip-bits 8 --json near_dup.json
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Figure-Maker near-duplicate index benchmark")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100_000, 1_000_000], help="indexed photos")
+    parser.add_argument("--queries", type=int, default=200, help="lookups per size")
+    parser.add_argument("--flip-bits", type=int, default=6, help="bits flipped in each query hash (<= max distance)")
+    parser.add_argument("--max-distance", type=int, default=10, help="NEAR_DUP_MAX_DISTANCE")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--json", dest="json_path", help="write the results as JSON")
+    return parser
+
+
+def _flip(value: int, bits: int, rng: random.Random) -> int:
+    for position in rng.sample(range(64), bits):
+        value ^= 1 << position
+    return value
+
+
+async def measure(size: int, args, rng: random.Random) -> dict:
+    from app.services.job_store import JobStore
+    from app.services import perceptual_hash
+    from app.services.perceptual_hash import NearDuplicateIndex, bands, to_signed
+
+    with tempfile.TemporaryDirectory() as tmp:
+        store = JobStore(os.path.join(tmp, "state.db"), stale_after=600, retention_seconds=3600)
+        perceptual_hash.job_store = store
+        index = NearDuplicateIndex(max_distance=args.max_distance)
+
+        hashes = [(rng.getrandbits(64), rng.getrandbits(64)) for _ in range(size)]
+        started = time.perf_counter()
+        # 채우기는 한 트랜잭션으로 (앱은 업로드마다 한 건씩 넣음)
+        conn = store._connection()
+        conn.execute("BEGIN")
+        conn.executemany(
+            "INSERT INTO image_hashes (etag, original_id, phash, dhash, band0, band1, band2, band3, created_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, 0)",
+            (
+                (f"e{i}", f"o{i}", to_signed(phash), to_signed(dhash), *bands(phash))
+                for i, (phash, dhash) in enumerate(hashes)
+            ),
+        )
+        conn.execute("COMMIT")
+        fill_seconds = time.perf_counter() - started
+
+        latencies, found = [], 0
+        for _ in range(args.queries):
+            target = rng.randrange(size)
+            phash, dhash = hashes[target]
+            query_started = time.perf_counter()
+            matches = await index.lookup(_flip(phash, args.flip_bits, rng), _flip(dhash, args.flip_bits, rng))
+            latencies.append(time.perf_counter() - query_started)
+            found += any(match.etag == f"e{target}" for match in matches)
+        store.close()
+
+    latencies.sort()
+    return {
+        "size": size,
+        "fill_seconds": round(fill_seconds, 1),
+        "p50_ms": round(statistics.median(latencies) * 1000, 2),
+        "p95_ms": round(latencies[int(len(latencies) * 0.95) - 1] * 1000, 2),
+        "recall": round(found / args.queries, 3),
+    }
+
+
+async def run(args) -> list:
+    rng = random.Random(args.seed)
+    rows = []
+    for size in args.sizes:
+        row = await measure(size, args, rng)
+        print(
+            f"{row['size']:>10} photos  fill {row['fill_seconds']:>6}s  "
+            f"lookup p50 {row['p50_ms']:>7} ms  p95 {row['p95_ms']:>7} ms  recall {row['recall']}"
+        )
+        rows.append(row)
+    return rows
+
+
+def main() -> None:
+    args = build_parser().parse_args()
+    rows = asyncio.run(run(args))
+    if args.json_path:
+        Path(args.json_path).write_text(json.dumps(rows, indent=2))
+
+
+if __name__ == "__main__":
+    main()
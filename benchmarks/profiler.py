@@ -0,0 +1,176 @@
+"""
+관리자 프로파일러 / 느린 요청 캡처 확인 (가짜 ComfyUI 사용)
+
+1. ADMIN_TOKEN 과 낮은 SLOW_REQUEST_THRESHOLD_MS 로 앱을 띄우고 변환 + 갤러리 조회 부하를 건다
+2. 부하 중에 POST /api/admin/profile 로 N초 프로파일을 받아 folded stacks 형식인지, 이벤트 루프 스레드가 들어 있는지 확인
+3. 변환 요청이 느린 요청으로 캡처됐는지(단계별 span, ComfyUI 결과 대기 [wait] 스택) 확인
+4. 캡처를 끈 앱(SLOW_REQUEST_THRESHOLD_MS=0)과 갤러리 조회 지연을 비교해 샘플링 오버헤드를 본다
+
+확인에 실패하면 0이 아닌 코드로 종료한다.
+
+    python -m benchmarks.profiler --transforms 8 --profile-seconds 3
+    python -m benchmarks.profiler --out profile.folded   # flamegraph.pl profile.folded > profile.svg
+"""
+
+import argparse
+import asyncio
+import json
+import sys
+import time
+from pathlib import Path
+
+import httpx
+
+from benchmarks.fake_comfyui import FakeComfyConfig, FakeComfyServer
+from benchmarks.loadtest import AppProcess, percentile, sample_photo
+
+TOKEN = "bench-admin-token"
+
+
+async def transform(client: httpx.AsyncClient, photo: bytes, index: int, request_ids: list) -> None:
+    files = {"image": ("photo.jpg", photo + index.to_bytes(4, "big"), "image/jpeg")}
+    response = await client.post("/api/transform/character", files=files, data={"style": "character"})
+    if response.status_code == 200:
+        request_ids.append(response.headers["X-Request-ID"])
+
+
+async def gallery_load(client: httpx.AsyncClient, stop: asyncio.Event, latencies: list) -> None:
+    while not stop.is_set():
+        started = time.perf_counter()
+        await client.get("/api/transform/gallery")
+        latencies.append(time.perf_counter() - started)
+        await asyncio.sleep(0.01)
+
+
+def check_folded(text: str) -> bool:
+    """모든 줄이 "프레임;프레임;... 횟수" 인지"""
+    lines = text.splitlines()
+    return bool(lines) and all(
+        ";" in line and line.rsplit(" ", 1)[-1].isdigit() for line in lines
+    )
+
+
+async def run_load(app: AppProcess, args, photo: bytes, profile: bool) -> dict:
+    headers = {"X-Admin-Token": TOKEN}
+    latencies: list = []
+    request_ids: list = []
+    stop = asyncio.Event()
+    result: dict = {}
+    async with httpx.AsyncClient(base_url=app.base_url, timeout=120) as client:
+        gallery = [asyncio.create_task(gallery_load(client, stop, latencies)) for _ in range(args.gallery_clients)]
+        transforms = asyncio.gather(*(transform(client, photo, i, request_ids) for i in range(args.transforms)))
+        if profile:
+            response = await client.post(
+                "/api/admin/profile", params={"seconds": args.profile_seconds, "hz": args.hz}, headers=headers
+            )
+            result["profile_status"] = response.status_code
+            result["profile_samples"] = int(response.headers.get("X-Profile-Samples", 0))
+            result["profile_text"] = response.text
+            result["unauthorized_status"] = (await client.get("/api/admin/slow-requests")).status_code
+        await transforms
+        stop.set()
+        await asyncio.gather(*gallery)
+        if profile:
+            result["slow"] = (await client.get("/api/admin/slow-requests", headers=headers)).json()
+            if request_ids:
+                detail = await client.get(f"/api/admin/slow-requests/{request_ids[0]}", headers=headers)
+                folded = await client.get(f"/api/admin/slow-requests/{request_ids[0]}/folded", headers=headers)
+                result["detail"] = detail.json() if detail.status_code == 200 else None
+                result["detail_folded"] = folded.text if folded.status_code == 200 else ""
+    result["request_ids"] = request_ids
+    result["gallery_ms"] = {
+        "requests": len(latencies),
+        "p50": round(percentile(latencies, 50) * 1000, 1),
+        "p99": round(percentile(latencies, 99) * 1000, 1),
+    }
+    return result
+
+
+async def run(args) -> dict:
+    photo = sample_photo(600, 800)
+    config = FakeComfyConfig(exec_time=args.exec_time, gpu_workers=2, seed=3)
+    base_env = {
+        "ADMIN_TOKEN": TOKEN,
+        "RATE_LIMIT_TRANSFORMS_PER_MINUTE": "0",
+        "WARMUP_ENABLED": "false",
+        "FALLBACK_ENABLED": "false",
+    }
+    with FakeComfyServer(config) as comfy:
+        app = AppProcess(comfy.base_url, env={**base_env, "SLOW_REQUEST_THRESHOLD_MS": str(args.threshold_ms)}).start()
+        try:
+            captured = await run_load(app, args, photo, profile=True)
+        finally:
+            app.stop()
+        app = AppProcess(comfy.base_url, env={**base_env, "SLOW_REQUEST_THRESHOLD_MS": "0"}).start()
+        try:
+            baseline = await run_load(app, args, photo, profile=False)
+        finally:
+            app.stop()
+
+    text = captured["profile_text"]
+    detail = captured.get("detail") or {}
+    stage_names = {stage["name"] for stage in detail.get("stages", [])}
+    checks = {
+        "profile_ok": captured["profile_status"] == 200 and check_folded(text),
+        "profile_has_event_loop": any(line.startswith("MainThread;") for line in text.splitlines()),
+        "admin_requires_token": captured["unauthorized_status"] == 401,
+        "transforms_captured": bool(captured["request_ids"]) and len(captured["slow"]["requests"]) >= min(
+            len(captured["request_ids"]), captured["slow"]["buffered"]
+        ),
+        "stages_recorded": "zimage.wait_for_result" in stage_names,
+        "wait_stacks_recorded": "_wait_for_outputs" in captured.get("detail_folded", ""),
+    }
+    return {
+        "profile": {
+            "samples": captured["profile_samples"],
+            "distinct_stacks": len(text.splitlines()),
+            "top": text.splitlines()[:5],
+        },
+        "slow_requests": {
+            "captured": captured["slow"]["captured"],
+            "example": {key: detail.get(key) for key in ("path", "duration_ms", "samples", "cpu_samples", "loop_busy_samples")},
+            "stages": sorted(stage_names),
+        },
+        "gallery_ms_capture_on": captured["gallery_ms"],
+        "gallery_ms_capture_off": baseline["gallery_ms"],
+        "checks": checks,
+        "ok": all(checks.values()),
+        "_profile_text": text,
+    }
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Figure-Maker admin profiler and slow request capture check")
+    parser.add_argument("--transforms", type=int, default=8, help="transforms sent during the profile")
+    parser.add_argument("--gallery-clients", type=int, default=4, help="clients polling /gallery in a loop")
+    parser.add_argument("--exec-time", type=float, default=1.0, help="fake ComfyUI seconds per prompt")
+    parser.add_argument("--profile-seconds", type=float, default=3.0, help="length of the admin profile")
+    parser.add_argument("--hz", type=int, default=100, help="profile sampling rate")
+    parser.add_argument("--threshold-ms", type=float, default=500, help="SLOW_REQUEST_THRESHOLD_MS for the app")
+    parser.add_argument("--out", help="write the downloaded folded stacks here")
+    parser.add_argument("--json", dest="json_path", help="write the results as JSON")
+    return parser
+
+
+def main() -> None:
+    args = build_parser().parse_args()
+    result = asyncio.run(run(args))
+    text = result.pop("_profile_text")
+    print(f"profile: {result['profile']['samples']} samples, {result['profile']['distinct_stacks']} distinct stacks")
+    for line in result["profile"]["top"]:
+        print(f"  {line[-140:]}")
+    print(f"slow requests captured: {result['slow_requests']['captured']}  example {result['slow_requests']['example']}")
+    print(f"  stages: {', '.join(result['slow_requests']['stages'])}")
+    print(f"gallery latency capture on:  {result['gallery_ms_capture_on']}")
+    print(f"gallery latency capture off: {result['gallery_ms_capture_off']}")
+    for name, passed in result["checks"].items():
+        print(f"  {'ok  ' if passed else 'FAIL'} {name}")
+    if args.out:
+        Path(args.out).write_text(text)
+    if args.json_path:
+        Path(args.json_path).write_text(json.dumps(result, indent=2))
+    sys.exit(0 if result["ok"] else 1)
+
+
+if __name__ == "__main__":
+    main()
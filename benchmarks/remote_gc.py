@@ -0,0 +1,189 @@
+"""
+ComfyUI 파일/히스토리 정리 규약 확인 (가짜 ComfyUI 사용)
+
+1. 앱을 띄우기 전에 가짜 ComfyUI에 기록 없는 이 배포의 prompt(upload_<배포>_ 입력 -> zimage_<배포>_ 출력)를 남겨 둔다
+   (고아 항목). 같은 ComfyUI를 쓰는 다른 배포와 배포 이름 없는 예전 버전의 prompt도 같이 남겨 둔다
+2. 앱을 짧은 TTL/정리 주기, REMOTE_GC_RECONCILE로 띄우면 백엔드 첫 연결 때 reconcile이 이 배포의 고아 항목만 지운다
+3. 앱으로 변환을 여러 건 보낸다 (일부는 실행 오류를 주입해 다운로드까지 가지 못한 묶음 = TTL 뒤 정리)
+4. TTL + 정리 주기가 지난 뒤 가짜 ComfyUI에 이 배포의 히스토리/입력/출력이 남아 있지 않고 다른 배포의 것은
+   그대로인지 확인한다 (프리셋 레퍼런스 이미지는 매번 덮어쓰는 고정 파일이라 남는 것이 정상)
+
+남은 것이 있으면 0이 아닌 코드로 종료한다. --no-delete-endpoint 면 ComfyUI 기본 상태처럼 파일 삭제 API 없이
+히스토리만 정리되는지 확인한다.
+
+    python -m benchmarks.remote_gc --transforms 12 --failure-rate 0.25
+    python -m benchmarks.remote_gc --no-delete-endpoint
+"""
+
+import argparse
+import asyncio
+import json
+import sys
+import time
+import uuid
+from pathlib import Path
+
+import httpx
+
+from app.services.zimage import CHARACTER_STYLES
+from benchmarks.fake_comfyui import FakeComfyConfig, FakeComfyServer
+from benchmarks.loadtest import AppProcess, sample_photo
+
+DELETE_PATH = "/figure/files/delete"
+DEPLOYMENT = "bench"
+# reconcile이 건드리면 안 되는 항목: 같은 ComfyUI를 쓰는 다른 배포, 배포 이름이 없던 예전 버전
+FOREIGN_DEPLOYMENTS = ("bench2", "")
+
+
+def prefixes(deployment: str) -> tuple:
+    return (f"upload_{deployment}_", f"zimage_{deployment}_") if deployment else ("upload_", "zimage_")
+
+
+async def seed_orphans(client: httpx.AsyncClient, count: int, deployment: str) -> list:
+    """앱 기록 없이 업로드 + prompt 실행 (이전 버전/죽은 프로세스/다른 배포가 남긴 것과 같은 모양)"""
+    upload_prefix, output_prefix = prefixes(deployment)
+    prompt_ids = []
+    for _ in range(count):
+        name = f"{upload_prefix}{uuid.uuid4().hex}.png"
+        await client.post("/upload/image", files={"image": (name, b"\x89PNG\r\n\x1a\n", "image/png")})
+        workflow = {
+            "11": {"class_type": "LoadImage", "inputs": {"image": name}},
+            "9": {"class_type": "SaveImage", "inputs": {"images": ["11", 0], "filename_prefix": output_prefix}},
+        }
+        response = await client.post("/prompt", json={"prompt": workflow, "client_id": "orphan"})
+        prompt_ids.append(response.json()["prompt_id"])
+    return prompt_ids
+
+
+async def transform(client: httpx.AsyncClient, photo: bytes, index: int, outcomes: dict) -> None:
+    files = {"image": ("photo.jpg", photo + index.to_bytes(4, "big"), "image/jpeg")}
+    response = await client.post("/api/transform/character", files=files, data={"style": "character"})
+    key = "ok" if response.status_code == 200 else str(response.status_code)
+    outcomes[key] = outcomes.get(key, 0) + 1
+
+
+def leftovers(comfy: FakeComfyServer, foreign: set) -> dict:
+    """이 배포가 남긴 것 (foreign = 다른 배포/예전 버전 prompt id)"""
+    presets = {config["reference_image"] for config in CHARACTER_STYLES.values()}
+    upload_prefix, output_prefix = prefixes(DEPLOYMENT)
+    state = comfy.state
+    return {
+        "history": len(set(state.prompts) - foreign),
+        "inputs": len([name for name in state.inputs if name not in presets and name.startswith(upload_prefix)]),
+        "outputs": len([name for name in state.outputs if name.startswith(output_prefix)]),
+    }
+
+
+def foreign_leftovers(comfy: FakeComfyServer, foreign: set) -> dict:
+    """다른 배포/예전 버전 항목 (reconcile 뒤에도 그대로여야 함)"""
+    presets = {config["reference_image"] for config in CHARACTER_STYLES.values()}
+    upload_prefix, output_prefix = prefixes(DEPLOYMENT)
+    state = comfy.state
+    return {
+        "history": len(set(state.prompts) & foreign),
+        "inputs": len([name for name in state.inputs if name not in presets and not name.startswith(upload_prefix)]),
+        "outputs": len([name for name in state.outputs if not name.startswith(output_prefix)]),
+    }
+
+
+async def run(args) -> dict:
+    config = FakeComfyConfig(
+        exec_time=args.exec_time,
+        failure_rate=args.failure_rate,
+        seed=args.seed,
+        file_delete_path="" if args.no_delete_endpoint else DELETE_PATH,
+    )
+    with FakeComfyServer(config) as comfy:
+        async with httpx.AsyncClient(base_url=comfy.base_url, timeout=30) as client:
+            await seed_orphans(client, args.orphans, DEPLOYMENT)
+            foreign = set()
+            for deployment in FOREIGN_DEPLOYMENTS:
+                foreign.update(await seed_orphans(client, args.orphans, deployment))
+            while any(job.status in ("pending", "running") for job in comfy.state.prompts.values()):
+                await asyncio.sleep(0.1)
+        before_app = leftovers(comfy, foreign)
+        foreign_before = foreign_leftovers(comfy, foreign)
+        # 고아 항목이 TTL보다 오래되도록
+        await asyncio.sleep(args.ttl + 0.5)
+
+        env = {
+            "COMFYUI_DEPLOYMENT_ID": DEPLOYMENT,
+            "REMOTE_GC_RECONCILE": "true",
+            "REMOTE_GC_TTL_SECONDS": str(args.ttl),
+            "REMOTE_GC_INTERVAL_SECONDS": str(args.interval),
+            "COMFYUI_DELETE_ENDPOINT": "" if args.no_delete_endpoint else DELETE_PATH,
+            "RATE_LIMIT_TRANSFORMS_PER_MINUTE": "0",
+            "WARMUP_ENABLED": "false",
+            "FALLBACK_ENABLED": "false",
+        }
+        app = AppProcess(comfy.base_url, env=env).start()
+        try:
+            # 첫 헬스 체크에서 백엔드가 연결됨 -> reconcile
+            deadline = time.monotonic() + 15
+            while set(comfy.state.prompts) - foreign and time.monotonic() < deadline:
+                await asyncio.sleep(0.2)
+            after_reconcile = leftovers(comfy, foreign)
+
+            photo = sample_photo(600, 800)
+            outcomes: dict = {}
+            async with httpx.AsyncClient(base_url=app.base_url, timeout=120) as client:
+                await asyncio.gather(*(transform(client, photo, i, outcomes) for i in range(args.transforms)))
+                during = leftovers(comfy, foreign)
+                # 실패한 묶음은 TTL 뒤, 성공한 묶음은 다음 정리 주기에 지워짐
+                await asyncio.sleep(args.ttl + args.interval * 3)
+                health = (await client.get("/health")).json()["remote_gc"]
+            final = leftovers(comfy, foreign)
+            foreign_after = foreign_leftovers(comfy, foreign)
+        finally:
+            app.stop()
+
+    expected = {"history": 0, "inputs": 0, "outputs": 0}
+    if args.no_delete_endpoint:
+        # 파일 삭제 API가 없으면 히스토리만 정리됨
+        expected = {**final, "history": 0}
+    return {
+        "orphans_seeded": before_app,
+        "after_reconcile": after_reconcile,
+        "transforms": outcomes,
+        "right_after_transforms": during,
+        "final": final,
+        "foreign_seeded": foreign_before,
+        "foreign_after": foreign_after,
+        "clean": final == expected and foreign_after == foreign_before,
+        "app_remote_gc": health,
+    }
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Figure-Maker ComfyUI artifact cleanup check")
+    parser.add_argument("--transforms", type=int, default=12, help="transforms sent through the app")
+    parser.add_argument("--orphans", type=int, default=5, help="untracked prompts per deployment left on the backend before the app starts")
+    parser.add_argument("--failure-rate", type=float, default=0.25, help="fake ComfyUI execution error rate")
+    parser.add_argument("--exec-time", type=float, default=0.2, help="fake ComfyUI seconds per prompt")
+    parser.add_argument("--ttl", type=float, default=2.0, help="REMOTE_GC_TTL_SECONDS for the app")
+    parser.add_argument("--interval", type=float, default=0.5, help="REMOTE_GC_INTERVAL_SECONDS for the app")
+    parser.add_argument("--seed", type=int, default=7, help="fake ComfyUI random seed")
+    parser.add_argument("--no-delete-endpoint", action="store_true", help="backend without a file delete API")
+    parser.add_argument("--json", dest="json_path", help="write the results as JSON")
+    return parser
+
+
+def main() -> None:
+    args = build_parser().parse_args()
+    result = asyncio.run(run(args))
+    print(f"orphans seeded:        {result['orphans_seeded']}")
+    print(f"after reconciliation:  {result['after_reconcile']}")
+    print(f"transforms:            {result['transforms']}")
+    print(f"right after transforms: {result['right_after_transforms']}")
+    print(f"after ttl:             {result['final']}")
+    print(f"other deployments:     {result['foreign_seeded']} -> {result['foreign_after']}")
+    print(f"app: removed {result['app_remote_gc']['removed']}  files kept {result['app_remote_gc']['files_kept']}  "
+          f"errors {result['app_remote_gc']['errors']}")
+    print("clean" if result["clean"] else "LEFTOVERS on the backend")
+    if args.json_path:
+        Path(args.json_path).write_text(json.dumps(result, indent=2))
+    sys.exit(0 if result["clean"] else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+"""
+기동 시간 예산 점검 / 시작 프로파일 리포트
+
+1) `python -X importtime -c "import app.main"` 을 새 프로세스로 실행해 import 비용을 모듈별로 집계한다
+   (누적 시간 상위 모듈, 최상위 패키지별 자체 시간 합계).
+2) 앱을 uvicorn 프로세스로 띄워 첫 요청(/health, /api/transform/styles)이 성공하기까지의 시간을 잰다.
+예산(--import-budget-ms, --first-request-budget-ms)을 넘으면 0이 아닌 코드로 종료하므로 CI 게이트로 쓸 수 있다.
+
+    python -m benchmarks.startup
+    python -m benchmarks.startup --import-budget-ms 800 --first-request-budget-ms 2500 --repeat 3
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+from collections import defaultdict
+from pathlib import Path
+
+import httpx
+
+from benchmarks.loadtest import REPO_ROOT, AppProcess
+
+# import 시점에 불러오면 안 되는 모듈 (lifespan / 첫 사용 시점으로 미룸)
+LAZY_MODULES = ("PIL",)
+
+
+def profile_imports(module: str = "app.main") -> dict:
+    """-X importtime 출력 파싱: {module: (self_us, cumulative_us)}"""
+    env = {**os.environ, "PYTHONPATH": str(REPO_ROOT)}
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=REPO_ROOT, env=env, capture_output=True, text=True, check=True,
+    )
+    modules = {}
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        parts = line[len("import time:"):].split("|")
+        try:
+            self_us, cumulative_us = int(parts[0]), int(parts[1])
+        except ValueError:
+            continue  # 헤더 줄
+        modules[parts[2].strip()] = (self_us, cumulative_us)
+    return modules
+
+
+def import_report(modules: dict, module: str = "app.main", top: int = 15) -> dict:
+    by_package = defaultdict(int)
+    for name, (self_us, _) in modules.items():
+        by_package[name.split(".")[0]] += self_us
+    return {
+        "total_ms": round(modules.get(module, (0, 0))[1] / 1000, 1),
+        "top_cumulative": [
+            {"module": name, "cumulative_ms": round(cum / 1000, 1), "self_ms": round(own / 1000, 1)}
+            for name, (own, cum) in sorted(modules.items(), key=lambda kv: kv[1][1], reverse=True)[:top]
+        ],
+        "by_package_ms": {
+            name: round(us / 1000, 1)
+            for name, us in sorted(by_package.items(), key=lambda kv: kv[1], reverse=True)[:top]
+        },
+        "eager_lazy_modules": sorted({name.split(".")[0] for name in modules} & set(LAZY_MODULES)),
+    }
+
+
+def time_to_first_request() -> dict:
+    """프로세스 시작 -> /health 200 -> 첫 API 응답까지 (ComfyUI 없이; 헬스/워밍업은 백그라운드)"""
+    started = time.perf_counter()
+    app = AppProcess(comfy_url="http://127.0.0.1:9").start()
+    try:
+        ready = time.perf_counter() - started
+        response = httpx.get(f"{app.base_url}/api/transform/styles", timeout=10.0)
+        response.raise_for_status()
+        first_api = time.perf_counter() - started
+    finally:
+        app.stop()
+    return {"ready_ms": round(ready * 1000, 1), "first_api_ms": round(first_api * 1000, 1)}
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Figure-Maker startup budget check")
+    parser.add_argument("--import-budget-ms", type=float, default=1000.0, help="budget for `import app.main`")
+    parser.add_argument("--first-request-budget-ms", type=float, default=3000.0, help="budget for process start -> first API response")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per measurement (best run is compared to the budget)")
+    parser.add_argument("--top", type=int, default=15, help="modules listed in the report")
+    parser.add_argument("--json", dest="json_path", help="write the report as JSON")
+    return parser
+
+
+def main() -> None:
+    args = build_parser().parse_args()
+    imports = min((import_report(profile_imports(), top=args.top) for _ in range(args.repeat)), key=lambda r: r["total_ms"])
+    first = min((time_to_first_request() for _ in range(args.repeat)), key=lambda r: r["first_api_ms"])
+
+    print(f"import app.main: {imports['total_ms']} ms (budget {args.import_budget_ms} ms)")
+    print(f"{'module':<48}{'cumulative ms':>15}{'self ms':>10}")
+    for row in imports["top_cumulative"]:
+        print(f"{row['module']:<48}{row['cumulative_ms']:>15}{row['self_ms']:>10}")
+    print("self time by package: " + ", ".join(f"{name} {ms}" for name, ms in imports["by_package_ms"].items()))
+    print(f"ready (/health 200): {first['ready_ms']} ms")
+    print(f"first API response: {first['first_api_ms']} ms (budget {args.first_request_budget_ms} ms)")
+
+    failures = []
+    if imports["total_ms"] > args.import_budget_ms:
+        failures.append(f"import time {imports['total_ms']} ms > {args.import_budget_ms} ms")
+    if first["first_api_ms"] > args.first_request_budget_ms:
+        failures.append(f"time to first request {first['first_api_ms']} ms > {args.first_request_budget_ms} ms")
+    if imports["eager_lazy_modules"]:
+        failures.append(f"imported at startup: {', '.join(imports['eager_lazy_modules'])}")
+
+    if args.json_path:
+        Path(args.json_path).write_text(json.dumps({"imports": imports, "first_request": first, "failures": failures}, indent=2))
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+"""
+스타일 친화 라우팅 효과 측정
+
+가짜 ComfyUI 백엔드 여러 대(기본 2대, 노드 출력 캐시 흉내)를 띄우고 스타일이 섞인 키오스크 흐름(loadtest)을
+STYLE_AFFINITY_ENABLED 켬/끔으로 각각 돌린다. 앱 /metrics 의 prompt당 실행 노드 수(figure_comfyui_nodes_executed)와
+백엔드별 캐시 재사용 노드 수, transform 처리량/p50/p95를 비교해 출력한다.
+가짜 서버의 --node-time 은 캐시되지 않고 실행된 노드 하나의 GPU 시간 (실제로는 모델/ControlNet 로딩, 텍스트 인코딩 비용).
+저장소에 프리셋 이미지가 없는 스타일은 측정 동안만 있는 프리셋을 복사해 두고 끝나면 지운다.
+
+    python -m benchmarks.style_affinity --backends 2 --concurrency 4 --flows 32 --node-time 0.1
+    python -m benchmarks.style_affinity --styles character semi_realistic --json affinity.json
+"""
+
+import asyncio
+import json
+import re
+import shutil
+from contextlib import ExitStack, contextmanager
+from pathlib import Path
+
+import httpx
+
+from app.services.zimage import CHARACTER_STYLES
+from benchmarks.fake_comfyui import FakeComfyServer
+from benchmarks.loadtest import AppProcess, FlowRecorder, build_parser, comfy_config_from_args, drive, percentile, sample_photo
+
+
+@contextmanager
+def placeholder_presets(styles: list):
+    """프리셋 이미지가 없는 스타일에 임시 프리셋 (레퍼런스 이미지가 달라야 스타일별 캐시가 갈리므로 내용은 복사본이어도 됨)"""
+    from app.services.zimage import CHARACTER_STYLES, PRESET_DIR
+
+    existing = [PRESET_DIR / CHARACTER_STYLES[s]["reference_image"] for s in CHARACTER_STYLES]
+    source = next((path for path in existing if path.exists()), None)
+    created = []
+    try:
+        for style in styles:
+            path = PRESET_DIR / CHARACTER_STYLES[style]["reference_image"]
+            if source is not None and not path.exists():
+                shutil.copyfile(source, path)
+                created.append(path)
+        yield
+    finally:
+        for path in created:
+            path.unlink(missing_ok=True)
+
+
+def scrape_nodes(metrics_text: str) -> dict:
+    """/metrics -> {"prompts": n, "executed": 실행 노드 합, "cached": 캐시 노드 합}"""
+    prompts = executed = cached = 0.0
+    for line in metrics_text.splitlines():
+        if line.startswith("figure_comfyui_nodes_executed_count"):
+            prompts += float(line.rsplit(" ", 1)[1])
+        elif line.startswith("figure_comfyui_nodes_executed_sum"):
+            executed += float(line.rsplit(" ", 1)[1])
+        elif line.startswith("figure_comfyui_nodes_cached_total"):
+            cached += float(line.rsplit(" ", 1)[1])
+    return {"prompts": prompts, "executed": executed, "cached": cached}
+
+
+def scrape_routing(metrics_text: str) -> dict:
+    routed: dict = {}
+    for match in re.finditer(r'^figure_comfyui_routed_total\{worker="[^"]*",backend="[^"]*",reason="([^"]+)"\} (\S+)$', metrics_text, re.M):
+        routed[match.group(1)] = routed.get(match.group(1), 0) + int(float(match.group(2)))
+    return routed
+
+
+async def measure(args, affinity: bool) -> dict:
+    photo = sample_photo()
+    with ExitStack() as stack:
+        comfys = [stack.enter_context(FakeComfyServer(comfy_config_from_args(args))) for _ in range(args.backends)]
+        env = {
+            "ZIMAGE_BACKEND_URLS": ",".join(comfy.base_url for comfy in comfys),
+            "STYLE_AFFINITY_ENABLED": "true" if affinity else "false",
+            "SCHEDULER_MAX_IN_FLIGHT": str(args.in_flight or args.backends * 2),
+            "WARMUP_ENABLED": "false",
+        }
+        app = AppProcess(comfys[0].base_url, env=env, workers=args.workers).start()
+        try:
+            rec = FlowRecorder()
+            elapsed = await drive(app.base_url, args.concurrency, args.flows, photo, rec, args.styles)
+            metrics_text = httpx.get(f"{app.base_url}/metrics", timeout=10).text
+        finally:
+            app.stop()
+        backend_nodes = [
+            {"executed": comfy.state.nodes_executed, "cached": comfy.state.nodes_cached, "prompts": comfy.state.executed}
+            for comfy in comfys
+        ]
+
+    nodes = scrape_nodes(metrics_text)
+    transform = rec.latencies.get("transform", [])
+    return {
+        "affinity": affinity,
+        "flows_ok": rec.flows_ok,
+        "flows_failed": rec.flows_failed,
+        "throughput_flows_per_s": round(rec.flows_ok / elapsed, 3) if elapsed else 0.0,
+        "transform_p50_ms": round(percentile(transform, 50) * 1000, 1),
+        "transform_p95_ms": round(percentile(transform, 95) * 1000, 1),
+        "nodes_executed_per_prompt": round(nodes["executed"] / nodes["prompts"], 2) if nodes["prompts"] else None,
+        "cache_hit_ratio": round(nodes["cached"] / (nodes["cached"] + nodes["executed"]), 3) if nodes["prompts"] else None,
+        "routing": scrape_routing(metrics_text),
+        "backends": backend_nodes,
+    }
+
+
+async def compare(args) -> list:
+    with placeholder_presets(args.styles):
+        return [await measure(args, affinity) for affinity in (False, True)]
+
+
+def build_affinity_parser():
+    parser = build_parser()
+    parser.description = "Figure-Maker style-affinity routing benchmark"
+    parser.add_argument("--backends", type=int, default=2, help="fake ComfyUI backends")
+    parser.add_argument("--in-flight", type=int, default=0, help="SCHEDULER_MAX_IN_FLIGHT (default: backends x 2)")
+    parser.set_defaults(node_time=0.1, styles=sorted(CHARACTER_STYLES))
+    return parser
+
+
+def main() -> None:
+    args = build_affinity_parser().parse_args()
+    rows = asyncio.run(compare(args))
+    print(f"{'affinity':>9}{'ok':>5}{'flows/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'nodes/prompt':>14}{'cache hit':>11}  routing")
+    for row in rows:
+        print(
+            f"{'on' if row['affinity'] else 'off':>9}{row['flows_ok']:>5}{row['throughput_flows_per_s']:>9}"
+            f"{row['transform_p50_ms']:>9}{row['transform_p95_ms']:>9}{row['nodes_executed_per_prompt']:>14}"
+            f"{row['cache_hit_ratio']:>11}  {row['routing']}"
+        )
+    if args.json_path:
+        Path(args.json_path).write_text(json.dumps(rows, indent=2))
+
+
+if __name__ == "__main__":
+    main()